@@ -0,0 +1,347 @@
+# In this file, we keep a read-only, in-memory copy of the ratings for the /api/analytics endpoints.
+#
+# Questions like "how many ratings were made each day" or "what is the average rating of each genre"
+#  look at every rating.  Answering them by reading the rows into Rating objects and adding them up
+#  in Python loops is slow, and running the GROUP BY queries in SQLite on every request isn't much
+#  better once there are millions of ratings.  Instead we keep a *columnar snapshot*: one NumPy array
+#  per column (user_id, movie_id, rating and the date as a whole number of days), with the n-th
+#  entry of each array belonging to the n-th rating.  A group-by is then a couple of whole-array
+#  operations (np.unique to number the groups, np.bincount to count and add up each group), which
+#  run in C over the whole column at once.
+#
+# The snapshot is built from the database the first time it is used and is never changed after
+#  that (the arrays are read-only), so any number of requests can read it at the same time.  It is
+#  replaced by a new one when it is older than ANALYTICS_MAX_AGE_SECONDS or when more than
+#  ANALYTICS_REFRESH_AFTER_WRITES ratings, movies or users have been written through api/services.py
+#  since it was built.  The answers can therefore be a little out of date, which is fine for
+#  analytics; every response says when its snapshot was taken.
+import threading
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from api import config
+from api.db import get_connection
+from api.models import RatingGroup
+
+# Dates are stored as the number of days since 1970-01-01.  A rating without a (readable) date gets
+#  this instead, and is left out of anything grouped by day.
+NO_DATE = np.iinfo(np.int32).min
+EPOCH = date(1970, 1, 1)
+
+
+def parse_day(text: str) -> int:
+    """
+    Turn a date from the ratings table into a number of days since 1970-01-01.
+
+    Args:
+        text (str): The date, as an ISO date (2024-01-31, possibly followed by a time) or the way
+                    the original CSV files write them (1/31/2024).
+
+    Returns:
+        int: The number of days, or NO_DATE if there is no date or it can't be read.
+    """
+    if not text:
+        return NO_DATE
+    for date_format, length in (("%Y-%m-%d", 10), ("%m/%d/%Y", None)):
+        try:
+            return (datetime.strptime(text[:length].strip(), date_format).date() - EPOCH).days
+        except ValueError:
+            pass
+    return NO_DATE
+
+
+def day_to_iso(day: int) -> str:
+    """Turn a number of days since 1970-01-01 back into an ISO date."""
+    return date.fromordinal(EPOCH.toordinal() + int(day)).isoformat()
+
+
+def read_only(array: np.ndarray) -> np.ndarray:
+    """Mark an array as read-only (so the shared snapshot can't be changed by accident) and return it."""
+    array.flags.writeable = False
+    return array
+
+
+def group_ratings(keys: np.ndarray, counts: np.ndarray, totals: np.ndarray, sum_squares: np.ndarray) -> tuple:
+    """
+    Add up the counts, totals and sums of squares that have the same key.
+
+    Args:
+        keys (np.ndarray): The key (group) of each entry.
+        counts, totals, sum_squares (np.ndarray): The number of ratings, their sum and the sum of
+                                                  their squares for each entry.
+
+    Returns:
+        tuple: The different keys in order, and the count, total and sum of squares of each.
+    """
+    groups, group_of = np.unique(keys, return_inverse=True)
+    size = len(groups)
+    return (groups,
+            np.bincount(group_of, weights=counts, minlength=size),
+            np.bincount(group_of, weights=totals, minlength=size),
+            np.bincount(group_of, weights=sum_squares, minlength=size))
+
+
+class RatingsSnapshot:
+    """
+    The ratings (and the movie details they are grouped by) as NumPy arrays.
+    """
+
+    def __init__(self, user_ids, movie_ids, ratings, days, users, movies, release_years, genre_names, genre_links):
+        """
+        Args:
+            user_ids, movie_ids, ratings, days: One entry per rating (days as returned by parse_day).
+            users: The user_id of every user.
+            movies: The movie_id of every movie.
+            release_years: The release year of each movie in movies (NaN if it doesn't have one).
+            genre_names (dict): genre_id -> name.
+            genre_links: (genre_id, movie_id) pairs from the movie_genres table.
+        """
+        self.user_ids = read_only(np.asarray(user_ids, dtype=np.int64))
+        self.movie_ids = read_only(np.asarray(movie_ids, dtype=np.int64))
+        self.ratings = read_only(np.asarray(ratings, dtype=np.float64))
+        self.days = read_only(np.asarray(days, dtype=np.int32))
+        self.users = read_only(np.sort(np.asarray(users, dtype=np.int64)))
+        order = np.argsort(np.asarray(movies, dtype=np.int64))
+        self.movies = read_only(np.asarray(movies, dtype=np.int64)[order])
+        self.release_years = read_only(np.asarray(release_years, dtype=np.float64)[order])
+        self.genre_names = genre_names
+        links = np.asarray(genre_links, dtype=np.int64).reshape(-1, 2)
+        self.genre_ids = read_only(links[:, 0])
+        self.genre_movies = read_only(self.positions(self.movies, links[:, 1]))
+        # The position of each rating's movie in self.movies (-1 for a movie that no longer exists)
+        self.rating_movies = read_only(self.positions(self.movies, self.movie_ids))
+        self.built_at = datetime.now(timezone.utc)
+
+    def __len__(self):
+        return len(self.ratings)
+
+    @staticmethod
+    def positions(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Find each id in sorted_ids, -1 for the ones that aren't there."""
+        found = np.searchsorted(sorted_ids, ids)
+        found[found == len(sorted_ids)] = 0
+        missing = len(sorted_ids) == 0 or sorted_ids[found] != ids
+        return np.where(missing, -1, found)
+
+    @classmethod
+    def load(cls, conn) -> "RatingsSnapshot":
+        """
+        Read a snapshot of the ratings from the database.
+
+        Args:
+            conn (sqlite3.Connection): A connection to the database.
+
+        Returns:
+            RatingsSnapshot: The snapshot.
+        """
+        columns = ([], [], [], [])
+        # There are only a few thousand different dates however many ratings there are, so each
+        #  one is only parsed once
+        days = {}
+        cursor = conn.execute("SELECT user_id, movie_id, rating, date FROM ratings WHERE rating IS NOT NULL")
+        while True:
+            rows = cursor.fetchmany(config.ANALYTICS_LOAD_BATCH_SIZE)
+            if not rows:
+                break
+            user_ids, movie_ids, ratings, dates = zip(*rows)
+            for day in dates:
+                if day not in days:
+                    days[day] = parse_day(day)
+            for column, values in zip(columns, (user_ids, movie_ids, ratings, [days[day] for day in dates])):
+                # One small array per batch, joined at the end, rather than one big list of Python objects
+                column.append(np.array(values, dtype=np.float64 if column is columns[2] else np.int64))
+
+        movies = conn.execute("SELECT movie_id, release_year FROM movies").fetchall()
+        return cls(*(np.concatenate(column) if column else [] for column in columns),
+                   users=[row[0] for row in conn.execute("SELECT user_id FROM users")],
+                   movies=[row[0] for row in movies],
+                   release_years=[row[1] if row[1] is not None else np.nan for row in movies],
+                   genre_names=dict(conn.execute("SELECT genre_id, name FROM genres").fetchall()),
+                   genre_links=[tuple(row) for row in conn.execute("SELECT genre_id, movie_id FROM movie_genres")])
+
+    def per_movie(self) -> tuple:
+        """
+        Return the number of ratings, their total and the total of their squares for each movie in self.movies.
+        Ratings of movies that no longer exist are left out.
+        """
+        known = self.rating_movies >= 0
+        positions, ratings = self.rating_movies[known], self.ratings[known]
+        size = len(self.movies)
+        return (np.bincount(positions, minlength=size).astype(np.float64),
+                np.bincount(positions, weights=ratings, minlength=size),
+                np.bincount(positions, weights=ratings ** 2, minlength=size))
+
+    def by_genre(self) -> list:
+        """
+        The ratings of each genre.  A movie with several genres counts towards each of them.
+
+        Returns:
+            list: A RatingGroup per genre that has ratings, in name order.
+        """
+        counts, totals, sum_squares = self.per_movie()
+        # Each link of a genre to a movie brings all of that movie's ratings with it
+        linked = self.genre_movies >= 0
+        movies = self.genre_movies[linked]
+        genre_ids, counts, totals, sum_squares = group_ratings(
+            self.genre_ids[linked], counts[movies], totals[movies], sum_squares[movies])
+        groups = [RatingGroup("genre", self.genre_names.get(genre_id), int(count), total, squares)
+                  for genre_id, count, total, squares in zip(genre_ids.tolist(), counts, totals, sum_squares)
+                  if count > 0]
+        return sorted(groups, key=lambda group: str(group.value))
+
+    def by_release_year(self) -> list:
+        """
+        The ratings of the movies released in each year.  Movies without a release year are left out.
+
+        Returns:
+            list: A RatingGroup per release year that has ratings, in year order.
+        """
+        counts, totals, sum_squares = self.per_movie()
+        dated = ~np.isnan(self.release_years)
+        years, counts, totals, sum_squares = group_ratings(
+            self.release_years[dated].astype(np.int64), counts[dated], totals[dated], sum_squares[dated])
+        return [RatingGroup("release_year", year, int(count), total, squares)
+                for year, count, total, squares in zip(years.tolist(), counts, totals, sum_squares)
+                if count > 0]
+
+    def by_day(self, start: int = None, end: int = None) -> list:
+        """
+        The ratings made on each day.  Ratings without a date are left out.
+
+        Args:
+            start (int, optional): The first day to include (days since 1970-01-01). Defaults to the first there is.
+            end (int, optional): The last day to include. Defaults to the last there is.
+
+        Returns:
+            list: A RatingGroup per day that has ratings, in date order.
+        """
+        keep = self.days != NO_DATE
+        if start is not None:
+            keep &= self.days >= start
+        if end is not None:
+            keep &= self.days <= end
+        ratings = self.ratings[keep]
+        days, counts, totals, sum_squares = group_ratings(
+            self.days[keep], np.ones(len(ratings)), ratings, ratings ** 2)
+        return [RatingGroup("date", day_to_iso(day), int(count), total, squares)
+                for day, count, total, squares in zip(days.tolist(), counts, totals, sum_squares)]
+
+    def activity(self, kind: str, percentiles: list) -> dict:
+        """
+        How the number of ratings is spread over the users (or the movies).
+
+        Args:
+            kind (str): "users" or "movies".
+            percentiles (list): The percentiles to work out, from 0 to 100.
+
+        Returns:
+            dict: The number of users (or movies), the mean number of ratings each, and the
+                  number of ratings at each percentile.  Users and movies without ratings count too.
+        """
+        ids, rating_ids = (self.users, self.user_ids) if kind == "users" else (self.movies, self.movie_ids)
+        positions = self.positions(ids, rating_ids)
+        counts = np.bincount(positions[positions >= 0], minlength=len(ids))
+        values = np.percentile(counts, percentiles).tolist() if len(counts) else [None] * len(percentiles)
+        return {
+            kind: len(ids),
+            "mean": float(counts.mean()) if len(counts) else None,
+            "max": int(counts.max()) if len(counts) else None,
+            # JSON object keys are always strings
+            "percentiles": {f"{percentile:g}": value for percentile, value in zip(percentiles, values)},
+        }
+
+
+# ---------------------------------------------------------
+# The shared snapshot used by api/services.py
+# ---------------------------------------------------------
+# (the time it was built, RatingsSnapshot).  Replaced as a whole, so readers never need a lock.
+_snapshot = (None, None)
+# Only one thread takes a new snapshot at a time.  The writes are counted under a lock of their
+#  own, so a write never waits for a snapshot to be taken (which can take seconds).
+_load_lock = threading.Lock()
+_writes = 0
+_writes_lock = threading.Lock()
+# Bumped by reset(), so a snapshot that was being taken from the old database is thrown away
+_generation = 0
+
+
+def _is_stale(built_at: float, snapshot: RatingsSnapshot) -> bool:
+    """Whether a new snapshot is needed (see get_snapshot)."""
+    max_age = config.ANALYTICS_MAX_AGE_SECONDS
+    max_writes = config.ANALYTICS_REFRESH_AFTER_WRITES
+    return (snapshot is None or (max_age > 0 and time.monotonic() - built_at > max_age)
+            or (max_writes > 0 and _writes >= max_writes))
+
+
+def get_snapshot() -> RatingsSnapshot:
+    """
+    Return the shared snapshot, taking a new one first if there isn't one yet, it is older than
+    ANALYTICS_MAX_AGE_SECONDS, or more than ANALYTICS_REFRESH_AFTER_WRITES writes were recorded since.
+    While one thread takes a new snapshot, the others keep using the old one (or wait for the new
+    one if there isn't an old one).
+
+    Returns:
+        RatingsSnapshot: The snapshot.
+    """
+    global _snapshot, _writes
+    built_at, snapshot = _snapshot
+    if not _is_stale(built_at, snapshot):
+        return snapshot
+    if not _load_lock.acquire(blocking=snapshot is None):
+        # Another thread is already taking the new one
+        return snapshot
+    try:
+        # It may have been taken while we waited for the lock
+        built_at, snapshot = _snapshot
+        if not _is_stale(built_at, snapshot):
+            return snapshot
+        generation = _generation
+        with _writes_lock:
+            writes_before = _writes
+        # Taken without holding any lock the writes need
+        with get_connection() as conn:
+            snapshot = RatingsSnapshot.load(conn)
+        with _writes_lock:
+            if generation == _generation:
+                # Writes recorded while the snapshot was being taken may not be in it, so they still count
+                _writes -= writes_before
+                _snapshot = (time.monotonic(), snapshot)
+        return snapshot
+    finally:
+        _load_lock.release()
+
+
+def record_writes(count: int = 1):
+    """
+    Count rows written since the snapshot was taken (see get_snapshot).
+
+    Args:
+        count (int, optional): How many rows were added, changed or deleted. Defaults to 1.
+    """
+    global _writes
+    with _writes_lock:
+        _writes += count
+
+
+def reset():
+    """Forget the shared snapshot, e.g. after pointing the connection pool at a different database."""
+    global _snapshot, _writes, _generation
+    with _writes_lock:
+        _generation += 1
+        _snapshot = (None, None)
+        _writes = 0
+
+
+def stats() -> dict:
+    """
+    Describe the shared snapshot, if one has been taken.
+
+    Returns:
+        dict: The number of ratings in it, when it was taken and the writes recorded since.
+    """
+    _, snapshot = _snapshot
+    if snapshot is None:
+        return {}
+    return {"ratings": len(snapshot), "as_of": snapshot.built_at.isoformat(), "writes_since": _writes}
@@ -0,0 +1,242 @@
+# In this file, we keep a small in-memory cache in front of the most common lookups.
+# Almost every page of a front end resolves a movie or a user by id, so rather than asking SQLite
+#  for the same row over and over, the first lookup stores the row here and later lookups are
+#  answered from memory.  This is called a "read-through" cache: callers always ask the cache,
+#  and the cache only goes to the database when it doesn't have the answer.
+#
+# A cache is only useful if it never hands out stale data, so:
+#   - every entry expires after a time-to-live (TTL), which bounds how stale an entry can get
+#     if something changes the database behind our back (another process, or a script)
+#   - the services functions that change a movie or user invalidate its entry straight away.
+#     With the default, in-process backend that only reaches this process's cache: every other
+#     worker process keeps its own copy until the TTL runs out.  The conditional endpoints check
+#     the row_version of what they send (see api/conditional.py), everything else can be up to
+#     CACHE_TTL_SECONDS out of date.
+#   - a lookup that reads the row while it is being changed mustn't put the old row back after
+#     the change has invalidated it, so every invalidate() starts a new generation and a row read
+#     during an older generation isn't stored (see read_through)
+#   - the cache has a maximum size, and when it is full the least recently used (LRU) entry
+#     is thrown away to make room
+#
+# The cache stores plain dictionaries rather than model objects.  Callers are free to change the
+#  objects they get back without changing what is in the cache, and a dictionary can be sent to an
+#  out-of-process cache (memcached, Redis, ...) as JSON.  To use one of those, write a subclass of
+#  CacheBackend and pass it to set_backend().
+import threading
+import time
+from collections import OrderedDict
+
+from api import config
+
+
+class CacheBackend:
+    """
+    The interface every cache backend implements.
+
+    Keys are strings and values are anything that can be converted to JSON.  A backend may
+    forget an entry at any time (that just means the next lookup goes to the database).
+    """
+
+    def get(self, key: str):
+        """Return the value stored for key, or None if there isn't one."""
+        raise NotImplementedError
+
+    def set(self, key: str, value):
+        """Store value under key."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """Forget the value stored for key, if there is one."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Forget everything."""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Return a dictionary of counters that describe how well the cache is doing."""
+        return {}
+
+
+class LocalLRUCache(CacheBackend):
+    """
+    A thread-safe, in-process cache with a maximum size and a time-to-live.
+
+    The entries are kept in an OrderedDict in least recently used order: every hit moves the
+    entry to the end, so when the cache is full the entry at the front is the one to throw away.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, clock=time.monotonic):
+        """
+        Args:
+            max_entries (int): The most entries to keep before evicting the least recently used one.
+            ttl (float): How many seconds an entry stays valid after it is stored.
+            clock (callable, optional): Returns the current time in seconds. Tests pass a fake clock.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        # key -> (expires_at, value)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                # Too old, treat it as if it wasn't there
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "local",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# ---------------------------------------------------------
+# The shared cache used by api/services.py
+# ---------------------------------------------------------
+_backend = LocalLRUCache(config.CACHE_MAX_ENTRIES, config.CACHE_TTL_SECONDS)
+# Goes up with every invalidate(), so read_through can tell whether one happened while it was loading
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def set_backend(backend: CacheBackend):
+    """
+    Replace the shared cache, for example with one that lives in another process.
+
+    Args:
+        backend (CacheBackend): The new cache.
+    """
+    global _backend
+    _backend = backend
+
+
+def get_backend() -> CacheBackend:
+    """
+    Return the shared cache.
+
+    Returns:
+        CacheBackend: The cache the services functions use.
+    """
+    return _backend
+
+
+def make_key(kind: str, entity_id) -> str:
+    """
+    Build the cache key for one entity, e.g. "movie:42".
+
+    Args:
+        kind (str): The type of entity ("movie", "user").
+        entity_id: The entity's id.
+
+    Returns:
+        str: The cache key.
+    """
+    return f"{kind}:{entity_id}"
+
+
+def read_through(kind: str, entity_id, load, row_version: int = None):
+    """
+    Return the cached value for an entity, loading (and caching) it if it isn't cached.
+
+    Args:
+        kind (str): The type of entity ("movie", "user").
+        entity_id: The entity's id.
+        load (callable): Loads the value from the database. Returns None if the entity doesn't exist.
+        row_version (int, optional): The entity's row_version, if the caller has just read it (see
+                                     api/conditional.py).  A cached value with a different
+                                     "row_version" is out of date and is loaded again.
+
+    Returns:
+        The cached or freshly loaded value, or None if the entity doesn't exist.
+    """
+    if not config.CACHE_ENABLED:
+        return load()
+    key = make_key(kind, entity_id)
+    value = _backend.get(key)
+    if value is not None and row_version is not None and value.get("row_version") != row_version:
+        # Changed since it was cached, by another process or a script that couldn't invalidate it
+        value = None
+    if value is None:
+        started = _generation
+        value = load()
+        # Entities that don't exist are not cached, so one created later is found straight away
+        if value is not None:
+            with _generation_lock:
+                # Something was invalidated while we were reading, which may have been this row
+                #  changing after we read it, so the next lookup reads it again instead
+                if _generation == started:
+                    _backend.set(key, value)
+    return value
+
+
+def invalidate(kind: str, entity_id):
+    """
+    Remove an entity from the cache, call this whenever it is changed or deleted.
+    Only this process's lookups hear about it, unless the backend is shared between processes.
+
+    Args:
+        kind (str): The type of entity ("movie", "user").
+        entity_id: The entity's id.
+    """
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        _backend.delete(make_key(kind, entity_id))
+
+
+def clear():
+    """Empty the shared cache, e.g. after pointing the connection pool at a different database."""
+    _backend.clear()
+
+
+def stats() -> dict:
+    """
+    Return the shared cache's counters.
+
+    Returns:
+        dict: The hits, misses, hit ratio, evictions etc.
+    """
+    return _backend.stats()
@@ -0,0 +1,134 @@
+# In this file, we compress the API's responses before they are sent.
+# JSON is very repetitive ("movie_id", "title", "genre" ... on every item), so a page of 1000
+#  movies shrinks to a fraction of its size with gzip, and a little further with brotli.  Clients
+#  say which encodings they understand in the Accept-Encoding header, e.g.
+#     Accept-Encoding: gzip, deflate, br
+#  and the response says which one it used in Content-Encoding.  Every browser and HTTP library
+#  does this by itself, so clients don't need to change anything.
+#
+# Compressing costs CPU, so:
+#   - small responses (under COMPRESSION_MIN_BYTES) are sent as they are, since the headers would
+#     be most of what is saved,
+#   - responses kept by the response cache (see api/response_cache.py) are compressed once, when
+#     they are stored, and the compressed bytes are sent to every client after that.
+#
+# Brotli is only used if the brotli package is installed (pip install brotli), gzip is part of
+#  Python.  Streamed responses are sent uncompressed.
+import gzip
+
+from flask import request
+
+from api import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def available_encodings() -> list:
+    """
+    The encodings the API can send, best first.
+
+    Returns:
+        list: e.g. ["br", "gzip"], or just ["gzip"] without the brotli package.
+    """
+    if not config.COMPRESSION_ENABLED:
+        return []
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding() -> str:
+    """
+    Pick the encoding for the current request's response from its Accept-Encoding header.
+
+    Returns:
+        str: "br", "gzip", or None to send the response uncompressed.
+    """
+    encodings = available_encodings()
+    if not encodings:
+        return None
+    # best_match follows the client's q-values, and prefers the first of ours when they are equal
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compress a response body.
+
+    Args:
+        body (bytes): The body.
+        encoding (str): "br" or "gzip".
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=config.COMPRESSION_BROTLI_QUALITY)
+    # mtime=0 leaves the time out of the gzip header, so the same body always gives the same bytes
+    return gzip.compress(body, compresslevel=config.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(response) -> bool:
+    """Whether a response is one that can be compressed: a whole (not streamed) 200 of a compressible type."""
+    return (response.status_code == 200 and not response.is_streamed
+            and response.mimetype in config.COMPRESSION_MIMETYPES)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """
+    The ETag of the compressed version of a response.  A strong ETag promises the bytes are the
+    same, so the gzip and brotli versions each need a tag of their own.
+
+    Args:
+        etag (str): The ETag of the uncompressed response (without quotes).
+        encoding (str): "br" or "gzip".
+
+    Returns:
+        str: e.g. "movies:1a2b3c4d:42:3-gzip".
+    """
+    return f"{etag}-{encoding}"
+
+
+def etag_variants(etag: str) -> list:
+    """Every ETag a client may have been sent for a response: uncompressed, then each encoding."""
+    return [etag] + [encoded_etag(etag, encoding) for encoding in ("br", "gzip")]
+
+
+def compress_response(response):
+    """
+    Compress a response if the client accepts it and it is worth it (registered with
+    app.after_request by init_app).  Responses that already have a Content-Encoding (the
+    precompressed ones from the response cache) are left as they are.
+
+    Args:
+        response (Response): The response.
+
+    Returns:
+        Response: The same response.
+    """
+    if not is_compressible(response):
+        return response
+    # Caches in between must keep the compressed and uncompressed versions apart
+    response.vary.add("Accept-Encoding")
+    encoding = response.headers.get("Content-Encoding")
+    if encoding is None:
+        encoding = choose_encoding()
+        if encoding is None or (response.content_length or 0) < config.COMPRESSION_MIN_BYTES:
+            return response
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers["Content-Encoding"] = encoding
+    etag, is_weak = response.get_etag()
+    if etag and not is_weak:
+        response.set_etag(encoded_etag(etag, encoding))
+    return response
+
+
+def init_app(app):
+    """
+    Compress the responses of a Flask app.
+
+    Args:
+        app (Flask): The app (see run.create_app).
+    """
+    app.after_request(compress_response)
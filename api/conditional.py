@@ -0,0 +1,166 @@
+# In this file, we handle HTTP conditional requests for the GET endpoints.
+# Every response from a conditional endpoint carries two validators:
+#   - ETag: "movies:1a2b3c4d:42:3", a strong tag that changes whenever the response could (here,
+#     the table's epoch, the movie's ID and its row_version, see migration 9 in api/migrations.py)
+#   - Last-Modified: when the row (or, for a list, the table) last changed
+# A client or CDN that already has a copy sends them back on its next request:
+#     GET /api/movies/42
+#     If-None-Match: "movies:1a2b3c4d:42:3"
+# and if the copy is still current the answer is a 304 Not Modified with no body.  The check is a
+#  primary key lookup of the version, made before the view runs, so a 304 never reads the movie
+#  itself, converts it to a dictionary or encodes any JSON.
+#
+# The version is read before the data, so if a write happens in between the response is tagged with
+#  the older version.  The client's next request then just gets a 200 it didn't strictly need,
+#  never a 304 for a copy that is out of date.  The data itself may come from the by-id cache (see
+#  api/cache.py), which only hears about the writes made in this process, so the view passes the
+#  version it was tagged with (current_row_version()) to the cache, and a cached copy of any other
+#  version is read from the database again.
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import g, make_response, request
+
+from api import compression, config, services
+
+# The format of the times in the database (see migrations.NOW_SQL)
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class Validators:
+    """
+    The ETag (without its quotes) and Last-Modified time of a response, and for a single row its
+    row_version.
+    """
+
+    def __init__(self, etag: str, last_modified: datetime, row_version: int = None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.row_version = row_version
+
+    def __repr__(self):
+        return f"<Validators {self.etag} - {self.last_modified}>"
+
+
+def parse_time(text: str) -> datetime:
+    """Turn a time from the database into a datetime in UTC (None if there isn't one)."""
+    if not text:
+        return None
+    return datetime.strptime(text, TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def row_validators(table: str, row_id: int) -> Validators:
+    """
+    The validators of one movie, user or rating.
+
+    Args:
+        table (str): "movies", "users" or "ratings".
+        row_id (int): The row's ID.
+
+    Returns:
+        Validators: The validators, or None if there is no such row (the view then returns its 404).
+    """
+    version = services.get_row_version(table, row_id)
+    if version is None:
+        return None
+    epoch, row_version, updated_at = version
+    return Validators(f"{table}:{epoch}:{row_id}:{row_version}", parse_time(updated_at), row_version)
+
+
+def current_row_version() -> int:
+    """
+    The row_version the response to the current request is tagged with, or None if it isn't tagged
+    with one (not a single row, or conditional requests are switched off).
+    """
+    validators = g.get("validators")
+    return validators.row_version if validators is not None else None
+
+
+def table_validators(*tables: str) -> Validators:
+    """
+    The validators of a list built from some tables: it can only change when one of their
+    generations does.  The URL (and so the query string) is part of what a client's copy is
+    stored under, so the same tag can be shared by every page and filter of a list.
+
+    Args:
+        tables (str): The tables the list is built from, e.g. "movies".
+
+    Returns:
+        Validators: The validators.
+    """
+    generations = services.get_table_generations(list(tables))
+    etag = ";".join(f"{table}:{epoch}:{generation}" for table, epoch, generation, _ in generations)
+    return Validators(etag, max(parse_time(changed_at) for _, _, _, changed_at in generations))
+
+
+def not_modified_etag(validators: Validators) -> str:
+    """
+    Work out whether the client's copy (if it has one) is still current, following RFC 9110: when
+    the request has If-None-Match, If-Modified-Since is ignored.
+
+    Args:
+        validators (Validators): The validators of the current version.
+
+    Returns:
+        str: The ETag to send with a 304 Not Modified, or None if the full response should be sent.
+    """
+    if request.if_none_match:
+        # The client may have the gzip or brotli version, which has a tag of its own (see
+        #  api/compression.py).  If-None-Match always uses the weak comparison (so W/"..." from a
+        #  CDN matches too), and * matches anything
+        for etag in compression.etag_variants(validators.etag):
+            if request.if_none_match.contains_weak(etag):
+                return etag
+        return None
+    if request.if_modified_since and validators.last_modified:
+        # HTTP dates are to the second, like the ones in the database
+        if validators.last_modified <= request.if_modified_since:
+            return validators.etag
+    return None
+
+
+def add_validators(response, validators: Validators):
+    """Put the ETag, Last-Modified and Cache-Control headers on a response."""
+    response.set_etag(validators.etag)
+    if validators.last_modified:
+        response.last_modified = validators.last_modified
+    if config.HTTP_CACHE_CONTROL:
+        response.headers["Cache-Control"] = config.HTTP_CACHE_CONTROL
+    return response
+
+
+def conditional(get_validators):
+    """
+    A decorator that makes a GET endpoint answer conditional requests.
+
+    Args:
+        get_validators (callable): Called with the view's arguments, returns the Validators of the
+                                   response it would send (or None to skip the check, e.g. for a
+                                   row that doesn't exist or a streamed response).
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(view):
+        # wraps keeps the view's name and docstring, which Flask uses for the endpoint's name
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not config.CONDITIONAL_REQUESTS_ENABLED:
+                return view(*args, **kwargs)
+            validators = get_validators(*args, **kwargs)
+            if validators is None:
+                return view(*args, **kwargs)
+            etag = not_modified_etag(validators)
+            if etag is not None:
+                response = add_validators(make_response("", 304), validators)
+                response.set_etag(etag)
+                return response
+            # The view can check its data is the version it will be tagged with
+            g.validators = validators
+            response = make_response(view(*args, **kwargs))
+            # Errors (and anything streamed) are sent as they are
+            if response.status_code == 200 and not response.is_streamed:
+                add_validators(response, validators)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,243 @@
+# In this file, we keep the settings that control how the API talks to the database.
+# Every value has a sensible default, but each one can be overridden with an environment
+#  variable of the same name (prefixed with MOVIE_) so that we don't need to edit code
+#  to tune a deployment.  For example:
+#     MOVIE_DB_POOL_SIZE=10 python run.py
+import os
+from pathlib import Path
+
+
+def _env(name: str, default, cast=str):
+    """
+    Read a setting from the environment, falling back to the default if it isn't set.
+
+    Args:
+        name (str): The name of the setting (without the MOVIE_ prefix).
+        default: The value to use if the environment variable is not set.
+        cast (callable, optional): Used to convert the environment string to the right type.
+
+    Returns:
+        The setting value, converted with cast.
+    """
+    value = os.environ.get(f"MOVIE_{name}")
+    if value is None:
+        return default
+    return cast(value)
+
+
+def _bool(value: str) -> bool:
+    """Read an on/off setting: "0", "false" and "no" (in any case) are off, anything else is on."""
+    return value.lower() not in ("0", "false", "no")
+
+
+# ---------------------------------------------------------
+# Database location
+# ---------------------------------------------------------
+DATABASE_PATH = Path(_env("DATABASE_PATH", Path(__file__).parents[1] / "data" / "movie_data.db"))
+
+# ---------------------------------------------------------
+# Connection pool
+# ---------------------------------------------------------
+# The maximum number of connections the pool will ever open at the same time
+DB_POOL_SIZE = _env("DB_POOL_SIZE", 5, int)
+# How long (in seconds) a caller will wait for a free connection before giving up
+DB_POOL_TIMEOUT = _env("DB_POOL_TIMEOUT", 10.0, float)
+# Connections that have been idle longer than this (in seconds) are pinged before being handed out
+DB_POOL_HEALTH_CHECK_INTERVAL = _env("DB_POOL_HEALTH_CHECK_INTERVAL", 30.0, float)
+# Apply any pending schema migrations (see api/migrations.py) when the pool is created.
+#  Set MOVIE_DB_AUTO_MIGRATE=0 to manage migrations by hand instead.
+DB_AUTO_MIGRATE = _env("DB_AUTO_MIGRATE", True, _bool)
+
+# ---------------------------------------------------------
+# Storage profile
+# ---------------------------------------------------------
+# A storage profile is the set of PRAGMAs applied to every new connection when it is opened.
+# The order matters: journal_mode is applied first because it changes how the others behave.
+STORAGE_PROFILES = {
+    # Write-ahead logging: readers never block the writer and the writer never blocks readers.
+    #  This is what the API should normally run with.
+    "wal": {
+        "journal_mode": "WAL",
+        # NORMAL is safe in WAL mode (a power cut can lose the last commits but never corrupts the file)
+        "synchronous": "NORMAL",
+        # Map up to 256MB of the database file into memory instead of copying pages with read()
+        "mmap_size": 256 * 1024 * 1024,
+        # A negative cache_size is in KiB, so this is a 16MB page cache per connection
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        # How long (in milliseconds) to wait for a lock before failing with "database is locked"
+        "busy_timeout": _env("DB_BUSY_TIMEOUT_MS", 5000, int),
+        # Checkpoint the WAL back into the database automatically once it holds this many pages
+        "wal_autocheckpoint": _env("DB_WAL_AUTOCHECKPOINT", 1000, int),
+    },
+    # SQLite's out-of-the-box rollback journal.  Kept so we can compare against it (see benchmarks/).
+    "rollback": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": _env("DB_BUSY_TIMEOUT_MS", 5000, int),
+    },
+}
+DB_STORAGE_PROFILE = _env("DB_STORAGE_PROFILE", "wal")
+# PRAGMAs applied to every new connection when it is opened
+DB_PRAGMAS = STORAGE_PROFILES[DB_STORAGE_PROFILE]
+# The checkpoint mode used when the pool is closed.  TRUNCATE copies everything from the WAL into the
+#  database and then empties the WAL file, so it doesn't keep growing between restarts.
+DB_CHECKPOINT_ON_CLOSE = _env("DB_CHECKPOINT_ON_CLOSE", "TRUNCATE")
+
+# ---------------------------------------------------------
+# Response sizes
+# ---------------------------------------------------------
+# The number of items a list endpoint returns when the client doesn't pass a limit
+DEFAULT_PAGE_SIZE = _env("DEFAULT_PAGE_SIZE", 100, int)
+# The largest limit a client may ask for on a list endpoint
+MAX_PAGE_SIZE = _env("MAX_PAGE_SIZE", 1000, int)
+# The most ratings GET /api/movies/<id>/ratings will ever return in one response
+MAX_RATINGS_PER_MOVIE = _env("MAX_RATINGS_PER_MOVIE", 1000, int)
+# How many rows the streaming endpoints fetch from SQLite (and send to the client) at a time
+STREAM_BATCH_SIZE = _env("STREAM_BATCH_SIZE", 500, int)
+# The most items one request to a bulk endpoint (e.g. POST /api/ratings/bulk) may contain
+MAX_BULK_ITEMS = _env("MAX_BULK_ITEMS", 100000, int)
+
+# ---------------------------------------------------------
+# Bulk inserts
+# ---------------------------------------------------------
+# How many rows the bulk endpoints insert per transaction.  Bigger batches mean fewer commits
+#  (and so fewer waits for the disk), but hold the write lock for longer at a time.
+BULK_BATCH_SIZE = _env("BULK_BATCH_SIZE", 1000, int)
+
+# ---------------------------------------------------------
+# Caching
+# ---------------------------------------------------------
+# The read-through cache in front of get_movie_by_id and get_user_by_id (see api/cache.py)
+#  Set MOVIE_CACHE_ENABLED=0 to always go to the database.
+CACHE_ENABLED = _env("CACHE_ENABLED", True, _bool)
+# The most movies and users to keep in memory before the least recently used ones are dropped
+CACHE_MAX_ENTRIES = _env("CACHE_MAX_ENTRIES", 10000, int)
+# How long a cached entry is trusted.  Changes made through api/services.py invalidate the entry
+#  straight away, but only in the process that made them: another worker process, or a script,
+#  can leave an entry out of date for this long (the conditional endpoints check the row_version,
+#  see api/conditional.py).
+CACHE_TTL_SECONDS = _env("CACHE_TTL_SECONDS", 60.0, float)
+# Send ETag and Last-Modified headers, and answer If-None-Match / If-Modified-Since with a
+#  304 Not Modified when the client's copy is still current (see api/conditional.py)
+CONDITIONAL_REQUESTS_ENABLED = _env("CONDITIONAL_REQUESTS_ENABLED", True, _bool)
+# The Cache-Control header sent with those responses.  "no-cache" lets clients and CDNs keep a copy
+#  but makes them check it is still current (a cheap 304) before using it.  Empty leaves it out.
+HTTP_CACHE_CONTROL = _env("HTTP_CACHE_CONTROL", "no-cache")
+# The cache of whole responses in front of the busiest list endpoints (see api/response_cache.py).
+#  Set MOVIE_RESPONSE_CACHE_ENABLED=0 to always build the response.
+RESPONSE_CACHE_ENABLED = _env("RESPONSE_CACHE_ENABLED", True, _bool)
+# The most bytes of responses to keep, and the biggest single response worth keeping
+RESPONSE_CACHE_MAX_BYTES = _env("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024, int)
+RESPONSE_CACHE_MAX_ENTRY_BYTES = _env("RESPONSE_CACHE_MAX_ENTRY_BYTES", 1024 * 1024, int)
+# How long (in seconds) each route's responses are kept.  Changes made through api/services.py
+#  take effect straight away (in every worker process), so this only matters if the tables are
+#  changed without the triggers, e.g. while utility/load_data.py has them switched off.  Written
+#  as route=seconds pairs, e.g. MOVIE_RESPONSE_CACHE_TTL_SECONDS=movies=30,users=5.  0 switches
+#  the cache off for a route.
+RESPONSE_CACHE_TTL_SECONDS = _env("RESPONSE_CACHE_TTL_SECONDS", {"movies": 30.0, "users": 30.0, "movie_ratings": 10.0},
+                                  lambda value: {route.strip(): float(seconds) for route, seconds in
+                                                 (pair.split("=") for pair in value.split(",") if pair.strip())})
+# The TTL of a route that isn't in RESPONSE_CACHE_TTL_SECONDS
+RESPONSE_CACHE_DEFAULT_TTL_SECONDS = _env("RESPONSE_CACHE_DEFAULT_TTL_SECONDS", 30.0, float)
+# How long (in seconds) a request waits for another request that is building the same response
+#  before giving up with 503 Service Unavailable
+RESPONSE_CACHE_WAIT_TIMEOUT = _env("RESPONSE_CACHE_WAIT_TIMEOUT", 10.0, float)
+
+# ---------------------------------------------------------
+# Compression
+# ---------------------------------------------------------
+# Compress responses for clients that accept gzip (or brotli, if the brotli package is installed),
+#  see api/compression.py.  Set MOVIE_COMPRESSION_ENABLED=0 to always send them uncompressed.
+COMPRESSION_ENABLED = _env("COMPRESSION_ENABLED", True, _bool)
+# Responses smaller than this (in bytes) aren't worth compressing
+COMPRESSION_MIN_BYTES = _env("COMPRESSION_MIN_BYTES", 1024, int)
+# How hard to compress, from 1 (fastest) to 9 for gzip and 0 to 11 for brotli.  Responses from the
+#  response cache are only compressed once, but the rest are compressed on every request.
+COMPRESSION_GZIP_LEVEL = _env("COMPRESSION_GZIP_LEVEL", 6, int)
+COMPRESSION_BROTLI_QUALITY = _env("COMPRESSION_BROTLI_QUALITY", 5, int)
+# The content types that are compressed (images and the like are compressed already)
+COMPRESSION_MIMETYPES = _env("COMPRESSION_MIMETYPES", ["application/json", "text/plain", "text/html"],
+                             lambda value: [mimetype.strip() for mimetype in value.split(",")])
+
+# ---------------------------------------------------------
+# Serialization
+# ---------------------------------------------------------
+# The JSON encoder used for the list endpoints (see api/serialization.py): "orjson" (much faster,
+#  but the orjson package has to be installed), "json" (the standard library, the same bytes as
+#  Flask's jsonify) or "auto" for orjson if it is installed and json otherwise
+JSON_ENCODER = _env("JSON_ENCODER", "auto")
+
+# ---------------------------------------------------------
+# Rankings
+# ---------------------------------------------------------
+# How many "imaginary" average ratings every movie starts with when ranking the top movies
+#  (see api/migrations.py).  The higher it is, the more ratings a movie needs before its own
+#  average outweighs the overall average.
+RANKING_PRIOR_WEIGHT = _env("RANKING_PRIOR_WEIGHT", 5.0, float)
+
+# ---------------------------------------------------------
+# Name searches
+# ---------------------------------------------------------
+# Answer the "contains" name searches (and the typo-tolerant ones) from the in-memory trigram
+#  index in api/trigram.py.  Set MOVIE_TRIGRAM_INDEX_ENABLED=0 to use LIKE '%...%' instead.
+TRIGRAM_INDEX_ENABLED = _env("TRIGRAM_INDEX_ENABLED", True, _bool)
+# How long (in seconds) an index is used before it is rebuilt from the database.  Changes made through
+#  api/services.py update it straight away, so this only matters for changes made some other way.
+#  0 means never rebuild.
+TRIGRAM_MAX_AGE_SECONDS = _env("TRIGRAM_MAX_AGE_SECONDS", 300.0, float)
+# How alike (from 0 to 1) a name has to be to the search text to be returned by a fuzzy search
+TRIGRAM_SIMILARITY_THRESHOLD = _env("TRIGRAM_SIMILARITY_THRESHOLD", 0.3, float)
+
+# ---------------------------------------------------------
+# Recommendations
+# ---------------------------------------------------------
+# How many of its most similar movies are kept for each movie (see api/recommender.py).  More
+#  neighbours give better recommendations for users with few ratings, but a bigger table.
+RECOMMENDER_NEIGHBOURS = _env("RECOMMENDER_NEIGHBOURS", 50, int)
+# How many users have to have rated two movies before they can count as similar.  With 1, two
+#  movies rated by a single user in common can look very alike by chance.
+RECOMMENDER_MIN_COMMON_USERS = _env("RECOMMENDER_MIN_COMMON_USERS", 1, int)
+# The similarities are worked out for a block of movies at a time, against every movie.  This is
+#  the most (block x movies) values held in memory at once (8 bytes each, twice over).
+RECOMMENDER_BLOCK_CELLS = _env("RECOMMENDER_BLOCK_CELLS", 2000000, int)
+# How many ratings are read from SQLite at a time when loading them into NumPy
+RECOMMENDER_LOAD_BATCH_SIZE = _env("RECOMMENDER_LOAD_BATCH_SIZE", 100000, int)
+# A rating that is added, changed or deleted queues its movie in similarity_refresh_queue, and the
+#  similar movies of the queued movies are worked out again by a scheduled job
+#  (python utility/refresh_similarities.py, which calls services.refresh_similarities()).
+#  Set MOVIE_RECOMMENDER_REFRESH_ON_WRITE=1 to also start a refresh on a background thread after
+#  every write.  The refresh reads every rating of every user who rated the movie and holds the
+#  write lock while it works, so it never runs on the request itself.
+RECOMMENDER_REFRESH_ON_WRITE = _env("RECOMMENDER_REFRESH_ON_WRITE", False, _bool)
+
+# ---------------------------------------------------------
+# Similar movies
+# ---------------------------------------------------------
+# How many similar movies the index behind /api/movies/<id>/similar keeps for each movie (see api/similar_movies.py)
+SIMILAR_MOVIES_COUNT = _env("SIMILAR_MOVIES_COUNT", 20, int)
+# How much each way of being alike counts towards the similarity of two movies.  Only their sizes
+#  relative to each other matter.
+SIMILAR_MOVIES_RATINGS_WEIGHT = _env("SIMILAR_MOVIES_RATINGS_WEIGHT", 0.5, float)
+SIMILAR_MOVIES_GENRE_WEIGHT = _env("SIMILAR_MOVIES_GENRE_WEIGHT", 0.25, float)
+SIMILAR_MOVIES_DIRECTOR_WEIGHT = _env("SIMILAR_MOVIES_DIRECTOR_WEIGHT", 0.15, float)
+SIMILAR_MOVIES_YEAR_WEIGHT = _env("SIMILAR_MOVIES_YEAR_WEIGHT", 0.1, float)
+# How many years apart two movies have to be for their release years to count for nothing (more than 0)
+SIMILAR_MOVIES_YEAR_SPAN = _env("SIMILAR_MOVIES_YEAR_SPAN", 10.0, float)
+# Where the index is saved.  By default it goes next to the database (data/movie_data.similar.npy).
+SIMILAR_MOVIES_INDEX_PATH = _env("SIMILAR_MOVIES_INDEX_PATH", None, Path)
+
+# ---------------------------------------------------------
+# Analytics
+# ---------------------------------------------------------
+# The /api/analytics endpoints work from a snapshot of the ratings held in memory (see api/analytics.py).
+# How long (in seconds) a snapshot is used before a new one is taken.  0 means never.
+ANALYTICS_MAX_AGE_SECONDS = _env("ANALYTICS_MAX_AGE_SECONDS", 300.0, float)
+# A new snapshot is also taken once this many ratings, movies or users have been added, changed or
+#  deleted through api/services.py since the last one.  0 means never.
+ANALYTICS_REFRESH_AFTER_WRITES = _env("ANALYTICS_REFRESH_AFTER_WRITES", 1000, int)
+# How many ratings are read from SQLite at a time when taking a snapshot
+ANALYTICS_LOAD_BATCH_SIZE = _env("ANALYTICS_LOAD_BATCH_SIZE", 100000, int)
+# The percentiles /api/analytics/<users or movies>/activity returns when none are asked for
+ANALYTICS_PERCENTILES = _env("ANALYTICS_PERCENTILES", [25.0, 50.0, 75.0, 90.0, 99.0],
+                             lambda value: [float(percentile) for percentile in value.split(",")])
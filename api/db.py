@@ -0,0 +1,395 @@
+# In this file, we manage the connections to the SQLite database.
+# Opening a new sqlite3 connection for every query is surprisingly expensive: SQLite has to open
+#  the file and parse the schema every time.  Instead, we keep a small pool of connections open
+#  and hand them out to whoever needs one.  When the caller is done, the connection goes back
+#  into the pool so the next caller can reuse it.
+#
+# Most code should use the get_connection() context manager:
+#
+#     with get_connection() as conn:
+#         rows = conn.execute("SELECT * FROM users").fetchall()
+#
+# Inside a Flask request, every call to get_connection() shares the same connection, and the
+#  connection is returned to the pool when the request finishes (see run.create_app).
+#  Outside of a request (tests, scripts) the connection is returned as soon as the with block ends.
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from flask import g, has_app_context
+
+from api import config, migrations
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes free within the pool timeout."""
+
+
+def connect(database_path: Path = None, pragmas: dict = None) -> sqlite3.Connection:
+    """
+    Open a new, fully initialised connection to the SQLite database.
+
+    The connection uses sqlite3.Row as the row factory so columns can be accessed by name,
+    and every PRAGMA in the pragmas dictionary is applied before the connection is returned.
+
+    Args:
+        database_path (Path, optional): The database file to open. Defaults to config.DATABASE_PATH.
+        pragmas (dict, optional): PRAGMA name/value pairs to apply. Defaults to config.DB_PRAGMAS.
+
+    Returns:
+        sqlite3.Connection: A connection object to the SQLite database.
+    """
+    database_path = database_path or config.DATABASE_PATH
+    pragmas = config.DB_PRAGMAS if pragmas is None else pragmas
+    # check_same_thread is turned off because a pooled connection may be used by
+    #  different threads over its life (but never by two threads at the same time)
+    connection = sqlite3.connect(database_path, check_same_thread=False)
+    connection.row_factory = sqlite3.Row  # This allows you to access columns by name
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name} = {value}")
+    return connection
+
+
+class ConnectionPool:
+    """
+    A bounded pool of SQLite connections.
+
+    Connections are opened lazily, up to `size` of them.  When every connection is checked out,
+    callers wait (up to `timeout` seconds) for one to be returned.  A connection that has been
+    sitting idle for longer than `health_check_interval` seconds is pinged before it is handed
+    out, and replaced if it turns out to be broken.
+    """
+
+    def __init__(self, database_path: Path, size: int, timeout: float,
+                 health_check_interval: float, pragmas: dict = None):
+        self.database_path = database_path
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pragmas = pragmas
+        # Idle connections are stored as (connection, time it was returned) tuples.
+        # A LIFO queue keeps the most recently used (and so most likely healthy) connections at the front.
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._in_use = 0
+        self._closed = False
+        # Metrics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._peak_in_use = 0
+        # Functions that will be called as listener(wait_seconds, in_use, size) on every checkout
+        self.checkout_listeners = []
+
+    def _open(self) -> sqlite3.Connection:
+        return connect(self.database_path, self.pragmas)
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self) -> sqlite3.Connection:
+        """
+        Check a connection out of the pool, opening a new one if the pool isn't full yet.
+
+        Returns:
+            sqlite3.Connection: A healthy connection that the caller must hand back with release().
+        Raises:
+            PoolTimeoutError: If no connection became free within the pool timeout.
+        """
+        if self._closed:
+            raise RuntimeError("The connection pool has been closed")
+        started = time.perf_counter()
+        # returned_at stays None for brand new connections, which never need a health check
+        returned_at = None
+        try:
+            conn, returned_at = self._idle.get_nowait()
+        except queue.Empty:
+            # Reserve a slot for a brand new connection if we haven't hit the limit yet
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                try:
+                    conn, returned_at = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"No database connection became free within {self.timeout} seconds"
+                    )
+
+        # Connections that have been idle for a while get a quick health check
+        idle_for = time.monotonic() - returned_at if returned_at is not None else 0.0
+        if idle_for > self.health_check_interval and not self._is_healthy(conn):
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            # The broken connection's slot is reused, so give it up if a new one can't be opened
+            try:
+                conn = self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            in_use = self._in_use
+        for listener in self.checkout_listeners:
+            listener(waited, in_use, self.size)
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """
+        Return a connection to the pool.  Any transaction left open by the caller is rolled back.
+
+        Args:
+            conn (sqlite3.Connection): A connection previously returned by acquire().
+        """
+        with self._lock:
+            self._in_use -= 1
+        if self._closed:
+            conn.close()
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # The connection is broken, throw it away and free up its slot
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def checkpoint(self, mode: str = "PASSIVE") -> tuple:
+        """
+        Copy the pages in the write-ahead log back into the database file.
+        This does nothing useful (but is harmless) if the database isn't in WAL mode.
+
+        Args:
+            mode (str, optional): PASSIVE, FULL, RESTART or TRUNCATE. See https://www.sqlite.org/pragma.html#pragma_wal_checkpoint
+
+        Returns:
+            tuple: (busy, wal pages, pages checkpointed) as reported by SQLite.
+        """
+        conn = self.acquire()
+        try:
+            return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+        finally:
+            self.release(conn)
+
+    def close(self, checkpoint_mode: str = None):
+        """
+        Close every idle connection.  Connections still checked out are closed when released.
+
+        Args:
+            checkpoint_mode (str, optional): If given, checkpoint the WAL with this mode before closing.
+        """
+        if checkpoint_mode and not self._closed:
+            try:
+                self.checkpoint(checkpoint_mode)
+            except sqlite3.Error:
+                # Another process is still using the WAL, SQLite will checkpoint it later
+                pass
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+    def stats(self) -> dict:
+        """
+        Return a snapshot of the pool metrics.
+
+        Returns:
+            dict: The pool size, connections opened/in use, checkout count, wait times and saturation
+                  (the fraction of the pool currently checked out).
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "in_use": self._in_use,
+                "peak_in_use": self._peak_in_use,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "total_wait_seconds": self._total_wait,
+                "max_wait_seconds": self._max_wait,
+                "average_wait_seconds": self._total_wait / self._checkouts if self._checkouts else 0.0,
+                "saturation": self._in_use / self.size,
+            }
+
+
+# ---------------------------------------------------------
+# The shared pool used by the API
+# ---------------------------------------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _build_pool(database_path: Path = None, size: int = None, timeout: float = None,
+                health_check_interval: float = None, pragmas: dict = None) -> ConnectionPool:
+    pool = ConnectionPool(
+        database_path=database_path or config.DATABASE_PATH,
+        size=size or config.DB_POOL_SIZE,
+        timeout=timeout if timeout is not None else config.DB_POOL_TIMEOUT,
+        health_check_interval=(
+            health_check_interval if health_check_interval is not None
+            else config.DB_POOL_HEALTH_CHECK_INTERVAL
+        ),
+        pragmas=pragmas,
+    )
+    # Bring the schema up to date before anyone else gets to use the database
+    if config.DB_AUTO_MIGRATE:
+        conn = pool.acquire()
+        try:
+            migrations.migrate(conn)
+        finally:
+            pool.release(conn)
+    return pool
+
+
+def init_pool(database_path: Path = None, size: int = None, timeout: float = None,
+              health_check_interval: float = None, pragmas: dict = None) -> ConnectionPool:
+    """
+    (Re)create the shared connection pool.  Any previous pool is closed first.
+    Arguments left as None fall back to the values in api.config.
+
+    Returns:
+        ConnectionPool: The new shared pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close(config.DB_CHECKPOINT_ON_CLOSE)
+        _pool = _build_pool(database_path, size, timeout, health_check_interval, pragmas)
+        return _pool
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Return the shared connection pool, creating it on first use.
+
+    Returns:
+        ConnectionPool: The shared pool.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            # Check again now that we hold the lock, another thread may have beaten us to it
+            if _pool is None:
+                _pool = _build_pool()
+    return _pool
+
+
+def close_pool():
+    """Close the shared pool (if there is one), checkpointing the WAL first."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close(config.DB_CHECKPOINT_ON_CLOSE)
+            _pool = None
+
+
+# Make sure the WAL is checkpointed and the connections are closed when the process exits
+atexit.register(close_pool)
+
+
+def checkpoint(mode: str = "PASSIVE") -> tuple:
+    """
+    Checkpoint the shared pool's database.  SQLite already checkpoints automatically once the WAL
+    reaches wal_autocheckpoint pages; this is for running one at a quiet moment (or from a script).
+
+    Args:
+        mode (str, optional): PASSIVE, FULL, RESTART or TRUNCATE. Defaults to PASSIVE.
+
+    Returns:
+        tuple: (busy, wal pages, pages checkpointed) as reported by SQLite.
+    """
+    return get_pool().checkpoint(mode)
+
+
+@contextmanager
+def get_connection():
+    """
+    Context manager that provides a pooled database connection.
+
+    Inside a Flask application context the connection is pinned to the request (flask.g), so every
+    call during the request shares it, and it is returned by release_request_connection() when the
+    request ends.  Outside of an application context the connection is returned to the pool as soon
+    as the with block exits.  If the block raises, any open transaction is rolled back.
+
+    Yields:
+        sqlite3.Connection: A connection to the SQLite database.
+    """
+    if has_app_context():
+        conn = g.get("_db_connection")
+        if conn is None:
+            # Remember which pool the connection came from, in case the pool is replaced mid-request
+            g._db_pool = get_pool()
+            conn = g._db_connection = g._db_pool.acquire()
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        return
+
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def release_request_connection(exception=None):
+    """
+    Return the connection pinned to the current request (if any) to the pool.
+    This is registered as an app teardown function in run.create_app.
+
+    Args:
+        exception (Exception, optional): The exception that ended the request, supplied by Flask.
+    """
+    conn = g.pop("_db_connection", None)
+    pool = g.pop("_db_pool", None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def pool_stats() -> dict:
+    """
+    Return the metrics of the shared pool.
+
+    Returns:
+        dict: See ConnectionPool.stats().
+    """
+    return get_pool().stats()
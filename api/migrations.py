@@ -0,0 +1,860 @@
+# In this file, we keep track of changes to the database schema.
+# Rather than editing the database by hand, every change is written down as a numbered migration.
+#  SQLite gives every database a free integer, PRAGMA user_version, which we use to remember
+#  which migrations have already been applied.  When the API starts up (the first time the
+#  connection pool is used) any migrations newer than the database's user_version are applied,
+#  in order, and the user_version is bumped.
+#
+# To change the schema, add a new Migration to the end of the MIGRATIONS list with the next
+#  version number.  Never edit a migration that has already been released, because databases
+#  that have already applied it will never run it again.
+import sqlite3
+from collections import namedtuple
+
+from api import config, recommender
+
+# A migration has a version number, a short description and a list of SQL statements to run.
+#  If a change can't be expressed in plain SQL, `steps` can instead be a function that takes the
+#  connection and makes the change itself.
+Migration = namedtuple("Migration", ["version", "description", "steps"])
+
+MIGRATIONS = [
+    Migration(1, "Secondary indexes for the lookups in api/services.py", [
+        # get_movie_ratings filters on movie_id and returns the ratings in rating_id order.
+        #  Including rating makes the index covering for anything that only needs the scores
+        #  (averages, counts, histograms)
+        "CREATE INDEX IF NOT EXISTS idx_ratings_movie_id_rating ON ratings (movie_id, rating_id, rating)",
+        # get_user_ratings filters on user_id, and a user's ratings are usually wanted by date
+        "CREATE INDEX IF NOT EXISTS idx_ratings_user_id_date ON ratings (user_id, date)",
+        # LIKE is case-insensitive, so SQLite can only use an index for `username LIKE 'abc%'`
+        #  if the index uses the NOCASE collation
+        "CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users (username COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_movies_title_nocase ON movies (title COLLATE NOCASE)",
+    ]),
+    # create_rating_stats is defined further down, the lambda looks it up when the migration runs
+    Migration(2, "Per-movie rating aggregates, kept up to date by triggers",
+              lambda conn: create_rating_stats(conn)),
+    Migration(3, "Bayesian ranking score for the top movies lists",
+              lambda conn: create_rankings(conn)),
+    Migration(4, "Full-text search over movies and reviews",
+              lambda conn: create_search_index(conn)),
+    Migration(5, "Indexes for the movie filters in api/query_builder.py", [
+        # The filters compare text with the NOCASE collation, so the indexes have to use it too.
+        #  Genre and year are often used together (e.g. dramas from the 1990s)
+        "CREATE INDEX IF NOT EXISTS idx_movies_genre_nocase_year ON movies (genre COLLATE NOCASE, release_year)",
+        "CREATE INDEX IF NOT EXISTS idx_movies_director_nocase ON movies (director COLLATE NOCASE)",
+    ]),
+    Migration(6, "Genre and person tables, linked to the movies",
+              lambda conn: create_movie_links(conn)),
+    Migration(7, "Similar movies for the recommendations, worked out from the ratings",
+              lambda conn: create_item_similarities(conn)),
+    Migration(8, "ISO rating dates, and daily rating rollups for the trends",
+              lambda conn: create_rating_rollups(conn)),
+    Migration(9, "Row versions and table generations for the HTTP conditional requests",
+              lambda conn: create_versioning(conn)),
+]
+
+
+# ---------------------------------------------------------
+# Rating aggregates (migration 2)
+# ---------------------------------------------------------
+# movie_rating_stats holds one row per rated movie with running totals of its ratings.  The mean
+#  is rating_sum / rating_count and the variance is rating_sum_squares / rating_count - mean^2,
+#  so reading the stats for a movie is a single primary key lookup however many ratings it has.
+#  The triggers below keep the totals up to date whenever a rating is added, changed or deleted,
+#  so every way of writing to the ratings table (the API, scripts, the sqlite3 shell) is covered.
+RATING_STATS_TABLE = """
+    CREATE TABLE IF NOT EXISTS movie_rating_stats (
+        movie_id INTEGER PRIMARY KEY,
+        rating_count INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        rating_sum_squares INTEGER NOT NULL DEFAULT 0,
+        count_1 INTEGER NOT NULL DEFAULT 0,
+        count_2 INTEGER NOT NULL DEFAULT 0,
+        count_3 INTEGER NOT NULL DEFAULT 0,
+        count_4 INTEGER NOT NULL DEFAULT 0,
+        count_5 INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+# Add a rating to (sign = +1) or take it away from (sign = -1) its movie's totals.
+#  The comparisons (rating = 1 etc.) are 1 when true and 0 when false, which fills in the histogram.
+#  Ratings outside 1-5 still count towards the totals, they just don't show up in the histogram.
+_APPLY_RATING = """
+    INSERT INTO movie_rating_stats (movie_id, rating_count, rating_sum, rating_sum_squares,
+                                    count_1, count_2, count_3, count_4, count_5)
+    VALUES ({row}.movie_id, {sign}, {sign} * {row}.rating, {sign} * {row}.rating * {row}.rating,
+            {sign} * ({row}.rating = 1), {sign} * ({row}.rating = 2), {sign} * ({row}.rating = 3),
+            {sign} * ({row}.rating = 4), {sign} * ({row}.rating = 5))
+    ON CONFLICT (movie_id) DO UPDATE SET
+        rating_count = rating_count + excluded.rating_count,
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_sum_squares = rating_sum_squares + excluded.rating_sum_squares,
+        count_1 = count_1 + excluded.count_1,
+        count_2 = count_2 + excluded.count_2,
+        count_3 = count_3 + excluded.count_3,
+        count_4 = count_4 + excluded.count_4,
+        count_5 = count_5 + excluded.count_5;
+"""
+ADD_NEW_RATING = _APPLY_RATING.format(row="NEW", sign=1)
+REMOVE_OLD_RATING = _APPLY_RATING.format(row="OLD", sign=-1)
+
+RATING_STATS_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_stats_insert AFTER INSERT ON ratings
+        WHEN NEW.rating IS NOT NULL AND NEW.movie_id IS NOT NULL
+        BEGIN {ADD_NEW_RATING} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_stats_delete AFTER DELETE ON ratings
+        WHEN OLD.rating IS NOT NULL AND OLD.movie_id IS NOT NULL
+        BEGIN {REMOVE_OLD_RATING} END""",
+    # An update is the old rating taken away and the new one added (it may even be for another movie)
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_stats_remove_old AFTER UPDATE OF movie_id, rating ON ratings
+        WHEN OLD.rating IS NOT NULL AND OLD.movie_id IS NOT NULL
+        BEGIN {REMOVE_OLD_RATING} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_stats_add_new AFTER UPDATE OF movie_id, rating ON ratings
+        WHEN NEW.rating IS NOT NULL AND NEW.movie_id IS NOT NULL
+        BEGIN {ADD_NEW_RATING} END""",
+]
+
+
+def rebuild_rating_stats(conn: sqlite3.Connection):
+    """
+    Recalculate movie_rating_stats from scratch from the ratings table.
+
+    The triggers keep the totals right on their own, this is for filling the table in the first
+    time and for repairing it if the triggers were ever missing (e.g. after a bulk load that
+    dropped them).  The caller is responsible for committing.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    conn.execute("DELETE FROM movie_rating_stats")
+    conn.execute("""
+        INSERT INTO movie_rating_stats (movie_id, rating_count, rating_sum, rating_sum_squares,
+                                        count_1, count_2, count_3, count_4, count_5)
+        SELECT movie_id, COUNT(*), SUM(rating), SUM(rating * rating),
+               SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+        FROM ratings
+        WHERE rating IS NOT NULL AND movie_id IS NOT NULL
+        GROUP BY movie_id
+    """)
+
+
+def create_rating_stats(conn: sqlite3.Connection):
+    """
+    Create the movie_rating_stats table and its triggers, and fill it in from the existing ratings.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    conn.execute(RATING_STATS_TABLE)
+    for trigger in RATING_STATS_TRIGGERS:
+        conn.execute(trigger)
+    rebuild_rating_stats(conn)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """
+    Return the schema version of the database (the number of the last migration applied).
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+
+    Returns:
+        int: The schema version, 0 for a database that has never been migrated.
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def latest_version() -> int:
+    """
+    Return the version number of the newest migration.
+
+    Returns:
+        int: The highest version in MIGRATIONS.
+    """
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def migrate(conn: sqlite3.Connection, target_version: int = None) -> list:
+    """
+    Apply every migration newer than the database's schema version.
+
+    Each migration runs in its own transaction together with the user_version update, so a
+    migration is either applied completely or not at all.  BEGIN IMMEDIATE takes the write lock
+    up front, so if two processes start at the same time only one of them applies each migration.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+        target_version (int, optional): Stop after this version. Defaults to the latest migration.
+
+    Returns:
+        list: The version numbers of the migrations that were applied.
+    """
+    if target_version is None:
+        target_version = latest_version()
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version > target_version:
+            break
+        # Cheap check first, so an up-to-date database never takes the write lock
+        if migration.version <= get_schema_version(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Check again now that we hold the lock, another process may have just applied it
+            if migration.version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            if callable(migration.steps):
+                migration.steps(conn)
+            else:
+                for statement in migration.steps:
+                    conn.execute(statement)
+            # PRAGMA statements can't use ? parameters, but the version is always an int we control
+            conn.execute(f"PRAGMA user_version = {int(migration.version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(migration.version)
+    return applied
+
+
+# ---------------------------------------------------------
+# Rankings (migration 3)
+# ---------------------------------------------------------
+# Sorting movies by their plain average rating puts a movie with a single 5 star rating above one
+#  with a thousand ratings averaging 4.9.  Instead we rank by a damped (Bayesian) average:
+#
+#     rank_score = (prior_weight * prior_mean + rating_sum) / (prior_weight + rating_count)
+#
+#  which is the movie's average after adding prior_weight "imaginary" ratings of prior_mean (the
+#  average rating over all movies).  A movie with few ratings stays close to the overall average,
+#  and the more ratings it gets the closer its score gets to its own average.
+#
+# The score is stored in movies.rank_score with indexes on it, so the top N movies (overall, for a
+#  genre or for a year) can be read straight off an index instead of aggregating every rating.
+#  A trigger recalculates a movie's score whenever its movie_rating_stats row changes, using the
+#  prior stored in the one-row ranking_prior table.  The prior mean itself drifts as ratings come
+#  in, refresh_rankings() recalculates it and every movie's score.
+RANKING_TABLES = [
+    "ALTER TABLE movies ADD COLUMN rank_score REAL",
+    # CHECK (id = 1) makes sure the table can only ever have the one row
+    """CREATE TABLE IF NOT EXISTS ranking_prior (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        prior_mean REAL NOT NULL,
+        prior_weight REAL NOT NULL
+    )""",
+    # rank_score on its own for the overall list, and after genre/release_year for the filtered ones.
+    #  A movie with no ratings has a NULL score, which sorts after every real score when we sort DESC.
+    "CREATE INDEX IF NOT EXISTS idx_movies_rank_score ON movies (rank_score)",
+    "CREATE INDEX IF NOT EXISTS idx_movies_genre_rank_score ON movies (genre, rank_score)",
+    "CREATE INDEX IF NOT EXISTS idx_movies_release_year_rank_score ON movies (release_year, rank_score)",
+]
+
+_UPDATE_RANK_SCORE = """
+    UPDATE movies SET rank_score = CASE WHEN NEW.rating_count > 0 THEN
+        (SELECT (p.prior_weight * p.prior_mean + NEW.rating_sum) / (p.prior_weight + NEW.rating_count)
+         FROM ranking_prior p WHERE p.id = 1)
+        END
+    WHERE movie_id = NEW.movie_id;
+"""
+
+RANKING_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS rating_stats_rank_insert AFTER INSERT ON movie_rating_stats
+        BEGIN {_UPDATE_RANK_SCORE} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rating_stats_rank_update AFTER UPDATE ON movie_rating_stats
+        BEGIN {_UPDATE_RANK_SCORE} END""",
+]
+
+
+def refresh_rankings(conn: sqlite3.Connection, prior_weight: float = None):
+    """
+    Recalculate the prior mean and every movie's rank_score.
+
+    The triggers keep each movie's score up to date as it is rated, but they use the prior mean
+    from the last refresh.  Run this every now and then (utility/load_data.py --rebuild-stats
+    does) to pick up the drift.  The caller is responsible for committing.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+        prior_weight (float, optional): How many "imaginary" average ratings every movie starts with.
+                                        Defaults to config.RANKING_PRIOR_WEIGHT.
+    """
+    if prior_weight is None:
+        prior_weight = config.RANKING_PRIOR_WEIGHT
+    # The average over every rating of every movie.  With no ratings at all, use the middle of the scale.
+    conn.execute("""
+        INSERT INTO ranking_prior (id, prior_mean, prior_weight)
+        SELECT 1, COALESCE(SUM(rating_sum) * 1.0 / NULLIF(SUM(rating_count), 0), 3.0), ?
+        FROM movie_rating_stats
+        WHERE true
+        ON CONFLICT (id) DO UPDATE SET prior_mean = excluded.prior_mean, prior_weight = excluded.prior_weight
+    """, (prior_weight,))
+    conn.execute("""
+        UPDATE movies SET rank_score = (
+            SELECT (p.prior_weight * p.prior_mean + s.rating_sum) / (p.prior_weight + s.rating_count)
+            FROM movie_rating_stats s, ranking_prior p
+            WHERE s.movie_id = movies.movie_id AND s.rating_count > 0 AND p.id = 1
+        )
+    """)
+
+
+def create_rankings(conn: sqlite3.Connection):
+    """
+    Add the rank_score column, its indexes, the ranking_prior table and the triggers, then
+    calculate every movie's score.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    for statement in RANKING_TABLES + RANKING_TRIGGERS:
+        conn.execute(statement)
+    refresh_rankings(conn)
+
+
+# ---------------------------------------------------------
+# Full-text search (migration 4)
+# ---------------------------------------------------------
+# A LIKE '%term%' search has to read every row of the table.  SQLite's FTS5 extension keeps an
+#  inverted index instead: for every word, the list of rows that contain it.  movies_fts indexes
+#  the title, director and genre of every movie and reviews_fts the text of every review.
+#
+# They are "external content" tables, which means they only store the index and read the text
+#  itself from the movies and ratings tables, so nothing is stored twice.  The catch is that FTS5
+#  can't see changes to those tables on its own, so the triggers below tell it about every insert,
+#  update and delete (an update is a delete of the old text and an insert of the new).
+SEARCH_TABLES = [
+    # remove_diacritics lets "amelie" find "Amélie"
+    """CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+        title, director, genre,
+        content='movies', content_rowid='movie_id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5(
+        review,
+        content='ratings', content_rowid='rating_id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    # Results are ordered by bm25 relevance.  A match in the title counts ten times as much as one
+    #  in the genre, and a match in the director five times as much.
+    "INSERT INTO movies_fts (movies_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')",
+]
+
+_MOVIES_FTS_INSERT = "INSERT INTO movies_fts (rowid, title, director, genre) VALUES (NEW.movie_id, NEW.title, NEW.director, NEW.genre);"
+_MOVIES_FTS_DELETE = ("INSERT INTO movies_fts (movies_fts, rowid, title, director, genre) "
+                      "VALUES ('delete', OLD.movie_id, OLD.title, OLD.director, OLD.genre);")
+_REVIEWS_FTS_INSERT = "INSERT INTO reviews_fts (rowid, review) VALUES (NEW.rating_id, NEW.review);"
+_REVIEWS_FTS_DELETE = "INSERT INTO reviews_fts (reviews_fts, rowid, review) VALUES ('delete', OLD.rating_id, OLD.review);"
+
+SEARCH_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN {_MOVIES_FTS_INSERT} END",
+    f"CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN {_MOVIES_FTS_DELETE} END",
+    f"""CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF title, director, genre ON movies
+        BEGIN {_MOVIES_FTS_DELETE} {_MOVIES_FTS_INSERT} END""",
+    f"CREATE TRIGGER IF NOT EXISTS reviews_fts_insert AFTER INSERT ON ratings BEGIN {_REVIEWS_FTS_INSERT} END",
+    f"CREATE TRIGGER IF NOT EXISTS reviews_fts_delete AFTER DELETE ON ratings BEGIN {_REVIEWS_FTS_DELETE} END",
+    f"""CREATE TRIGGER IF NOT EXISTS reviews_fts_update AFTER UPDATE OF review ON ratings
+        BEGIN {_REVIEWS_FTS_DELETE} {_REVIEWS_FTS_INSERT} END""",
+]
+
+
+def rebuild_search_index(conn: sqlite3.Connection):
+    """
+    Rebuild the full-text indexes from scratch from the movies and ratings tables.
+
+    Needed after the tables were changed with the triggers missing (e.g. a bulk load).
+    The caller is responsible for committing.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    conn.execute("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO reviews_fts (reviews_fts) VALUES ('rebuild')")
+
+
+def create_search_index(conn: sqlite3.Connection):
+    """
+    Create the full-text search tables and their triggers, and index the existing movies and reviews.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    for statement in SEARCH_TABLES + SEARCH_TRIGGERS:
+        conn.execute(statement)
+    rebuild_search_index(conn)
+
+
+# ---------------------------------------------------------
+# Genres and directors (migration 6)
+# ---------------------------------------------------------
+# movies.genre and movies.director are free text, and a movie with several directors stores them
+#  all in one string ("Anthony Russo, Joe Russo").  Finding "every movie by Joe Russo" from those
+#  columns means a LIKE '%Joe Russo%' over every movie.  So every genre and every person gets a row
+#  of their own with an integer id, and the link tables say which movies they belong to:
+#
+#     genres (genre_id, name)      movie_genres (genre_id, movie_id)
+#     people (person_id, name)     movie_directors (person_id, movie_id)
+#
+# The link tables' primary keys start with the genre/person id, so "every movie in genre 3" is a
+#  range of the primary key, already in movie_id order.  The second index on each goes the other
+#  way, for "every genre of movie 42".
+#
+# The text columns stay as they are (the API still returns them), and the triggers below keep
+#  the new tables in step with them.  A comma separated value is split into one name per item.
+#  SQLite doesn't allow WITH in a trigger, so the list is turned into a JSON array (after escaping
+#  any \ and " in it) and split with json_each.
+MOVIE_LINK_TABLES = [
+    """CREATE TABLE IF NOT EXISTS genres (
+        genre_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE
+    )""",
+    """CREATE TABLE IF NOT EXISTS people (
+        person_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE
+    )""",
+    """CREATE TABLE IF NOT EXISTS movie_genres (
+        genre_id INTEGER NOT NULL REFERENCES genres (genre_id),
+        movie_id INTEGER NOT NULL REFERENCES movies (movie_id),
+        PRIMARY KEY (genre_id, movie_id)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS movie_directors (
+        person_id INTEGER NOT NULL REFERENCES people (person_id),
+        movie_id INTEGER NOT NULL REFERENCES movies (movie_id),
+        PRIMARY KEY (person_id, movie_id)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_movie_genres_movie_id ON movie_genres (movie_id, genre_id)",
+    "CREATE INDEX IF NOT EXISTS idx_movie_directors_movie_id ON movie_directors (movie_id, person_id)",
+    # The genre and director filters now go through the tables above (see api/query_builder.py),
+    #  so the text indexes added for them in migration 5 aren't used anymore
+    "DROP INDEX IF EXISTS idx_movies_genre_nocase_year",
+    "DROP INDEX IF EXISTS idx_movies_director_nocase",
+]
+
+
+def split_names(value: str) -> str:
+    """
+    The SQL for the list of names in a comma separated column, as a json_each() table.
+
+    Args:
+        value (str): The SQL for the column, e.g. "NEW.director".
+
+    Returns:
+        str: The SQL for a table with one row per item, the name is trim(value).
+    """
+    escaped = f"replace(replace({value}, '\\', '\\\\'), '\"', '\\\"')"
+    return f"""json_each('["' || replace({escaped}, ',', '","') || '"]')"""
+
+
+# (the movies column, the name table, its id column, the link table)
+_LINKS = [
+    ("genre", "genres", "genre_id", "movie_genres"),
+    ("director", "people", "person_id", "movie_directors"),
+]
+
+
+def _add_links(row: str, column: str, table: str, id_column: str, link_table: str) -> str:
+    """The statements that add the names in row.column (if they are new) and link them to the movie."""
+    names = split_names(f"{row}.{column}")
+    return f"""
+        INSERT OR IGNORE INTO {table} (name) SELECT trim(value) FROM {names} WHERE trim(value) <> '';
+        INSERT OR IGNORE INTO {link_table} ({id_column}, movie_id)
+            SELECT t.{id_column}, {row}.movie_id FROM {names} JOIN {table} t ON t.name = trim(value);
+    """
+
+
+def _unlink(row: str, link_table: str) -> str:
+    """The statement that unlinks every name from the movie."""
+    return f"DELETE FROM {link_table} WHERE movie_id = {row}.movie_id;"
+
+
+def _delete_unused(row: str, column: str, table: str, id_column: str, link_table: str) -> str:
+    """The statement that deletes the names in row.column that no movie uses anymore."""
+    names = split_names(f"{row}.{column}")
+    return f"""
+        DELETE FROM {table} WHERE name IN (SELECT trim(value) FROM {names})
+            AND NOT EXISTS (SELECT 1 FROM {link_table} l WHERE l.{id_column} = {table}.{id_column});
+    """
+
+
+MOVIE_LINK_TRIGGERS = []
+for _column, _table, _id_column, _link_table in _LINKS:
+    _add = _add_links("NEW", _column, _table, _id_column, _link_table)
+    _unlink_old = _unlink("OLD", _link_table)
+    _delete_old = _delete_unused("OLD", _column, _table, _id_column, _link_table)
+    MOVIE_LINK_TRIGGERS += [
+        f"CREATE TRIGGER IF NOT EXISTS movies_{_column}_links_insert AFTER INSERT ON movies BEGIN {_add} END",
+        f"""CREATE TRIGGER IF NOT EXISTS movies_{_column}_links_delete AFTER DELETE ON movies
+            BEGIN {_unlink_old} {_delete_old} END""",
+        # The new names are linked before the old ones are cleaned up, so a name the movie keeps keeps its id
+        f"""CREATE TRIGGER IF NOT EXISTS movies_{_column}_links_update AFTER UPDATE OF {_column} ON movies
+            BEGIN {_unlink_old} {_add} {_delete_old} END""",
+    ]
+
+
+def rebuild_movie_links(conn: sqlite3.Connection):
+    """
+    Rebuild the genre and director links from scratch from the movies table.
+
+    Needed after the movies were changed with the triggers missing (e.g. a bulk load).  Existing
+    genres and people keep their ids, so links held by clients stay valid.
+    The caller is responsible for committing.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    for column, table, id_column, link_table in _LINKS:
+        names = split_names(f"m.{column}")
+        conn.execute(f"DELETE FROM {link_table}")
+        conn.execute(f"""
+            INSERT OR IGNORE INTO {table} (name)
+            SELECT trim(value) FROM movies m, {names} WHERE trim(value) <> ''
+        """)
+        conn.execute(f"""
+            INSERT OR IGNORE INTO {link_table} ({id_column}, movie_id)
+            SELECT t.{id_column}, m.movie_id FROM movies m, {names} JOIN {table} t ON t.name = trim(value)
+        """)
+        conn.execute(f"""
+            DELETE FROM {table}
+            WHERE NOT EXISTS (SELECT 1 FROM {link_table} l WHERE l.{id_column} = {table}.{id_column})
+        """)
+
+
+def create_movie_links(conn: sqlite3.Connection):
+    """
+    Create the genre and person tables, their link tables and triggers, and fill them in from the existing movies.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    for statement in MOVIE_LINK_TABLES + MOVIE_LINK_TRIGGERS:
+        conn.execute(statement)
+    rebuild_movie_links(conn)
+
+
+# ---------------------------------------------------------
+# Similar movies (migration 7)
+# ---------------------------------------------------------
+# The recommendations (services.get_recommendations) are built from the most similar movies of
+#  each movie the user rated.  Working those out takes NumPy (see api/recommender.py), so they are
+#  worked out ahead of time and kept in item_similarities, one row per (movie, similar movie).
+#  Its primary key starts with movie_id, so a movie's similar movies are a range of the primary key.
+#
+# item_norms holds the sum of the squares of each movie's ratings, which the similarities are
+#  divided by, so working out a few movies again doesn't mean reading every rating.
+#
+# The triggers don't work anything out themselves, they just add the movie of every new, changed
+#  or deleted rating to similarity_refresh_queue.  recommender.refresh_similarities() then works
+#  out the similar movies of the queued movies (and the movies they affect) in one go.
+ITEM_SIMILARITY_TABLES = [
+    """CREATE TABLE IF NOT EXISTS item_similarities (
+        movie_id INTEGER NOT NULL,
+        neighbour_id INTEGER NOT NULL,
+        similarity REAL NOT NULL,
+        PRIMARY KEY (movie_id, neighbour_id)
+    ) WITHOUT ROWID""",
+    # Which movies have a changed movie as one of their similar movies
+    "CREATE INDEX IF NOT EXISTS idx_item_similarities_neighbour_id ON item_similarities (neighbour_id)",
+    """CREATE TABLE IF NOT EXISTS item_norms (
+        movie_id INTEGER PRIMARY KEY,
+        sum_squares REAL NOT NULL
+    )""",
+    "CREATE TABLE IF NOT EXISTS similarity_refresh_queue (movie_id INTEGER PRIMARY KEY)",
+]
+
+_QUEUE_NEW = "INSERT OR IGNORE INTO similarity_refresh_queue (movie_id) VALUES (NEW.movie_id);"
+_QUEUE_OLD = "INSERT OR IGNORE INTO similarity_refresh_queue (movie_id) VALUES (OLD.movie_id);"
+
+ITEM_SIMILARITY_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS ratings_similarity_insert AFTER INSERT ON ratings BEGIN {_QUEUE_NEW} END",
+    f"CREATE TRIGGER IF NOT EXISTS ratings_similarity_delete AFTER DELETE ON ratings BEGIN {_QUEUE_OLD} END",
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_similarity_update AFTER UPDATE OF user_id, movie_id, rating ON ratings
+        BEGIN {_QUEUE_OLD} {_QUEUE_NEW} END""",
+]
+
+
+def rebuild_item_similarities(conn: sqlite3.Connection):
+    """
+    Work out the similar movies of every movie from scratch (see recommender.build_similarities).
+
+    Needed after the ratings were changed with the triggers missing (e.g. a bulk load).
+    The caller is responsible for committing.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    recommender.build_similarities(conn)
+
+
+def create_item_similarities(conn: sqlite3.Connection):
+    """
+    Create the similar movies tables and triggers, and fill them in from the existing ratings.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    for statement in ITEM_SIMILARITY_TABLES + ITEM_SIMILARITY_TRIGGERS:
+        conn.execute(statement)
+    rebuild_item_similarities(conn)
+
+
+# ---------------------------------------------------------
+# Rating dates and daily rollups (migration 8)
+# ---------------------------------------------------------
+# The ratings loaded from the original CSV files had their dates written as m/d/yyyy, while the
+#  API and utility/load_data.py write ISO dates (yyyy-mm-dd).  Only ISO dates sort and compare
+#  properly as text ("10/1/2023" < "9/1/2023"), so this migration rewrites the old ones, and a
+#  trigger rewrites any m/d/yyyy date written later (by a client, a script or the sqlite3 shell).
+#  With every date in the same form, an index on ratings (date) answers date ranges.
+#
+# For the trends (/api/movies/<id>/trend) rating_daily_rollups keeps the count, sum and sum of
+#  squares of each movie's ratings per day, and rating_daily_totals the same for all the movies
+#  together.  Like movie_rating_stats (migration 2), triggers keep both up to date, so a year of
+#  trend for a movie is at most 366 rows of a primary key range, however many ratings it has.
+def iso_date_sql(column: str) -> str:
+    """
+    Return an SQL expression that turns a date in a column into an ISO date (yyyy-mm-dd).
+
+    Args:
+        column (str): The column (or NEW.column / OLD.column in a trigger).
+
+    Returns:
+        str: The expression.  It understands m/d/yyyy and ISO dates (with or without a time),
+             and is NULL for anything else.
+    """
+    # Split "m/d/yyyy" at its two slashes.  SQLite's date() checks the result, and passes ISO
+    #  dates through (dropping any time of day)
+    rest = f"substr({column}, instr({column}, '/') + 1)"
+    month = f"CAST(substr({column}, 1, instr({column}, '/') - 1) AS INTEGER)"
+    day = f"CAST(substr({rest}, 1, instr({rest}, '/') - 1) AS INTEGER)"
+    year = f"CAST(substr({rest}, instr({rest}, '/') + 1) AS INTEGER)"
+    return (f"date(CASE WHEN {column} LIKE '%/%/%' THEN printf('%04d-%02d-%02d', {year}, {month}, {day}) "
+            f"ELSE {column} END)")
+
+
+# Dates that can't be read are left as they are
+_NORMALISE_DATE = f"""
+    UPDATE ratings SET date = COALESCE({iso_date_sql("NEW.date")}, NEW.date) WHERE rating_id = NEW.rating_id;
+"""
+
+RATING_ROLLUP_TABLES = [
+    "CREATE INDEX IF NOT EXISTS idx_ratings_date ON ratings (date)",
+    # WITHOUT ROWID stores the rows in primary key order, so a movie's days are next to each other
+    """CREATE TABLE IF NOT EXISTS rating_daily_rollups (
+        movie_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        rating_count INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        rating_sum_squares INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (movie_id, day)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS rating_daily_totals (
+        day TEXT PRIMARY KEY,
+        rating_count INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        rating_sum_squares INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID""",
+]
+
+# Add a rating to (sign = +1) or take it away from (sign = -1) its movie's day and the day's totals
+_APPLY_DAILY_RATING = """
+    INSERT INTO rating_daily_rollups (movie_id, day, rating_count, rating_sum, rating_sum_squares)
+    VALUES ({row}.movie_id, {day}, {sign}, {sign} * {row}.rating, {sign} * {row}.rating * {row}.rating)
+    ON CONFLICT (movie_id, day) DO UPDATE SET
+        rating_count = rating_count + excluded.rating_count,
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_sum_squares = rating_sum_squares + excluded.rating_sum_squares;
+    INSERT INTO rating_daily_totals (day, rating_count, rating_sum, rating_sum_squares)
+    VALUES ({day}, {sign}, {sign} * {row}.rating, {sign} * {row}.rating * {row}.rating)
+    ON CONFLICT (day) DO UPDATE SET
+        rating_count = rating_count + excluded.rating_count,
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_sum_squares = rating_sum_squares + excluded.rating_sum_squares;
+"""
+_ADD_NEW_DAILY = _APPLY_DAILY_RATING.format(row="NEW", sign=1, day=iso_date_sql("NEW.date"))
+_REMOVE_OLD_DAILY = _APPLY_DAILY_RATING.format(row="OLD", sign=-1, day=iso_date_sql("OLD.date"))
+_NEW_COUNTS = f"NEW.rating IS NOT NULL AND NEW.movie_id IS NOT NULL AND {iso_date_sql('NEW.date')} IS NOT NULL"
+_OLD_COUNTS = f"OLD.rating IS NOT NULL AND OLD.movie_id IS NOT NULL AND {iso_date_sql('OLD.date')} IS NOT NULL"
+
+RATING_ROLLUP_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_normalise_date_insert AFTER INSERT ON ratings
+        WHEN NEW.date LIKE '%/%/%' BEGIN {_NORMALISE_DATE} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_normalise_date_update AFTER UPDATE OF date ON ratings
+        WHEN NEW.date LIKE '%/%/%' BEGIN {_NORMALISE_DATE} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_daily_insert AFTER INSERT ON ratings
+        WHEN {_NEW_COUNTS} BEGIN {_ADD_NEW_DAILY} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_daily_delete AFTER DELETE ON ratings
+        WHEN {_OLD_COUNTS} BEGIN {_REMOVE_OLD_DAILY} END""",
+    # Rewriting a date from m/d/yyyy to ISO is an update too, but it takes away and adds back the same day
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_daily_remove_old AFTER UPDATE OF movie_id, rating, date ON ratings
+        WHEN {_OLD_COUNTS} BEGIN {_REMOVE_OLD_DAILY} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ratings_daily_add_new AFTER UPDATE OF movie_id, rating, date ON ratings
+        WHEN {_NEW_COUNTS} BEGIN {_ADD_NEW_DAILY} END""",
+]
+
+
+def normalise_rating_dates(conn: sqlite3.Connection) -> int:
+    """
+    Rewrite the m/d/yyyy dates in the ratings table as ISO dates.  The caller is responsible for committing.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+
+    Returns:
+        int: The number of ratings changed.
+    """
+    iso_date = iso_date_sql("date")
+    cursor = conn.execute(f"UPDATE ratings SET date = {iso_date} WHERE date LIKE '%/%/%' AND {iso_date} IS NOT NULL")
+    return cursor.rowcount
+
+
+def rebuild_rating_rollups(conn: sqlite3.Connection):
+    """
+    Recalculate rating_daily_rollups and rating_daily_totals from scratch from the ratings table
+    (e.g. after a bulk load that dropped the triggers).  The caller is responsible for committing.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    conn.execute("DELETE FROM rating_daily_rollups")
+    conn.execute("DELETE FROM rating_daily_totals")
+    conn.execute(f"""
+        INSERT INTO rating_daily_rollups (movie_id, day, rating_count, rating_sum, rating_sum_squares)
+        SELECT movie_id, day, COUNT(*), SUM(rating), SUM(rating * rating)
+        FROM (SELECT movie_id, rating, {iso_date_sql("date")} AS day FROM ratings)
+        WHERE rating IS NOT NULL AND movie_id IS NOT NULL AND day IS NOT NULL
+        GROUP BY movie_id, day
+    """)
+    conn.execute("""
+        INSERT INTO rating_daily_totals (day, rating_count, rating_sum, rating_sum_squares)
+        SELECT day, SUM(rating_count), SUM(rating_sum), SUM(rating_sum_squares)
+        FROM rating_daily_rollups
+        GROUP BY day
+    """)
+
+
+def create_rating_rollups(conn: sqlite3.Connection):
+    """
+    Rewrite the old rating dates, then create the date index, the rollup tables and their
+    triggers, and fill the rollups in from the existing ratings.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    normalise_rating_dates(conn)
+    for statement in RATING_ROLLUP_TABLES + RATING_ROLLUP_TRIGGERS:
+        conn.execute(statement)
+    rebuild_rating_rollups(conn)
+
+
+# ---------------------------------------------------------
+# Row versions and table generations (migration 9)
+# ---------------------------------------------------------
+# Clients and caches in front of the API send back the ETag or Last-Modified header of a response
+#  they already have (If-None-Match / If-Modified-Since), and get a 304 Not Modified with no body if
+#  it is still up to date (see api/conditional.py).  To answer that without reading the rows:
+#   - every movie, user and rating has a row_version, which goes up by one each time the row is
+#     changed, and an updated_at time (NULL for rows bulk loaded by utility/load_data.py, which
+#     haven't changed since the table's reset_at),
+#   - table_generations has a generation per table, which goes up by one each time any row of the
+#     table is added, changed or deleted, and the time that last happened (changed_at).
+#  Triggers keep both up to date.  Each table also gets a random epoch when its generation row is
+#  created, so a database rebuilt from scratch (generation 1 again) never reuses an old ETag.
+#
+# Only changes to the columns the API returns count: e.g. the rankings rewrite movies.rank_score
+#  after every rating, which mustn't make every cached copy of the movie out of date.
+VERSIONED_TABLES = {
+    # table: (primary key, the columns whose changes count)
+    "movies": ("movie_id", "title, genre, release_year, director"),
+    "users": ("user_id", "username, email, date_joined"),
+    "ratings": ("rating_id", "user_id, movie_id, rating, review, date"),
+}
+
+# The times are stored as ISO text in UTC, to the second like the HTTP dates they end up in
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%SZ', 'now')"
+
+VERSIONING_TABLES = [
+    """CREATE TABLE IF NOT EXISTS table_generations (
+        table_name TEXT PRIMARY KEY,
+        generation INTEGER NOT NULL DEFAULT 1,
+        epoch TEXT NOT NULL,
+        changed_at TEXT NOT NULL,
+        reset_at TEXT NOT NULL
+    )""",
+]
+
+
+def _bump_generation(table: str) -> str:
+    return (f"UPDATE table_generations SET generation = generation + 1, changed_at = {NOW_SQL} "
+            f"WHERE table_name = '{table}';")
+
+
+def versioning_triggers(table: str, key_column: str, columns: str) -> list:
+    """
+    Return the triggers that keep a table's row versions and generation up to date.
+
+    Args:
+        table (str): The table (a key of VERSIONED_TABLES).
+        key_column (str): Its primary key.
+        columns (str): The columns whose changes count, comma separated.
+
+    Returns:
+        list: The CREATE TRIGGER statements.
+    """
+    # The triggers only update row_version and updated_at, which aren't in `columns`, so they
+    #  never set themselves (or the other UPDATE OF triggers) off again
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_version_insert AFTER INSERT ON {table} BEGIN
+            UPDATE {table} SET updated_at = {NOW_SQL} WHERE {key_column} = NEW.{key_column} AND updated_at IS NULL;
+            {_bump_generation(table)}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_version_update AFTER UPDATE OF {columns} ON {table} BEGIN
+            UPDATE {table} SET row_version = row_version + 1, updated_at = {NOW_SQL}
+            WHERE {key_column} = NEW.{key_column};
+            {_bump_generation(table)}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_version_delete AFTER DELETE ON {table} BEGIN
+            {_bump_generation(table)}
+        END""",
+    ]
+
+
+def touch_generations(conn: sqlite3.Connection, tables=None):
+    """
+    Start a new generation of some tables and record that every row without an updated_at time may
+    have changed now, e.g. after a bulk load that dropped the triggers.  The caller is responsible
+    for committing.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+        tables (iterable, optional): The tables. Defaults to all of VERSIONED_TABLES.
+    """
+    tables = list(tables or VERSIONED_TABLES)
+    placeholders = ", ".join("?" for _ in tables)
+    conn.execute(f"""
+        UPDATE table_generations SET generation = generation + 1, changed_at = {NOW_SQL}, reset_at = {NOW_SQL}
+        WHERE table_name IN ({placeholders})
+    """, tables)
+
+
+def create_versioning(conn: sqlite3.Connection):
+    """
+    Add row_version and updated_at to the movies, users and ratings tables, and create
+    table_generations and the triggers that keep them up to date.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+    """
+    for statement in VERSIONING_TABLES:
+        conn.execute(statement)
+    for table, (key_column, columns) in VERSIONED_TABLES.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        # ALTER TABLE can only add a column with a constant default, so updated_at starts as NULL
+        if "row_version" not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1")
+        if "updated_at" not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TEXT")
+        conn.execute(f"""
+            INSERT OR IGNORE INTO table_generations (table_name, generation, epoch, changed_at, reset_at)
+            VALUES (?, 1, lower(hex(randomblob(4))), {NOW_SQL}, {NOW_SQL})
+        """, (table,))
+        for statement in versioning_triggers(table, key_column, columns):
+            conn.execute(statement)
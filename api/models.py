@@ -1,123 +1,280 @@
-# In this file, we define the classes that represent the data in our application.
-# If our classes got to be too numerous, we could refactor them into separate files,
-#  likely if we went this path, we would put them into a models directory rather than in the api directory.
-class User:
-    
-    def __init__(self, id: int, username: str, email: str):
-        self.id = id
-        self.username = username
-        self.email = email
-        self.date_joined = None
-
-    def __repr__(self):
-        return f'<User {self.id} - {self.username}>'
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'username': self.username,
-            'email': self.email,
-            'date_joined': self.date_joined
-        }
-
-# This function will take a dictionary and return a User object
-def create_user_from_dict( data: dict) -> User:
-    # In this case, we want to be able to create a User object from a dictionary
-    # but not all dictionaries will have an id, so we'll use the get method to return None if it doesn't exist
-    # This is useful for creating new objects, where the id will be assigned by the database
-    # It's also useful for creating objects from JSON data, where the id may not be present
-    return User(data.get('id',None), data['username'], data['email'])
-
-class Movie:
-
-    def __init__(self, movie_id: int, title: str, genre: str, release_year: int, director: str):
-        self.movie_id = movie_id
-        self.title = title
-        self.genre = genre
-        self.release_year = release_year
-        self.director = director
-        self.ratings = []
-
-    def __repr__(self):
-        return f'<Movie {self.movie_id} - {self.title}>'
-
-    # This function will return a dictionary representation of the Movie object
-    # This is useful for converting the object to JSON
-    # If the ratings attribute is a list of Rating objects, we would need to convert them to dictionaries as well
-    def to_dict(self):
-        movie_dict = {
-            'movie_id': self.movie_id,
-            'title': self.title,
-            'genre': self.genre,
-            'release_year': self.release_year,
-            'director': self.director
-        }
-        if len(self.ratings) > 0:
-            movie_dict['ratings'] = [rating.to_dict() for rating in self.ratings]
-        return movie_dict
-
-    # This function will take a dictionary and return a Movie object, this is useful to convert JSON to an object
-    # This is a bit more complex syntax than the User and Ratings classes, this is what we call a class method
-    # It is a method that is bound to the class itself rather than an object of the class
-    # It doesn't require creation of a class instance, so it can be called on the class itself
-    # An example of how to use it is
-    # movie = Movie.from_dict(data)
-    # Notice how this is different from the typical way of creating an object
-    # movie = Movie(data['movie_id'], data['title'], data['genre'], data['release_year'], data['director'])
-    @classmethod
-    def from_dict(cls, data: dict) -> 'Movie':
-        return cls(
-            # Sometimes an id doesn't make sense to be in the dictionary, 
-            #   so we'll use the get method to return None if it doesn't exist
-            movie_id=data.get('movie_id',None),
-            title=data['title'],
-            genre=data['genre'],
-            release_year=data['release_year'],
-            director=data['director']
-        )
-
-
-class Rating:
-
-    def __init__(
-        self,
-        user_id: int,
-        rating: int,
-        review: str,
-        date: str,
-        movie_id: int = None,
-        rating_id: int = None,
-    ):
-        self.user_id = user_id
-        self.rating = rating
-        self.review = review
-        self.date = date
-        self.movie_id = movie_id
-        self.rating_id = rating_id
-
-    def __repr__(self):
-        return f"<Rating {self.rating_id}>"
-
-    def to_dict(self):
-        return {
-            "rating_id": self.rating_id,
-            "user_id": self.user_id,
-            "movie_id": self.movie_id,
-            "rating": self.rating,
-            "review": self.review,
-            "date": self.date,
-        }
-
-    # This function will take a dictionary and return a Rating object
-    # See the advanced_concepts documenation for more information on class methods
-    # NOTE: This is the same as the create_rating_from_dict function
-    @classmethod
-    def from_dict(cls, data: dict) -> 'Rating':
-        return cls(
-            rating_id=data.get("rating_id", None),
-            user_id=data["user_id"],
-            movie_id=data["movie_id"],
-            rating=data["rating"],
-            review=data["review"],
-            date=data["date"],
-        )
\ No newline at end of file
+# In this file, we define the classes that represent the data in our application.
+# If our classes got to be too numerous, we could refactor them into separate files,
+#  likely if we went this path, we would put them into a models directory rather than in the api directory.
+#
+# User, Movie and Rating list their attributes in __slots__.  Normally every object keeps its
+#  attributes in a dictionary of its own (obj.__dict__), which is flexible but big: a dictionary
+#  costs more than the object itself.  With __slots__ the attributes are stored in fixed places
+#  inside the object and there is no dictionary, so a Rating takes about 40% less memory.
+#  The catch is that only the attributes named in __slots__ can be set.  A movie with 200,000
+#  ratings makes 200,000 Rating objects, so this matters (see benchmarks/model_memory.py).
+class User:
+    __slots__ = ("id", "username", "email", "date_joined")
+
+    def __init__(self, id: int, username: str, email: str):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.date_joined = None
+
+    def __repr__(self):
+        return f'<User {self.id} - {self.username}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'email': self.email,
+            'date_joined': self.date_joined
+        }
+
+# This function will take a dictionary and return a User object
+def create_user_from_dict( data: dict) -> User:
+    # In this case, we want to be able to create a User object from a dictionary
+    # but not all dictionaries will have an id, so we'll use the get method to return None if it doesn't exist
+    # This is useful for creating new objects, where the id will be assigned by the database
+    # It's also useful for creating objects from JSON data, where the id may not be present
+    return User(data.get('id',None), data['username'], data['email'])
+
+class Movie:
+    __slots__ = ("movie_id", "title", "genre", "release_year", "director", "_ratings", "rank_score", "stats")
+
+    def __init__(self, movie_id: int, title: str, genre: str, release_year: int, director: str):
+        self.movie_id = movie_id
+        self.title = title
+        self.genre = genre
+        self.release_year = release_year
+        self.director = director
+        # Most movies never have ratings attached, so the list is only made when it is first used (see ratings)
+        self._ratings = None
+        # Only filled in by the top movies list (see services.get_top_movies)
+        self.rank_score = None
+        self.stats = None
+
+    def __repr__(self):
+        return f'<Movie {self.movie_id} - {self.title}>'
+
+    # A property looks like an ordinary attribute (movie.ratings.append(rating) still works),
+    #  but runs a function when it is read or set
+    @property
+    def ratings(self) -> list:
+        if self._ratings is None:
+            self._ratings = []
+        return self._ratings
+
+    @ratings.setter
+    def ratings(self, ratings: list):
+        self._ratings = ratings
+
+    # This function will return a dictionary representation of the Movie object
+    # This is useful for converting the object to JSON
+    # If the ratings attribute is a list of Rating objects, we would need to convert them to dictionaries as well
+    def to_dict(self):
+        movie_dict = {
+            'movie_id': self.movie_id,
+            'title': self.title,
+            'genre': self.genre,
+            'release_year': self.release_year,
+            'director': self.director
+        }
+        # Check _ratings rather than ratings, so we don't make an empty list just to look at it
+        if self._ratings:
+            movie_dict['ratings'] = [rating.to_dict() for rating in self._ratings]
+        if self.rank_score is not None:
+            movie_dict['rank_score'] = self.rank_score
+        if self.stats is not None:
+            movie_dict['stats'] = self.stats.to_dict()
+        return movie_dict
+
+    # This function will take a dictionary and return a Movie object, this is useful to convert JSON to an object
+    # This is a bit more complex syntax than the User and Ratings classes, this is what we call a class method
+    # It is a method that is bound to the class itself rather than an object of the class
+    # It doesn't require creation of a class instance, so it can be called on the class itself
+    # An example of how to use it is
+    # movie = Movie.from_dict(data)
+    # Notice how this is different from the typical way of creating an object
+    # movie = Movie(data['movie_id'], data['title'], data['genre'], data['release_year'], data['director'])
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Movie':
+        return cls(
+            # Sometimes an id doesn't make sense to be in the dictionary, 
+            #   so we'll use the get method to return None if it doesn't exist
+            movie_id=data.get('movie_id',None),
+            title=data['title'],
+            genre=data['genre'],
+            release_year=data['release_year'],
+            director=data['director']
+        )
+
+
+class Rating:
+    __slots__ = ("user_id", "rating", "review", "date", "movie_id", "rating_id")
+
+    def __init__(
+        self,
+        user_id: int,
+        rating: int,
+        review: str,
+        date: str,
+        movie_id: int = None,
+        rating_id: int = None,
+    ):
+        self.user_id = user_id
+        self.rating = rating
+        self.review = review
+        self.date = date
+        self.movie_id = movie_id
+        self.rating_id = rating_id
+
+    def __repr__(self):
+        return f"<Rating {self.rating_id}>"
+
+    def to_dict(self):
+        return {
+            "rating_id": self.rating_id,
+            "user_id": self.user_id,
+            "movie_id": self.movie_id,
+            "rating": self.rating,
+            "review": self.review,
+            "date": self.date,
+        }
+
+    # This function will take a dictionary and return a Rating object
+    # See the advanced_concepts documenation for more information on class methods
+    # NOTE: This is the same as the create_rating_from_dict function
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Rating':
+        return cls(
+            rating_id=data.get("rating_id", None),
+            user_id=data["user_id"],
+            movie_id=data["movie_id"],
+            rating=data["rating"],
+            review=data["review"],
+            date=data["date"],
+        )
+
+# The rating statistics for one movie, read from the movie_rating_stats table (see api/migrations.py)
+# The table only stores running totals, the mean and standard deviation are worked out from them here
+class RatingStats:
+
+    def __init__(self, movie_id: int, count: int = 0, total: int = 0, sum_squares: int = 0, histogram: dict = None):
+        self.movie_id = movie_id
+        self.count = count
+        self.total = total
+        self.sum_squares = sum_squares
+        # How many ratings of each score (1-5) the movie has
+        self.histogram = histogram or {score: 0 for score in range(1, 6)}
+
+    def __repr__(self):
+        return f"<RatingStats {self.movie_id} - {self.count} ratings>"
+
+    @property
+    def mean(self) -> float:
+        # A movie with no ratings doesn't have an average
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    @property
+    def stddev(self) -> float:
+        if self.count == 0:
+            return None
+        # Variance = mean of the squares - square of the mean.  Rounding can make it a tiny bit negative.
+        variance = self.sum_squares / self.count - self.mean ** 2
+        return max(variance, 0) ** 0.5
+
+    def to_dict(self):
+        return {
+            "movie_id": self.movie_id,
+            "count": self.count,
+            "mean": self.mean,
+            "stddev": self.stddev,
+            # JSON object keys are always strings
+            "histogram": {str(score): count for score, count in self.histogram.items()},
+        }
+
+
+# The ratings of one group in an analytics query (see api/analytics.py) or a trend, e.g. every
+#  rating of a genre or every rating made in a week.  field is what the ratings are grouped by
+#  ("genre", "release_year", "date" or "period") and value is this group's genre, year or date.
+class RatingGroup:
+
+    def __init__(self, field: str, value, count: int, total: float, sum_squares: float):
+        self.field = field
+        self.value = value
+        self.count = count
+        self.total = total
+        self.sum_squares = sum_squares
+
+    def __repr__(self):
+        return f"<RatingGroup {self.field}={self.value} - {self.count} ratings>"
+
+    @property
+    def mean(self) -> float:
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    @property
+    def stddev(self) -> float:
+        if self.count == 0:
+            return None
+        # The same sum of squares trick as RatingStats.stddev
+        variance = self.sum_squares / self.count - self.mean ** 2
+        return max(variance, 0) ** 0.5
+
+    def to_dict(self):
+        return {
+            self.field: self.value,
+            "count": self.count,
+            "mean": self.mean,
+            "stddev": self.stddev,
+        }
+
+
+# One result of a full-text search: the movie or rating that matched, how well it matched
+#  (a higher score is a better match) and a snippet of the matching text with the search terms
+#  wrapped in <mark> tags
+class SearchResult:
+
+    def __init__(self, item, score: float, snippet: str):
+        self.item = item
+        self.score = score
+        self.snippet = snippet
+
+    def __repr__(self):
+        return f"<SearchResult {self.item!r} - {self.score:.3f}>"
+
+    def to_dict(self):
+        result = self.item.to_dict()
+        result["score"] = self.score
+        result["snippet"] = self.snippet
+        return result
+
+
+# A genre, e.g. "Drama".  Movies are linked to their genres by the movie_genres table
+class Genre:
+
+    def __init__(self, genre_id: int, name: str):
+        self.genre_id = genre_id
+        self.name = name
+
+    def __repr__(self):
+        return f"<Genre {self.genre_id} - {self.name}>"
+
+    def to_dict(self):
+        return {"genre_id": self.genre_id, "name": self.name}
+
+
+# A person who worked on movies.  For now that means a director, linked by the movie_directors table
+class Person:
+
+    def __init__(self, person_id: int, name: str):
+        self.person_id = person_id
+        self.name = name
+
+    def __repr__(self):
+        return f"<Person {self.person_id} - {self.name}>"
+
+    def to_dict(self):
+        return {"person_id": self.person_id, "name": self.name}
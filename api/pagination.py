@@ -0,0 +1,120 @@
+# In this file, we have the helpers for cursor (keyset) pagination.
+# Instead of asking for "page 7" (which makes the database skip over every row on pages 1-6),
+#  the client passes back a cursor that says "give me the rows after this one".  The database
+#  can jump straight to that row using the primary key (or an index), so every page costs the
+#  same no matter how deep into the results it is.
+#
+# The cursor is the key of the last row on the page, JSON encoded and then base64 encoded so that
+#  it is safe to put in a URL.  Clients should treat it as an opaque string and never build one
+#  themselves, that way we are free to change what goes into it later.
+import base64
+import binascii
+import json
+
+from api import config
+
+
+class PaginationError(ValueError):
+    """Raised when a client asks for a page we can't give them (a bad limit or cursor)."""
+
+
+class InvalidCursorError(PaginationError):
+    """Raised when a cursor passed in by a client can't be decoded."""
+
+
+def encode_cursor(key: tuple) -> str:
+    """
+    Turn the key of the last row on a page into an opaque cursor string.
+
+    Args:
+        key (tuple): The sort key of the row, e.g. (movie_id,).
+
+    Returns:
+        str: A URL-safe cursor string.
+    """
+    data = json.dumps(list(key), separators=(",", ":")).encode("utf-8")
+    # The "=" padding is not needed to decode and would have to be escaped in a URL
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Turn a cursor string back into the key of the row it points at.
+
+    Args:
+        cursor (str): A cursor created by encode_cursor().
+
+    Returns:
+        tuple: The sort key of the row.
+    Raises:
+        InvalidCursorError: If the cursor is not one we created.
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+    if not isinstance(key, list) or len(key) == 0:
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+    return tuple(key)
+
+
+def is_key_part(value, key_type: type) -> bool:
+    """
+    Check that one part of a decoded cursor has the type we expect.
+
+    Args:
+        value: The value from the cursor.
+        key_type (type): int or float (JSON doesn't tell 1.0 and 1 apart, so an int is a valid float).
+
+    Returns:
+        bool: True if the value can be used as that part of the key.
+    """
+    # bool is a subclass of int, but true/false are never part of a key
+    if isinstance(value, bool):
+        return False
+    if key_type is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, key_type)
+
+
+def clamp_limit(limit: int, maximum: int = None) -> int:
+    """
+    Apply the default and maximum page sizes to a limit requested by a client.
+
+    Args:
+        limit (int): The requested page size, or None to use config.DEFAULT_PAGE_SIZE.
+        maximum (int, optional): The largest page allowed. Defaults to config.MAX_PAGE_SIZE.
+
+    Returns:
+        int: The page size to use.
+    Raises:
+        PaginationError: If the limit is zero or negative.
+    """
+    maximum = maximum or config.MAX_PAGE_SIZE
+    if limit is None:
+        return min(config.DEFAULT_PAGE_SIZE, maximum)
+    if limit <= 0:
+        raise PaginationError("limit must be a positive integer")
+    return min(limit, maximum)
+
+
+def split_page(items: list, limit: int, key) -> tuple:
+    """
+    Split the results of a query that asked for limit + 1 rows into a page and a next cursor.
+
+    Asking the database for one row more than we need is the cheapest way to find out whether
+    there is another page: if the extra row came back, there is.
+
+    Args:
+        items (list): Up to limit + 1 results, in order.
+        limit (int): The page size.
+        key (callable): Returns the sort key (a tuple) of a result.
+
+    Returns:
+        tuple: (the results on this page, the cursor for the next page or None if this is the last page)
+    """
+    if len(items) <= limit:
+        return items, None
+    page = items[:limit]
+    return page, encode_cursor(key(page[-1]))
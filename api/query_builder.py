@@ -0,0 +1,237 @@
+# In this file, we build the SELECT statements for the filtered movie and rating lists.
+# Gluing SQL together by hand for every combination of filters is easy to get wrong (a stray
+#  "WHERE " when there are no filters, a forgotten "AND") and easy to make slow: a filter like
+#  genre LIKE '%drama%' can never use an index.  A Query collects the filters one at a time, each
+#  written in a form SQLite can answer from an index:
+#
+#   - equals:      column = ?                          (text columns ignore case, see below)
+#   - starts_with: column LIKE 'abc%' ESCAPE '\'       (SQLite turns this into an index range)
+#   - between:     column >= ? AND column <= ?         (either end can be left open)
+#   - one_of:      column IN (?, ?, ...)
+#
+# Text comparisons use the NOCASE collation, the same as LIKE, so "drama" finds "Drama".  SQLite
+#  can only use an index for them if the index was built with NOCASE too.
+#
+# Some filters are on a linked table rather than a column, e.g. a movie's genres and directors live
+#  in the genres/people tables (see migration 6).  A filter on one of those becomes
+#  movie_id IN (SELECT ... WHERE <the filter on the name>), which SQLite answers from the indexes
+#  on the name and link tables.
+#
+# Queries with the same "shape" (the same filters on the same columns, with the same number of
+#  values, and the same order) always produce the same SQL, only the parameters change.  The SQL
+#  text is worked out once per shape and cached, and sqlite3's own statement cache then reuses
+#  the prepared statement.
+from functools import lru_cache
+
+
+class QueryError(ValueError):
+    """Raised when a filter or sort order can't be used, e.g. an unknown column."""
+
+
+class Table:
+    """
+    Describes a table that can be queried: its columns, its id column, and which columns hold text.
+    """
+
+    def __init__(self, name: str, columns: tuple, key_column: str, text_columns: tuple = (), sortable: tuple = (),
+                 other_columns: tuple = (), links: dict = None):
+        """
+        Args:
+            name (str): The table name.
+            columns (tuple): The columns to select.
+            key_column (str): The id column, used for keyset paging and as the tie-breaker when sorting.
+            text_columns (tuple, optional): The columns compared without regard to case.
+            sortable (tuple, optional): The columns a client may sort by, besides the id column.
+            other_columns (tuple, optional): Columns that can be filtered on but aren't selected.
+            links (dict, optional): Filters on a linked table, each one the SQL for the ids that match,
+                                    with {condition} where the filter on the linked table's t.name goes.
+        """
+        self.name = name
+        self.columns = columns
+        self.links = links or {}
+        self.filterable = tuple(columns) + tuple(other_columns) + tuple(self.links)
+        self.key_column = key_column
+        self.text_columns = text_columns
+        self.sortable = (key_column,) + tuple(sortable)
+
+
+MOVIES = Table("movies", ("movie_id", "title", "genre", "release_year", "director"), "movie_id",
+               text_columns=("title",), sortable=("title", "release_year", "rank_score"),
+               other_columns=("rank_score",), links={
+                   # A movie can have several genres and directors, so these match any one of them
+                   "genres": "movie_id IN (SELECT l.movie_id FROM genres t "
+                             "JOIN movie_genres l ON l.genre_id = t.genre_id WHERE {condition})",
+                   "directors": "movie_id IN (SELECT l.movie_id FROM people t "
+                                "JOIN movie_directors l ON l.person_id = t.person_id WHERE {condition})",
+               })
+
+RATINGS = Table("ratings", ("rating_id", "user_id", "movie_id", "rating", "review", "date"), "rating_id",
+                sortable=("rating", "date"))
+
+
+def escape_like(text: str) -> str:
+    """
+    Escape the LIKE wildcards in text, so a search for "50%" doesn't match everything starting with "50".
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        str: The text with \\, % and _ escaped with a backslash.
+    """
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class Query:
+    """
+    A SELECT over one table, built up one filter at a time.  Every method returns the query, so the
+    calls can be chained:
+
+        Query(MOVIES).one_of("genre", ["Drama", "Crime"]).between("release_year", 1990, 1999).order_by("title")
+    """
+
+    def __init__(self, table: Table):
+        self.table = table
+        # (column, operation, number of values), one per filter
+        self._filters = []
+        self._params = []
+        self._order = None
+        self._descending = False
+        self._after = None
+        self._limit = None
+
+    def _check_column(self, column: str):
+        if column not in self.table.filterable:
+            raise QueryError(f"{self.table.name} can't be filtered on {column}")
+
+    def equals(self, column: str, value):
+        """Only keep rows where column is value (ignoring case for text)."""
+        self._check_column(column)
+        self._filters.append((column, "equals", 1))
+        self._params.append(value)
+        return self
+
+    def starts_with(self, column: str, prefix: str):
+        """Only keep rows where column starts with prefix (ignoring case)."""
+        self._check_column(column)
+        self._filters.append((column, "starts_with", 1))
+        self._params.append(escape_like(prefix) + "%")
+        return self
+
+    def between(self, column: str, low=None, high=None):
+        """Only keep rows where column is between low and high (inclusive), None leaves that end open."""
+        self._check_column(column)
+        if low is not None and high is not None and low > high:
+            raise QueryError(f"The lowest {column} can't be greater than the highest")
+        if low is not None:
+            self._filters.append((column, "at_least", 1))
+            self._params.append(low)
+        if high is not None:
+            self._filters.append((column, "at_most", 1))
+            self._params.append(high)
+        return self
+
+    def one_of(self, column: str, values: list):
+        """Only keep rows where column is one of values (ignoring case for text)."""
+        self._check_column(column)
+        if not values:
+            raise QueryError(f"At least one {column} is needed")
+        self._filters.append((column, "one_of", len(values)))
+        self._params.extend(values)
+        return self
+
+    def order_by(self, column: str, descending: bool = False):
+        """
+        Sort the rows by column, with the id column breaking ties.  Without an order the rows
+        come in id order, and only then can they be paged through with after().
+        """
+        if column not in self.table.sortable:
+            raise QueryError(f"{self.table.name} can't be sorted by {column}, "
+                             f"use one of: {', '.join(self.table.sortable)}")
+        self._order = None if column == self.table.key_column and not descending else column
+        self._descending = descending
+        return self
+
+    def after(self, key):
+        """Only keep rows whose id is greater than key (keyset paging, see api/pagination.py)."""
+        self._after = key
+        return self
+
+    def limit(self, count: int):
+        """Return at most count rows."""
+        self._limit = count
+        return self
+
+    def shape(self) -> tuple:
+        """Everything about the query except the parameter values."""
+        return (self.table.name, tuple(self._filters), self._order, self._descending,
+                self._after is not None, self._limit is not None)
+
+    def to_sql(self) -> tuple:
+        """
+        Build the statement.
+
+        Returns:
+            tuple: (the SQL text, the list of parameters)
+        """
+        if self._after is not None and (self._order is not None or self._descending):
+            raise QueryError("A sorted list can't be paged with a cursor")
+        params = list(self._params)
+        if self._after is not None:
+            params.append(self._after)
+        if self._limit is not None:
+            params.append(self._limit)
+        return compile_statement(self.table, self.shape()), params
+
+
+# How each filter is written in SQL.  {column} is the column (with COLLATE NOCASE for text columns),
+#  {placeholders} is one ? per value.
+_OPERATIONS = {
+    "equals": "{column} = ?",
+    "starts_with": "{column} LIKE ? ESCAPE '\\'",
+    "at_least": "{column} >= ?",
+    "at_most": "{column} <= ?",
+    "one_of": "{column} IN ({placeholders})",
+}
+
+
+@lru_cache(maxsize=256)
+def compile_statement(table: Table, shape: tuple) -> str:
+    """
+    Turn a query shape (see Query.shape) into SQL.  The result is cached, so each shape is only
+    worked out once.
+
+    Args:
+        table (Table): The table being queried.
+        shape (tuple): The query's shape.
+
+    Returns:
+        str: The SQL text, with a ? for every parameter.
+    """
+    _, filters, order, descending, paged, limited = shape
+    where_clauses = []
+    for column, operation, count in filters:
+        placeholders = ", ".join("?" * count)
+        if column in table.links:
+            # The linked table's name column is declared COLLATE NOCASE, so it ignores case on its own
+            condition = _OPERATIONS[operation].format(column="t.name", placeholders=placeholders)
+            where_clauses.append(table.links[column].format(condition=condition))
+            continue
+        # LIKE already ignores case, and adding a collation to it would stop SQLite using the index
+        if column in table.text_columns and operation != "starts_with":
+            column = f"{column} COLLATE NOCASE"
+        where_clauses.append(_OPERATIONS[operation].format(column=column, placeholders=placeholders))
+    if paged:
+        where_clauses.append(f"{table.key_column} > ?")
+
+    sql = f"SELECT {', '.join(table.columns)} FROM {table.name}"
+    if where_clauses:
+        sql += " WHERE " + " AND ".join(where_clauses)
+    direction = " DESC" if descending else ""
+    if order is None:
+        sql += f" ORDER BY {table.key_column}{direction}"
+    else:
+        sql += f" ORDER BY {order}{direction}, {table.key_column}{direction}"
+    if limited:
+        sql += " LIMIT ?"
+    return sql
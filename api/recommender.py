@@ -0,0 +1,346 @@
+# In this file, we work out which movies are alike from the ratings, so that the API can
+#  recommend movies to a user ("item-item collaborative filtering").
+#
+# Think of the ratings as a big table with a row per user and a column per movie, where most of
+#  the cells are empty (nobody has rated more than a tiny fraction of the movies).  Two movies are
+#  alike if the same users gave them similar ratings, which we measure with the cosine similarity
+#  of their columns:
+#
+#     similarity(a, b) = sum over users of rating(a) * rating(b) / (|a| * |b|)
+#
+#  where |a| is the square root of the sum of the squares of a's ratings.  It runs from 0 (no user
+#  rated both) to 1.  To recommend movies to a user, we take the movies they rated, look up each
+#  one's most similar movies, and rank those by the user's ratings weighted by the similarities
+#  (see services.get_recommendations).
+#
+# Working that out for every pair of movies on every request would be far too slow, so it is done
+#  ahead of time and only the NEIGHBOURS most similar movies of each movie are kept, in the
+#  item_similarities table (see migration 7 in api/migrations.py).  Answering a request is then a
+#  handful of primary key lookups.
+#
+# The table is filled in with NumPy:
+#   - The ratings are loaded into a RatingMatrix, which only stores the cells that aren't empty, as
+#     three flat arrays (the compressed sparse row, or CSR, layout).
+#   - The similarities are worked out for a block of movies at a time: every rating of a movie in
+#     the block is paired with every other rating by the same user, and np.bincount adds the
+#     products up per pair of movies.  No Python loop runs per rating, and the block size keeps
+#     the memory used bounded however many movies there are.
+#
+# A trigger on the ratings table adds the movie of every new, changed or deleted rating to the
+#  similarity_refresh_queue table.  A rating only changes its own movie's column, so only the
+#  similarities between that movie and the others change, and refresh_similarities only works
+#  those out again rather than starting from scratch.
+import json
+import sqlite3
+
+import numpy as np
+
+from api import config
+
+
+def concatenated_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    The numbers start, start + 1, ..., start + length - 1 for every (start, length), one after another.
+
+    e.g. starts [10, 20], lengths [2, 3] -> [10, 11, 20, 21, 22]
+
+    Args:
+        starts (np.ndarray): The first number of each range.
+        lengths (np.ndarray): How many numbers are in each range.
+
+    Returns:
+        np.ndarray: All of the ranges, joined together.
+    """
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Each output position minus the position its range starts at, plus the range's start
+    range_offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return range_offsets + np.arange(total)
+
+
+class RatingMatrix:
+    """
+    The ratings as a sparse user x movie matrix in compressed sparse row (CSR) form.
+
+    The users and movies are numbered 0, 1, 2, ... in id order (user_ids and movie_ids map those
+    positions back to the ids).  The ratings of the user in row u are data[indptr[u]:indptr[u + 1]],
+    and indices holds the column (movie) of each one.  The same ratings are also indexed by column:
+    column_order[column_ptr[c]:column_ptr[c + 1]] are the positions in data of movie c's ratings.
+    """
+
+    def __init__(self, user_ids, movie_ids, ratings):
+        """
+        Args:
+            user_ids: The user of each rating.
+            movie_ids: The movie of each rating.
+            ratings: The ratings.  Every (user, movie) pair must only appear once.
+        """
+        self.user_ids, rows = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+        self.movie_ids, columns = np.unique(np.asarray(movie_ids, dtype=np.int64), return_inverse=True)
+        ratings = np.asarray(ratings, dtype=np.float64)
+
+        # CSR: the ratings sorted by user, and where each user's ratings start
+        order = np.lexsort((columns, rows))
+        self.row_of = rows[order]
+        self.indices = columns[order]
+        self.data = ratings[order]
+        self.indptr = np.zeros(len(self.user_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self.user_ids)), out=self.indptr[1:])
+
+        # The same ratings by movie
+        self.column_order = np.argsort(self.indices, kind="stable")
+        self.column_ptr = np.zeros(len(self.movie_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=len(self.movie_ids)), out=self.column_ptr[1:])
+
+    def __len__(self):
+        return len(self.data)
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, user_ids: list = None):
+        """
+        Load the ratings from the database.  A user who rated the same movie more than once counts
+        with the average of their ratings.
+
+        Args:
+            conn (sqlite3.Connection): A connection to the database.
+            user_ids (list, optional): Only load the ratings by these users. Defaults to None (everyone).
+
+        Returns:
+            RatingMatrix: The ratings.
+        """
+        query = "SELECT user_id, movie_id, AVG(rating) FROM ratings WHERE rating IS NOT NULL"
+        params = ()
+        if user_ids is not None:
+            query += " AND user_id IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(user_ids),)
+        query += " GROUP BY user_id, movie_id"
+        cursor = conn.execute(query, params)
+        # Read the rows a batch at a time into arrays, rather than building one big list of tuples
+        batches = []
+        while True:
+            rows = cursor.fetchmany(config.RECOMMENDER_LOAD_BATCH_SIZE)
+            if not rows:
+                break
+            batches.append(np.array([tuple(row) for row in rows], dtype=np.float64))
+        table = np.concatenate(batches) if batches else np.zeros((0, 3))
+        return cls(table[:, 0], table[:, 1], table[:, 2])
+
+    def sum_squares(self) -> np.ndarray:
+        """The sum of the squares of each movie's ratings (its squared length), by column."""
+        return np.bincount(self.indices, weights=self.data ** 2, minlength=len(self.movie_ids))
+
+    def pairs(self, columns: np.ndarray) -> tuple:
+        """
+        Pair every rating of the given movies with every rating by the same user.
+
+        Args:
+            columns (np.ndarray): The columns (positions in movie_ids) of the movies.
+
+        Returns:
+            tuple: Three arrays with an entry per pair: the position in columns of the first movie,
+                   the column of the second movie, and the product of the two ratings.
+        """
+        # Every rating of the block's movies...
+        lengths = self.column_ptr[columns + 1] - self.column_ptr[columns]
+        picked = self.column_order[concatenated_ranges(self.column_ptr[columns], lengths)]
+        block_rows = np.repeat(np.arange(len(columns)), lengths)
+        users = self.row_of[picked]
+
+        # ...paired with every rating by the same user
+        row_starts = self.indptr[users]
+        row_lengths = self.indptr[users + 1] - row_starts
+        others = concatenated_ranges(row_starts, row_lengths)
+        products = np.repeat(self.data[picked], row_lengths) * self.data[others]
+        return np.repeat(block_rows, row_lengths), self.indices[others], products
+
+    def dot_products(self, columns: np.ndarray) -> tuple:
+        """
+        Work out the dot product of each of the given movies with every movie, and how many users
+        rated both.
+
+        Args:
+            columns (np.ndarray): The columns (positions in movie_ids) of the movies.
+
+        Returns:
+            tuple: Two arrays with a row per movie in columns and a column per movie in the matrix:
+                   the dot products, and the number of users in common.
+        """
+        movie_count = len(self.movie_ids)
+        block_rows, others, products = self.pairs(columns)
+        cells = block_rows * movie_count + others
+        size = len(columns) * movie_count
+        dots = np.bincount(cells, weights=products, minlength=size).reshape(len(columns), movie_count)
+        common = np.bincount(cells, minlength=size).reshape(len(columns), movie_count)
+        return dots, common
+
+
+def similarity_rows(matrix: RatingMatrix, columns: np.ndarray, sum_squares: np.ndarray,
+                    min_common_users: int) -> np.ndarray:
+    """
+    Work out the similarity of each of the given movies to every movie.
+
+    Args:
+        matrix (RatingMatrix): The ratings, including every rating by every user who rated one of the movies.
+        columns (np.ndarray): The columns of the movies.
+        sum_squares (np.ndarray): The squared length of every movie's ratings, by column.  These come
+                                  from all of the ratings, even if the matrix only holds some of them.
+        min_common_users (int): How many users have to have rated both movies for them to count as similar.
+
+    Returns:
+        np.ndarray: A row per movie in columns and a column per movie in the matrix.  A movie's
+                    similarity to itself is left at 0, it isn't its own neighbour.
+    """
+    dots, common = matrix.dot_products(columns)
+    lengths = np.sqrt(sum_squares)
+    scale = np.outer(lengths[columns], lengths)
+    similarities = np.divide(dots, scale, out=np.zeros_like(dots), where=scale > 0)
+    similarities[common < min_common_users] = 0
+    similarities[np.arange(len(columns)), columns] = 0
+    return similarities
+
+
+def top_neighbours(matrix: RatingMatrix, columns: np.ndarray, similarities: np.ndarray, neighbours: int) -> list:
+    """
+    Pick the most similar movies out of the rows from similarity_rows.
+
+    Args:
+        matrix (RatingMatrix): The ratings.
+        columns (np.ndarray): The columns of the movies.
+        similarities (np.ndarray): Their similarity to every movie.
+        neighbours (int): How many similar movies to keep for each movie.
+
+    Returns:
+        list: (movie_id, neighbour_id, similarity) rows, for the similarities above 0.
+    """
+    keep = min(neighbours, similarities.shape[1])
+    if keep == 0:
+        return []
+    # argpartition finds the top few of each row without sorting the whole row
+    best = np.argpartition(-similarities, keep - 1, axis=1)[:, :keep]
+    best_similarities = np.take_along_axis(similarities, best, axis=1)
+    block_rows, positions = np.nonzero(best_similarities > 0)
+    return list(zip(matrix.movie_ids[columns[block_rows]].tolist(),
+                    matrix.movie_ids[best[block_rows, positions]].tolist(),
+                    best_similarities[block_rows, positions].tolist()))
+
+
+def find_columns(matrix: RatingMatrix, movie_ids: np.ndarray) -> np.ndarray:
+    """The columns of the given movies.  Movies with no ratings aren't in the matrix, and are left out."""
+    positions = np.searchsorted(matrix.movie_ids, movie_ids)
+    found = positions < len(matrix.movie_ids)
+    found[found] = matrix.movie_ids[positions[found]] == movie_ids[found]
+    return positions[found]
+
+
+def in_blocks(matrix: RatingMatrix, columns: np.ndarray):
+    """
+    Split the columns into blocks small enough for a (block x movies) array to stay under
+    config.RECOMMENDER_BLOCK_CELLS.
+    """
+    block_size = max(1, config.RECOMMENDER_BLOCK_CELLS // max(1, len(matrix.movie_ids)))
+    for start in range(0, len(columns), block_size):
+        yield columns[start:start + block_size]
+
+
+def build_similarities(conn: sqlite3.Connection) -> int:
+    """
+    Work out the similar movies of every movie from scratch.
+
+    The caller is responsible for committing.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+
+    Returns:
+        int: The number of movies that have similar movies.
+    """
+    matrix = RatingMatrix.load(conn)
+    sum_squares = matrix.sum_squares()
+    conn.execute("DELETE FROM item_similarities")
+    conn.execute("DELETE FROM item_norms")
+    conn.execute("DELETE FROM similarity_refresh_queue")
+    conn.executemany("INSERT INTO item_norms (movie_id, sum_squares) VALUES (?, ?)",
+                     zip(matrix.movie_ids.tolist(), sum_squares.tolist()))
+    for columns in in_blocks(matrix, np.arange(len(matrix.movie_ids))):
+        similarities = similarity_rows(matrix, columns, sum_squares, config.RECOMMENDER_MIN_COMMON_USERS)
+        conn.executemany("INSERT INTO item_similarities (movie_id, neighbour_id, similarity) VALUES (?, ?, ?)",
+                         top_neighbours(matrix, columns, similarities, config.RECOMMENDER_NEIGHBOURS))
+    return conn.execute("SELECT COUNT(DISTINCT movie_id) FROM item_similarities").fetchone()[0]
+
+
+def refresh_similarities(conn: sqlite3.Connection) -> int:
+    """
+    Bring the similar movies up to date after ratings were added, changed or deleted.
+
+    A rating only changes its own movie's column, so for each movie in similarity_refresh_queue:
+      - its own similar movies are worked out again, and
+      - its similarity to every other movie is updated in that movie's list: added if it is now
+        good enough to be one of the NEIGHBOURS best, changed if it was already there, and
+        removed if it is now 0.
+    The one thing this doesn't do is bring back a movie that was pushed out of a list earlier,
+    when a queued movie's similarity drops, as the lists don't remember what was pushed out.
+    build_similarities starts from scratch and puts that right.
+    The caller is responsible for committing.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+
+    Returns:
+        int: The number of movies whose similar movies were worked out again.
+    """
+    changed = [row[0] for row in conn.execute("SELECT movie_id FROM similarity_refresh_queue ORDER BY movie_id")]
+    if not changed:
+        return 0
+    changed_json = json.dumps(changed)
+
+    # The lengths of the changed movies' columns
+    conn.execute("DELETE FROM item_norms WHERE movie_id IN (SELECT value FROM json_each(?))", (changed_json,))
+    conn.execute("""
+        INSERT INTO item_norms (movie_id, sum_squares)
+        SELECT movie_id, SUM(rating * rating) FROM (
+            SELECT movie_id, AVG(rating) AS rating FROM ratings
+            WHERE movie_id IN (SELECT value FROM json_each(?)) AND rating IS NOT NULL
+            GROUP BY movie_id, user_id
+        ) GROUP BY movie_id
+    """, (changed_json,))
+
+    # A changed movie's similarities only need the ratings by the users who rated it
+    users = [row[0] for row in conn.execute(
+        "SELECT DISTINCT user_id FROM ratings WHERE movie_id IN (SELECT value FROM json_each(?))", (changed_json,))]
+    matrix = RatingMatrix.load(conn, users)
+    # The other movies' lengths come from all of their ratings, not just the ones loaded
+    lengths = dict(conn.execute("SELECT movie_id, sum_squares FROM item_norms WHERE movie_id IN "
+                                "(SELECT value FROM json_each(?))", (json.dumps(matrix.movie_ids.tolist()),)))
+    sum_squares = np.array([lengths.get(movie_id, 0.0) for movie_id in matrix.movie_ids.tolist()], dtype=np.float64)
+
+    conn.execute("DELETE FROM item_similarities WHERE movie_id IN (SELECT value FROM json_each(?))", (changed_json,))
+    # The changed movies are taken out of the other lists too, and put back below if they still belong there
+    conn.execute("DELETE FROM item_similarities WHERE neighbour_id IN (SELECT value FROM json_each(?))",
+                 (changed_json,))
+    neighbours = config.RECOMMENDER_NEIGHBOURS
+    changed_movies = set(changed)
+    for columns in in_blocks(matrix, find_columns(matrix, np.array(changed, dtype=np.int64))):
+        similarities = similarity_rows(matrix, columns, sum_squares, config.RECOMMENDER_MIN_COMMON_USERS)
+        conn.executemany("INSERT INTO item_similarities (movie_id, neighbour_id, similarity) VALUES (?, ?, ?)",
+                         top_neighbours(matrix, columns, similarities, neighbours))
+
+        # Similarity is symmetric, so row m also holds every other movie's similarity to movie m
+        block_rows, others = np.nonzero(similarities > 0)
+        pairs = list(zip(matrix.movie_ids[others].tolist(), matrix.movie_ids[columns[block_rows]].tolist(),
+                         similarities[block_rows, others].tolist()))
+        # (the changed movies' own lists were worked out in full just above)
+        pairs = [pair for pair in pairs if pair[0] not in changed_movies]
+        conn.executemany("INSERT OR REPLACE INTO item_similarities (movie_id, neighbour_id, similarity) "
+                         "VALUES (?, ?, ?)", pairs)
+        # ...then cut every list that grew back down to the best NEIGHBOURS
+        conn.executemany("""
+            DELETE FROM item_similarities WHERE movie_id = ?1 AND neighbour_id NOT IN (
+                SELECT neighbour_id FROM item_similarities WHERE movie_id = ?1
+                ORDER BY similarity DESC, neighbour_id LIMIT ?2
+            )
+        """, [(movie_id, neighbours) for movie_id in sorted({pair[0] for pair in pairs})])
+
+    conn.execute("DELETE FROM similarity_refresh_queue WHERE movie_id IN (SELECT value FROM json_each(?))",
+                 (changed_json,))
+    return len(changed)
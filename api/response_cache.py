@@ -0,0 +1,313 @@
+# In this file, we keep a cache of whole responses for the busiest GET endpoints.
+# A handful of requests make up most of the traffic (the first page of /api/movies, the movies
+#  whose title starts with "star", the ratings of this week's popular movie), and each one runs the
+#  same SQLite queries, builds the same model objects and encodes the same JSON every time.  The
+#  first response is kept here as the bytes that were sent, and the same request is answered with
+#  those bytes until something it depends on changes.
+#
+# A response is stored under its route, the host it was asked for (the Link header has the full URL
+#  in it), its normalised query string ("?limit=10&genre=Drama" and "?genre=Drama&limit=10" are the
+#  same) and the *generation* of every table it depends on.  A generation is a counter in the
+#  table_generations table that triggers bump whenever a row of the table is added, changed or
+#  deleted (see migrations.create_versioning), so a change makes every response built from the
+#  table unreachable at once, without having to find them: the next request builds a new key and
+#  the old entries drop out as the least recently used.  Because the generations live in the
+#  database, a change made by another worker process or a script is seen straight away too.
+#
+# Like api/cache.py:
+#   - every entry expires after a time-to-live (set per route with RESPONSE_CACHE_TTL_SECONDS),
+#     which bounds how stale it can get if the database is changed behind our back (another
+#     process, a script)
+#   - the cache has a maximum size, here in bytes, and drops the least recently used entries to
+#     stay under it
+#
+# Responses are also compressed once, when they are stored, for every encoding the API can send
+#  (see api/compression.py), so sending a cached response to a client that accepts gzip costs no
+#  more CPU than sending it uncompressed.
+#
+# When a popular entry expires, every request for it that comes in before the new one is ready
+#  would otherwise run the same queries at the same time (a "cache stampede").  Instead only the
+#  first one runs the view, and the rest wait for it and share its response ("single-flight").
+#  They only wait for RESPONSE_CACHE_WAIT_TIMEOUT seconds, so a view that never finishes can't
+#  hold up every request for the same page with it.
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from api import compression, config, services
+
+
+class SingleFlightTimeoutError(Exception):
+    """Raised when the thread doing the work for a key doesn't finish within the wait timeout."""
+
+
+class CachedResponse:
+    """
+    The parts of a response needed to send it again: its body (as bytes), its headers, and the
+    body compressed with each encoding the API can send (encoding -> bytes, empty if the body is
+    too small to be worth compressing).
+    """
+
+    def __init__(self, body: bytes, status: int, headers: list, encoded: dict = None):
+        self.body = body
+        self.status = status
+        self.headers = headers
+        self.encoded = encoded or {}
+
+    def __repr__(self):
+        return f"<CachedResponse {self.status} - {len(self.body)} bytes>"
+
+    @property
+    def size(self) -> int:
+        """The bytes the entry takes up: the body and its compressed versions."""
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+    @classmethod
+    def from_response(cls, response) -> 'CachedResponse':
+        # Content-Length is worked out again when the response is rebuilt
+        headers = [(name, value) for name, value in response.headers if name != "Content-Length"]
+        body = response.get_data()
+        encoded = {}
+        if compression.is_compressible(response) and len(body) >= config.COMPRESSION_MIN_BYTES:
+            encoded = {encoding: compression.compress(body, encoding) for encoding in compression.available_encodings()}
+        return cls(body, response.status_code, headers, encoded)
+
+    def to_response(self):
+        """Build the response for the current request, compressed if the client accepts one of the encodings."""
+        encoding = compression.choose_encoding() if self.encoded else None
+        if encoding in self.encoded:
+            return current_app.response_class(self.encoded[encoding], status=self.status,
+                                              headers=self.headers + [("Content-Encoding", encoding)])
+        return current_app.response_class(self.body, status=self.status, headers=self.headers)
+
+
+class ResponseStore:
+    """
+    A thread-safe, in-process store of CachedResponse objects with a maximum total size in bytes
+    and a time-to-live for each entry.  The entries are kept in least recently used order, like
+    cache.LocalLRUCache.
+    """
+
+    def __init__(self, max_bytes: int, clock=time.monotonic):
+        """
+        Args:
+            max_bytes (int): The most bytes of response bodies (and their compressed versions) to keep.
+            clock (callable, optional): Returns the current time in seconds. Tests pass a fake clock.
+        """
+        self.max_bytes = max_bytes
+        self.clock = clock
+        # key -> (expires_at, CachedResponse)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> CachedResponse:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, response = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def set(self, key: str, response: CachedResponse, ttl: float):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self.clock() + ttl, response)
+            self.size += response.size
+            while self.size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        # The caller holds the lock
+        _, response = self._entries.pop(key)
+        self.size -= response.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SingleFlight:
+    """
+    Makes sure only one thread at a time does the work for a key.  The others that ask for the
+    same key while it is running wait for it and get the same result.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+        self.timeouts = 0
+
+    def run(self, key: str, function, timeout: float = None) -> tuple:
+        """
+        Run function for key, unless another thread is already running it.
+
+        Args:
+            key (str): What the work is for.
+            function (callable): Does the work and returns its result.
+            timeout (float, optional): The most seconds to wait for another thread's result.
+                                       Defaults to waiting as long as it takes.
+
+        Returns:
+            tuple: The result, and whether this thread ran function (False means it waited for
+                   another thread's result).  If the other thread's function raised an exception
+                   the result is None.
+        Raises:
+            SingleFlightTimeoutError: If another thread is running function and it doesn't finish
+                                      within the timeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.shared += 1
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise SingleFlightTimeoutError(f"Gave up waiting for {key} after {timeout} seconds")
+            return call.result, False
+        try:
+            call.result = function()
+            return call.result, True
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+# ---------------------------------------------------------
+# The shared cache used by api/routes.py
+# ---------------------------------------------------------
+_store = ResponseStore(config.RESPONSE_CACHE_MAX_BYTES)
+_flights = SingleFlight()
+
+
+def make_key(route: str, tables: tuple) -> str:
+    """
+    Build the cache key of the current request.
+
+    Args:
+        route (str): The name of the route.
+        tables (tuple): The tables its response depends on.
+
+    Returns:
+        str: The key, e.g. "movies|http://localhost/||genre=Drama&limit=10|movies=1a2b3c:3".
+    """
+    # Sorted by name, but the values of a repeated parameter keep their order
+    args = "&".join(f"{name}={value}" for name in sorted(request.args)
+                    for value in request.args.getlist(name))
+    view_args = ",".join(f"{name}={value}" for name, value in sorted((request.view_args or {}).items()))
+    # The epoch as well as the generation, so a database rebuilt from scratch (generation 1 again)
+    #  never matches a response built from the old one
+    generations = ",".join(f"{table}={epoch}:{generation}"
+                           for table, epoch, generation, _ in services.get_table_generations(list(tables)))
+    return f"{route}|{request.host_url}|{view_args}|{args}|{generations}"
+
+
+def ttl_for(route: str) -> float:
+    """How many seconds a route's responses are kept (see config.RESPONSE_CACHE_TTL_SECONDS)."""
+    return config.RESPONSE_CACHE_TTL_SECONDS.get(route, config.RESPONSE_CACHE_DEFAULT_TTL_SECONDS)
+
+
+def cached(route: str, tables):
+    """
+    A decorator that caches the responses of a GET endpoint.
+
+    Args:
+        route (str): The name of the route, for the key and its TTL setting (e.g. "movies").
+        tables (tuple or callable): The tables the response depends on, or a function that works
+                                    them out for the current request (returning None to skip the
+                                    cache, e.g. for a streamed response).
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            depends_on = tables() if callable(tables) else tables
+            ttl = ttl_for(route)
+            if not config.RESPONSE_CACHE_ENABLED or depends_on is None or ttl <= 0:
+                return view(*args, **kwargs)
+            key = make_key(route, depends_on)
+            entry = _store.get(key)
+            if entry is not None:
+                return entry.to_response()
+
+            def fill():
+                response = make_response(view(*args, **kwargs))
+                entry = None
+                # Only whole, successful responses are kept (not errors, and not streams)
+                if response.status_code == 200 and not response.is_streamed:
+                    entry = CachedResponse.from_response(response)
+                    if entry.size <= config.RESPONSE_CACHE_MAX_ENTRY_BYTES:
+                        _store.set(key, entry, ttl)
+                return response, entry
+
+            result, leader = _flights.run(key, fill, config.RESPONSE_CACHE_WAIT_TIMEOUT)
+            if result is not None and result[1] is not None:
+                # Send the stored bytes, which are already compressed
+                return result[1].to_response()
+            if leader:
+                return result[0]
+            # Another request tried to build it, but it failed or couldn't be kept, so build our own
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def clear():
+    """Empty the cache, e.g. after pointing the connection pool at a different database."""
+    _store.clear()
+
+
+def stats() -> dict:
+    """
+    Return the cache's counters.
+
+    Returns:
+        dict: The entries, bytes, hits, misses etc., how many requests waited for another's response,
+              and how many gave up waiting.
+    """
+    return dict(_store.stats(), single_flight_shared=_flights.shared, single_flight_timeouts=_flights.timeouts)
@@ -1,363 +1,1011 @@
-from flask import jsonify, request, Blueprint
-import api.services as services
-from api.models import User, create_user_from_dict, Movie, Rating
-from datetime import datetime
-
-# Create a Blueprint instance
-# This will allow us to group related routes together. All the routes in this file will be part of the 'api' Blueprint.
-# This means that the routes will be accessible at '/api/' followed by the route path.
-# For instance, the route '/users' will be accessible at '/api/users'.
-# We can then register the Blueprint with the Flask app in the main.py file.
-
-api_bp = Blueprint("api", __name__)
-
-@api_bp.route('/')
-def home():
-    """
-    Just a generic endpoint that we can use to test if the API is running.
-
-    Returns:
-        str: A timestamp string indicating the current time, alogn with a message.
-    """
-    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S') # Get the current time
-    welcome_message = f'Welcome to the User API!  The current time: {current_time}'
-    return welcome_message, 200
-
-@api_bp.route('/connection')
-def test_connection():
-    """
-    Test the database connection.
-
-    Returns:
-        tuple: A tuple containing a JSON response with a message and an HTTP status code.
-    """
-    services.get_db_connection()
-    return jsonify({'message': 'Successfully connected to the API'}), 200
-
-# ---------------------------------------------------------
-# Users
-# ---------------------------------------------------------
-@api_bp.route("/users", methods=["GET"])
-def get_users():
-    """
-    Retrieve a list of all users or filter users by name.
-    If the query string parameter "starts_with" is provided, filter users by name.
-    If the query string parameter "contains" is provided, filter users by name containing the string.
-
-    Returns:
-        tuple: A tuple containing a JSON response with all users and an HTTP status code 200.
-    """
-    # Example: /api/users?starts_with=A
-    # Example: /api/users?contains=John
-    # Example: /api/users
-    
-    # Get the query string parameter "starts_with" from the request if it's there
-    user_name = request.args.get("starts_with")  # Accessing query string parameter
-    # If user_name is not provided
-    if not user_name:
-        # See if the query string parameter "contains" is provided
-        contains_user_name = request.args.get("contains")
-        if contains_user_name:
-            user_list = services.get_users_by_name(contains_user_name, starts_with=False)
-        # If neither "starts_with" nor "contains" is provided, get all users
-        else:
-            user_list = services.get_all_users()
-    else:
-        # If user_name is provided, filter users by name
-        user_list = services.get_users_by_name(user_name)
-
-    # Convert the list of User objects to a list of dictionaries so that we can jsonify it
-    user_dict_list = [user.to_dict() for user in user_list]
-    return (jsonify(user_dict_list), 200)
-
-@api_bp.route('/users/<int:user_id>', methods=['GET'])
-def lookup_user_by_id(user_id):
-    """
-    Retrieve user information by user ID.
-
-    Args:
-        user_id (int): The unique identifier of the user.
-
-    Returns:
-        tuple: A tuple containing a JSON response and an HTTP status code.
-            - If the user is found, returns a JSON object with user information and status code 200.
-            - If the user is not found, returns a JSON object with an error message and status code 404.
-    """
-    
-    # Example: /api/users/1
-    
-    # Using the database services to get the user by ID
-    user = services.get_user_by_id(user_id)
-    if user:
-        return jsonify(user.to_dict()), 200
-    return jsonify({'message': 'User not found'}), 404
-
-@api_bp.route('/users/<int:user_id>/ratings', methods=['GET'])
-def lookup_ratings_for_user(user_id):
-    """
-    Retrieve all ratings for a specific user by user ID.
-
-    Args:
-        user_id (int): The unique identifier of the user.
-
-    Returns:
-        tuple: A tuple containing a JSON response with all ratings for the user and an HTTP status code.
-    """
-    ratings = services.get_user_ratings(user_id)
-    rating_list = [rating.to_dict() for rating in ratings]
-    ratings_dict = {'user_id': user_id, 'ratings': rating_list}
-    return jsonify(ratings_dict), 200
-
-@api_bp.route('/users', methods=['POST'])
-def add_new_user():
-    """
-    Adds a new user to the system.
-
-    This function retrieves user data from a JSON request, creates a new User object,
-    and adds it to the system using the create_user function.
-    
-    {
-        "username": "new_user",
-        "email": "new_user@example.com"
-    }
-
-    Returns:
-        Response: A JSON response containing a success message and the added user,
-                  with a status code of 201 (Created).
-    """
-    new_user_dict = request.get_json()
-    # We can also use the create_user_from_dict function to create a User object
-    new_user = User(None, new_user_dict['username'], new_user_dict['email'])
-    new_user.id = services.create_user(new_user)
-    return jsonify({'message': 'User added', 'user': new_user.to_dict()}), 201
-
-@api_bp.route('/users/<int:user_id>', methods=['PUT'])
-def update_existing_user(user_id):
-    """
-    Update an existing user with the provided user ID.
-
-    This function retrieves user data from the request's JSON payload,
-    creates a user object from the dictionary, and updates the user
-    in the database.
-
-    Args:
-        user_id (int): The ID of the user to be updated.
-
-    Returns:
-        Response: A JSON response containing a message and the updated user object,
-                  along with an HTTP status code 200.
-    """
-    user_dict = request.get_json()
-    # We can also just create a user directly from the dictionary if we want
-    user_dict['id'] = user_id
-    user = create_user_from_dict(user_dict)
-    services.update_user(user)
-    return jsonify({'message': 'User updated', 'user': user.to_dict()}), 200
-
-@api_bp.route('/users/<int:user_id>', methods=['DELETE'])
-def remove_user(user_id):
-    """
-    Remove a user by their user ID.
-
-    This function deletes a user from the database and returns a JSON response
-    indicating that the user has been deleted.
-
-    Args:
-        user_id (int): The ID of the user to be removed.
-
-    Returns:
-        tuple: A tuple containing a JSON response with a message and an HTTP status code.
-    """
-    services.delete_user(user_id)
-    return jsonify({'message': 'User deleted'}), 200
-
-# ---------------------------------------------------------
-# Movies
-# ---------------------------------------------------------
-@api_bp.route('/movies', methods=['GET'])
-def get_movies():
-    """
-    Retrieve a list of all movies.
-    If the query string parameter "title" is provided, filter movies by title.
-    
-    Returns:
-        tuple: A tuple containing a JSON response with all movies and an HTTP status code 200.
-    """
-    movie_name = request.args.get("title")
-    # If a "start_with" query parameter is provided, filter movies by name otherwise get all movies
-    movies = services.get_movies_by_name(movie_name, starts_with=True) if movie_name else services.get_all_movies()
-    
-    # Convert the list of Movie objects to a list of dictionaries so that we can jsonify it
-    movie_list = [movie.to_dict() for movie in movies]
-    return jsonify(movie_list), 200
-
-@api_bp.route('/movies/<int:movie_id>', methods=['GET'])
-def lookup_movie_by_id(movie_id):
-    """
-    Retrieve movie information by movie ID.
-
-    Args:
-        movie_id (int): The unique identifier of the movie.
-        
-    Returns:
-        tuple: A tuple containing a JSON response and an HTTP status code.
-            - If the movie is found, returns a JSON object with movie information and status code 200.
-            - If the movie is not found, returns a JSON object with an error message and status code 404.
-    """
-    movie = services.get_movie_by_id(movie_id)
-    if movie:
-        return jsonify(movie.to_dict()), 200
-    return jsonify({'message': 'Movie not found'}), 404
-
-@api_bp.route('/movies/<int:movie_id>/ratings', methods=['GET'])
-def lookup_ratings_for_movie(movie_id): 
-    """
-    Retrieve all ratings for a specific movie by movie ID.
-
-    Args:
-        movie_id (int): The unique identifier of the movie.
-
-    Returns:
-        tuple: A tuple containing a JSON response with all ratings for the movie and an HTTP status code.
-    """
-    ratings = services.get_movie_ratings(movie_id)
-    rating_list = ratings
-    movie = services.get_movie_by_id(movie_id)
-    movie.ratings = rating_list
-    return jsonify(movie.to_dict()), 200
-
-
-@api_bp.route('/movies', methods=['POST'])
-def add_new_movie():
-    """
-    Adds a new movie to the system.
-
-    This function retrieves movie data from a JSON request, creates a new Movie object,
-    and adds it to the system using the create_movie function.
-
-    Returns:
-        Response: A JSON response containing a success message and the added movie,
-                  with a status code of 201 (Created).
-    """
-    new_movie_dict = request.get_json()
-    new_movie = Movie.from_dict(new_movie_dict)
-    new_movie_id = services.create_movie(new_movie)
-    new_movie.movie_id = new_movie_id
-    return jsonify({'message': 'Movie added', 'movie': new_movie.to_dict()}), 201
-
-@api_bp.route('/movies/<int:movie_id>', methods=['PUT'])
-def update_existing_movie(movie_id):
-    """
-    Update an existing movie with the provided movie ID.
-
-    This function retrieves movie data from the request's JSON payload,
-    creates a movie object from the dictionary, and updates the movie
-    in the database.
-
-    Args:
-        movie_id (int): The ID of the movie to be updated.
-
-    Returns:
-        Response: A JSON response containing a message and the updated movie object,
-                  along with an HTTP status code 200.
-    """
-    movie_dict = request.get_json()
-    movie = Movie.from_dict(movie_dict)
-    movie.movie_id = movie_id
-    services.update_movie(movie)
-    return jsonify({'message': 'Movie updated', 'movie': movie.to_dict()}), 200
-
-@api_bp.route('/movies/<int:movie_id>', methods=['DELETE'])
-def remove_movie(movie_id):
-    """
-    Remove a movie by its movie ID.
-
-    This function deletes a movie from the database and returns a JSON response
-    indicating that the movie has been deleted.
-
-    Args:
-        movie_id (int): The ID of the movie to be removed.
-
-    Returns:
-        tuple: A tuple containing a JSON response with a message and an HTTP status code.
-    """
-    services.delete_movie(movie_id)
-    return jsonify({'message': 'Movie deleted'}), 200
-
-# ---------------------------------------------------------
-# Ratings
-# ---------------------------------------------------------
-@api_bp.route('/ratings', methods=['POST'])
-def add_new_rating():
-    """
-    Adds a new rating to the system.
-
-    This function retrieves rating data from a JSON request, creates a new Rating object,
-    and adds it to the system using the create_rating function.
-
-    Returns:
-        Response: A JSON response containing a success message and the added rating,
-                  with a status code of 201 (Created).
-    """
-    new_rating_dict = request.get_json()
-    new_rating = Rating.from_dict(new_rating_dict)
-    new_rating_id = services.create_rating(new_rating)
-    new_rating.rating_id = new_rating_id
-    return jsonify({'message': 'Rating added', 'rating': new_rating.to_dict()}), 201
-
-@api_bp.route('/ratings/<int:rating_id>', methods=['PUT'])
-def update_existing_rating(rating_id):
-    """
-    Update an existing rating with the provided rating ID.
-
-    This function retrieves rating data from the request's JSON payload,
-    creates a rating object from the dictionary, and updates the rating
-    in the database.
-
-    Args:
-        rating_id (int): The ID of the rating to be updated.
-
-    Returns:
-        Response: A JSON response containing a message and the updated rating object,
-                  along with an HTTP status code 200.
-    """
-    rating_dict = request.get_json()
-    rating = Rating.from_dict(rating_dict)
-    rating.rating_id = rating_id
-    services.update_rating(rating)
-    return jsonify({'message': 'Rating updated', 'rating': rating.to_dict()}), 200
-
-@api_bp.route('/ratings/<int:rating_id>', methods=['DELETE'])
-def remove_rating(rating_id):
-    """
-    Remove a rating by its rating ID.
-
-    This function deletes a rating from the database and returns a JSON response
-    indicating that the rating has been deleted.
-
-    Args:
-        rating_id (int): The ID of the rating to be removed.
-
-    Returns:
-        tuple: A tuple containing a JSON response with a message and an HTTP status code.
-    """
-    services.delete_rating(rating_id)
-    return jsonify({'message': 'Rating deleted'}), 200
-
-@api_bp.route('/ratings/<int:rating_id>', methods=['GET'])
-def lookup_rating_by_id(rating_id):
-    """
-    Retrieve rating information by rating ID.
-
-    Args:
-        rating_id (int): The unique identifier of the rating.
-
-    Returns:
-        tuple: A tuple containing a JSON response and an HTTP status code.
-            - If the rating is found, returns a JSON object with rating information and status code 200.
-            - If the rating is not found, returns a JSON object with an error message and status code 404.
-    """
-    rating = services.get_rating_by_id(rating_id)
-    if rating:
-        return jsonify(rating.to_dict()), 200
+from flask import jsonify, request, Blueprint
+import api.services as services
+from api import analytics, cache, config, db, pagination, response_cache, serialization, similar_movies, streaming, trigram, validation
+from api.conditional import conditional, current_row_version, row_validators, table_validators
+from api.response_cache import cached
+from api.models import User, create_user_from_dict, Movie, Rating
+from api.pagination import PaginationError
+from api.query_builder import QueryError
+from api.validation import ValidationError
+from datetime import datetime
+from urllib.parse import urlencode
+
+# Create a Blueprint instance
+# This will allow us to group related routes together. All the routes in this file will be part of the 'api' Blueprint.
+# This means that the routes will be accessible at '/api/' followed by the route path.
+# For instance, the route '/users' will be accessible at '/api/users'.
+# We can then register the Blueprint with the Flask app in the main.py file.
+
+api_bp = Blueprint("api", __name__)
+
+# ---------------------------------------------------------
+# Pagination helpers
+# ---------------------------------------------------------
+# The list endpoints return one page of results at a time.  The client can pass "limit" to choose
+#  the page size, and if there are more results the response has a Link header (and an
+#  X-Next-Cursor header) pointing at the next page.  For example:
+#     GET /api/movies?limit=2
+#     Link: <http://localhost:5000/api/movies?limit=2&cursor=WzJd>; rel="next"
+@api_bp.errorhandler(PaginationError)
+def handle_pagination_error(error):
+    """
+    Turn a bad "limit" or "cursor" query string parameter into a 400 Bad Request response.
+    """
+    return jsonify({'message': str(error)}), 400
+
+def read_page_args(maximum: int = None, key_types: tuple = (int,)) -> tuple:
+    """
+    Read the "limit" and "cursor" query string parameters of the current request.
+
+    Args:
+        maximum (int, optional): The largest page size allowed. Defaults to config.MAX_PAGE_SIZE.
+        key_types (tuple, optional): The type of each part of the sort key in the cursor.
+                                     Defaults to a single integer id.
+
+    Returns:
+        tuple: The page size and the key to start after (None for the first page).  A key with a
+               single part is returned on its own, otherwise as a tuple.
+    Raises:
+        PaginationError: If the limit or cursor isn't valid.
+    """
+    limit = request.args.get("limit")
+    try:
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        raise PaginationError("limit must be a positive integer")
+    limit = pagination.clamp_limit(limit, maximum)
+
+    after = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        key = pagination.decode_cursor(cursor)
+        if len(key) != len(key_types) or not all(pagination.is_key_part(part, key_type)
+                                                 for part, key_type in zip(key, key_types)):
+            raise pagination.InvalidCursorError(f"Invalid cursor: {cursor!r}")
+        after = key[0] if len(key) == 1 else key
+    return limit, after
+
+def paged_response(body, next_cursor: str):
+    """
+    Build a JSON response, adding the link to the next page if there is one.
+    The body is encoded by api/serialization.py, with the faster JSON encoder if it is installed.
+
+    Args:
+        body: The data to send.
+        next_cursor (str): The cursor of the next page, or None if this is the last page.
+
+    Returns:
+        Response: The JSON response.
+    """
+    response = serialization.json_response(body)
+    if next_cursor is not None:
+        # Keep all of the other query string parameters (filters, limit) and swap in the new cursor
+        args = request.args.copy()
+        args["cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(list(args.items(multi=True)))}>; rel="next"'
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+# ---------------------------------------------------------
+# Bulk insert helpers
+# ---------------------------------------------------------
+# The /bulk endpoints take a JSON array of items (or newline-delimited JSON, one item per line,
+#  with Content-Type: application/x-ndjson) and insert all of the valid ones in a few big
+#  transactions.  For example:
+#     POST /api/ratings/bulk
+#     [{"user_id": 1, "movie_id": 2, "rating": 5, "review": "Great", "date": "1/1/2023"}, ...]
+@api_bp.errorhandler(ValidationError)
+def handle_validation_error(error):
+    """
+    Turn a request body we can't use at all into a 400 Bad Request response.
+    """
+    return jsonify({'message': str(error)}), 400
+
+# ---------------------------------------------------------
+# Filter helpers
+# ---------------------------------------------------------
+# The list endpoints accept filters in the query string, for example:
+#     GET /api/movies?genre=Drama,Crime&year_from=1990&year_to=1999&sort=-rank_score
+@api_bp.errorhandler(QueryError)
+def handle_query_error(error):
+    """
+    Turn a filter or sort order we can't use into a 400 Bad Request response.
+    """
+    return jsonify({'message': str(error)}), 400
+
+def read_number_arg(name: str, cast=int):
+    """
+    Read a numeric query string parameter of the current request.
+
+    Args:
+        name (str): The parameter's name.
+        cast (callable, optional): int or float. Defaults to int.
+
+    Returns:
+        The number, or None if the parameter wasn't given.
+    Raises:
+        QueryError: If the parameter isn't a number.
+    """
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise QueryError(f"{name} must be a number")
+
+def read_sort_arg() -> dict:
+    """
+    Read the "sort" query string parameter, e.g. "title" or "-rank_score" (a leading "-" sorts the other way round).
+
+    Returns:
+        dict: The sort and descending arguments for the services query functions (empty if there is no sort).
+    """
+    sort = request.args.get("sort")
+    if not sort:
+        return {}
+    return {"sort": sort.lstrip("-"), "descending": sort.startswith("-")}
+
+def read_movie_filters() -> dict:
+    """
+    Read the movie filters from the query string of the current request (see services.movie_query).
+
+    Returns:
+        dict: The filters that were given, as keyword arguments for services.find_movies.
+    Raises:
+        QueryError: If a filter isn't valid.
+    """
+    filters = read_sort_arg()
+    # ?genre=Drama&genre=Crime and ?genre=Drama,Crime both ask for either genre
+    genres = [genre.strip() for value in request.args.getlist("genre") for genre in value.split(",") if genre.strip()]
+    if genres:
+        filters["genres"] = genres
+    for name in ("title", "director", "director_starts_with"):
+        if request.args.get(name):
+            filters[name] = request.args[name]
+    year = read_number_arg("year")
+    filters["year_from"] = year if year is not None else read_number_arg("year_from")
+    filters["year_to"] = year if year is not None else read_number_arg("year_to")
+    filters["min_score"] = read_number_arg("min_score", float)
+    filters["max_score"] = read_number_arg("max_score", float)
+    # Leave out the ones that weren't given
+    return {name: value for name, value in filters.items() if value is not None}
+
+def bulk_create(kind: str, create_many):
+    """
+    Validate the items in the request body and insert the valid ones.
+
+    Invalid items are skipped and reported back, the rest are still inserted.  The optional query
+    string parameter "batch_size" sets how many rows go in each transaction.
+
+    Args:
+        kind (str): "user", "movie" or "rating" (see validation.VALIDATORS).
+        create_many (callable): The services function that inserts a list of model objects.
+
+    Returns:
+        tuple: A JSON response and an HTTP status code.  The response has the number of items created,
+               "ids" with the new id of every item in the request (null for the invalid ones) and
+               "errors" with the problems found with each invalid item.  The status is 201 unless
+               every item was invalid, in which case it is 400.  If a transaction fails part way
+               through the status is 500, and "ids" still has the items that were saved before it.
+    """
+    ndjson = request.mimetype == streaming.NDJSON_MIMETYPE
+    items = validation.parse_items(request.get_data(), ndjson=ndjson, max_items=config.MAX_BULK_ITEMS)
+    valid, errors = validation.validate_items(kind, items)
+    batch_size = request.args.get("batch_size", type=int)
+    if batch_size is not None and batch_size <= 0:
+        raise ValidationError("batch_size must be a positive integer")
+
+    failure = None
+    try:
+        new_ids = create_many([item for _, item in valid], batch_size) if valid else []
+    except services.BulkInsertError as error:
+        # The earlier batches were committed, so the client needs to know which items they were
+        new_ids, failure = error.ids, str(error)
+    # Line the new ids up with the items the client sent
+    ids = [None] * len(items)
+    for (index, _), new_id in zip(valid, new_ids):
+        ids[index] = new_id
+    body = {'created': len(new_ids), 'ids': ids, 'errors': errors}
+    if failure is not None:
+        return jsonify(dict(body, message=failure)), 500
+    status = 400 if errors and not new_ids else 201
+    return jsonify(body), status
+
+@api_bp.route('/')
+def home():
+    """
+    Just a generic endpoint that we can use to test if the API is running.
+
+    Returns:
+        str: A timestamp string indicating the current time, alogn with a message.
+    """
+    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S') # Get the current time
+    welcome_message = f'Welcome to the User API!  The current time: {current_time}'
+    return welcome_message, 200
+
+@api_bp.route('/connection')
+def test_connection():
+    """
+    Test the database connection.
+    The response also includes the connection pool and cache metrics, which is handy for monitoring.
+
+    Returns:
+        tuple: A tuple containing a JSON response with a message and an HTTP status code.
+    """
+    with db.get_connection() as conn:
+        conn.execute("SELECT 1")
+    return jsonify({'message': 'Successfully connected to the API', 'pool': db.pool_stats(),
+                    'cache': cache.stats(), 'name_search': trigram.stats(),
+                    'analytics': analytics.stats(), 'response_cache': response_cache.stats()}), 200
+
+# ---------------------------------------------------------
+# Genres and directors
+# ---------------------------------------------------------
+def list_names(kind: str, id_field: str):
+    """
+    Retrieve a page of genres or directors.  The query string parameter "name" looks one up by
+    name, and "limit" and "cursor" page through the list.
+
+    Args:
+        kind (str): "genre" or "director".
+        id_field (str): The name of the id in the JSON ("genre_id" or "person_id").
+
+    Returns:
+        tuple: A tuple containing a JSON response with the genres or directors and an HTTP status code 200.
+    """
+    limit, after = read_page_args()
+    names = services.get_names(kind, name=request.args.get("name"), after=after, limit=limit + 1)
+    names, next_cursor = pagination.split_page(names, limit, key=lambda item: (getattr(item, id_field),))
+    return paged_response([item.to_dict() for item in names], next_cursor), 200
+
+def list_linked_movies(kind: str, name_id: int, id_field: str):
+    """
+    Retrieve a genre or director with a page of their movies, in movie_id order.
+    The query string parameters "limit" and "cursor" page through the movies.
+
+    Args:
+        kind (str): "genre" or "director".
+        name_id (int): The genre_id or person_id.
+        id_field (str): The name of the id in the JSON ("genre_id" or "person_id").
+
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - If the genre/director is found, returns it with its movies and status code 200.
+            - If not, returns a JSON object with an error message and status code 404.
+    """
+    item = services.get_name_by_id(kind, name_id)
+    if item is None:
+        return jsonify({'message': f'{kind.capitalize()} not found'}), 404
+    limit, after = read_page_args()
+    movies = services.get_linked_movies(kind, name_id, after=after, limit=limit + 1)
+    movies, next_cursor = pagination.split_page(movies, limit, key=lambda movie: (movie.movie_id,))
+    body = item.to_dict()
+    body['movies'] = [movie.to_dict() for movie in movies]
+    return paged_response(body, next_cursor), 200
+
+@api_bp.route('/genres', methods=['GET'])
+def get_genres():
+    """
+    Retrieve a page of genres, e.g. /api/genres or /api/genres?name=Drama (see list_names).
+    """
+    return list_names("genre", "genre_id")
+
+@api_bp.route('/genres/<int:genre_id>/movies', methods=['GET'])
+def lookup_movies_for_genre(genre_id):
+    """
+    Retrieve a genre and a page of its movies, e.g. /api/genres/3/movies?limit=20 (see list_linked_movies).
+    """
+    return list_linked_movies("genre", genre_id, "genre_id")
+
+@api_bp.route('/directors', methods=['GET'])
+def get_directors():
+    """
+    Retrieve a page of directors, e.g. /api/directors?name=Christopher Nolan (see list_names).
+    """
+    return list_names("director", "person_id")
+
+@api_bp.route('/directors/<int:person_id>/movies', methods=['GET'])
+def lookup_movies_for_director(person_id):
+    """
+    Retrieve a director and a page of their movies, e.g. /api/directors/7/movies (see list_linked_movies).
+    """
+    return list_linked_movies("director", person_id, "person_id")
+
+# ---------------------------------------------------------
+# Analytics
+# ---------------------------------------------------------
+# These are worked out from a snapshot of the ratings held in memory (see api/analytics.py), so
+#  every response says when the snapshot was taken ("as_of").
+# The names used in the URL for the fields the ratings can be grouped by
+RATING_GROUPS = {"genre": "genre", "release-year": "release_year", "date": "date"}
+
+@api_bp.route('/analytics/ratings/by-<group>', methods=['GET'])
+def ratings_by_group(group):
+    """
+    Group the ratings by genre, by the release year of the movie or by the day they were made,
+    and return the number, mean and standard deviation of each group.
+    For dates, the query string parameters "start" and "end" limit the days included.
+
+    Args:
+        group (str): "genre", "release-year" or "date".
+
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - A JSON object with "as_of" and "groups" and status code 200.
+            - If the group isn't one of the above, a JSON object with an error message and status code 404.
+            - If "start" or "end" isn't a date, a JSON object with an error message and status code 400.
+    """
+    # Example: /api/analytics/ratings/by-genre
+    # Example: /api/analytics/ratings/by-date?start=2024-01-01&end=2024-01-31
+    if group not in RATING_GROUPS:
+        return jsonify({'message': f'Ratings can be grouped by {", ".join(RATING_GROUPS)}'}), 404
+    groups, as_of = services.get_ratings_by(RATING_GROUPS[group], start=request.args.get("start"),
+                                            end=request.args.get("end"))
+    return jsonify({'as_of': as_of.isoformat(), 'groups': [item.to_dict() for item in groups]}), 200
+
+@api_bp.route('/analytics/<any(users, movies):kind>/activity', methods=['GET'])
+def rating_activity(kind):
+    """
+    Describe how the ratings are spread over the users or the movies.
+    The query string parameter "percentiles" (e.g. "50,90,99") chooses the percentiles returned.
+
+    Args:
+        kind (str): "users" or "movies".
+
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - A JSON object with "as_of", the number of users (or movies), the mean and maximum
+              number of ratings each and "percentiles", and status code 200.
+            - If a percentile isn't a number from 0 to 100, a JSON object with an error message and status code 400.
+    """
+    # Example: /api/analytics/users/activity?percentiles=50,90,99
+    percentiles = request.args.get("percentiles")
+    if percentiles:
+        try:
+            percentiles = [float(percentile) for percentile in percentiles.split(",")]
+        except ValueError:
+            raise QueryError("percentiles must be numbers separated by commas")
+    activity, as_of = services.get_rating_activity(kind, percentiles or config.ANALYTICS_PERCENTILES)
+    return jsonify({'as_of': as_of.isoformat(), **activity}), 200
+
+# ---------------------------------------------------------
+# Search
+# ---------------------------------------------------------
+@api_bp.route('/search', methods=['GET'])
+def search():
+    """
+    Full-text search over the movies (title, director and genre) or the text of the reviews.
+    The query string parameter "q" is the search text and "type" is "movies" (the default) or
+    "reviews".  Results come best match first, and "limit" and "cursor" page through them.
+
+    Returns:
+        tuple: A tuple containing a JSON response with the results and an HTTP status code.
+            - Each result is the movie or rating with its "score" (higher is better) and a "snippet"
+              of the matching text with the search terms wrapped in <mark> tags.
+            - If "q" is missing or "type" isn't valid, returns an error message and status code 400.
+    """
+    # Example: /api/search?q=nolan
+    # Example: /api/search?q=amazing&type=reviews&limit=10
+    text = request.args.get("q", "").strip()
+    kind = request.args.get("type", "movies")
+    searches = {"movies": services.search_movies, "reviews": services.search_reviews}
+    if not text:
+        return jsonify({'message': 'The query string parameter "q" is required'}), 400
+    if kind not in searches:
+        return jsonify({'message': 'type must be "movies" or "reviews"'}), 400
+
+    # The cursor is the (rank, id) of the last result, see services.run_search
+    limit, after = read_page_args(key_types=(float, int))
+    results = searches[kind](text, after=after, limit=limit + 1)
+    results, next_cursor = pagination.split_page(results, limit, key=lambda result: result.key)
+    return paged_response([result.to_dict() for result in results], next_cursor), 200
+
+# ---------------------------------------------------------
+# Users
+# ---------------------------------------------------------
+@api_bp.route("/users", methods=["GET"])
+@cached("users", ("users",))
+def get_users():
+    """
+    Retrieve a page of users, optionally filtered by name.
+    If the query string parameter "starts_with" is provided, filter users by name.
+    If the query string parameter "contains" is provided, filter users by name containing the string.
+    If the query string parameter "similar_to" is provided, return the users whose name looks like it
+    (typos and all), most similar first.  That list isn't paged, so "cursor" is ignored.
+    The query string parameters "limit" and "cursor" page through the results (see read_page_args).
+
+    Returns:
+        tuple: A tuple containing a JSON response with the users and an HTTP status code 200.
+    """
+    # Example: /api/users?starts_with=A
+    # Example: /api/users?contains=John
+    # Example: /api/users?similar_to=jonh
+    # Example: /api/users?limit=10
+    limit, after = read_page_args()
+
+    similar_to = request.args.get("similar_to")
+    if similar_to:
+        results = services.fuzzy_search_users(similar_to, limit=limit)
+        return jsonify([result.to_dict() for result in results]), 200
+    
+    # Get the query string parameter "starts_with" from the request if it's there
+    user_name = request.args.get("starts_with")  # Accessing query string parameter
+    # We ask for one more user than we need, so we know whether there is another page
+    # The lists are read as database rows and turned straight into JSON (see api/serialization.py),
+    #  which is much quicker than making a User object for each one first
+    # If user_name is not provided
+    if not user_name:
+        # See if the query string parameter "contains" is provided
+        contains_user_name = request.args.get("contains")
+        if contains_user_name:
+            rows = services.get_users_by_name(contains_user_name, starts_with=False, after=after, limit=limit + 1,
+                                              raw=True)
+        # If neither "starts_with" nor "contains" is provided, get all users
+        else:
+            rows = services.get_all_users(after=after, limit=limit + 1, raw=True)
+    else:
+        # If user_name is provided, filter users by name
+        rows = services.get_users_by_name(user_name, after=after, limit=limit + 1, raw=True)
+    rows, next_cursor = pagination.split_page(rows, limit, key=lambda row: (row["user_id"],))
+
+    # Turn the rows into the same dictionaries User.to_dict() would give
+    return paged_response(serialization.USER.to_dicts(rows), next_cursor), 200
+
+# The conditional endpoints send ETag and Last-Modified headers, and answer a client whose copy is
+#  still current with a 304 Not Modified (see api/conditional.py)
+@api_bp.route('/users/<int:user_id>', methods=['GET'])
+@conditional(lambda user_id: row_validators("users", user_id))
+def lookup_user_by_id(user_id):
+    """
+    Retrieve user information by user ID.
+
+    Args:
+        user_id (int): The unique identifier of the user.
+
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - If the user is found, returns a JSON object with user information and status code 200.
+            - If the user is not found, returns a JSON object with an error message and status code 404.
+    """
+    
+    # Example: /api/users/1
+    
+    # Using the database services to get the user by ID
+    # The version the response is tagged with, so a cached copy of an older one isn't sent
+    user = services.get_user_by_id(user_id, row_version=current_row_version())
+    if user:
+        return jsonify(user.to_dict()), 200
+    return jsonify({'message': 'User not found'}), 404
+
+@api_bp.route('/users/<int:user_id>/ratings', methods=['GET'])
+@conditional(lambda user_id: table_validators("ratings"))
+def lookup_ratings_for_user(user_id):
+    """
+    Retrieve a page of ratings for a specific user by user ID.
+    The query string parameters "min_rating" and "max_rating" only keep ratings with that many stars,
+    and "limit" and "cursor" page through the ratings.
+
+    Args:
+        user_id (int): The unique identifier of the user.
+
+    Returns:
+        tuple: A tuple containing a JSON response with the ratings for the user and an HTTP status code.
+    """
+    # Example: /api/users/1/ratings?min_rating=4
+    limit, after = read_page_args()
+    rows = services.get_user_ratings(user_id, after=after, limit=limit + 1, raw=True,
+                                     min_rating=read_number_arg("min_rating"), max_rating=read_number_arg("max_rating"))
+    rows, next_cursor = pagination.split_page(rows, limit, key=lambda row: (row["rating_id"],))
+    ratings_dict = {'user_id': user_id, 'ratings': serialization.RATING.to_dicts(rows)}
+    return paged_response(ratings_dict, next_cursor), 200
+
+@api_bp.route('/users/<int:user_id>/recommendations', methods=['GET'])
+def lookup_recommendations_for_user(user_id):
+    """
+    Recommend movies to a user, from the movies that are most like the ones they rated.
+    The query string parameter "limit" sets how many movies to return.  The list isn't paged.
+
+    Args:
+        user_id (int): The unique identifier of the user.
+
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - If the user is found, returns the recommended movies (best first) and status code 200.
+              Each movie has a "score", the rating the user is expected to give it.
+            - If the user is not found, returns a JSON object with an error message and status code 404.
+    """
+    # Example: /api/users/1/recommendations?limit=10
+    limit, _ = read_page_args()
+    if services.get_user_by_id(user_id) is None:
+        return jsonify({'message': 'User not found'}), 404
+    recommendations = services.get_recommendations(user_id, limit=limit)
+    return jsonify([recommendation.to_dict() for recommendation in recommendations]), 200
+
+@api_bp.route('/users', methods=['POST'])
+def add_new_user():
+    """
+    Adds a new user to the system.
+
+    This function retrieves user data from a JSON request, creates a new User object,
+    and adds it to the system using the create_user function.
+    
+    {
+        "username": "new_user",
+        "email": "new_user@example.com"
+    }
+
+    Returns:
+        Response: A JSON response containing a success message and the added user,
+                  with a status code of 201 (Created).
+    """
+    new_user_dict = request.get_json()
+    # We can also use the create_user_from_dict function to create a User object
+    new_user = User(None, new_user_dict['username'], new_user_dict['email'])
+    new_user.id = services.create_user(new_user)
+    return jsonify({'message': 'User added', 'user': new_user.to_dict()}), 201
+
+@api_bp.route('/users/bulk', methods=['POST'])
+def add_new_users():
+    """
+    Adds many users to the system at once (see bulk_create).
+
+    Returns:
+        tuple: A JSON response with the new user IDs and any errors, and an HTTP status code.
+    """
+    return bulk_create("user", services.create_users)
+
+@api_bp.route('/users/<int:user_id>', methods=['PUT'])
+def update_existing_user(user_id):
+    """
+    Update an existing user with the provided user ID.
+
+    This function retrieves user data from the request's JSON payload,
+    creates a user object from the dictionary, and updates the user
+    in the database.
+
+    Args:
+        user_id (int): The ID of the user to be updated.
+
+    Returns:
+        Response: A JSON response containing a message and the updated user object,
+                  along with an HTTP status code 200.
+    """
+    user_dict = request.get_json()
+    # We can also just create a user directly from the dictionary if we want
+    user_dict['id'] = user_id
+    user = create_user_from_dict(user_dict)
+    services.update_user(user)
+    return jsonify({'message': 'User updated', 'user': user.to_dict()}), 200
+
+@api_bp.route('/users/<int:user_id>', methods=['DELETE'])
+def remove_user(user_id):
+    """
+    Remove a user by their user ID.
+
+    This function deletes a user from the database and returns a JSON response
+    indicating that the user has been deleted.
+
+    Args:
+        user_id (int): The ID of the user to be removed.
+
+    Returns:
+        tuple: A tuple containing a JSON response with a message and an HTTP status code.
+    """
+    services.delete_user(user_id)
+    return jsonify({'message': 'User deleted'}), 200
+
+# ---------------------------------------------------------
+# Movies
+# ---------------------------------------------------------
+def movie_list_tables() -> tuple:
+    """
+    The tables GET /api/movies is built from.  The list only changes with the movies table, unless
+    it is filtered or sorted by rank_score, which changes with the ratings.
+
+    Returns:
+        tuple: The tables, or None for a streamed response (which is neither conditional nor cached).
+    """
+    if streaming.stream_format():
+        return None
+    filters = read_movie_filters()
+    if "min_score" in filters or "max_score" in filters or filters.get("sort") == "rank_score":
+        return ("movies", "ratings")
+    return ("movies",)
+
+def movie_list_validators():
+    """The validators of GET /api/movies (see api/conditional.py), or None for a streamed response."""
+    tables = movie_list_tables()
+    return table_validators(*tables) if tables else None
+
+# The busiest list endpoints keep their responses in api/response_cache.py
+@api_bp.errorhandler(response_cache.SingleFlightTimeoutError)
+def handle_single_flight_timeout(error):
+    """
+    Turn giving up on waiting for another request to build the same response into a 503 Service
+    Unavailable response, so the client can try again rather than the request hanging.
+    """
+    return jsonify({'message': str(error)}), 503, {'Retry-After': '1'}
+
+@api_bp.route('/movies', methods=['GET'])
+@conditional(movie_list_validators)
+@cached("movies", movie_list_tables)
+def get_movies():
+    """
+    Retrieve a page of movies.
+    If the query string parameter "title" is provided, filter movies by title.
+    The movies can also be filtered by "genre" (one or more, comma separated), "director",
+    "director_starts_with", "year" (or a range with "year_from" and "year_to") and "min_score" /
+    "max_score" (their rank_score), and sorted with "sort" (see read_movie_filters).  A sorted
+    list isn't paged, so "cursor" can only be used without "sort".
+    If the query string parameter "similar_to" is provided, return the movies whose title looks like it
+    (typos and all), most similar first.  That list isn't paged, so "cursor" is ignored.
+    The query string parameters "limit" and "cursor" page through the results (see read_page_args).
+    Clients can instead have every matching movie streamed to them (see api/streaming.py).
+    
+    Returns:
+        tuple: A tuple containing a JSON response with the movies and an HTTP status code 200.
+    """
+    # Example: /api/movies?genre=Drama,Crime&year_from=1990&year_to=1999
+    # Example: /api/movies?director_starts_with=nolan&sort=-release_year
+    filters = read_movie_filters()
+    # Example: /api/movies?stream=true or an "Accept: application/x-ndjson" header
+    fmt = streaming.stream_format()
+    if fmt:
+        return streaming.stream_items(services.iter_movies(**filters), Movie.to_dict, fmt)
+
+    limit, after = read_page_args()
+    # Example: /api/movies?similar_to=dark nite
+    similar_to = request.args.get("similar_to")
+    if similar_to:
+        results = services.fuzzy_search_movies(similar_to, limit=limit)
+        return jsonify([result.to_dict() for result in results]), 200
+
+    # The movies are read as database rows and turned straight into JSON (see api/serialization.py)
+    # A sorted list is just the first "limit" movies
+    if "sort" in filters and (filters["sort"], filters["descending"]) != ("movie_id", False):
+        rows = services.find_movies(after=after, limit=limit, raw=True, **filters)
+        return serialization.json_response(serialization.MOVIE.to_dicts(rows)), 200
+
+    # We ask for one more movie than we need, so we know whether there is another page
+    rows = services.find_movies(after=after, limit=limit + 1, raw=True, **filters)
+    rows, next_cursor = pagination.split_page(rows, limit, key=lambda row: (row["movie_id"],))
+    
+    # Turn the rows into the same dictionaries Movie.to_dict() would give
+    return paged_response(serialization.MOVIE.to_dicts(rows), next_cursor), 200
+
+@api_bp.route('/movies/top', methods=['GET'])
+def get_top_movies():
+    """
+    Retrieve the highest ranked movies (see services.get_top_movies).
+    The query string parameters "genre" and "year" narrow the list down, and "limit" sets how many
+    movies to return.  The list isn't paged, so "cursor" is ignored.
+
+    Returns:
+        tuple: A tuple containing a JSON response with the movies, best first, and an HTTP status code 200.
+    """
+    # Example: /api/movies/top?genre=Drama&limit=10
+    # Example: /api/movies/top?year=2010
+    limit, _ = read_page_args()
+    genre = request.args.get("genre")
+    year = request.args.get("year", type=int)
+    movies = services.get_top_movies(genre=genre, year=year, limit=limit)
+    return jsonify([movie.to_dict() for movie in movies]), 200
+
+@api_bp.route('/movies/<int:movie_id>', methods=['GET'])
+@conditional(lambda movie_id: row_validators("movies", movie_id))
+def lookup_movie_by_id(movie_id):
+    """
+    Retrieve movie information by movie ID.
+
+    Args:
+        movie_id (int): The unique identifier of the movie.
+        
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - If the movie is found, returns a JSON object with movie information and status code 200.
+            - If the movie is not found, returns a JSON object with an error message and status code 404.
+    """
+    # The version the response is tagged with, so a cached copy of an older one isn't sent
+    movie = services.get_movie_by_id(movie_id, row_version=current_row_version())
+    if movie:
+        return jsonify(movie.to_dict()), 200
+    return jsonify({'message': 'Movie not found'}), 404
+
+@api_bp.route('/movies/<int:movie_id>/ratings', methods=['GET'])
+@cached("movie_ratings", lambda: None if streaming.stream_format() else ("movies", "ratings"))
+def lookup_ratings_for_movie(movie_id):
+    """
+    Retrieve a movie and its ratings by movie ID.
+    The query string parameters "limit" and "cursor" page through the ratings,
+    and at most config.MAX_RATINGS_PER_MOVIE ratings are returned at once.
+    Clients can instead have every rating streamed to them (see api/streaming.py).
+
+    Args:
+        movie_id (int): The unique identifier of the movie.
+
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - If the movie is found, returns the movie with its ratings and status code 200.
+            - If the movie is not found, returns a JSON object with an error message and status code 404.
+    """
+    fmt = streaming.stream_format()
+    if fmt:
+        movie = services.get_movie_by_id(movie_id)
+        if movie is None:
+            return jsonify({'message': 'Movie not found'}), 404
+        ratings = services.iter_movie_ratings(movie_id)
+        return streaming.stream_items(ratings, Rating.to_dict, fmt, envelope=movie.to_dict(), field="ratings")
+
+    # Example: /api/movies/1/ratings?limit=20
+    limit, after = read_page_args(maximum=config.MAX_RATINGS_PER_MOVIE)
+    movie, rows = services.get_movie_with_ratings(movie_id, limit=limit + 1, after=after, raw=True)
+    if movie is None:
+        return jsonify({'message': 'Movie not found'}), 404
+    rows, next_cursor = pagination.split_page(rows, limit, key=lambda row: (row["rating_id"],))
+    movie_dict = movie.to_dict()
+    # The ratings go straight from the rows into JSON (see api/serialization.py).  Like
+    #  Movie.to_dict(), a movie without ratings has no "ratings" key.
+    if rows:
+        movie_dict['ratings'] = serialization.RATING.to_dicts(rows)
+    return paged_response(movie_dict, next_cursor), 200
+
+@api_bp.route('/movies/<int:movie_id>/stats', methods=['GET'])
+def lookup_stats_for_movie(movie_id):
+    """
+    Retrieve the rating statistics for a movie: how many ratings it has, their mean and
+    standard deviation, and how many of each score (1-5) it got.
+
+    Args:
+        movie_id (int): The unique identifier of the movie.
+
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - If the movie is found, returns its statistics and status code 200.
+            - If the movie is not found, returns a JSON object with an error message and status code 404.
+    """
+    stats = services.get_movie_rating_stats(movie_id)
+    if stats is None:
+        return jsonify({'message': 'Movie not found'}), 404
+    return jsonify(stats.to_dict()), 200
+
+
+def trend_response(movie_id: int = None):
+    """
+    Build the response of the trend endpoints from the "from", "to" and "bucket" query string parameters.
+
+    Args:
+        movie_id (int, optional): The movie, or None for every movie.
+
+    Returns:
+        dict: The bucket and the list of periods.
+    """
+    bucket = request.args.get("bucket", "day")
+    trend = services.get_rating_trend(movie_id, start=request.args.get("from"), end=request.args.get("to"),
+                                      bucket=bucket)
+    return {'bucket': bucket, 'trend': [period.to_dict() for period in trend]}
+
+
+@api_bp.route('/movies/<int:movie_id>/trend', methods=['GET'])
+def lookup_trend_for_movie(movie_id):
+    """
+    Retrieve how a movie's ratings changed over time: the number, mean and standard deviation of
+    the ratings made in each day, week, month or year.
+    The query string parameters "from" and "to" (ISO dates) limit the days included, and "bucket"
+    ("day", "week", "month" or "year", "day" by default) sets the length of each period.
+
+    Args:
+        movie_id (int): The unique identifier of the movie.
+
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - If the movie is found, returns the periods with ratings (oldest first) and status code 200.
+            - If the movie is not found, returns a JSON object with an error message and status code 404.
+            - If a date or the bucket isn't valid, returns a JSON object with an error message and status code 400.
+    """
+    # Example: /api/movies/1/trend?from=2024-01-01&to=2024-03-31&bucket=week
+    if services.get_movie_by_id(movie_id) is None:
+        return jsonify({'message': 'Movie not found'}), 404
+    return jsonify({'movie_id': movie_id, **trend_response(movie_id)}), 200
+
+
+@api_bp.errorhandler(similar_movies.IndexNotBuiltError)
+def handle_index_not_built(error):
+    """
+    Turn a missing similar movies index into a 503 Service Unavailable response.  Building it is
+    far too slow for a request, it is left to utility/build_similar_movies.py.
+    """
+    return jsonify({'message': str(error)}), 503
+
+@api_bp.route('/movies/<int:movie_id>/similar', methods=['GET'])
+def lookup_similar_movies(movie_id):
+    """
+    Retrieve the movies most like a movie: rated alike by the same users, with the same genres or
+    directors, and from around the same time.
+    The query string parameter "limit" sets how many movies to return.  The list isn't paged.
+
+    Args:
+        movie_id (int): The unique identifier of the movie.
+
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - If the movie is found, returns the similar movies (most similar first) and status code 200.
+              Each movie has a "score", its similarity from 0 to 1.
+            - If the movie is not found, returns a JSON object with an error message and status code 404.
+            - If the index hasn't been built yet, returns a JSON object with an error message and status code 503.
+    """
+    # Example: /api/movies/1/similar?limit=5
+    limit, _ = read_page_args()
+    if services.get_movie_by_id(movie_id) is None:
+        return jsonify({'message': 'Movie not found'}), 404
+    similar = services.get_similar_movies(movie_id, limit=limit)
+    return jsonify([result.to_dict() for result in similar]), 200
+
+
+@api_bp.route('/movies', methods=['POST'])
+def add_new_movie():
+    """
+    Adds a new movie to the system.
+
+    This function retrieves movie data from a JSON request, creates a new Movie object,
+    and adds it to the system using the create_movie function.
+
+    Returns:
+        Response: A JSON response containing a success message and the added movie,
+                  with a status code of 201 (Created).
+    """
+    new_movie_dict = request.get_json()
+    new_movie = Movie.from_dict(new_movie_dict)
+    new_movie_id = services.create_movie(new_movie)
+    new_movie.movie_id = new_movie_id
+    return jsonify({'message': 'Movie added', 'movie': new_movie.to_dict()}), 201
+
+@api_bp.route('/movies/bulk', methods=['POST'])
+def add_new_movies():
+    """
+    Adds many movies to the system at once (see bulk_create).
+
+    Returns:
+        tuple: A JSON response with the new movie IDs and any errors, and an HTTP status code.
+    """
+    return bulk_create("movie", services.create_movies)
+
+@api_bp.route('/movies/<int:movie_id>', methods=['PUT'])
+def update_existing_movie(movie_id):
+    """
+    Update an existing movie with the provided movie ID.
+
+    This function retrieves movie data from the request's JSON payload,
+    creates a movie object from the dictionary, and updates the movie
+    in the database.
+
+    Args:
+        movie_id (int): The ID of the movie to be updated.
+
+    Returns:
+        Response: A JSON response containing a message and the updated movie object,
+                  along with an HTTP status code 200.
+    """
+    movie_dict = request.get_json()
+    movie = Movie.from_dict(movie_dict)
+    movie.movie_id = movie_id
+    services.update_movie(movie)
+    return jsonify({'message': 'Movie updated', 'movie': movie.to_dict()}), 200
+
+@api_bp.route('/movies/<int:movie_id>', methods=['DELETE'])
+def remove_movie(movie_id):
+    """
+    Remove a movie by its movie ID.
+
+    This function deletes a movie from the database and returns a JSON response
+    indicating that the movie has been deleted.
+
+    Args:
+        movie_id (int): The ID of the movie to be removed.
+
+    Returns:
+        tuple: A tuple containing a JSON response with a message and an HTTP status code.
+    """
+    services.delete_movie(movie_id)
+    return jsonify({'message': 'Movie deleted'}), 200
+
+# ---------------------------------------------------------
+# Ratings
+# ---------------------------------------------------------
+@api_bp.route('/ratings', methods=['POST'])
+def add_new_rating():
+    """
+    Adds a new rating to the system.
+
+    This function retrieves rating data from a JSON request, creates a new Rating object,
+    and adds it to the system using the create_rating function.
+
+    Returns:
+        Response: A JSON response containing a success message and the added rating,
+                  with a status code of 201 (Created).
+    """
+    new_rating_dict = request.get_json()
+    new_rating = Rating.from_dict(new_rating_dict)
+    new_rating_id = services.create_rating(new_rating)
+    new_rating.rating_id = new_rating_id
+    return jsonify({'message': 'Rating added', 'rating': new_rating.to_dict()}), 201
+
+@api_bp.route('/ratings/bulk', methods=['POST'])
+def add_new_ratings():
+    """
+    Adds many ratings to the system at once (see bulk_create).
+
+    Returns:
+        tuple: A JSON response with the new rating IDs and any errors, and an HTTP status code.
+    """
+    return bulk_create("rating", services.create_ratings)
+
+@api_bp.route('/ratings/<int:rating_id>', methods=['PUT'])
+def update_existing_rating(rating_id):
+    """
+    Update an existing rating with the provided rating ID.
+
+    This function retrieves rating data from the request's JSON payload,
+    creates a rating object from the dictionary, and updates the rating
+    in the database.
+
+    Args:
+        rating_id (int): The ID of the rating to be updated.
+
+    Returns:
+        Response: A JSON response containing a message and the updated rating object,
+                  along with an HTTP status code 200.
+    """
+    rating_dict = request.get_json()
+    rating = Rating.from_dict(rating_dict)
+    rating.rating_id = rating_id
+    services.update_rating(rating)
+    return jsonify({'message': 'Rating updated', 'rating': rating.to_dict()}), 200
+
+@api_bp.route('/ratings/<int:rating_id>', methods=['DELETE'])
+def remove_rating(rating_id):
+    """
+    Remove a rating by its rating ID.
+
+    This function deletes a rating from the database and returns a JSON response
+    indicating that the rating has been deleted.
+
+    Args:
+        rating_id (int): The ID of the rating to be removed.
+
+    Returns:
+        tuple: A tuple containing a JSON response with a message and an HTTP status code.
+    """
+    services.delete_rating(rating_id)
+    return jsonify({'message': 'Rating deleted'}), 200
+
+@api_bp.route('/ratings/trend', methods=['GET'])
+def lookup_rating_trend():
+    """
+    Retrieve how the ratings of every movie together changed over time (see lookup_trend_for_movie).
+
+    Returns:
+        tuple: A tuple containing a JSON response with the periods and an HTTP status code 200
+               (400 if a date or the bucket isn't valid).
+    """
+    # Example: /api/ratings/trend?bucket=month
+    return jsonify(trend_response()), 200
+
+@api_bp.route('/ratings/<int:rating_id>', methods=['GET'])
+@conditional(lambda rating_id: row_validators("ratings", rating_id))
+def lookup_rating_by_id(rating_id):
+    """
+    Retrieve rating information by rating ID.
+
+    Args:
+        rating_id (int): The unique identifier of the rating.
+
+    Returns:
+        tuple: A tuple containing a JSON response and an HTTP status code.
+            - If the rating is found, returns a JSON object with rating information and status code 200.
+            - If the rating is not found, returns a JSON object with an error message and status code 404.
+    """
+    rating = services.get_rating_by_id(rating_id)
+    if rating:
+        return jsonify(rating.to_dict()), 200
     return jsonify({'message': 'Rating not found'}), 404
\ No newline at end of file
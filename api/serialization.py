@@ -0,0 +1,146 @@
+# In this file, we turn database rows straight into JSON for the list endpoints.
+# The usual way a response is built is:
+#     sqlite3.Row -> User/Movie/Rating object -> dictionary (to_dict) -> JSON (jsonify)
+#  which makes three new Python objects for every row.  For a page of 1000 movies that is most of
+#  the time the request takes.  Here every model has a RowTemplate instead: the JSON keys it is
+#  written with and the column each one comes from, worked out once.  A row goes straight into a
+#  dictionary with those keys, and the whole list is encoded in one call.
+#
+# The JSON encoder can be swapped (see config.JSON_ENCODER).  orjson is written in Rust and is
+#  several times faster than the standard library, but it is an optional package
+#  (pip install orjson), so without it we fall back to the standard library's json module.
+import json
+from operator import itemgetter
+
+from flask import current_app
+
+from api import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RowTemplate:
+    """
+    How the rows of one model are written as JSON: the keys of its to_dict() and the column each
+    one is read from.  The templates give exactly the same dictionaries as the models' to_dict().
+    """
+
+    def __init__(self, model: str, fields: dict):
+        """
+        Args:
+            model (str): The name of the model, e.g. "movie".
+            fields (dict): JSON key -> column name, or None for a key that is always null
+                           (e.g. a User's date_joined, which the list queries don't read).
+        """
+        self.model = model
+        # Flask's jsonify sorts the keys, so the template does too and the JSON comes out the same
+        self.keys = tuple(sorted(fields))
+        self.columns = tuple(fields[key] for key in self.keys)
+        # The columns of a query -> a function that picks the values out of one of its rows
+        self._getters = {}
+
+    def __repr__(self):
+        return f"<RowTemplate {self.model} - {', '.join(self.keys)}>"
+
+    def getter(self, row_columns: tuple):
+        """
+        Build (once for each column order) a function that returns a row's values in key order.
+
+        Args:
+            row_columns (tuple): The column names of the query's rows (sqlite3.Row.keys()).
+
+        Returns:
+            callable: Takes a row and returns a tuple of its values, one for each key.
+        """
+        getter = self._getters.get(row_columns)
+        if getter is None:
+            if None in self.columns:
+                # A column the rows don't have is read from one extra None on the end of the row
+                positions = [row_columns.index(column) if column else len(row_columns) for column in self.columns]
+                pick = itemgetter(*positions)
+                getter = lambda row: pick(tuple(row) + (None,))
+            else:
+                getter = itemgetter(*[row_columns.index(column) for column in self.columns])
+            if len(self.columns) == 1:
+                # itemgetter returns a single value on its own rather than in a tuple
+                single = getter
+                getter = lambda row: (single(row),)
+            self._getters[row_columns] = getter
+        return getter
+
+    def to_dicts(self, rows: list) -> list:
+        """
+        Turn rows into the dictionaries their model's to_dict() would give, without making the
+        model objects.
+
+        Args:
+            rows (list): sqlite3.Row objects, all from the same query.
+
+        Returns:
+            list: One dictionary per row.
+        """
+        if not rows:
+            return []
+        getter = self.getter(tuple(rows[0].keys()))
+        keys = self.keys
+        return [dict(zip(keys, getter(row))) for row in rows]
+
+
+# The templates of the models in api/models.py
+USER = RowTemplate("user", {"id": "user_id", "username": "username", "email": "email", "date_joined": None})
+MOVIE = RowTemplate("movie", {"movie_id": "movie_id", "title": "title", "genre": "genre",
+                              "release_year": "release_year", "director": "director"})
+RATING = RowTemplate("rating", {"rating_id": "rating_id", "user_id": "user_id", "movie_id": "movie_id",
+                                "rating": "rating", "review": "review", "date": "date"})
+
+# The same settings as Flask's jsonify outside debug mode: no spaces, non-ASCII characters escaped
+_json_encoder = json.JSONEncoder(separators=(",", ":"), sort_keys=True)
+
+
+def encoder_name() -> str:
+    """
+    The JSON encoder in use (see config.JSON_ENCODER).
+
+    Returns:
+        str: "orjson" or "json".
+    """
+    if config.JSON_ENCODER in ("auto", "orjson") and orjson is not None:
+        return "orjson"
+    return "json"
+
+
+def dumps(body) -> bytes:
+    """
+    Encode a response body as JSON.
+
+    Args:
+        body: Lists, dictionaries, strings, numbers and None (e.g. the dictionaries from to_dicts).
+
+    Returns:
+        bytes: The UTF-8 encoded JSON.
+    """
+    if encoder_name() == "orjson":
+        try:
+            # Sorted keys, like jsonify, so both encoders give the keys in the same order
+            return orjson.dumps(body, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # Something orjson can't encode (e.g. an integer bigger than 64 bits), the json module can
+            pass
+    return _json_encoder.encode(body).encode("utf-8")
+
+
+def json_response(body):
+    """
+    Build a JSON response, like jsonify but with the encoder chosen by config.JSON_ENCODER.
+
+    Args:
+        body: The data to send.
+
+    Returns:
+        Response: The JSON response.
+    """
+    # jsonify ends the body with a newline, and so do we
+    return current_app.response_class(dumps(body) + b"\n", mimetype="application/json")
@@ -1,546 +1,1700 @@
-import sqlite3
-from typing import List
-from api.models import User, Rating, Movie
-from pathlib import Path
-
-def get_db_connection():
-    """
-    Establishes and returns a connection to the SQLite database.
-
-    The connection uses 'data/movie_data.db' as the database file and sets the
-    row factory to sqlite3.Row, allowing access to columns by name.
-
-    Returns:
-        sqlite3.Connection: A connection object to the SQLite database.
-    """
-    DATABASE_PATH = Path(__file__).parents[1] / "data"
-    connection = sqlite3.connect(DATABASE_PATH/'movie_data.db')
-    connection.row_factory = sqlite3.Row  # This allows you to access columns by name
-    return connection
-
-def run_query(query, params=None):
-    """
-    Run a query on the database and return the results.
-
-    Args:
-        query (str): The SQL query to be executed.
-        params (tuple, optional): The parameters to be passed to the query. Defaults to None.
-
-    Returns:
-        list of dict: A list of dictionaries representing the query results.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    if params is not None:
-        cursor.execute(query, params)
-    else:
-        cursor.execute(query)
-    results = cursor.fetchall()
-    conn.close()
-    return results
-
-# ---------------------------------------------------------
-# Users
-# ---------------------------------------------------------
-def convert_rows_to_user_list(users):
-    """
-    Converts a list of user dictionaries to a list of User objects.
-
-    Args:
-        users (list): A list of dictionaries, where each dictionary contains
-                      user information with keys 'user_id', 'username', and 'email'.
-
-    Returns:
-        list: A list of User objects created from the provided user dictionaries.
-    """
-    all_users = []
-    # If nothing was passed in, return an empty list
-    if users is None:
-        return all_users
-    for user in users:
-        user = User(user["user_id"], user["username"], user["email"])
-        all_users.append(user)
-    return all_users
-
-
-def get_all_users() -> List[User]:
-    """
-    Retrieve all users from the database.
-    This function establishes a connection to the database, executes a query to
-    fetch all users, and converts the result into a list of User objects.
-    Returns:
-        List[User]: A list of User objects representing all users in the database.
-    """
-    # We need to start by getting the connection to the database
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Query the database for all users
-    query = "SELECT user_id,username,email  FROM users"
-    cursor.execute(query)
-    
-    users = cursor.fetchall()
-    conn.close()
-    
-    # Convert this list of users into a list of User objects
-    return convert_rows_to_user_list(users)
-
-
-def get_user_by_id(user_id: int) -> User:
-    """
-    Retrieve a user from the database by their user ID.
-    Args:
-        user_id (int): The ID of the user to retrieve.
-    Returns:
-        User: The User object corresponding to the given user ID.
-    Raises:
-        Exception: If there is an issue with the database connection or query execution.
-    """
-    # We need to start by getting the connection to the database
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Query the database for all users
-    query = "SELECT user_id,username,email FROM users WHERE user_id = ?"
-    # We need to pass the user_id as a tuple to be the parameters of the query
-    cursor.execute(query, (user_id,))
-    
-    users = cursor.fetchall()
-    conn.close()
-    
-    # Convert this list of users into a list of User objects, but only take the first object
-    #  realy there should only ever be one or zero, but we will take the first one in case there are more
-    user_list = convert_rows_to_user_list(users)
-    if len(user_list) == 0:
-        return None
-    return user_list[0]
-
-def get_users_by_name(username: str, starts_with: bool =True) -> List[User]:
-    """
-    Retrieve a list of users from the database whose usernames match the given pattern.
-    Args:
-        user_name (str): The username or partial username to search for.
-        starts_with (bool, optional): If True, search for usernames that start with the given user_name.
-                                        If False, search for usernames that contain the given user_name.
-                                        Defaults to True.
-    Returns:
-        List[User]: A list of User objects that match the search criteria.
-    """
-    # We need to start by getting the connection to the database
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Query the database for all users
-    query = "SELECT user_id,username,email FROM users WHERE username like ?"
-    
-    # We use the % symbol as a wildcard to match any characters before or after the user_name
-    params = f'{username}%' if starts_with else f'%{username}%'
-    cursor.execute(query, (params,))
-    
-    users = cursor.fetchall()
-    conn.close()
-    
-    # Convert this list of users into a list of User objects
-    return convert_rows_to_user_list(users)
-
-# Add a user to the database
-def create_user(user: User) -> int:
-    """
-    Creates a new user in the database.
-    Args:
-        user (User): An instance of the User class containing the user's details.
-    Returns:
-        int: The ID of the newly created user.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "INSERT INTO users (username, email) VALUES (?, ?)"
-    cursor.execute(query, (user.username, user.email))
-    # Get the ID of the newly created user
-    user_id = cursor.lastrowid
-    
-    conn.commit()
-    conn.close()
-    return user_id
-
-# Update a user in the database
-def update_user(user: User):
-    """
-    Updates the username and email of an existing user in the database.
-    Args:
-        user (User): An instance of the User class containing the updated user information.
-            - user.user_name (str): The new username for the user.
-            - user.email (str): The new email for the user.
-            - user.id (int): The unique identifier of the user to be updated.
-    Returns:
-        None
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "UPDATE users SET username = ?, email = ? WHERE user_id = ?"
-    cursor.execute(query, (user.username, user.email, user.id))
-    
-    conn.commit()
-    conn.close()
-
-# Delete a user from the database
-def delete_user(user_id: int):
-    """
-    Deletes a user from the database based on the provided user ID.
-    Args:
-        user_id (int): The ID of the user to be deleted.
-    Returns:
-        None
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "DELETE FROM users WHERE user_id = ?"
-    cursor.execute(query, (user_id,))
-
-    conn.commit()
-    conn.close()
-
-
-# ---------------------------------------------------------
-# Movies
-# ---------------------------------------------------------
-def convert_rows_to_movie_list(movies):
-    """
-    Converts a list of movie dictionaries to a list of Movie objects.
-
-    Args:
-        movies (list of dict): A list where each dictionary contains movie details
-                               with keys 'movie_id', 'title', 'genre', 'release_year', and 'director'.
-
-    Returns:
-        list of Movie: A list of Movie objects created from the input dictionaries.
-    """
-    all_movies = []
-    # If nothing was passed in, return an empty list
-    if movies is None:
-        return all_movies
-
-    for movie in movies:
-        movie = Movie(
-            movie["movie_id"],
-            movie["title"],
-            movie["genre"],
-            movie["release_year"],
-            movie["director"],
-        )
-        all_movies.append(movie)
-    return all_movies
-
-def create_movie(movie: Movie) -> int:
-    """
-    Add a new movie to the database.
-    Args:
-        movie (Movie): A Movie object representing the movie to be added.
-    Returns:
-        int: The ID of the newly created movie.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "INSERT INTO movies (title, genre, release_year, director) VALUES (?, ?, ?, ?)"
-    cursor.execute(query, (movie.title, movie.genre, movie.release_year, movie.director))
-    movie_id = cursor.lastrowid
-
-    conn.commit()
-    conn.close()
-
-    return movie_id
-
-
-def update_movie(movie: Movie):
-    """
-    Update a movie in the database.
-    Args:
-        movie (Movie): A Movie object containing the updated movie information.
-    Returns:
-        None
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "UPDATE movies SET title = ?, genre = ?, release_year = ?, director = ? WHERE movie_id = ?"
-    cursor.execute(
-        query,
-        (movie.title, movie.genre, movie.release_year, movie.director, movie.movie_id),
-    )
-
-    conn.commit()
-    conn.close()
-
-
-def delete_movie(movie_id: int):
-    """
-    Delete a movie from the database by its ID.
-    Args:
-        movie_id (int): The ID of the movie to be deleted.
-    Returns:
-        None
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "DELETE FROM movies WHERE movie_id = ?"
-    cursor.execute(query, (movie_id,))
-    
-    conn.commit()
-    conn.close()
-
-def get_all_movies() -> List[Movie]:
-    """
-    Retrieve all movies from the database.
-    Returns:
-        List[Movie]: A list of Movie objects representing all movies in the database.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT movie_id,title,genre,release_year,director FROM movies"
-    cursor.execute(query)
-
-    movies = cursor.fetchall()
-    conn.close()
-
-    return convert_rows_to_movie_list(movies)
-
-
-def get_movie_by_id(movie_id: int) -> Movie:
-    """
-    Retrieve a movie from the database by its ID.
-    Args:
-        movie_id (int): The ID of the movie to retrieve.
-    Returns:
-        Movie: A Movie object representing the movie with the given ID.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT movie_id,title,genre,release_year,director FROM movies WHERE movie_id = ?"
-    cursor.execute(query, (movie_id,))
-
-    movie = cursor.fetchone()
-    conn.close()
-
-    if movie is None:
-        return None
-
-    return Movie(
-        movie["movie_id"],
-        movie["title"],
-        movie["genre"],
-        movie["release_year"],
-        movie["director"],
-    )
-
-def get_movies_by_name(title: str, starts_with: bool = True) -> List[Movie]:
-    """
-    Retrieve a list of movies from the database whose titles match the given pattern.
-    Args:
-        title (str): The movie title or partial title to search for.
-        starts_with (bool, optional): If True, search for movie titles that start with the given title.
-                                      If False, search for movie titles that contain the given title.
-                                      Defaults to True.
-    Returns:
-        List[Movie]: A list of Movie objects that match the search criteria.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT movie_id,title,genre,release_year,director FROM movies WHERE title like ?"
-
-    # If the starts_with value is True then we will search for movies that start with the title like (title%), 
-    # otherwise we will search for movies that contain the title (%title%)
-    params = f'{title}%' if starts_with else f'%{title}%'
-    cursor.execute(query, (params,))
-
-    movies = cursor.fetchall()
-    conn.close()
-
-    return convert_rows_to_movie_list(movies)
-
-def get_movies_matching_criteria(genre: str ="", director: str ="", year: int=0) -> List[Movie]:
-    """
-    Retrieve a list of movies from the database that match the given criteria.
-    Args:
-        genre (str, optional): The genre of the movie to search for. Defaults to an empty string.
-        director (str, optional): The director of the movie to search for. Defaults to an empty string.
-        year (int, optional): The release year of the movie to search for. Defaults to 0.
-        
-    Returns:
-
-        List[Movie]: A list of Movie objects that match the search criteria.
-    """
-    query = "SELECT movie_id,title,genre,release_year,director FROM movies WHERE "
-    where_clauses = [] # A list to store the WHERE clauses for the query
-    params = []
-    if genre:
-        where_clauses.append("genre like ?")
-        params.append(f"%{genre}%")
-    if director:
-        where_clauses.append("director like ?")
-        params.append(f"%{director}%")
-    if year > 0:
-        where_clauses.append("release_year = ?")
-        params.append(year)
-
-    where_clause = " AND ".join(where_clauses) # Join the WHERE clauses with an AND statement
-    query += where_clause
-    movies = run_query(query, params=params)
-    return convert_rows_to_movie_list(movies)
-
-# ---------------------------------------------------------
-# Ratings
-# ---------------------------------------------------------
-
-
-def convert_rows_to_rating_list(ratings):
-    """
-    Converts a list of rating dictionaries to a list of Rating objects.
-
-    Args:
-        ratings (list of dict): A list of dictionaries where each dictionary
-                                contains the keys 'rating_id', 'user_id',
-                                'movie_id', 'rating', 'review', and 'date'.
-
-    Returns:
-        list of Rating: A list of Rating objects created from the input dictionaries.
-    """
-    all_ratings = []
-    if ratings is None:
-        return None
-    for rating in ratings:
-        rating = Rating(
-            rating_id=rating["rating_id"],
-            user_id=rating["user_id"],
-            movie_id=rating["movie_id"],
-            rating=rating["rating"],
-            review=rating["review"],
-            date=rating["date"],
-        )
-        all_ratings.append(rating)
-    return all_ratings
-
-def create_rating(rating: Rating) -> int:
-    """
-    Add a new rating to the database.
-    Args:
-        rating (Rating): A Rating object representing the rating to be added.
-    Returns:
-        int: The ID of the newly created rating.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "INSERT INTO ratings (user_id, movie_id, rating, review, date) VALUES (?, ?, ?, ?, ?)"
-    cursor.execute(query, (rating.user_id, rating.movie_id, rating.rating, rating.review, rating.date))
-    rating_id = cursor.lastrowid
-
-    conn.commit()
-    conn.close()
-
-    return rating_id
-
-def update_rating(rating: Rating):
-    """
-    Update a rating in the database.
-    Args:
-        rating (Rating): A Rating object containing the updated rating information.
-    Returns:
-        None
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "UPDATE ratings SET user_id = ?, movie_id = ?, rating = ?, review = ?, date = ? WHERE rating_id = ?"
-    cursor.execute(
-        query,
-        (rating.user_id, rating.movie_id, rating.rating, rating.review, rating.date, rating.rating_id),
-    )
-
-    conn.commit()
-    conn.close()
-
-def get_rating_by_id(rating_id: int) -> Rating:
-    """
-    Retrieve a rating from the database by its ID.
-    Args:
-        rating_id (int): The ID of the rating to retrieve.
-    Returns:
-        Rating: A Rating object representing the rating with the given ID.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT rating_id,user_id,movie_id,rating,review,date FROM ratings WHERE rating_id = ?"
-    cursor.execute(query, (rating_id,))
-
-    ratings = cursor.fetchall()
-    conn.close()
-
-    rating_list = convert_rows_to_rating_list(ratings)
-
-    if len(rating_list) == 0:
-        return None
-    return rating_list[0]
-
-def delete_rating(rating_id: int):
-    """
-    Delete a rating from the database by its ID.
-    Args:
-        rating_id (int): The ID of the rating to be deleted.
-    Returns:
-        None
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "DELETE FROM ratings WHERE rating_id = ?"
-    cursor.execute(query, (rating_id,))
-
-    conn.commit()
-    conn.close()
-
-def get_movie_ratings(movie_id: int) -> List[Rating]:
-    """
-    Retrieve all ratings for a specific movie by movie ID.
-    Args:
-        movie_id (int): The unique identifier of the movie.
-    Returns:
-        List[Rating]: A list of Rating objects representing the ratings for the movie.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT rating_id, user_id, movie_id, rating,review,date FROM ratings WHERE movie_id = ?"
-    cursor.execute(query, (movie_id,))
-
-    ratings = cursor.fetchall()
-    conn.close()
-
-    return convert_rows_to_rating_list(ratings)
-
-def get_user_ratings(user_id: int) -> List[Rating]:
-    """
-    Retrieve all ratings by a specific user.
-    Args:
-        user_id (int): The unique identifier of the user.
-    Returns:
-        List[Rating]: A list of Rating objects representing the ratings by the user.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT rating_id, user_id, movie_id, rating,review,date FROM ratings WHERE user_id = ?"
-    cursor.execute(query, (user_id,))
-
-    ratings = cursor.fetchall()
-    conn.close()
-
-    return convert_rows_to_rating_list(ratings)
+import logging
+import re
+import sqlite3
+import threading
+from typing import List
+from api.models import User, Rating, Movie, RatingGroup, RatingStats, SearchResult, Genre, Person, create_user_from_dict
+from api import analytics, cache, config, migrations, recommender, similar_movies, trigram
+from api.db import connect, get_connection, get_pool
+from api.query_builder import MOVIES, RATINGS, Query, QueryError
+
+logger = logging.getLogger(__name__)
+
+def get_db_connection() -> sqlite3.Connection:
+    """
+    Establishes and returns a new, standalone connection to the SQLite database.
+
+    The connection uses the database file from api.config and sets the
+    row factory to sqlite3.Row, allowing access to columns by name.
+    The caller is responsible for closing it.
+
+    NOTE: The functions in this module don't use this, they borrow a connection from the
+    pool with api.db.get_connection(), which is much cheaper than opening a new one.
+
+    Returns:
+        sqlite3.Connection: A connection object to the SQLite database.
+    """
+    return connect()
+
+def run_query(query, params=None):
+    """
+    Run a query on the database and return the results.
+
+    Args:
+        query (str): The SQL query to be executed.
+        params (tuple, optional): The parameters to be passed to the query. Defaults to None.
+
+    Returns:
+        list of dict: A list of dictionaries representing the query results.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if params is not None:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        results = cursor.fetchall()
+    return results
+
+def iter_query(query: str, params=(), batch_size: int = None):
+    """
+    Run a query and yield the resulting rows one at a time, without loading them all into memory.
+
+    Rows are fetched from the sqlite cursor in batches of batch_size, so memory use stays the same
+    no matter how many rows the query returns.  The connection stays checked out until the
+    generator is exhausted (or closed), so always consume it completely or close it.
+
+    Args:
+        query (str): The SQL query to be executed.
+        params (tuple, optional): The parameters to be passed to the query.
+        batch_size (int, optional): How many rows to fetch at a time. Defaults to config.STREAM_BATCH_SIZE.
+
+    Yields:
+        sqlite3.Row: The rows of the result, in order.
+    """
+    batch_size = batch_size or config.STREAM_BATCH_SIZE
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
+def build_paged_query(select: str, where_clauses: list, params: list, key_column: str,
+                      after: int = None, limit: int = None):
+    """
+    Finish a SELECT statement with keyset (cursor) pagination.
+
+    Rather than skipping rows with OFFSET, we ask for the rows whose key is greater than the last
+    key the client has already seen.  The key column is always the primary key (or another indexed,
+    unique column) so the database can jump straight to the right place.
+
+    Args:
+        select (str): The SELECT ... FROM part of the query.
+        where_clauses (list): The conditions for the WHERE clause, they will be joined with AND.
+        params (list): The parameters for the where_clauses.
+        key_column (str): The column the results are ordered and paged by.
+        after (int, optional): Only return rows whose key is greater than this. Defaults to None (from the start).
+        limit (int, optional): The maximum number of rows to return. Defaults to None (all of them).
+
+    Returns:
+        tuple: The complete query string and its list of parameters.
+    """
+    where_clauses = list(where_clauses)
+    params = list(params)
+    if after is not None:
+        where_clauses.append(f"{key_column} > ?")
+        params.append(after)
+    query = select
+    if where_clauses:
+        query += " WHERE " + " AND ".join(where_clauses)
+    query += f" ORDER BY {key_column}"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return query, params
+
+class BulkInsertError(Exception):
+    """
+    Raised when a batch of a bulk insert fails.  The batches before it have already been committed,
+    and the ids of their rows are in ids.
+    """
+
+    def __init__(self, message: str, ids: List[int]):
+        super().__init__(message)
+        self.ids = ids
+
+
+def bulk_insert(query: str, rows: list, batch_size: int = None) -> List[int]:
+    """
+    Insert many rows with one INSERT statement, batch_size rows per transaction.
+
+    Committing a transaction makes SQLite wait for the data to reach the disk, which is by far the
+    slowest part of a single-row insert.  executemany() runs the same prepared statement for every
+    row in the batch, and the whole batch shares one commit.
+
+    The ids of the new rows are worked out from last_insert_rowid(): BEGIN IMMEDIATE holds the
+    write lock for the whole batch, so nobody else can insert in between, and an AUTOINCREMENT
+    table hands out consecutive ids.  (Triggers that insert into other tables don't change it.)
+
+    Args:
+        query (str): An INSERT statement with ? parameters, into a table with an AUTOINCREMENT id.
+        rows (list): The parameters for each row.
+        batch_size (int, optional): How many rows to insert per transaction. Defaults to config.BULK_BATCH_SIZE.
+
+    Returns:
+        List[int]: The ids of the new rows, in the same order as rows.
+    Raises:
+        BulkInsertError: If a batch fails.  The rows of the batches before it are kept, so the
+                         error says which ones they are.
+    """
+    batch_size = batch_size or config.BULK_BATCH_SIZE
+    ids = []
+    with get_connection() as conn:
+        # Don't mix someone else's uncommitted work into our transactions
+        if conn.in_transaction:
+            conn.commit()
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(query, batch)
+                last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                conn.commit()
+            except Exception as error:
+                # The batches before this one have already been committed, this one leaves no trace
+                conn.rollback()
+                raise BulkInsertError(f"Only the first {len(ids)} rows were saved: {error}", ids) from error
+            ids.extend(range(last_id - len(batch) + 1, last_id + 1))
+    return ids
+
+def fetch_by_ids(select: str, key_column: str, ids: list) -> list:
+    """
+    Read the rows with the given ids, in the same order as ids.
+
+    Args:
+        select (str): The SELECT ... FROM part of the query, e.g. "SELECT user_id,username,email FROM users".
+        key_column (str): The id column, e.g. "user_id".
+        ids (list): The ids to read.
+
+    Returns:
+        list: The rows (ids that don't exist are left out).
+    """
+    rows = {}
+    with get_connection() as conn:
+        # SQLite limits the number of ? parameters in one statement, so read the ids in batches
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            query = f"{select} WHERE {key_column} IN ({', '.join('?' for _ in batch)})"
+            for row in conn.execute(query, batch):
+                rows[row[key_column]] = row
+    return [rows[item_id] for item_id in ids if item_id in rows]
+
+# ---------------------------------------------------------
+# Users
+# ---------------------------------------------------------
+def convert_rows_to_user_list(users):
+    """
+    Converts a list of user dictionaries to a list of User objects.
+
+    Args:
+        users (list): A list of dictionaries, where each dictionary contains
+                      user information with keys 'user_id', 'username', and 'email'.
+
+    Returns:
+        list: A list of User objects created from the provided user dictionaries.
+    """
+    all_users = []
+    # If nothing was passed in, return an empty list
+    if users is None:
+        return all_users
+    for user in users:
+        user = User(user["user_id"], user["username"], user["email"])
+        all_users.append(user)
+    return all_users
+
+
+def get_all_users(after: int = None, limit: int = None, raw: bool = False) -> List[User]:
+    """
+    Retrieve all users from the database, in user_id order.
+    This function establishes a connection to the database, executes a query to
+    fetch all users, and converts the result into a list of User objects.
+    Args:
+        after (int, optional): Only return users with a user_id greater than this (for paging). Defaults to None.
+        limit (int, optional): The maximum number of users to return. Defaults to None (all of them).
+        raw (bool, optional): Return the database rows rather than User objects, for
+                              api/serialization.py to turn straight into JSON. Defaults to False.
+    Returns:
+        List[User]: A list of User objects representing all users in the database.
+    """
+    # We need to start by getting the connection to the database
+    with get_connection() as conn:
+        cursor = conn.cursor()
+    
+        # Query the database for all users
+        query, params = build_paged_query("SELECT user_id,username,email FROM users", [], [],
+                                          "user_id", after=after, limit=limit)
+        cursor.execute(query, params)
+    
+        users = cursor.fetchall()
+    
+    if raw:
+        return users
+    # Convert this list of users into a list of User objects
+    return convert_rows_to_user_list(users)
+
+
+def get_user_by_id(user_id: int, row_version: int = None) -> User:
+    """
+    Retrieve a user by their user ID.
+    The user is looked up in the cache first and only read from the database on a miss (see api/cache.py).
+    Args:
+        user_id (int): The ID of the user to retrieve.
+        row_version (int, optional): The user's row_version, if the caller has just read it.  A cached
+                                     copy of a different version is read again.
+    Returns:
+        User: The User object corresponding to the given user ID.
+    Raises:
+        Exception: If there is an issue with the database connection or query execution.
+    """
+    user = cache.read_through("user", user_id, lambda: load_user_dict(user_id), row_version)
+    if user is None:
+        return None
+    return create_user_from_dict(user)
+
+
+def load_user_dict(user_id: int) -> dict:
+    """
+    Read a user from the database, as a dictionary that can be cached.
+    Args:
+        user_id (int): The ID of the user to read.
+    Returns:
+        dict: The user (see User.to_dict) and its row_version, or None if there is no such user.
+    """
+    # We need to start by getting the connection to the database
+    with get_connection() as conn:
+        cursor = conn.cursor()
+    
+        # Query the database for all users
+        query = "SELECT user_id,username,email,row_version FROM users WHERE user_id = ?"
+        # We need to pass the user_id as a tuple to be the parameters of the query
+        cursor.execute(query, (user_id,))
+    
+        users = cursor.fetchall()
+    
+    # Convert this list of users into a list of User objects, but only take the first object
+    #  realy there should only ever be one or zero, but we will take the first one in case there are more
+    user_list = convert_rows_to_user_list(users)
+    if len(user_list) == 0:
+        return None
+    # The version is kept with the cached copy, so it can be checked against the database
+    return dict(user_list[0].to_dict(), row_version=users[0]["row_version"])
+
+def get_users_by_name(username: str, starts_with: bool =True, after: int = None, limit: int = None,
+                      raw: bool = False) -> List[User]:
+    """
+    Retrieve a list of users from the database whose usernames match the given pattern, in user_id order.
+    Args:
+        user_name (str): The username or partial username to search for.
+        starts_with (bool, optional): If True, search for usernames that start with the given user_name.
+                                        If False, search for usernames that contain the given user_name.
+                                        Defaults to True.
+        after (int, optional): Only return users with a user_id greater than this (for paging). Defaults to None.
+        limit (int, optional): The maximum number of users to return. Defaults to None (all of them).
+        raw (bool, optional): Return the database rows rather than User objects (see get_all_users).
+    Returns:
+        List[User]: A list of User objects that match the search criteria.
+        A "contains" search ignores case and treats % and _ as ordinary characters.
+    """
+    # A "contains" search can't use an index in SQLite, so answer it from the trigram index (see api/trigram.py)
+    if not starts_with and config.TRIGRAM_INDEX_ENABLED:
+        ids = trigram.get_index("users").contains(username, after=after, limit=limit)
+        users = fetch_by_ids("SELECT user_id,username,email FROM users", "user_id", ids)
+        return users if raw else convert_rows_to_user_list(users)
+
+    # We need to start by getting the connection to the database
+    with get_connection() as conn:
+        cursor = conn.cursor()
+    
+        # We use the % symbol as a wildcard to match any characters before or after the user_name
+        pattern = f'{username}%' if starts_with else f'%{username}%'
+        query, params = build_paged_query("SELECT user_id,username,email FROM users", ["username like ?"], [pattern],
+                                          "user_id", after=after, limit=limit)
+        cursor.execute(query, params)
+    
+        users = cursor.fetchall()
+    
+    if raw:
+        return users
+    # Convert this list of users into a list of User objects
+    return convert_rows_to_user_list(users)
+
+# Add a user to the database
+def create_user(user: User) -> int:
+    """
+    Creates a new user in the database.
+    Args:
+        user (User): An instance of the User class containing the user's details.
+    Returns:
+        int: The ID of the newly created user.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+    
+        query = "INSERT INTO users (username, email) VALUES (?, ?)"
+        cursor.execute(query, (user.username, user.email))
+        # Get the ID of the newly created user
+        user_id = cursor.lastrowid
+    
+        conn.commit()
+    # Keep the name search index up to date
+    trigram.record_change("users", user_id, user.username)
+    analytics.record_writes()
+    return user_id
+
+def create_users(users: List[User], batch_size: int = None) -> List[int]:
+    """
+    Add many users to the database at once (see bulk_insert).
+    Args:
+        users (List[User]): The users to add.
+        batch_size (int, optional): How many users to insert per transaction. Defaults to config.BULK_BATCH_SIZE.
+    Returns:
+        List[int]: The IDs of the new users, in the same order as users.
+    Raises:
+        BulkInsertError: If a batch fails (the users before it are still added).
+    """
+    query = "INSERT INTO users (username, email) VALUES (?, ?)"
+    ids = []
+    try:
+        ids = bulk_insert(query, [(user.username, user.email) for user in users], batch_size)
+    except BulkInsertError as error:
+        ids = error.ids
+        raise
+    finally:
+        # Whatever was saved still has to be searchable
+        for user_id, user in zip(ids, users):
+            trigram.record_change("users", user_id, user.username)
+        analytics.record_writes(len(ids))
+    return ids
+
+# Update a user in the database
+def update_user(user: User):
+    """
+    Updates the username and email of an existing user in the database.
+    Args:
+        user (User): An instance of the User class containing the updated user information.
+            - user.user_name (str): The new username for the user.
+            - user.email (str): The new email for the user.
+            - user.id (int): The unique identifier of the user to be updated.
+    Returns:
+        None
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+    
+        query = "UPDATE users SET username = ?, email = ? WHERE user_id = ?"
+        cursor.execute(query, (user.username, user.email, user.id))
+    
+        conn.commit()
+    # The cached copy is out of date now
+    cache.invalidate("user", user.id)
+    trigram.record_change("users", user.id, user.username)
+
+# Delete a user from the database
+def delete_user(user_id: int):
+    """
+    Deletes a user from the database based on the provided user ID.
+    Args:
+        user_id (int): The ID of the user to be deleted.
+    Returns:
+        None
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "DELETE FROM users WHERE user_id = ?"
+        cursor.execute(query, (user_id,))
+
+        conn.commit()
+    cache.invalidate("user", user_id)
+    trigram.record_change("users", user_id)
+    analytics.record_writes()
+
+
+# ---------------------------------------------------------
+# Movies
+# ---------------------------------------------------------
+def convert_rows_to_movie_list(movies):
+    """
+    Converts a list of movie dictionaries to a list of Movie objects.
+
+    Args:
+        movies (list of dict): A list where each dictionary contains movie details
+                               with keys 'movie_id', 'title', 'genre', 'release_year', and 'director'.
+
+    Returns:
+        list of Movie: A list of Movie objects created from the input dictionaries.
+    """
+    all_movies = []
+    # If nothing was passed in, return an empty list
+    if movies is None:
+        return all_movies
+
+    for movie in movies:
+        movie = Movie(
+            movie["movie_id"],
+            movie["title"],
+            movie["genre"],
+            movie["release_year"],
+            movie["director"],
+        )
+        all_movies.append(movie)
+    return all_movies
+
+def create_movie(movie: Movie) -> int:
+    """
+    Add a new movie to the database.
+    Args:
+        movie (Movie): A Movie object representing the movie to be added.
+    Returns:
+        int: The ID of the newly created movie.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "INSERT INTO movies (title, genre, release_year, director) VALUES (?, ?, ?, ?)"
+        cursor.execute(query, (movie.title, movie.genre, movie.release_year, movie.director))
+        movie_id = cursor.lastrowid
+
+        conn.commit()
+    # Keep the title search index up to date
+    trigram.record_change("movies", movie_id, movie.title)
+    analytics.record_writes()
+
+    return movie_id
+
+
+def create_movies(movies: List[Movie], batch_size: int = None) -> List[int]:
+    """
+    Add many movies to the database at once (see bulk_insert).
+    Args:
+        movies (List[Movie]): The movies to add.
+        batch_size (int, optional): How many movies to insert per transaction. Defaults to config.BULK_BATCH_SIZE.
+    Returns:
+        List[int]: The IDs of the new movies, in the same order as movies.
+    Raises:
+        BulkInsertError: If a batch fails (the movies before it are still added).
+    """
+    query = "INSERT INTO movies (title, genre, release_year, director) VALUES (?, ?, ?, ?)"
+    rows = [(movie.title, movie.genre, movie.release_year, movie.director) for movie in movies]
+    ids = []
+    try:
+        ids = bulk_insert(query, rows, batch_size)
+    except BulkInsertError as error:
+        ids = error.ids
+        raise
+    finally:
+        # Whatever was saved still has to be searchable
+        for movie_id, movie in zip(ids, movies):
+            trigram.record_change("movies", movie_id, movie.title)
+        analytics.record_writes(len(ids))
+    return ids
+
+
+def update_movie(movie: Movie):
+    """
+    Update a movie in the database.
+    Args:
+        movie (Movie): A Movie object containing the updated movie information.
+    Returns:
+        None
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "UPDATE movies SET title = ?, genre = ?, release_year = ?, director = ? WHERE movie_id = ?"
+        cursor.execute(
+            query,
+            (movie.title, movie.genre, movie.release_year, movie.director, movie.movie_id),
+        )
+
+        conn.commit()
+    # The cached copy is out of date now
+    cache.invalidate("movie", movie.movie_id)
+    trigram.record_change("movies", movie.movie_id, movie.title)
+    analytics.record_writes()
+
+
+def delete_movie(movie_id: int):
+    """
+    Delete a movie from the database by its ID.
+    Args:
+        movie_id (int): The ID of the movie to be deleted.
+    Returns:
+        None
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+    
+        query = "DELETE FROM movies WHERE movie_id = ?"
+        cursor.execute(query, (movie_id,))
+    
+        conn.commit()
+    cache.invalidate("movie", movie_id)
+    trigram.record_change("movies", movie_id)
+    analytics.record_writes()
+
+
+def movie_query(title: str = None, genres: List[str] = None, director: str = None, director_starts_with: str = None,
+                year_from: int = None, year_to: int = None, min_score: float = None, max_score: float = None,
+                sort: str = "movie_id", descending: bool = False) -> Query:
+    """
+    Build the query for a filtered list of movies (see api/query_builder.py).  Every filter is optional,
+    and text is compared without regard to case.
+    Args:
+        title (str, optional): Only movies whose title starts with this.
+        genres (List[str], optional): Only movies in one of these genres.
+        director (str, optional): Only movies with exactly this director (one of them, if there are several).
+        director_starts_with (str, optional): Only movies with a director whose name starts with this.
+        year_from (int, optional): Only movies released in or after this year.
+        year_to (int, optional): Only movies released in or before this year.
+        min_score (float, optional): Only movies whose rank_score (see get_top_movies) is at least this.
+        max_score (float, optional): Only movies whose rank_score is at most this.
+        sort (str, optional): The column to sort by: movie_id, title, release_year or rank_score. Defaults to movie_id.
+        descending (bool, optional): Sort the other way round. Defaults to False.
+    Returns:
+        Query: The query, ready for find_movies or iter_movies.
+    Raises:
+        QueryError: If a filter or the sort can't be used.
+    """
+    query = Query(MOVIES)
+    if title:
+        query.starts_with("title", title)
+    # Genres and directors are matched through the genres and people tables (see migration 6),
+    #  so a movie with several of them matches any one
+    if genres:
+        # One genre is an = rather than an IN, so the statement is the same as a plain genre filter
+        if len(genres) == 1:
+            query.equals("genres", genres[0])
+        else:
+            query.one_of("genres", genres)
+    if director:
+        query.equals("directors", director)
+    if director_starts_with:
+        query.starts_with("directors", director_starts_with)
+    query.between("release_year", year_from, year_to)
+    query.between("rank_score", min_score, max_score)
+    return query.order_by(sort or "movie_id", descending)
+
+
+def find_movies(after: int = None, limit: int = None, raw: bool = False, **filters) -> List[Movie]:
+    """
+    Retrieve the movies that match the given filters.
+    Args:
+        after (int, optional): Only return movies with a movie_id greater than this (for paging). Defaults to None.
+                               Only allowed when the movies are in movie_id order.
+        limit (int, optional): The maximum number of movies to return. Defaults to None (all of them).
+        raw (bool, optional): Return the database rows rather than Movie objects, for
+                              api/serialization.py to turn straight into JSON. Defaults to False.
+        **filters: The filters and sort order, see movie_query.
+    Returns:
+        List[Movie]: The matching movies.
+    Raises:
+        QueryError: If a filter or the sort can't be used.
+    """
+    query, params = movie_query(**filters).after(after).limit(limit).to_sql()
+    with get_connection() as conn:
+        movies = conn.execute(query, params).fetchall()
+    return movies if raw else convert_rows_to_movie_list(movies)
+
+def get_all_movies(after: int = None, limit: int = None) -> List[Movie]:
+    """
+    Retrieve all movies from the database, in movie_id order.
+    Args:
+        after (int, optional): Only return movies with a movie_id greater than this (for paging). Defaults to None.
+        limit (int, optional): The maximum number of movies to return. Defaults to None (all of them).
+    Returns:
+        List[Movie]: A list of Movie objects representing all movies in the database.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query, params = build_paged_query("SELECT movie_id,title,genre,release_year,director FROM movies", [], [],
+                                          "movie_id", after=after, limit=limit)
+        cursor.execute(query, params)
+
+        movies = cursor.fetchall()
+
+    return convert_rows_to_movie_list(movies)
+
+
+def iter_movies(title: str = None, starts_with: bool = True, **filters):
+    """
+    Yield every movie (optionally filtered) one at a time, in movie_id order unless a sort is given.
+    This is the streaming version of find_movies, for result sets too big for a list.
+    Args:
+        title (str, optional): The movie title or partial title to search for. Defaults to None (all movies).
+        starts_with (bool, optional): If True, match titles that start with title, otherwise titles that contain it.
+        **filters: Any of the other filters of movie_query.
+    Yields:
+        Movie: The matching movies.
+    """
+    if title and not starts_with:
+        query, params = build_paged_query("SELECT movie_id,title,genre,release_year,director FROM movies",
+                                          ["title like ?"], [f'%{title}%'], "movie_id")
+    else:
+        query, params = movie_query(title=title, **filters).to_sql()
+    for row in iter_query(query, params):
+        yield Movie(row["movie_id"], row["title"], row["genre"], row["release_year"], row["director"])
+
+
+def get_movie_by_id(movie_id: int, row_version: int = None) -> Movie:
+    """
+    Retrieve a movie by its ID.
+    The movie is looked up in the cache first and only read from the database on a miss (see api/cache.py).
+    Args:
+        movie_id (int): The ID of the movie to retrieve.
+        row_version (int, optional): The movie's row_version, if the caller has just read it.  A cached
+                                     copy of a different version is read again.
+    Returns:
+        Movie: A Movie object representing the movie with the given ID.
+    """
+    movie = cache.read_through("movie", movie_id, lambda: load_movie_dict(movie_id), row_version)
+    if movie is None:
+        return None
+    return Movie.from_dict(movie)
+
+
+def load_movie_dict(movie_id: int) -> dict:
+    """
+    Read a movie from the database, as a dictionary that can be cached.
+    Args:
+        movie_id (int): The ID of the movie to read.
+    Returns:
+        dict: The movie (see Movie.to_dict) and its row_version, or None if there is no such movie.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "SELECT movie_id,title,genre,release_year,director,row_version FROM movies WHERE movie_id = ?"
+        cursor.execute(query, (movie_id,))
+
+        movie = cursor.fetchone()
+
+    if movie is None:
+        return None
+
+    movie_dict = Movie(
+        movie["movie_id"],
+        movie["title"],
+        movie["genre"],
+        movie["release_year"],
+        movie["director"],
+    ).to_dict()
+    # The version is kept with the cached copy, so it can be checked against the database
+    movie_dict["row_version"] = movie["row_version"]
+    return movie_dict
+
+def get_movies_by_name(title: str, starts_with: bool = True, after: int = None, limit: int = None) -> List[Movie]:
+    """
+    Retrieve a list of movies from the database whose titles match the given pattern, in movie_id order.
+    Args:
+        title (str): The movie title or partial title to search for.
+        starts_with (bool, optional): If True, search for movie titles that start with the given title.
+                                      If False, search for movie titles that contain the given title.
+                                      Defaults to True.
+        after (int, optional): Only return movies with a movie_id greater than this (for paging). Defaults to None.
+        limit (int, optional): The maximum number of movies to return. Defaults to None (all of them).
+    Returns:
+        List[Movie]: A list of Movie objects that match the search criteria.
+    """
+    # A "contains" search can't use an index in SQLite, so answer it from the trigram index (see api/trigram.py)
+    if not starts_with and config.TRIGRAM_INDEX_ENABLED:
+        ids = trigram.get_index("movies").contains(title, after=after, limit=limit)
+        select = "SELECT movie_id,title,genre,release_year,director FROM movies"
+        return convert_rows_to_movie_list(fetch_by_ids(select, "movie_id", ids))
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        # If the starts_with value is True then we will search for movies that start with the title like (title%), 
+        # otherwise we will search for movies that contain the title (%title%)
+        pattern = f'{title}%' if starts_with else f'%{title}%'
+        query, params = build_paged_query("SELECT movie_id,title,genre,release_year,director FROM movies",
+                                          ["title like ?"], [pattern], "movie_id", after=after, limit=limit)
+        cursor.execute(query, params)
+
+        movies = cursor.fetchall()
+
+    return convert_rows_to_movie_list(movies)
+
+def get_top_movies(genre: str = None, year: int = None, limit: int = None) -> List[Movie]:
+    """
+    Retrieve the highest ranked movies, optionally only those of a genre and/or release year.
+    Movies are ranked by their damped (Bayesian) average rating, which is kept in the indexed
+    movies.rank_score column (see api/migrations.py), so this reads the top of an index rather
+    than averaging every rating.  Movies nobody has rated yet are left out.
+    Args:
+        genre (str, optional): Only include movies of this genre (any case, one of the movie's genres). Defaults to None.
+        year (int, optional): Only include movies released in this year. Defaults to None.
+        limit (int, optional): The maximum number of movies to return. Defaults to config.DEFAULT_PAGE_SIZE.
+    Returns:
+        List[Movie]: The movies, best first, with rank_score and stats filled in.
+    """
+    where_clauses = ["m.rank_score IS NOT NULL"]
+    params = []
+    if genre:
+        # Through the genres table (see migration 6) like movie_query, so the name is matched
+        #  whatever its case and a movie with several genres counts for each of them.  The unary +
+        #  stops SQLite looking the genre's movies up by movie_id and then sorting them: the movies
+        #  are still read off the rank_score index, each one just has to be in the genre's set
+        where_clauses.append("+m.movie_id IN (SELECT l.movie_id FROM genres g "
+                             "JOIN movie_genres l ON l.genre_id = g.genre_id WHERE g.name = ?)")
+        params.append(genre)
+    if year:
+        where_clauses.append("m.release_year = ?")
+        params.append(year)
+    params.append(limit or config.DEFAULT_PAGE_SIZE)
+
+    # Ties are broken by movie_id, which is also in every index, so SQLite never has to sort
+    query = f"""
+        SELECT m.movie_id, m.title, m.genre, m.release_year, m.director, m.rank_score,
+               s.rating_count, s.rating_sum, s.rating_sum_squares,
+               s.count_1, s.count_2, s.count_3, s.count_4, s.count_5
+        FROM movies m
+        JOIN movie_rating_stats s ON s.movie_id = m.movie_id
+        WHERE {" AND ".join(where_clauses)}
+        ORDER BY m.rank_score DESC, m.movie_id DESC
+        LIMIT ?
+    """
+    with get_connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    movies = []
+    for row in rows:
+        movie = Movie(row["movie_id"], row["title"], row["genre"], row["release_year"], row["director"])
+        movie.rank_score = row["rank_score"]
+        movie.stats = RatingStats(
+            row["movie_id"],
+            count=row["rating_count"],
+            total=row["rating_sum"],
+            sum_squares=row["rating_sum_squares"],
+            histogram={score: row[f"count_{score}"] for score in range(1, 6)},
+        )
+        movies.append(movie)
+    return movies
+
+
+def refresh_rankings():
+    """
+    Recalculate the overall average rating used to rank movies, and every movie's rank_score.
+    Individual scores are kept up to date as ratings are written, this picks up the slow drift
+    in the overall average.
+    Returns:
+        None
+    """
+    with get_connection() as conn:
+        migrations.refresh_rankings(conn)
+        # Every movie's rank_score has changed, which the triggers don't count as a change, but the
+        #  movies sorted by rank_score may now be in a different order
+        migrations.touch_generations(conn, ["movies"])
+        conn.commit()
+
+
+def get_movies_matching_criteria(genre: str ="", director: str ="", year: int=0) -> List[Movie]:
+    """
+    Retrieve a list of movies from the database that match the given criteria, in movie_id order.
+    This is a shortcut for find_movies, which has more filters.
+    Args:
+        genre (str, optional): The genre of the movie to search for. Defaults to an empty string (any genre).
+        director (str, optional): The start of the director's name. Defaults to an empty string (any director).
+        year (int, optional): The release year of the movie to search for. Defaults to 0 (any year).
+        
+    Returns:
+
+        List[Movie]: A list of Movie objects that match the search criteria.
+    """
+    # Leave out the criteria that weren't given (find_movies ignores None)
+    return find_movies(genres=[genre] if genre else None, director_starts_with=director or None,
+                       year_from=year or None, year_to=year or None)
+
+# ---------------------------------------------------------
+# Genres and directors
+# ---------------------------------------------------------
+# Every genre and director has a row of its own, linked to their movies (see migration 6).
+#  Both tables have the same shape, so these helpers work for either:
+#  (the name table, its id column, the link table)
+NAME_TABLES = {
+    "genre": ("genres", "genre_id", "movie_genres"),
+    "director": ("people", "person_id", "movie_directors"),
+}
+
+
+def get_names(kind: str, name: str = None, after: int = None, limit: int = None) -> list:
+    """
+    Retrieve the genres or directors, in id order.
+    Args:
+        kind (str): "genre" or "director".
+        name (str, optional): Only return the one with this name (ignoring case). Defaults to None.
+        after (int, optional): Only return ids greater than this (for paging). Defaults to None.
+        limit (int, optional): The maximum number to return. Defaults to None (all of them).
+    Returns:
+        list: Genre or Person objects.
+    """
+    table, id_column, _ = NAME_TABLES[kind]
+    where_clauses, params = ([], []) if name is None else (["name = ?"], [name])
+    query, params = build_paged_query(f"SELECT {id_column}, name FROM {table}", where_clauses, params,
+                                      id_column, after=after, limit=limit)
+    with get_connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+    model = Genre if kind == "genre" else Person
+    return [model(row[id_column], row["name"]) for row in rows]
+
+
+def get_genres(name: str = None, after: int = None, limit: int = None) -> List[Genre]:
+    """
+    Retrieve the genres, in genre_id order (see get_names).
+    Returns:
+        List[Genre]: The genres.
+    """
+    return get_names("genre", name, after, limit)
+
+
+def get_directors(name: str = None, after: int = None, limit: int = None) -> List[Person]:
+    """
+    Retrieve the directors, in person_id order (see get_names).
+    Returns:
+        List[Person]: The directors.
+    """
+    return get_names("director", name, after, limit)
+
+
+def get_name_by_id(kind: str, name_id: int):
+    """
+    Retrieve one genre or director by id.
+    Args:
+        kind (str): "genre" or "director".
+        name_id (int): The genre_id or person_id.
+    Returns:
+        The Genre or Person, or None if there is no such id.
+    """
+    table, id_column, _ = NAME_TABLES[kind]
+    with get_connection() as conn:
+        row = conn.execute(f"SELECT {id_column}, name FROM {table} WHERE {id_column} = ?", (name_id,)).fetchone()
+    if row is None:
+        return None
+    model = Genre if kind == "genre" else Person
+    return model(row[id_column], row["name"])
+
+
+def get_linked_movies(kind: str, name_id: int, after: int = None, limit: int = None) -> List[Movie]:
+    """
+    Retrieve the movies in a genre, or by a director, in movie_id order.
+    The link table's primary key starts with the genre/person id, so this reads a range of it,
+    already in movie_id order, and looks each movie up by its primary key.
+    Args:
+        kind (str): "genre" or "director".
+        name_id (int): The genre_id or person_id.
+        after (int, optional): Only return movies with a movie_id greater than this (for paging). Defaults to None.
+        limit (int, optional): The maximum number of movies to return. Defaults to None (all of them).
+    Returns:
+        List[Movie]: The movies.
+    """
+    _, id_column, link_table = NAME_TABLES[kind]
+    select = f"""
+        SELECT m.movie_id, m.title, m.genre, m.release_year, m.director
+        FROM {link_table} l
+        JOIN movies m ON m.movie_id = l.movie_id
+    """
+    query, params = build_paged_query(select, [f"l.{id_column} = ?"], [name_id], "l.movie_id",
+                                      after=after, limit=limit)
+    with get_connection() as conn:
+        movies = conn.execute(query, params).fetchall()
+    return convert_rows_to_movie_list(movies)
+
+
+def get_genre_movies(genre_id: int, after: int = None, limit: int = None) -> List[Movie]:
+    """
+    Retrieve the movies in a genre, in movie_id order (see get_linked_movies).
+    Returns:
+        List[Movie]: The movies.
+    """
+    return get_linked_movies("genre", genre_id, after, limit)
+
+
+def get_director_movies(person_id: int, after: int = None, limit: int = None) -> List[Movie]:
+    """
+    Retrieve the movies by a director, in movie_id order (see get_linked_movies).
+    Returns:
+        List[Movie]: The movies.
+    """
+    return get_linked_movies("director", person_id, after, limit)
+
+# ---------------------------------------------------------
+# Ratings
+# ---------------------------------------------------------
+
+
+def convert_rows_to_rating_list(ratings):
+    """
+    Converts a list of rating dictionaries to a list of Rating objects.
+
+    Args:
+        ratings (list of dict): A list of dictionaries where each dictionary
+                                contains the keys 'rating_id', 'user_id',
+                                'movie_id', 'rating', 'review', and 'date'.
+
+    Returns:
+        list of Rating: A list of Rating objects created from the input dictionaries.
+    """
+    all_ratings = []
+    if ratings is None:
+        return None
+    for rating in ratings:
+        rating = Rating(
+            rating_id=rating["rating_id"],
+            user_id=rating["user_id"],
+            movie_id=rating["movie_id"],
+            rating=rating["rating"],
+            review=rating["review"],
+            date=rating["date"],
+        )
+        all_ratings.append(rating)
+    return all_ratings
+
+def create_rating(rating: Rating) -> int:
+    """
+    Add a new rating to the database.
+    Args:
+        rating (Rating): A Rating object representing the rating to be added.
+    Returns:
+        int: The ID of the newly created rating.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "INSERT INTO ratings (user_id, movie_id, rating, review, date) VALUES (?, ?, ?, ?, ?)"
+        cursor.execute(query, (rating.user_id, rating.movie_id, rating.rating, rating.review, rating.date))
+        rating_id = cursor.lastrowid
+
+        conn.commit()
+    analytics.record_writes()
+    refresh_similarities_after_write()
+
+    return rating_id
+
+def create_ratings(ratings: List[Rating], batch_size: int = None) -> List[int]:
+    """
+    Add many ratings to the database at once (see bulk_insert).
+    The rating statistics and rankings are updated by the triggers as the rows go in.
+    Args:
+        ratings (List[Rating]): The ratings to add.
+        batch_size (int, optional): How many ratings to insert per transaction. Defaults to config.BULK_BATCH_SIZE.
+    Returns:
+        List[int]: The IDs of the new ratings, in the same order as ratings.
+    Raises:
+        BulkInsertError: If a batch fails (the ratings before it are still added).
+    """
+    query = "INSERT INTO ratings (user_id, movie_id, rating, review, date) VALUES (?, ?, ?, ?, ?)"
+    rows = [(rating.user_id, rating.movie_id, rating.rating, rating.review, rating.date) for rating in ratings]
+    ids = []
+    try:
+        ids = bulk_insert(query, rows, batch_size)
+    except BulkInsertError as error:
+        ids = error.ids
+        raise
+    finally:
+        analytics.record_writes(len(ids))
+        # One refresh for the whole batch, rather than one per rating
+        if ids:
+            refresh_similarities_after_write()
+    return ids
+
+def update_rating(rating: Rating):
+    """
+    Update a rating in the database.
+    Args:
+        rating (Rating): A Rating object containing the updated rating information.
+    Returns:
+        None
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "UPDATE ratings SET user_id = ?, movie_id = ?, rating = ?, review = ?, date = ? WHERE rating_id = ?"
+        cursor.execute(
+            query,
+            (rating.user_id, rating.movie_id, rating.rating, rating.review, rating.date, rating.rating_id),
+        )
+
+        conn.commit()
+    analytics.record_writes()
+    refresh_similarities_after_write()
+
+def get_rating_by_id(rating_id: int) -> Rating:
+    """
+    Retrieve a rating from the database by its ID.
+    Args:
+        rating_id (int): The ID of the rating to retrieve.
+    Returns:
+        Rating: A Rating object representing the rating with the given ID.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "SELECT rating_id,user_id,movie_id,rating,review,date FROM ratings WHERE rating_id = ?"
+        cursor.execute(query, (rating_id,))
+
+        ratings = cursor.fetchall()
+
+    rating_list = convert_rows_to_rating_list(ratings)
+
+    if len(rating_list) == 0:
+        return None
+    return rating_list[0]
+
+def delete_rating(rating_id: int):
+    """
+    Delete a rating from the database by its ID.
+    Args:
+        rating_id (int): The ID of the rating to be deleted.
+    Returns:
+        None
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "DELETE FROM ratings WHERE rating_id = ?"
+        cursor.execute(query, (rating_id,))
+
+        conn.commit()
+    analytics.record_writes()
+    refresh_similarities_after_write()
+
+def get_movie_ratings(movie_id: int, after: int = None, limit: int = None) -> List[Rating]:
+    """
+    Retrieve all ratings for a specific movie by movie ID, in rating_id order.
+    Args:
+        movie_id (int): The unique identifier of the movie.
+        after (int, optional): Only return ratings with a rating_id greater than this (for paging). Defaults to None.
+        limit (int, optional): The maximum number of ratings to return. Defaults to None (all of them).
+    Returns:
+        List[Rating]: A list of Rating objects representing the ratings for the movie.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query, params = build_paged_query("SELECT rating_id, user_id, movie_id, rating,review,date FROM ratings",
+                                          ["movie_id = ?"], [movie_id], "rating_id", after=after, limit=limit)
+        cursor.execute(query, params)
+
+        ratings = cursor.fetchall()
+
+    return convert_rows_to_rating_list(ratings)
+
+def iter_movie_ratings(movie_id: int, after: int = None):
+    """
+    Yield every rating for a movie one at a time, in rating_id order.
+    This is the streaming version of get_movie_ratings, for movies with too many ratings for a list.
+    Args:
+        movie_id (int): The unique identifier of the movie.
+        after (int, optional): Only yield ratings with a rating_id greater than this. Defaults to None.
+    Yields:
+        Rating: The movie's ratings.
+    """
+    query, params = build_paged_query("SELECT rating_id, user_id, movie_id, rating,review,date FROM ratings",
+                                      ["movie_id = ?"], [movie_id], "rating_id", after=after)
+    for row in iter_query(query, params):
+        yield Rating(
+            rating_id=row["rating_id"],
+            user_id=row["user_id"],
+            movie_id=row["movie_id"],
+            rating=row["rating"],
+            review=row["review"],
+            date=row["date"],
+        )
+
+def get_movie_with_ratings(movie_id: int, limit: int = None, after: int = None, raw: bool = False) -> Movie:
+    """
+    Retrieve a movie together with its ratings, using a single query.
+
+    The movie is LEFT JOINed to a page of its ratings, so a movie with no ratings still comes back
+    (as one row with NULL rating columns).  Hot movies can have a huge number of ratings, so unless
+    a limit is given the number of ratings returned is capped at config.MAX_RATINGS_PER_MOVIE.
+
+    Args:
+        movie_id (int): The unique identifier of the movie.
+        limit (int, optional): The maximum number of ratings to return. Defaults to config.MAX_RATINGS_PER_MOVIE.
+        after (int, optional): Only return ratings with a rating_id greater than this (for paging). Defaults to None.
+        raw (bool, optional): Return the movie (without ratings) and the database rows of its ratings
+                              rather than attaching Rating objects to it, for api/serialization.py to
+                              turn straight into JSON. Defaults to False.
+    Returns:
+        Movie: The movie with its ratings attached, or None if there is no movie with that ID.
+               With raw, a tuple of the movie (or None) and the list of rating rows.
+    """
+    if limit is None:
+        limit = config.MAX_RATINGS_PER_MOVIE
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query = """
+            SELECT m.movie_id, m.title, m.genre, m.release_year, m.director,
+                   r.rating_id, r.user_id, r.rating, r.review, r.date
+            FROM movies m
+            LEFT JOIN (
+                SELECT rating_id, user_id, movie_id, rating, review, date
+                FROM ratings
+                WHERE movie_id = ? AND rating_id > ?
+                ORDER BY rating_id
+                LIMIT ?
+            ) r ON r.movie_id = m.movie_id
+            WHERE m.movie_id = ?
+            ORDER BY r.rating_id
+        """
+        # rating_id starts at 1, so "after 0" means from the first rating
+        cursor.execute(query, (movie_id, after or 0, max(limit, 0), movie_id))
+
+        rows = cursor.fetchall()
+
+    # No rows at all means there is no such movie
+    if len(rows) == 0:
+        return (None, []) if raw else None
+
+    movie = convert_rows_to_movie_list(rows[:1])[0]
+    if raw:
+        # The rating columns (and movie_id) of the rows are the same as a ratings query's
+        return movie, [row for row in rows if row["rating_id"] is not None]
+    # Every row repeats the movie columns, followed by the columns of one rating
+    for row in rows:
+        if row["rating_id"] is None:
+            continue
+        movie.ratings.append(Rating(
+            rating_id=row["rating_id"],
+            user_id=row["user_id"],
+            movie_id=row["movie_id"],
+            rating=row["rating"],
+            review=row["review"],
+            date=row["date"],
+        ))
+    return movie
+
+def get_user_ratings(user_id: int, after: int = None, limit: int = None, raw: bool = False, **filters) -> List[Rating]:
+    """
+    Retrieve all ratings by a specific user, in rating_id order.
+    Args:
+        user_id (int): The unique identifier of the user.
+        after (int, optional): Only return ratings with a rating_id greater than this (for paging). Defaults to None.
+        limit (int, optional): The maximum number of ratings to return. Defaults to None (all of them).
+        raw (bool, optional): Return the database rows rather than Rating objects (see find_ratings).
+        **filters: Any of the other filters of rating_query, e.g. min_rating=4.
+    Returns:
+        List[Rating]: A list of Rating objects representing the ratings by the user.
+    """
+    return find_ratings(user_id=user_id, after=after, limit=limit, raw=raw, **filters)
+
+
+def rating_query(movie_id: int = None, user_id: int = None, min_rating: int = None, max_rating: int = None,
+                 date_from: str = None, date_to: str = None, sort: str = "rating_id", descending: bool = False) -> Query:
+    """
+    Build the query for a filtered list of ratings (see api/query_builder.py).  Every filter is optional.
+    Args:
+        movie_id (int, optional): Only the ratings of this movie.
+        user_id (int, optional): Only the ratings by this user.
+        min_rating (int, optional): Only ratings of at least this many stars.
+        max_rating (int, optional): Only ratings of at most this many stars.
+        date_from (str, optional): Only ratings made on or after this date (yyyy-mm-dd).
+        date_to (str, optional): Only ratings made on or before this date (yyyy-mm-dd).
+        sort (str, optional): The column to sort by: rating_id, rating or date. Defaults to rating_id.
+        descending (bool, optional): Sort the other way round. Defaults to False.
+    Returns:
+        Query: The query, ready for find_ratings.
+    Raises:
+        QueryError: If a filter or the sort can't be used.
+    """
+    query = Query(RATINGS)
+    if movie_id is not None:
+        query.equals("movie_id", movie_id)
+    if user_id is not None:
+        query.equals("user_id", user_id)
+    query.between("rating", min_rating, max_rating)
+    query.between("date", date_from, date_to)
+    return query.order_by(sort or "rating_id", descending)
+
+
+def find_ratings(after: int = None, limit: int = None, raw: bool = False, **filters) -> List[Rating]:
+    """
+    Retrieve the ratings that match the given filters.
+    Args:
+        after (int, optional): Only return ratings with a rating_id greater than this (for paging). Defaults to None.
+                               Only allowed when the ratings are in rating_id order.
+        limit (int, optional): The maximum number of ratings to return. Defaults to None (all of them).
+        raw (bool, optional): Return the database rows rather than Rating objects, for
+                              api/serialization.py to turn straight into JSON. Defaults to False.
+        **filters: The filters and sort order, see rating_query.
+    Returns:
+        List[Rating]: The matching ratings.
+    Raises:
+        QueryError: If a filter or the sort can't be used.
+    """
+    query, params = rating_query(**filters).after(after).limit(limit).to_sql()
+    with get_connection() as conn:
+        ratings = conn.execute(query, params).fetchall()
+    return ratings if raw else convert_rows_to_rating_list(ratings)
+
+
+def get_movie_rating_stats(movie_id: int) -> RatingStats:
+    """
+    Retrieve the rating statistics (count, mean, standard deviation, histogram) for a movie.
+    The statistics are kept up to date by triggers on the ratings table (see api/migrations.py),
+    so this is a single lookup no matter how many ratings the movie has.
+    Args:
+        movie_id (int): The ID of the movie.
+    Returns:
+        RatingStats: The movie's statistics, or None if the movie doesn't exist.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        # LEFT JOIN so that a movie nobody has rated yet still comes back (with empty statistics)
+        query = """
+            SELECT m.movie_id, s.rating_count, s.rating_sum, s.rating_sum_squares,
+                   s.count_1, s.count_2, s.count_3, s.count_4, s.count_5
+            FROM movies m
+            LEFT JOIN movie_rating_stats s ON s.movie_id = m.movie_id
+            WHERE m.movie_id = ?
+        """
+        cursor.execute(query, (movie_id,))
+
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+    if row["rating_count"] is None:
+        return RatingStats(movie_id)
+    return RatingStats(
+        movie_id,
+        count=row["rating_count"],
+        total=row["rating_sum"],
+        sum_squares=row["rating_sum_squares"],
+        histogram={score: row[f"count_{score}"] for score in range(1, 6)},
+    )
+
+
+# How to turn a day (an ISO date) into the first day of its bucket, for get_rating_trend.
+#  Weeks start on Monday: go back 6 days, then forward to the next Monday (which may be the day itself).
+TREND_BUCKETS = {
+    "day": "day",
+    "week": "date(day, '-6 days', 'weekday 1')",
+    "month": "strftime('%Y-%m-01', day)",
+    "year": "strftime('%Y-01-01', day)",
+}
+
+def get_rating_trend(movie_id: int = None, start: str = None, end: str = None, bucket: str = "day") -> List[RatingGroup]:
+    """
+    Retrieve the number, mean and standard deviation of the ratings made in each day, week, month
+    or year.  They are added up from the daily rollups the triggers keep (see migration 8), so this
+    reads at most one row per day however many ratings there are.
+    Args:
+        movie_id (int, optional): Only count the ratings of this movie. Defaults to None (every movie).
+        start (str, optional): The first day to include (an ISO date). Defaults to None.
+        end (str, optional): The last day to include (an ISO date). Defaults to None.
+        bucket (str, optional): "day", "week", "month" or "year". Defaults to "day".
+    Returns:
+        List[RatingGroup]: One group per bucket with ratings, in date order.  Each one's "period"
+                           is the first day of the bucket (weeks start on Monday).
+    Raises:
+        QueryError: If the bucket isn't one of the above or a date can't be read.
+    """
+    if bucket not in TREND_BUCKETS:
+        raise QueryError(f"bucket must be one of {', '.join(TREND_BUCKETS)}")
+    if movie_id is None:
+        table, where_clauses, params = "rating_daily_totals", [], []
+    else:
+        table, where_clauses, params = "rating_daily_rollups", ["movie_id = ?"], [movie_id]
+    # ISO dates compare properly as text, so a date range is a range of the primary key
+    if start is not None:
+        where_clauses.append("day >= ?")
+        params.append(check_iso_date(start, "from"))
+    if end is not None:
+        where_clauses.append("day <= ?")
+        params.append(check_iso_date(end, "to"))
+    where = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+
+    with get_connection() as conn:
+        # Days whose ratings were all deleted again are still in the rollups, with a count of 0
+        query = f"""
+            SELECT {TREND_BUCKETS[bucket]} AS period, SUM(rating_count) AS rating_count,
+                   SUM(rating_sum) AS rating_sum, SUM(rating_sum_squares) AS rating_sum_squares
+            FROM {table}
+            {where}
+            GROUP BY period
+            HAVING SUM(rating_count) > 0
+            ORDER BY period
+        """
+        rows = conn.execute(query, params).fetchall()
+    return [RatingGroup("period", row["period"], row["rating_count"], row["rating_sum"], row["rating_sum_squares"])
+            for row in rows]
+
+
+# ---------------------------------------------------------
+# Recommendations
+# ---------------------------------------------------------
+# The similar movies of every movie are worked out ahead of time from the ratings and kept in the
+#  item_similarities table (see api/recommender.py), so a user's recommendations are a lookup.
+def refresh_similarities() -> int:
+    """
+    Work out the similar movies again for the movies whose ratings changed since the last refresh.
+    Returns:
+        int: The number of movies whose similar movies were worked out again.
+    """
+    with get_connection() as conn:
+        try:
+            refreshed = recommender.refresh_similarities(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return refreshed
+
+# With config.RECOMMENDER_REFRESH_ON_WRITE, the refreshes run on one background thread.  Writes
+#  that come in while it is busy only ask for one more refresh, which picks up all of their movies.
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+_refresh_wanted = False
+
+def refresh_similarities_after_write():
+    """
+    Start a background refresh of the similar movies after a rating was written, if
+    config.RECOMMENDER_REFRESH_ON_WRITE is on.  The write has already been committed, so the
+    refresh never holds it up and a refresh that fails never fails the write (the movies stay
+    queued for the next refresh).
+    """
+    global _refresh_thread, _refresh_wanted
+    if not config.RECOMMENDER_REFRESH_ON_WRITE:
+        return
+    with _refresh_lock:
+        _refresh_wanted = True
+        if _refresh_thread is None:
+            _refresh_thread = threading.Thread(target=_refresh_in_background, name="similarity-refresh", daemon=True)
+            _refresh_thread.start()
+
+def _refresh_in_background():
+    """Run refresh_similarities until nobody has asked for another refresh."""
+    global _refresh_thread, _refresh_wanted
+    while True:
+        with _refresh_lock:
+            if not _refresh_wanted:
+                _refresh_thread = None
+                return
+            _refresh_wanted = False
+        try:
+            refresh_similarities()
+        except Exception:
+            logger.exception("Refreshing the similar movies failed, the changed movies stay queued")
+
+def wait_for_similarity_refresh(timeout: float = None) -> bool:
+    """
+    Wait for the background refresh (if one is running) to finish.  Used by tests and scripts.
+    Args:
+        timeout (float, optional): The most seconds to wait. Defaults to None (as long as it takes).
+    Returns:
+        bool: True if no refresh is running any more.
+    """
+    with _refresh_lock:
+        thread = _refresh_thread
+    if thread is not None:
+        thread.join(timeout)
+        return not thread.is_alive()
+    return True
+
+def get_recommendations(user_id: int, limit: int = None) -> List[SearchResult]:
+    """
+    Recommend movies to a user, from the movies that are most similar to the ones they rated.
+
+    Every movie that is one of the similar movies of a movie the user rated (and that they haven't
+    rated themselves) gets a score: the average of the user's ratings of those movies, weighted by
+    how similar each one is.  So a movie that is very like the movies they loved scores close to 5.
+    Args:
+        user_id (int): The ID of the user.
+        limit (int, optional): The maximum number of movies. Defaults to config.DEFAULT_PAGE_SIZE.
+    Returns:
+        List[SearchResult]: The movies, best first, with the predicted rating as the score.
+    """
+    with get_connection() as conn:
+        # Movies with the same score are ordered by the total similarity, i.e. how much evidence there is
+        query = """
+            SELECT m.movie_id, m.title, m.genre, m.release_year, m.director,
+                   SUM(s.similarity * r.rating) / SUM(s.similarity) AS score
+            FROM ratings r
+            JOIN item_similarities s ON s.movie_id = r.movie_id
+            JOIN movies m ON m.movie_id = s.neighbour_id
+            WHERE r.user_id = ? AND r.rating IS NOT NULL
+              AND s.neighbour_id NOT IN (SELECT movie_id FROM ratings WHERE user_id = ?)
+            GROUP BY s.neighbour_id
+            ORDER BY score DESC, SUM(s.similarity) DESC, s.neighbour_id
+            LIMIT ?
+        """
+        rows = conn.execute(query, (user_id, user_id, limit or config.DEFAULT_PAGE_SIZE)).fetchall()
+    movies = convert_rows_to_movie_list(rows)
+    return [SearchResult(movie, row["score"], None) for movie, row in zip(movies, rows)]
+
+def get_similar_movies(movie_id: int, limit: int = None) -> List[SearchResult]:
+    """
+    Find the movies most like a movie, by who rated them and how, their genres, directors and
+    release years (see api/similar_movies.py).  They are read from an index built ahead of time,
+    so a movie added since it was last built has no similar movies yet.
+    Args:
+        movie_id (int): The ID of the movie.
+        limit (int, optional): The maximum number of movies. Defaults to config.DEFAULT_PAGE_SIZE.
+    Returns:
+        List[SearchResult]: The movies, most similar first, with the similarity (0-1) as the score.
+    Raises:
+        similar_movies.IndexNotBuiltError: If the index hasn't been built yet.
+    """
+    index = similar_movies.get_index(get_pool().database_path)
+    matches = index.lookup(movie_id, limit or config.DEFAULT_PAGE_SIZE)
+    select = "SELECT movie_id,title,genre,release_year,director FROM movies"
+    rows = fetch_by_ids(select, "movie_id", [similar_id for similar_id, _ in matches])
+    movies = {movie.movie_id: movie for movie in convert_rows_to_movie_list(rows)}
+    # A movie deleted since the index was built is left out
+    return [SearchResult(movies[similar_id], score, None) for similar_id, score in matches if similar_id in movies]
+
+
+# ---------------------------------------------------------
+# Analytics
+# ---------------------------------------------------------
+# The analytics are worked out with NumPy from a snapshot of the ratings held in memory (see
+#  api/analytics.py) rather than from the database, so they may be a few minutes out of date.
+def get_ratings_by(field: str, start: str = None, end: str = None) -> tuple:
+    """
+    Group the ratings and work out the number, mean and standard deviation of each group.
+    Args:
+        field (str): "genre", "release_year" or "date" (the day the rating was made).
+        start (str, optional): For "date", the first day to include (an ISO date). Defaults to None.
+        end (str, optional): For "date", the last day to include (an ISO date). Defaults to None.
+    Returns:
+        tuple: The groups (a list of RatingGroup objects, in order) and when the snapshot was taken.
+    Raises:
+        QueryError: If the field isn't one of the above or a date can't be read.
+    """
+    snapshot = analytics.get_snapshot()
+    if field == "genre":
+        groups = snapshot.by_genre()
+    elif field == "release_year":
+        groups = snapshot.by_release_year()
+    elif field == "date":
+        groups = snapshot.by_day(read_day(start, "start"), read_day(end, "end"))
+    else:
+        raise QueryError(f"Can't group ratings by {field!r}")
+    return groups, snapshot.built_at
+
+def read_day(text: str, name: str) -> int:
+    """Turn an ISO date from a request into a number of days for api/analytics.py (None stays None)."""
+    if text is None:
+        return None
+    return analytics.parse_day(check_iso_date(text, name))
+
+def check_iso_date(text: str, name: str) -> str:
+    """
+    Check that a date from a request is an ISO date (yyyy-mm-dd).
+    Args:
+        text (str): The date.
+        name (str): The name of the query string parameter, for the error message.
+    Returns:
+        str: The date.
+    Raises:
+        QueryError: If it isn't an ISO date.
+    """
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", text) or analytics.parse_day(text) == analytics.NO_DATE:
+        raise QueryError(f"{name} must be a date like 2024-01-31")
+    return text
+
+def get_rating_activity(kind: str, percentiles: list) -> tuple:
+    """
+    Work out how the ratings are spread over the users or the movies: how many ratings the
+    busiest 1%, the median user and so on have.
+    Args:
+        kind (str): "users" or "movies".
+        percentiles (list): The percentiles to work out, from 0 to 100.
+    Returns:
+        tuple: A dictionary (see RatingsSnapshot.activity) and when the snapshot was taken.
+    Raises:
+        QueryError: If kind isn't "users" or "movies", or a percentile isn't between 0 and 100.
+    """
+    if kind not in ("users", "movies"):
+        raise QueryError('kind must be "users" or "movies"')
+    if not all(0 <= percentile <= 100 for percentile in percentiles):
+        raise QueryError("percentiles must be between 0 and 100")
+    snapshot = analytics.get_snapshot()
+    return snapshot.activity(kind, percentiles), snapshot.built_at
+
+
+# ---------------------------------------------------------
+# Versions
+# ---------------------------------------------------------
+# The row versions and table generations behind the ETag and Last-Modified headers (see migration
+#  9 and api/conditional.py).  Each is a primary key lookup, so a client whose copy is still up to
+#  date can be answered without reading (or converting) the rows themselves.
+def get_row_version(table: str, row_id: int) -> tuple:
+    """
+    Look up the version of one movie, user or rating.
+    Args:
+        table (str): "movies", "users" or "ratings".
+        row_id (int): The row's ID.
+    Returns:
+        tuple: The table's epoch, the row's row_version and when it last changed (ISO text in UTC),
+               or None if there is no such row.
+    Raises:
+        QueryError: If the table isn't versioned.
+    """
+    if table not in migrations.VERSIONED_TABLES:
+        raise QueryError(f"{table} has no row versions")
+    key_column = migrations.VERSIONED_TABLES[table][0]
+    with get_connection() as conn:
+        # Rows bulk loaded without an updated_at haven't changed since the table was loaded
+        row = conn.execute(f"""
+            SELECT g.epoch, t.row_version, COALESCE(t.updated_at, g.reset_at)
+            FROM {table} t JOIN table_generations g ON g.table_name = ?
+            WHERE t.{key_column} = ?
+        """, (table, row_id)).fetchone()
+    return tuple(row) if row is not None else None
+
+def get_table_generations(tables: List[str]) -> list:
+    """
+    Look up the generations of some tables.
+    Args:
+        tables (List[str]): The tables, e.g. ["movies", "ratings"].
+    Returns:
+        list: (table, epoch, generation, changed_at) tuples, in the same order as tables.
+    """
+    with get_connection() as conn:
+        rows = {row["table_name"]: tuple(row) for row in conn.execute(
+            "SELECT table_name, epoch, generation, changed_at FROM table_generations")}
+    return [rows[table] for table in tables]
+
+
+# ---------------------------------------------------------
+# Search
+# ---------------------------------------------------------
+def build_search_query(text: str) -> str:
+    """
+    Turn what a user typed into an FTS5 MATCH query.
+    FTS5 has its own query language (AND, OR, NEAR, quotes, column filters ...) and text that
+    isn't valid in it is an error, so rather than passing the user's text straight through we
+    pull out the words, quote each one, and let the last one match as a prefix so that results
+    show up while the user is still typing ("dark kni" finds "The Dark Knight").
+    Args:
+        text (str): The search text.
+    Returns:
+        str: The MATCH query, or "" if the text has no words in it.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def run_search(select: str, fts_table: str, text: str, after: tuple = None, limit: int = None) -> list:
+    """
+    Run a full-text search and return the matching rows, best match first.
+    The results are ordered by (rank, rowid), and paged with the same keyset idea as
+    build_paged_query: the next page starts after the (rank, rowid) of the last result.
+    Args:
+        select (str): The SELECT ... FROM ... JOIN part of the query, with the FTS table aliased as f.
+        fts_table (str): The name of the FTS table.
+        text (str): The search text.
+        after (tuple, optional): The (rank, rowid) of the last result already seen. Defaults to None.
+        limit (int, optional): The maximum number of results. Defaults to config.DEFAULT_PAGE_SIZE.
+    Returns:
+        list: The rows, with "rank" and "snippet" columns as well as the ones in select.
+    """
+    match = build_search_query(text)
+    if not match:
+        return []
+    where_clauses = [f"{fts_table} MATCH ?"]
+    params = [match]
+    if after is not None:
+        # bm25 gives better matches a lower (more negative) rank
+        where_clauses.append("(f.rank > ? OR (f.rank = ? AND f.rowid > ?))")
+        params.extend([after[0], after[0], after[1]])
+    params.append(limit or config.DEFAULT_PAGE_SIZE)
+    query = f"{select} WHERE {' AND '.join(where_clauses)} ORDER BY f.rank, f.rowid LIMIT ?"
+    with get_connection() as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def search_movies(text: str, after: tuple = None, limit: int = None) -> List[SearchResult]:
+    """
+    Search the titles, directors and genres of the movies (see the full-text indexes in api/migrations.py).
+    Args:
+        text (str): The search text, e.g. "nolan" or "dark kni".
+        after (tuple, optional): The (rank, movie_id) of the last result already seen (for paging). Defaults to None.
+        limit (int, optional): The maximum number of results. Defaults to config.DEFAULT_PAGE_SIZE.
+    Returns:
+        List[SearchResult]: The matching movies, best match first.  Each result's rank and id are
+                            available as result.key for paging.
+    """
+    select = """
+        SELECT m.movie_id, m.title, m.genre, m.release_year, m.director, f.rowid, f.rank,
+               snippet(movies_fts, -1, '<mark>', '</mark>', '...', 10) AS snippet
+        FROM movies_fts f
+        JOIN movies m ON m.movie_id = f.rowid
+    """
+    results = []
+    for row in run_search(select, "movies_fts", text, after, limit):
+        movie = Movie(row["movie_id"], row["title"], row["genre"], row["release_year"], row["director"])
+        result = SearchResult(movie, -row["rank"], row["snippet"])
+        result.key = (row["rank"], row["rowid"])
+        results.append(result)
+    return results
+
+
+def search_reviews(text: str, after: tuple = None, limit: int = None) -> List[SearchResult]:
+    """
+    Search the text of the reviews.
+    Args:
+        text (str): The search text.
+        after (tuple, optional): The (rank, rating_id) of the last result already seen (for paging). Defaults to None.
+        limit (int, optional): The maximum number of results. Defaults to config.DEFAULT_PAGE_SIZE.
+    Returns:
+        List[SearchResult]: The matching ratings, best match first.
+    """
+    select = """
+        SELECT r.rating_id, r.user_id, r.movie_id, r.rating, r.review, r.date, f.rowid, f.rank,
+               snippet(reviews_fts, 0, '<mark>', '</mark>', '...', 10) AS snippet
+        FROM reviews_fts f
+        JOIN ratings r ON r.rating_id = f.rowid
+    """
+    results = []
+    for row in run_search(select, "reviews_fts", text, after, limit):
+        rating = convert_rows_to_rating_list([row])[0]
+        result = SearchResult(rating, -row["rank"], row["snippet"])
+        result.key = (row["rank"], row["rowid"])
+        results.append(result)
+    return results
+
+
+def fuzzy_search_users(username: str, limit: int = None) -> List[SearchResult]:
+    """
+    Find the users whose username looks like the given text, typos and all (see api/trigram.py).
+    Args:
+        username (str): The (possibly misspelt) username, e.g. "jonh".
+        limit (int, optional): The maximum number of users. Defaults to config.DEFAULT_PAGE_SIZE.
+    Returns:
+        List[SearchResult]: The users, most similar first, with the similarity (0-1) as the score.
+    """
+    matches = trigram.get_index("users").similar(username, limit=limit or config.DEFAULT_PAGE_SIZE)
+    rows = fetch_by_ids("SELECT user_id,username,email FROM users", "user_id", [user_id for user_id, _ in matches])
+    users = {user.id: user for user in convert_rows_to_user_list(rows)}
+    return [SearchResult(users[user_id], score, None) for user_id, score in matches if user_id in users]
+
+
+def fuzzy_search_movies(title: str, limit: int = None) -> List[SearchResult]:
+    """
+    Find the movies whose title looks like the given text, typos and all (see api/trigram.py).
+    Args:
+        title (str): The (possibly misspelt) title, e.g. "dark nite".
+        limit (int, optional): The maximum number of movies. Defaults to config.DEFAULT_PAGE_SIZE.
+    Returns:
+        List[SearchResult]: The movies, most similar first, with the similarity (0-1) as the score.
+    """
+    matches = trigram.get_index("movies").similar(title, limit=limit or config.DEFAULT_PAGE_SIZE)
+    select = "SELECT movie_id,title,genre,release_year,director FROM movies"
+    rows = fetch_by_ids(select, "movie_id", [movie_id for movie_id, _ in matches])
+    movies = {movie.movie_id: movie for movie in convert_rows_to_movie_list(rows)}
+    return [SearchResult(movies[movie_id], score, None) for movie_id, score in matches if movie_id in movies]
@@ -0,0 +1,302 @@
+# In this file, we build and read the "similar movies" index behind /api/movies/<id>/similar.
+#
+# Two movies count as similar when they look alike in several ways, each scored from 0 to 1:
+#   - ratings:  the same users rated them alike (the item_similarities table, see api/recommender.py)
+#   - genre:    they share genres (the number shared / the square root of the product of their counts)
+#   - director: they share directors (worked out the same way)
+#   - year:     they came out close together (1 for the same year, down to 0 SIMILAR_MOVIES_YEAR_SPAN years apart)
+#  and the similarity is the weighted average of the four (the SIMILAR_MOVIES_*_WEIGHT settings).
+#
+# Scoring every movie against every other movie on each request would take time proportional to
+#  the square of the number of movies.  Instead a batch job (utility/build_similar_movies.py, which
+#  utility/load_data.py also runs) scores them all at once with NumPy, a block of movies at a time,
+#  and saves the SIMILAR_MOVIES_COUNT best for each movie to a .npy file next to the database.
+#
+# The file holds one record per movie, in movie_id order: the movie_id, the ids of its similar
+#  movies and their scores.  The API opens it with np.load(mmap_mode="r"), which maps the file into
+#  memory rather than reading it: opening it takes the same (tiny) time however big it is, the
+#  operating system only reads the pages a lookup touches, and every worker process shares the same
+#  copy.  A lookup is a binary search for the movie_id and one record read.
+#
+# The index is a snapshot.  Movies added since the last build don't have similar movies until the
+#  next one, and the API picks up a new build by itself (it checks the file's modification time).
+#  The API never builds the index itself: until the batch job has run, /api/movies/<id>/similar
+#  answers 503 Service Unavailable.
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from api import config
+from api.recommender import RatingMatrix
+
+
+class IndexNotBuiltError(Exception):
+    """Raised when the index file hasn't been built yet (see utility/build_similar_movies.py)."""
+
+
+def index_path(database_path: Path) -> Path:
+    """
+    Where the index of a database is kept.
+
+    Args:
+        database_path (Path): The database file.
+
+    Returns:
+        Path: config.SIMILAR_MOVIES_INDEX_PATH if it is set, otherwise the database's path with
+              .similar.npy instead of its extension (data/movie_data.similar.npy).
+    """
+    if config.SIMILAR_MOVIES_INDEX_PATH:
+        return Path(config.SIMILAR_MOVIES_INDEX_PATH)
+    return Path(database_path).with_suffix(".similar.npy")
+
+
+def record_type(count: int) -> np.dtype:
+    """The layout of one movie's record in the index file, with room for count similar movies."""
+    return np.dtype([("movie_id", np.int64), ("neighbours", np.int64, (count,)), ("scores", np.float32, (count,))])
+
+
+def link_scorer(matrix: RatingMatrix, movie_count: int):
+    """
+    Prepare to work out how much movies have in common through a link table (shared genres or
+    shared directors): the number of links two movies share divided by the square root of the
+    product of their numbers of links.
+
+    When there are few links (genres, or the made-up data in the benchmarks) a movie shares them
+    with a large share of the other movies, and the fastest way is a matrix multiplication of one
+    row per movie and one column per link.  When there are many (directors) that matrix would be
+    huge and almost all zeros, so instead the pairs of movies that share a link are counted.
+
+    Args:
+        matrix (RatingMatrix): The links as a matrix, with a row per genre (or person), a column per
+                               movie position, and a 1 for every link.
+        movie_count (int): The number of movies.
+
+    Returns:
+        function: Takes the positions of a block of movies and returns an array with a row per movie
+                  in the block and a column per movie.
+    """
+    counts = np.zeros(movie_count)
+    counts[matrix.movie_ids] = np.sqrt(matrix.sum_squares())
+
+    if movie_count * len(matrix.user_ids) <= config.RECOMMENDER_BLOCK_CELLS:
+        # Each movie's row is scaled by 1 / sqrt(its number of links), so the product is the score
+        dense = np.zeros((movie_count, len(matrix.user_ids)))
+        links = np.repeat(np.arange(len(matrix.user_ids)), np.diff(matrix.indptr))
+        dense[matrix.movie_ids[matrix.indices], links] = 1
+        dense[counts > 0] /= counts[counts > 0, None]
+        return lambda block: dense[block] @ dense.T
+
+    def score(block):
+        result = np.zeros((len(block), movie_count))
+        columns = np.searchsorted(matrix.movie_ids, block)
+        found = columns < len(matrix.movie_ids)
+        found[found] = matrix.movie_ids[columns[found]] == block[found]
+        if not found.any():
+            return result
+        block_rows, others, _ = matrix.pairs(columns[found])
+        cells, shared = np.unique(block_rows * len(matrix.movie_ids) + others, return_counts=True)
+        block_rows, others = np.divmod(cells, len(matrix.movie_ids))
+        rows = np.flatnonzero(found)[block_rows]
+        others = matrix.movie_ids[others]
+        result[rows, others] = shared / (counts[block[rows]] * counts[others])
+        return result
+    return score
+
+
+def build_index(conn: sqlite3.Connection, count: int = None) -> np.ndarray:
+    """
+    Score every movie against every other movie and keep the best for each.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+        count (int, optional): How many similar movies to keep for each movie.
+                               Defaults to config.SIMILAR_MOVIES_COUNT.
+
+    Returns:
+        np.ndarray: One record (see record_type) per movie, in movie_id order.  Rows with fewer
+                    similar movies than count are padded with movie_id 0 and score 0.
+    Raises:
+        ValueError: If config.SIMILAR_MOVIES_YEAR_SPAN isn't greater than 0.
+    """
+    count = count or config.SIMILAR_MOVIES_COUNT
+    # The year score divides by the span
+    if not config.SIMILAR_MOVIES_YEAR_SPAN > 0:
+        raise ValueError(f"SIMILAR_MOVIES_YEAR_SPAN must be greater than 0, not {config.SIMILAR_MOVIES_YEAR_SPAN}")
+    movies = conn.execute("SELECT movie_id, release_year FROM movies ORDER BY movie_id").fetchall()
+    movie_ids = np.array([row[0] for row in movies], dtype=np.int64)
+    years = np.array([row[1] if row[1] is not None else np.nan for row in movies], dtype=np.float64)
+    movie_count = len(movie_ids)
+
+    def positions(ids):
+        return np.searchsorted(movie_ids, np.asarray(ids, dtype=np.int64))
+
+    def link_matrix(query):
+        rows = conn.execute(query).fetchall()
+        # Links to movies that no longer exist are ignored
+        links = [row for row in rows if row[1] in known]
+        return RatingMatrix([row[0] for row in links], positions([row[1] for row in links]), np.ones(len(links)))
+
+    known = set(movie_ids.tolist())
+    genres = link_scorer(link_matrix("SELECT genre_id, movie_id FROM movie_genres"), movie_count)
+    directors = link_scorer(link_matrix("SELECT person_id, movie_id FROM movie_directors"), movie_count)
+
+    # The ratings similarities, by movie position (already sorted, so each movie's are one slice)
+    rated = [row for row in conn.execute(
+        "SELECT movie_id, neighbour_id, similarity FROM item_similarities ORDER BY movie_id")
+        if row[0] in known and row[1] in known]
+    rated_movies = positions([row[0] for row in rated])
+    rated_neighbours = positions([row[1] for row in rated])
+    rated_scores = np.array([row[2] for row in rated], dtype=np.float64)
+    rated_ptr = np.searchsorted(rated_movies, np.arange(movie_count + 1))
+
+    weights = {"ratings": config.SIMILAR_MOVIES_RATINGS_WEIGHT, "genre": config.SIMILAR_MOVIES_GENRE_WEIGHT,
+               "director": config.SIMILAR_MOVIES_DIRECTOR_WEIGHT, "year": config.SIMILAR_MOVIES_YEAR_WEIGHT}
+    total_weight = sum(weights.values()) or 1.0
+
+    index = np.zeros(movie_count, dtype=record_type(count))
+    index["movie_id"] = movie_ids
+    keep = min(count, movie_count)
+    # Each block needs a few (block x movies) arrays, so size the blocks to keep those under the limit
+    block_size = max(1, config.RECOMMENDER_BLOCK_CELLS // max(1, movie_count))
+    for start in range(0, movie_count, block_size):
+        block = np.arange(start, min(start + block_size, movie_count))
+        scores = weights["genre"] * genres(block)
+        scores += weights["director"] * directors(block)
+
+        # 1 for the same year, falling in a straight line to 0 at SIMILAR_MOVIES_YEAR_SPAN years apart
+        #  (a movie without a year is NaN, and counts as 0 to everything)
+        gaps = np.abs(years[block, None] - years[None, :])
+        closeness = np.clip(1 - gaps / config.SIMILAR_MOVIES_YEAR_SPAN, 0, 1)
+        scores += weights["year"] * np.where(np.isnan(closeness), 0, closeness)
+
+        low, high = rated_ptr[start], rated_ptr[block[-1] + 1]
+        rated_rows = rated_movies[low:high] - start
+        scores[rated_rows, rated_neighbours[low:high]] += weights["ratings"] * rated_scores[low:high]
+
+        scores /= total_weight
+        # A movie isn't similar to itself
+        scores[np.arange(len(block)), block] = 0
+        if keep == 0:
+            continue
+        # The best `keep` of each row (in no particular order), then sorted best first
+        best = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        index["neighbours"][block, :keep] = np.where(best_scores > 0, movie_ids[best], 0)
+        index["scores"][block, :keep] = best_scores
+    return index
+
+
+def save_index(index: np.ndarray, path: Path):
+    """
+    Write an index to a file.  It is written to a temporary file first and then renamed, so
+    anyone reading the old file never sees a half-written one.
+
+    Args:
+        index (np.ndarray): The index, from build_index.
+        path (Path): The file to write.
+    """
+    path = Path(path)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary, "wb") as file:
+        np.save(file, index)
+    os.replace(temporary, path)
+
+
+def build(conn: sqlite3.Connection, path: Path) -> int:
+    """
+    Build the index from the database and save it (the batch job).
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+        path (Path): The file to write.
+
+    Returns:
+        int: The number of movies in the index.
+    """
+    index = build_index(conn)
+    save_index(index, path)
+    return len(index)
+
+
+class SimilarMoviesIndex:
+    """The saved index, memory-mapped from its file."""
+
+    def __init__(self, path: Path):
+        # mmap_mode="r" maps the file instead of reading it, see the top of this file
+        self.records = np.load(path, mmap_mode="r")
+        self.movie_ids = self.records["movie_id"]
+
+    def __len__(self):
+        return len(self.records)
+
+    def lookup(self, movie_id: int, limit: int = None) -> list:
+        """
+        Find the movies most similar to a movie.
+
+        Args:
+            movie_id (int): The movie.
+            limit (int, optional): The most similar movies to return. Defaults to all of them.
+
+        Returns:
+            list: (movie_id, score) tuples, the most similar first.  Empty if the movie isn't in the index.
+        """
+        position = int(np.searchsorted(self.movie_ids, movie_id))
+        if position == len(self.movie_ids) or self.movie_ids[position] != movie_id:
+            return []
+        record = self.records[position]
+        results = [(int(neighbour), float(score))
+                   for neighbour, score in zip(record["neighbours"], record["scores"]) if score > 0]
+        return results[:limit] if limit is not None else results
+
+
+# ---------------------------------------------------------
+# The shared index used by api/services.py
+# ---------------------------------------------------------
+# (the file, its version, the SimilarMoviesIndex).  The version is the file's modification time and
+#  inode number: save_index always writes a new file, so a new build changes the inode even if it
+#  happens within the same tick of the clock.
+_shared = (None, None, None)
+_lock = threading.Lock()
+
+
+def get_index(database_path: Path) -> SimilarMoviesIndex:
+    """
+    Return the shared index, opening the file the first time it is used and again whenever the
+    batch job has replaced it.  Building it takes time proportional to the square of the number
+    of movies, so that is left to the batch job rather than done in a request.
+
+    Args:
+        database_path (Path): The database file (to find the index next to it).
+
+    Returns:
+        SimilarMoviesIndex: The index.
+    Raises:
+        IndexNotBuiltError: If the batch job hasn't built the index yet.
+    """
+    global _shared
+    path = index_path(database_path)
+    try:
+        status = path.stat()
+    except FileNotFoundError:
+        raise IndexNotBuiltError(
+            "The similar movies index hasn't been built yet, run python utility/build_similar_movies.py")
+    version = (status.st_mtime_ns, status.st_ino)
+    with _lock:
+        shared_path, shared_version, index = _shared
+        if index is None or shared_path != path or shared_version != version:
+            index = SimilarMoviesIndex(path)
+            _shared = (path, version, index)
+        return index
+
+
+def reset():
+    """Forget the shared index, e.g. after pointing the connection pool at a different database."""
+    global _shared
+    with _lock:
+        _shared = (None, None, None)
@@ -0,0 +1,127 @@
+# In this file, we build streaming responses for endpoints that can return a lot of data.
+# A normal response is built completely in memory before it is sent: every row becomes a model
+#  object, then a dictionary, then one big JSON string.  A streaming response instead sends the
+#  JSON a few hundred items at a time as they come out of the database, so memory use stays flat
+#  and the client starts receiving data straight away, no matter how big the result is.
+#
+# Clients choose the format with the Accept header:
+#   - Accept: application/x-ndjson   Newline-delimited JSON, one object per line (always streamed)
+#   - ?stream=true                   A normal JSON array, sent in chunks
+# Without either, the endpoint returns its normal (paged) response.
+import json
+from itertools import islice
+
+from flask import Response, request, stream_with_context
+
+from api import config
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+JSON_MIMETYPE = "application/json"
+
+
+def stream_format() -> str:
+    """
+    Work out whether (and how) the client wants the current response streamed.
+
+    Returns:
+        str: "ndjson", "json", or None for a normal, non-streamed response.
+    """
+    best = request.accept_mimetypes.best_match([JSON_MIMETYPE, NDJSON_MIMETYPE])
+    # best_match prefers the first option when the client accepts anything (*/*), so NDJSON is
+    #  only used when the client asked for it more specifically than JSON
+    if best == NDJSON_MIMETYPE:
+        return "ndjson"
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return "json"
+    return None
+
+
+def _batches(items, batch_size: int):
+    """Yield lists of up to batch_size items."""
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def json_array_chunks(items, to_dict, prefix: str = "", suffix: str = ""):
+    """
+    Yield a JSON array of items in chunks.
+
+    Args:
+        items (iterable): The objects to send, usually a generator from api.services.
+        to_dict (callable): Turns an item into something json.dumps can encode.
+        prefix (str, optional): Text to send before the array (used to wrap it in an object).
+        suffix (str, optional): Text to send after the array.
+
+    Yields:
+        str: Pieces of the JSON document, which joined together make one valid JSON value.
+    """
+    yield prefix + "["
+    first = True
+    for batch in _batches(items, config.STREAM_BATCH_SIZE):
+        chunk = ",".join(json.dumps(to_dict(item)) for item in batch)
+        yield chunk if first else "," + chunk
+        first = False
+    yield "]" + suffix
+
+
+def ndjson_chunks(items, to_dict):
+    """
+    Yield items as newline-delimited JSON, one object per line.
+
+    Args:
+        items (iterable): The objects to send, usually a generator from api.services.
+        to_dict (callable): Turns an item into something json.dumps can encode.
+
+    Yields:
+        str: Groups of complete lines.
+    """
+    for batch in _batches(items, config.STREAM_BATCH_SIZE):
+        yield "".join(json.dumps(to_dict(item)) + "\n" for item in batch)
+
+
+def streamed_response(chunks, fmt: str) -> Response:
+    """
+    Wrap a generator of chunks in a streaming Flask response.
+
+    stream_with_context keeps the request (and its pooled database connection) alive until the
+    last chunk has been sent; the connection is returned to the pool after that.
+
+    Args:
+        chunks (iterable): The pieces of the response body.
+        fmt (str): "ndjson" or "json", as returned by stream_format().
+
+    Returns:
+        Response: A response that is sent to the client as it is generated.
+    """
+    mimetype = NDJSON_MIMETYPE if fmt == "ndjson" else JSON_MIMETYPE
+    return Response(stream_with_context(chunks), mimetype=mimetype)
+
+
+def stream_items(items, to_dict, fmt: str, envelope: dict = None, field: str = None) -> Response:
+    """
+    Stream a collection of items as a JSON array or as NDJSON.
+
+    Args:
+        items (iterable): The objects to send, usually a generator from api.services.
+        to_dict (callable): Turns an item into something json.dumps can encode.
+        fmt (str): "ndjson" or "json", as returned by stream_format().
+        envelope (dict, optional): In JSON mode, send the array as envelope[field] instead of on its own.
+                                   For example the movie that a list of ratings belongs to.
+                                   NDJSON responses only ever contain the items.
+        field (str, optional): The key of the array inside the envelope.
+
+    Returns:
+        Response: The streaming response.
+    """
+    if fmt == "ndjson":
+        return streamed_response(ndjson_chunks(items, to_dict), fmt)
+    if envelope is None:
+        return streamed_response(json_array_chunks(items, to_dict), fmt)
+    # Open the envelope object, add the array as its last field, then close the object
+    opening = json.dumps(envelope)[:-1]
+    prefix = opening + ("," if envelope else "") + json.dumps(field) + ":"
+    return streamed_response(json_array_chunks(items, to_dict, prefix=prefix, suffix="}"), fmt)
@@ -0,0 +1,318 @@
+# In this file, we keep an in-memory trigram index over the usernames and movie titles.
+# A "contains" search like username LIKE '%john%' can't use a normal index, because the text can
+#  start anywhere in the name, so SQLite has to read every row of the table.  A trigram index
+#  splits every name into all of its three letter pieces ("john" -> "  j", " jo", "joh", "ohn",
+#  "hn ") and remembers which names contain each piece.  To find the names that contain "john",
+#  we only have to look at the names that have all of "joh" and "ohn", which is usually a tiny
+#  fraction of the table.
+#
+# The same pieces also give us a "fuzzy" search that copes with typos: two names that share most
+#  of their trigrams look alike, so "johny" still finds "johnny".  The similarity of two names is the
+#  number of trigrams they share divided by the number of different trigrams between them, from
+#  0 (nothing in common) to 1 (the same trigrams).
+#
+# The index lives in the memory of each API process.  It is built from the database the first time
+#  it is used, the services functions that add, change or delete a user or movie keep it up to date,
+#  and it is rebuilt after TRIGRAM_MAX_AGE_SECONDS to pick up changes made some other way (another
+#  process, or a script like utility/load_data.py).
+import threading
+import time
+from collections import Counter
+
+from api import config
+from api.db import get_connection
+
+
+def normalise(text: str) -> str:
+    """
+    Prepare a name for indexing or searching: case is ignored, like SQLite's LIKE.
+
+    Args:
+        text (str): The name or search text.
+
+    Returns:
+        str: The text in lower case (casefold also handles letters like the German ß).
+    """
+    return text.casefold()
+
+
+def trigrams(text: str, padded: bool = True) -> set:
+    """
+    Split a (normalised) piece of text into its trigrams.
+
+    Args:
+        text (str): The text.
+        padded (bool, optional): Add two spaces to the start and one to the end first, so that the
+                                 start and end of the text get trigrams of their own. Search text for a
+                                 "contains" search isn't padded, it can match anywhere in a name.
+
+    Returns:
+        set: The distinct trigrams.
+    """
+    if padded:
+        text = f"  {text} "
+    return {text[position:position + 3] for position in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """
+    A thread-safe trigram index over one column, e.g. users.username.
+
+    For every trigram we keep the set of ids whose text contains it (a "posting list").  The text
+    itself is kept too, so a candidate can be checked and an entry can be removed again.
+    """
+
+    def __init__(self):
+        # trigram -> set of ids
+        self._postings = {}
+        # id -> normalised text
+        self._texts = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, item_id: int, text: str):
+        """
+        Index an item's text, replacing whatever was indexed for it before.
+
+        Args:
+            item_id (int): The id of the row, e.g. the user_id.
+            text (str): The text to index. None (a NULL in the database) just removes the item.
+        """
+        with self._lock:
+            self.remove(item_id)
+            if text is None:
+                return
+            text = normalise(text)
+            self._texts[item_id] = text
+            for gram in trigrams(text):
+                self._postings.setdefault(gram, set()).add(item_id)
+
+    def remove(self, item_id: int):
+        """
+        Take an item out of the index, if it is there.
+
+        Args:
+            item_id (int): The id of the row.
+        """
+        with self._lock:
+            text = self._texts.pop(item_id, None)
+            if text is None:
+                return
+            for gram in trigrams(text):
+                postings = self._postings[gram]
+                postings.discard(item_id)
+                if not postings:
+                    del self._postings[gram]
+
+    def contains(self, text: str, after: int = None, limit: int = None) -> list:
+        """
+        Find the items whose text contains the search text, ignoring case.
+
+        Args:
+            text (str): The text to look for.
+            after (int, optional): Only return ids greater than this (for paging). Defaults to None.
+            limit (int, optional): The most ids to return. Defaults to None (all of them).
+
+        Returns:
+            list: The matching ids, in ascending order.
+        """
+        text = normalise(text)
+        with self._lock:
+            grams = trigrams(text, padded=False)
+            if grams:
+                # Only the items that have every trigram of the search text can contain it.
+                #  Start with the shortest posting list, so the intersection stays small.
+                lists = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+                candidates = set(lists[0])
+                for postings in lists[1:]:
+                    candidates &= postings
+                    if not candidates:
+                        break
+            else:
+                # Search text shorter than a trigram: every name that contains it has at least one
+                #  trigram that contains it, and there are far fewer trigrams than names
+                candidates = set()
+                for gram, postings in self._postings.items():
+                    if text in gram:
+                        candidates |= postings
+            if after is not None:
+                candidates = [item_id for item_id in candidates if item_id > after]
+            # Sharing every trigram doesn't prove the text is there ("abcab" has all of the trigrams
+            #  of "abcabc"), so check the candidates in id order until the page is full
+            matches = []
+            for item_id in sorted(candidates):
+                if text in self._texts[item_id]:
+                    matches.append(item_id)
+                    if limit is not None and len(matches) == limit:
+                        break
+            return matches
+
+    def similar(self, text: str, threshold: float = None, limit: int = None) -> list:
+        """
+        Find the items whose text looks like the search text, most similar first.
+
+        Args:
+            text (str): The text to look for, typos and all.
+            threshold (float, optional): The lowest similarity (0-1) to return.
+                                         Defaults to config.TRIGRAM_SIMILARITY_THRESHOLD.
+            limit (int, optional): The most items to return. Defaults to None (all of them).
+
+        Returns:
+            list: (id, similarity) tuples, the most similar first (ties in id order).
+        """
+        threshold = config.TRIGRAM_SIMILARITY_THRESHOLD if threshold is None else threshold
+        grams = trigrams(normalise(text))
+        with self._lock:
+            # Count the trigrams each item shares with the search text, items that share none are never touched
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            # The similarity can't be more than shared / len(grams), so skip items that can't reach the threshold
+            needed = threshold * len(grams)
+            results = []
+            for item_id, count in shared.items():
+                if count < needed:
+                    continue
+                size = len(trigrams(self._texts[item_id]))
+                similarity = count / (len(grams) + size - count)
+                if similarity >= threshold:
+                    results.append((item_id, similarity))
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results[:limit] if limit is not None else results
+
+    def stats(self) -> dict:
+        """Return the size of the index."""
+        with self._lock:
+            return {"items": len(self._texts), "trigrams": len(self._postings)}
+
+
+# ---------------------------------------------------------
+# The shared indexes used by api/services.py
+# ---------------------------------------------------------
+# The query that reads every (id, text) pair for each index
+SOURCES = {
+    "users": "SELECT user_id, username FROM users",
+    "movies": "SELECT movie_id, title FROM movies",
+}
+
+# name -> (the time it was built, TrigramIndex)
+_indexes = {}
+# name -> (an Event set when the build finishes, the changes recorded while it runs) for the
+#  indexes being built right now
+_builds = {}
+# Bumped by reset(), so an index that was being built from the old database is thrown away
+_generation = 0
+_lock = threading.Lock()
+
+
+def build_index(name: str) -> TrigramIndex:
+    """
+    Build an index from scratch by reading the whole column from the database.
+
+    Args:
+        name (str): "users" or "movies".
+
+    Returns:
+        TrigramIndex: The new index.
+    """
+    index = TrigramIndex()
+    with get_connection() as conn:
+        cursor = conn.execute(SOURCES[name])
+        while True:
+            rows = cursor.fetchmany(config.STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            for item_id, text in rows:
+                index.add(item_id, text)
+    return index
+
+
+def get_index(name: str) -> TrigramIndex:
+    """
+    Return the shared index, building it first if it hasn't been built or is too old.
+
+    The new index is built without holding the lock, so searches keep using the old one while it
+    is being built (only the very first build has to be waited for), and changes recorded while
+    it is built are applied to it before it replaces the old one.
+
+    Args:
+        name (str): "users" or "movies".
+
+    Returns:
+        TrigramIndex: The index.
+    """
+    while True:
+        with _lock:
+            built_at, index = _indexes.get(name, (None, None))
+            max_age = config.TRIGRAM_MAX_AGE_SECONDS
+            if index is not None and not (max_age > 0 and time.monotonic() - built_at > max_age):
+                return index
+            build = _builds.get(name)
+            if build is None:
+                # This thread builds it
+                build = _builds[name] = (threading.Event(), [])
+                generation = _generation
+                started_at = time.monotonic()
+                break
+            if index is not None:
+                # Another thread is building a new one, use the old one in the meantime
+                return index
+        # There is no index at all yet, wait for the thread that is building it and look again
+        build[0].wait()
+
+    new_index = None
+    try:
+        new_index = build_index(name)
+    finally:
+        with _lock:
+            done, changes = _builds.pop(name)
+            if new_index is not None and generation == _generation:
+                # Replay the changes recorded since the build started.  The build may already have
+                #  read some of them, but adding a row again just replaces it.
+                for item_id, text in changes:
+                    new_index.add(item_id, text)
+                _indexes[name] = (started_at, new_index)
+        done.set()
+    return new_index
+
+
+def record_change(name: str, item_id: int, text: str = None):
+    """
+    Keep a shared index up to date after a row was added, changed or deleted.
+    An index that hasn't been built yet is left alone, it will read the new data when it is built.
+    If an index is being built, the change is also kept to be applied to it once it has been read.
+
+    Args:
+        name (str): "users" or "movies".
+        item_id (int): The id of the row.
+        text (str, optional): The row's new text, None if the row was deleted.
+    """
+    with _lock:
+        _, index = _indexes.get(name, (None, None))
+        if index is not None:
+            index.add(item_id, text)
+        build = _builds.get(name)
+        if build is not None:
+            build[1].append((item_id, text))
+
+
+def reset():
+    """Forget the shared indexes, e.g. after pointing the connection pool at a different database."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _indexes.clear()
+
+
+def stats() -> dict:
+    """
+    Return the size of each shared index that has been built.
+
+    Returns:
+        dict: The number of items and trigrams in each index.
+    """
+    with _lock:
+        indexes = list(_indexes.items())
+    return {name: index.stats() for name, (_, index) in indexes}
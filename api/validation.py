@@ -0,0 +1,201 @@
+# In this file, we check the data clients send us before it goes anywhere near the database.
+# The single-item endpoints trust the client (a missing field just causes a KeyError), which is
+#  fine for one row at a time.  The bulk endpoints accept thousands of items in one request, and
+#  one bad item shouldn't stop the rest from being saved, so every item is checked up front and
+#  the problems are reported back to the client item by item.
+#
+# Each validate_* function takes one item (a dictionary from the request) and returns a list of
+#  problems with it, an empty list means the item is fine.
+import json
+from datetime import datetime
+
+from api.models import Movie, Rating, User
+
+
+class ValidationError(ValueError):
+    """Raised when a request body can't be used at all (rather than one item in it being wrong)."""
+
+
+def _check_string(data: dict, field: str, errors: list, required: bool = True):
+    """Add a problem to errors unless data[field] is a non-empty string (or missing/null and not required)."""
+    value = data.get(field)
+    if value is None:
+        if required:
+            errors.append(f"{field} is required")
+    elif not isinstance(value, str) or not value.strip():
+        errors.append(f"{field} must be a non-empty string")
+
+
+def _check_integer(data: dict, field: str, errors: list, minimum: int = None, maximum: int = None):
+    """Add a problem to errors unless data[field] is an integer within minimum and/or maximum."""
+    value = data.get(field)
+    # bool is a subclass of int in Python, but true/false are not valid ids or ratings
+    if value is None:
+        errors.append(f"{field} is required")
+    elif not isinstance(value, int) or isinstance(value, bool):
+        errors.append(f"{field} must be an integer")
+    elif (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        # Only mention the limits the field actually has
+        if maximum is None:
+            errors.append(f"{field} must be at least {minimum}")
+        elif minimum is None:
+            errors.append(f"{field} must be at most {maximum}")
+        else:
+            errors.append(f"{field} must be between {minimum} and {maximum}")
+
+
+# The date formats a client can send, ISO dates and the way the original CSV files write them
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y")
+
+
+def _is_date(text: str) -> bool:
+    """True if the whole of text is a date in one of DATE_FORMATS (anything after the date is an error)."""
+    for date_format in DATE_FORMATS:
+        try:
+            datetime.strptime(text.strip(), date_format)
+            return True
+        except ValueError:
+            pass
+    return False
+
+
+def _check_date(data: dict, field: str, errors: list):
+    """Add a problem to errors unless data[field] is missing/null or a date (yyyy-mm-dd or m/d/yyyy)."""
+    _check_string(data, field, errors, required=False)
+    value = data.get(field)
+    if isinstance(value, str) and value.strip() and not _is_date(value):
+        errors.append(f"{field} must be a date like 2024-01-31")
+
+
+def validate_user(data: dict) -> list:
+    """
+    Check a user sent by a client.
+
+    Args:
+        data (dict): The user, with username and email.
+
+    Returns:
+        list: A description of each problem with the user, empty if there are none.
+    """
+    errors = []
+    _check_string(data, "username", errors)
+    _check_string(data, "email", errors)
+    if isinstance(data.get("email"), str) and "@" not in data["email"]:
+        errors.append("email must be an email address")
+    return errors
+
+
+def validate_movie(data: dict) -> list:
+    """
+    Check a movie sent by a client.
+
+    Args:
+        data (dict): The movie, with title, genre, release_year and director.
+
+    Returns:
+        list: A description of each problem with the movie, empty if there are none.
+    """
+    errors = []
+    _check_string(data, "title", errors)
+    _check_string(data, "genre", errors, required=False)
+    _check_string(data, "director", errors, required=False)
+    if data.get("release_year") is not None:
+        _check_integer(data, "release_year", errors, minimum=1800, maximum=3000)
+    return errors
+
+
+def validate_rating(data: dict) -> list:
+    """
+    Check a rating sent by a client.
+
+    Args:
+        data (dict): The rating, with user_id, movie_id, rating, review and date.
+
+    Returns:
+        list: A description of each problem with the rating, empty if there are none.
+    """
+    errors = []
+    _check_integer(data, "user_id", errors, minimum=1)
+    _check_integer(data, "movie_id", errors, minimum=1)
+    _check_integer(data, "rating", errors, minimum=1, maximum=5)
+    if data.get("review") is not None and not isinstance(data["review"], str):
+        errors.append("review must be a string")
+    _check_date(data, "date", errors)
+    return errors
+
+
+# How to check, and then build the model object for, each kind of item
+VALIDATORS = {
+    "user": (validate_user, lambda data: User(None, data["username"], data["email"])),
+    "movie": (validate_movie, lambda data: Movie(None, data["title"], data.get("genre"),
+                                                 data.get("release_year"), data.get("director"))),
+    "rating": (validate_rating, lambda data: Rating(user_id=data["user_id"], movie_id=data["movie_id"],
+                                                    rating=data["rating"], review=data.get("review"),
+                                                    date=data.get("date"))),
+}
+
+
+def parse_items(body: bytes, ndjson: bool = False, max_items: int = None) -> list:
+    """
+    Read the items out of a bulk request body.
+
+    Args:
+        body (bytes): The request body, a JSON array or newline-delimited JSON (one item per line).
+        ndjson (bool, optional): True if the body is newline-delimited JSON.
+        max_items (int, optional): The most items allowed in one request.
+
+    Returns:
+        list: The items.  In NDJSON a line that isn't valid JSON becomes None, so it can be reported
+              as a problem with that item while the rest of the lines are still used.
+    Raises:
+        ValidationError: If the body isn't UTF-8 or a JSON array, or has too many items.
+    """
+    if ndjson:
+        try:
+            text = body.decode("utf-8")
+        except UnicodeDecodeError:
+            raise ValidationError("The request body is not valid UTF-8")
+        items = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError:
+            raise ValidationError("The request body is not valid JSON")
+        if not isinstance(items, list):
+            raise ValidationError("The request body must be a JSON array")
+    if max_items is not None and len(items) > max_items:
+        raise ValidationError(f"At most {max_items} items can be sent in one request")
+    return items
+
+
+def validate_items(kind: str, items: list) -> tuple:
+    """
+    Check every item of a bulk request and build model objects for the good ones.
+
+    Args:
+        kind (str): "user", "movie" or "rating".
+        items (list): The items from parse_items().
+
+    Returns:
+        tuple: (a list of (index, model object) for the valid items,
+                a list of {"index": ..., "errors": [...]} for the invalid ones)
+    """
+    validate, build = VALIDATORS[kind]
+    valid, invalid = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            invalid.append({"index": index, "errors": ["item must be a JSON object"]})
+            continue
+        errors = validate(item)
+        if errors:
+            invalid.append({"index": index, "errors": errors})
+        else:
+            valid.append((index, build(item)))
+    return valid, invalid
@@ -0,0 +1,73 @@
+# Benchmark: the /api/analytics group-bys, worked out three ways.
+#
+# This script fills a temporary copy of the database with made-up ratings (the same ones as
+#  benchmarks/recommendations.py) and then times the average rating of each day and of each
+#  genre when they are worked out:
+#   - in Python, from every rating read into a Rating object (services.get_all_ratings-style),
+#   - in SQLite, with GROUP BY,
+#   - with NumPy, from the columnar snapshot in api/analytics.py (plus the time to take it).
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.analytics --users 50000 --ratings-per-user 40
+import argparse
+from collections import defaultdict
+
+from api import analytics, db, services
+from benchmarks.common import Timer, print_table, temporary_database
+from benchmarks.recommendations import add_data
+
+
+def by_day_in_python() -> dict:
+    # The way it would be done without the snapshot: every rating becomes an object first
+    with db.get_connection() as conn:
+        rows = conn.execute("SELECT rating_id, user_id, movie_id, rating, review, date FROM ratings").fetchall()
+    totals = defaultdict(lambda: [0, 0])
+    for rating in services.convert_rows_to_rating_list(rows):
+        totals[rating.date][0] += 1
+        totals[rating.date][1] += rating.rating
+    return {day: total / count for day, (count, total) in totals.items()}
+
+
+def by_day_in_sqlite() -> list:
+    with db.get_connection() as conn:
+        return conn.execute("SELECT date, COUNT(*), AVG(rating) FROM ratings GROUP BY date").fetchall()
+
+
+def by_genre_in_sqlite() -> list:
+    with db.get_connection() as conn:
+        return conn.execute("""
+            SELECT g.name, COUNT(*), AVG(r.rating)
+            FROM ratings r JOIN movie_genres mg ON mg.movie_id = r.movie_id JOIN genres g ON g.genre_id = mg.genre_id
+            GROUP BY g.genre_id
+        """).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the analytics group-bys")
+    parser.add_argument("--users", type=int, default=50000, help="How many users to add")
+    parser.add_argument("--movies", type=int, default=5000, help="How many movies to add")
+    parser.add_argument("--ratings-per-user", type=int, default=40, help="About how many ratings each user makes")
+    args = parser.parse_args()
+
+    with temporary_database():
+        add_data(args.users, args.movies, args.ratings_per_user)
+
+        with Timer() as snapshot:
+            analytics.get_snapshot()
+        timings = [["take the snapshot", snapshot.seconds * 1000]]
+        for name, function in [
+            ("by day: Rating objects in Python", by_day_in_python),
+            ("by day: SQLite GROUP BY", by_day_in_sqlite),
+            ("by day: NumPy snapshot", lambda: services.get_ratings_by("date")),
+            ("by genre: SQLite GROUP BY", by_genre_in_sqlite),
+            ("by genre: NumPy snapshot", lambda: services.get_ratings_by("genre")),
+            ("user activity percentiles: NumPy snapshot", lambda: services.get_rating_activity("users", [50, 90, 99])),
+        ]:
+            with Timer() as timer:
+                function()
+            timings.append([name, timer.seconds * 1000])
+        print_table(["operation", "ms"], timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Benchmark: inserting ratings one at a time vs. in bulk.
+#
+# services.create_rating commits after every row, and every commit waits for the disk.
+#  services.create_ratings inserts the rows with executemany() and commits once per batch.
+#  This script inserts the same ratings both ways (and through the HTTP endpoints) on a
+#  temporary copy of the database and reports the rows per second for each.
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.bulk_insert --rows 5000
+import argparse
+
+from api import config, services
+from api.models import Rating
+from benchmarks.common import Timer, print_table, temporary_database
+from run import create_app_no_swagger
+
+
+def make_ratings(count: int) -> list:
+    """Build count ratings spread over the first few movies and users."""
+    return [Rating(user_id=n % 20 + 1, movie_id=n % 15 + 1, rating=n % 5 + 1, review="Benchmark", date="1/1/2024")
+            for n in range(count)]
+
+
+def run_services(rows: int, profile_name: str, batch_sizes: list) -> list:
+    """
+    Time the services functions: create_rating in a loop, then create_ratings with each batch size.
+
+    Returns:
+        list: One [method, batch size, rows, milliseconds, rows per second] row per run.
+    """
+    results = []
+    with temporary_database(pragmas=config.STORAGE_PROFILES[profile_name]):
+        ratings = make_ratings(rows)
+        with Timer() as timer:
+            for rating in ratings:
+                services.create_rating(rating)
+        results.append(["create_rating", 1, rows, timer.seconds * 1000, rows / timer.seconds])
+        for batch_size in batch_sizes:
+            with Timer() as timer:
+                services.create_ratings(ratings, batch_size=batch_size)
+            results.append(["create_ratings", batch_size, rows, timer.seconds * 1000, rows / timer.seconds])
+    return results
+
+
+def run_http(rows: int, profile_name: str) -> list:
+    """
+    Time the HTTP endpoints: POST /api/ratings once per rating, then one POST /api/ratings/bulk.
+
+    Returns:
+        list: One [method, batch size, rows, milliseconds, rows per second] row per run.
+    """
+    results = []
+    with temporary_database(pragmas=config.STORAGE_PROFILES[profile_name]):
+        client = create_app_no_swagger().test_client()
+        ratings = [rating.to_dict() for rating in make_ratings(rows)]
+        with Timer() as timer:
+            for rating in ratings:
+                client.post("/api/ratings", json=rating)
+        results.append(["POST /api/ratings", 1, rows, timer.seconds * 1000, rows / timer.seconds])
+        with Timer() as timer:
+            client.post("/api/ratings/bulk", json=ratings)
+        results.append(["POST /api/ratings/bulk", config.BULK_BATCH_SIZE, rows, timer.seconds * 1000, rows / timer.seconds])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare single-row and bulk rating inserts")
+    parser.add_argument("--rows", type=int, default=5000, help="How many ratings to insert each way")
+    parser.add_argument("--profile", default="wal", choices=sorted(config.STORAGE_PROFILES),
+                        help="The storage profile to use")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="The batch sizes to try with create_ratings")
+    args = parser.parse_args()
+
+    rows = run_services(args.rows, args.profile, args.batch_sizes) + run_http(args.rows, args.profile)
+    print_table(["method", "batch size", "rows", "ms", "rows/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
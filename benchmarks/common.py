@@ -0,0 +1,70 @@
+# Helpers shared by the benchmark scripts in this folder.
+# The benchmarks never touch data/movie_data.db directly, they work on a temporary copy
+#  so they can write as much as they like without messing up the real data.
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from api import analytics, cache, config, db, response_cache, similar_movies, trigram
+
+
+@contextmanager
+def temporary_database(pragmas: dict = None, pool_size: int = None):
+    """
+    Copy the real database into a temporary folder and point the shared connection pool at it.
+
+    Args:
+        pragmas (dict, optional): The storage profile to use. Defaults to config.DB_PRAGMAS.
+        pool_size (int, optional): The size of the connection pool. Defaults to config.DB_POOL_SIZE.
+
+    Yields:
+        Path: The path of the temporary database.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        database_path = Path(folder) / "movie_data.db"
+        shutil.copyfile(config.DATABASE_PATH, database_path)
+        db.init_pool(database_path=database_path, pragmas=pragmas, size=pool_size)
+        # Anything cached (or indexed) came from the other database
+        cache.clear()
+        response_cache.clear()
+        trigram.reset()
+        similar_movies.reset()
+        analytics.reset()
+        try:
+            yield database_path
+        finally:
+            db.close_pool()
+            cache.clear()
+            response_cache.clear()
+            trigram.reset()
+            similar_movies.reset()
+            analytics.reset()
+
+
+class Timer:
+    """A tiny context manager that measures how long its block took, in seconds."""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+
+
+def print_table(headers: list, rows: list):
+    """
+    Print a simple, aligned text table.
+
+    Args:
+        headers (list): The column titles.
+        rows (list): A list of rows, each one a list of values (the same length as headers).
+    """
+    rows = [[f"{value:,.1f}" if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    print("  ".join(str(header).ljust(width) for header, width in zip(headers, widths)))
+    print("  ".join("-" * width for width in widths))
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
@@ -0,0 +1,73 @@
+# Benchmark: sending responses uncompressed vs. gzip (and brotli) vs. precompressed from the cache.
+#
+# api/compression.py compresses responses for clients that send Accept-Encoding, and the response
+#  cache (api/response_cache.py) keeps a compressed copy of each entry so it is only compressed
+#  once.  This script fills a temporary copy of the database with made-up movies, users and ratings
+#  (the same ones as benchmarks/recommendations.py) and, for a few large list responses, measures
+#  the bytes sent, the CPU time per request and how many bytes of JSON are served per CPU second:
+#    - identity: no compression
+#    - <encoding>: compressed on every request (response cache switched off)
+#    - <encoding> cached: the precompressed bytes from the response cache
+#
+# Brotli is only measured if the brotli package is installed (pip install brotli).
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.compression --requests 500
+import argparse
+import time
+
+from api import compression, config
+from benchmarks.common import print_table, temporary_database
+from benchmarks.recommendations import add_data
+from run import create_app_no_swagger
+
+
+def measure(client, url: str, encoding: str, count: int) -> tuple:
+    """
+    Make the same GET request count times.
+
+    Returns:
+        tuple: The bytes of the (last) response body, the encoding it was sent with (small
+               responses aren't compressed) and the CPU milliseconds per request.
+    """
+    headers = {"Accept-Encoding": encoding}
+    # CPU time rather than wall-clock time, since compressing is CPU work
+    start = time.process_time()
+    for _ in range(count):
+        response = client.get(url, headers=headers)
+    cpu = time.process_time() - start
+    assert response.status_code == 200, response.status_code
+    return len(response.data), response.headers.get("Content-Encoding", "identity"), cpu * 1000 / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure response sizes and CPU time with and without compression")
+    parser.add_argument("--requests", type=int, default=500, help="How many requests to time for each URL and encoding")
+    parser.add_argument("--users", type=int, default=1000, help="How many users to add")
+    parser.add_argument("--movies", type=int, default=5000, help="How many movies to add")
+    parser.add_argument("--ratings-per-user", type=int, default=300, help="About how many ratings each user makes")
+    args = parser.parse_args()
+
+    encodings = compression.available_encodings()
+    with temporary_database():
+        _, movie_ids = add_data(args.users, args.movies, args.ratings_per_user)
+        client = create_app_no_swagger().test_client()
+        results = []
+        for url in ["/api/movies?limit=1000", "/api/users?limit=1000", f"/api/movies/{movie_ids[0]}/ratings?limit=1000"]:
+            plain = len(client.get(url).data)
+            runs = [("identity", "identity", True)]
+            runs += [(encoding, encoding, False) for encoding in encodings]
+            runs += [(f"{encoding} cached", encoding, True) for encoding in encodings]
+            for name, encoding, use_cache in runs:
+                config.RESPONSE_CACHE_ENABLED = use_cache
+                try:
+                    size, sent_as, cpu_ms = measure(client, url, encoding, args.requests)
+                finally:
+                    config.RESPONSE_CACHE_ENABLED = True
+                # Bytes of JSON served per CPU second: how much one core can send
+                results.append([url, name, sent_as, size, plain / size, cpu_ms, plain / cpu_ms * 1000 / 1e6])
+        print_table(["url", "asked for", "sent as", "bytes sent", "ratio", "CPU ms/request", "MB of JSON/CPU s"], results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Benchmark: full responses vs. 304 Not Modified.
+#
+# A client that already has a copy of a movie (or a page of movies) sends its ETag back in
+#  If-None-Match.  If the copy is still current the API answers 304 Not Modified after a primary
+#  key lookup of the version, without reading the rows, building Movie objects or encoding JSON
+#  (see api/conditional.py).  This script fills a temporary copy of the database with made-up movies
+#  and ratings (the same ones as benchmarks/recommendations.py) and times the same requests three ways: with conditional requests switched off, as a first visit (200 with the
+#  headers) and as a revisit with the ETag (304).
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.conditional_requests --requests 2000 --movies 5000
+import argparse
+
+from api import config
+from benchmarks.common import Timer, print_table, temporary_database
+from benchmarks.recommendations import add_data
+from run import create_app_no_swagger
+
+
+def time_requests(client, url: str, count: int, headers: dict = None) -> float:
+    """Make the same GET request count times and return the milliseconds per request."""
+    with Timer() as timer:
+        for _ in range(count):
+            response = client.get(url, headers=headers)
+    assert response.status_code in (200, 304), response.status_code
+    return timer.seconds * 1000 / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time full responses against 304 Not Modified")
+    parser.add_argument("--requests", type=int, default=2000, help="How many requests to time for each URL")
+    parser.add_argument("--users", type=int, default=1000, help="How many users to add")
+    parser.add_argument("--movies", type=int, default=5000, help="How many movies to add")
+    parser.add_argument("--ratings-per-user", type=int, default=300, help="About how many ratings each user makes")
+    args = parser.parse_args()
+
+    results = []
+    with temporary_database():
+        user_ids, movie_ids = add_data(args.users, args.movies, args.ratings_per_user)
+        client = create_app_no_swagger().test_client()
+        for url in [f"/api/movies/{movie_ids[0]}", "/api/movies?limit=100", "/api/movies?limit=1000",
+                    f"/api/users/{user_ids[0]}/ratings?limit=1000"]:
+            config.CONDITIONAL_REQUESTS_ENABLED = False
+            try:
+                plain = time_requests(client, url, args.requests)
+            finally:
+                config.CONDITIONAL_REQUESTS_ENABLED = True
+            first = time_requests(client, url, args.requests)
+            etag = client.get(url).headers["ETag"]
+            revisit = time_requests(client, url, args.requests, headers={"If-None-Match": etag})
+            results.append([url, plain, first, revisit, plain / revisit])
+    print_table(["url", "ms (off)", "ms (200 + ETag)", "ms (304)", "speed-up"], results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Benchmark: the memory taken by User, Movie and Rating objects, before and after __slots__.
+#
+# The models in api/models.py list their attributes in __slots__, so their objects don't carry a
+#  dictionary of attributes each, and a Movie only makes its ratings list when one is attached.
+#  This script makes the same objects with copies of the models as they were before (ordinary
+#  classes with an __dict__, and an empty ratings list in every Movie) and with the models as they
+#  are now, and measures the bytes each object takes with tracemalloc.  The values (ids, titles
+#  and so on) are made before measuring, so only the objects themselves are counted.
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.model_memory --objects 100000 --ratings 200000
+import argparse
+import gc
+import tracemalloc
+
+from api.models import Movie, Rating, User
+from benchmarks.common import print_table
+
+
+# The models as they were before __slots__, trimmed down to their __init__
+class DictUser:
+    def __init__(self, id, username, email):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.date_joined = None
+
+
+class DictMovie:
+    def __init__(self, movie_id, title, genre, release_year, director):
+        self.movie_id = movie_id
+        self.title = title
+        self.genre = genre
+        self.release_year = release_year
+        self.director = director
+        self.ratings = []
+        self.rank_score = None
+        self.stats = None
+
+
+class DictRating:
+    def __init__(self, user_id, rating, review, date, movie_id=None, rating_id=None):
+        self.user_id = user_id
+        self.rating = rating
+        self.review = review
+        self.date = date
+        self.movie_id = movie_id
+        self.rating_id = rating_id
+
+
+def measure(make, values: list) -> int:
+    """
+    Make one object from each set of values and return how many bytes they took altogether.
+
+    Args:
+        make (callable): Makes an object, e.g. a model class.
+        values (list): The arguments of each object.
+
+    Returns:
+        int: The bytes allocated for the objects (and anything they allocated themselves).
+    """
+    gc.collect()
+    tracemalloc.start()
+    objects = [make(*arguments) for arguments in values]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The list holding the objects isn't part of them
+    size -= objects.__sizeof__()
+    del objects
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory of the model objects before and after __slots__")
+    parser.add_argument("--objects", type=int, default=100000, help="How many objects of each model to make")
+    parser.add_argument("--ratings", type=int, default=200000, help="How many ratings the big movie has")
+    args = parser.parse_args()
+
+    count = args.objects
+    models = {
+        "User": (DictUser, User, [(i, f"user{i}", f"user{i}@example.com") for i in range(count)]),
+        "Movie": (DictMovie, Movie, [(i, f"Movie {i}", "Drama", 1950 + i % 75, f"Director {i}") for i in range(count)]),
+        "Rating": (DictRating, Rating, [(i, 1 + i % 5, f"Review {i}", "2024-01-01", i, i) for i in range(count)]),
+    }
+    results = []
+    for name, (before_class, after_class, values) in models.items():
+        before = measure(before_class, values) / count
+        after = measure(after_class, values) / count
+        results.append([name, before, after, 1 - after / before])
+    print_table(["model", "bytes/object before", "bytes/object after", "saved"], [
+        [name, before, after, f"{saved:.0%}"] for name, before, after, saved in results])
+
+    # One movie with a lot of ratings, like GET /api/movies/<id>/ratings for a very popular movie
+    values = [(i, 1 + i % 5, f"Review {i}", "2024-01-01", 1, i) for i in range(args.ratings)]
+    sizes = []
+    for movie_class, rating_class in ((DictMovie, DictRating), (Movie, Rating)):
+        def load(movie_class=movie_class, rating_class=rating_class):
+            movie = movie_class(1, "A popular movie", "Drama", 2024, "Someone")
+            movie.ratings.extend(rating_class(*arguments) for arguments in values)
+            return movie
+        sizes.append(measure(load, [()]))
+    print(f"\nA movie with {args.ratings:,} ratings: {sizes[0] / 2 ** 20:,.1f} MB before, "
+          f"{sizes[1] / 2 ** 20:,.1f} MB after")
+
+
+if __name__ == "__main__":
+    main()
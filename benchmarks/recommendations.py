@@ -0,0 +1,99 @@
+# Benchmark: working out the similar movies, and answering recommendation requests from them.
+#
+# The recommendations (services.get_recommendations) are read from the item_similarities table,
+#  which api/recommender.py fills in ahead of time with NumPy.  This script fills a temporary copy
+#  of the database with made-up users, movies and ratings, then times:
+#   - the full build of the similar movies (recommender.build_similarities),
+#   - recommending movies to a sample of the users,
+#   - adding one rating, and the refresh of the similar movies it affects (which the scheduled job
+#     or the background thread runs, see config.RECOMMENDER_REFRESH_ON_WRITE).
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.recommendations --users 20000 --movies 5000 --ratings-per-user 30
+import argparse
+import random
+
+from api import db, recommender, services
+from api.models import Rating
+from benchmarks.common import Timer, print_table, temporary_database
+
+# Every made-up movie belongs to one of these, and every made-up user likes one of them best,
+#  so there is something for the similarities to find
+TASTES = 20
+
+
+def add_data(users: int, movies: int, ratings_per_user: int) -> tuple:
+    """
+    Insert made-up users, movies and ratings straight into the (temporary) database.
+
+    Returns:
+        tuple: The new user ids and movie ids.
+    """
+    rng = random.Random(42)
+    with db.get_connection() as conn:
+        with conn:
+            first_movie = conn.execute("SELECT COALESCE(MAX(movie_id), 0) + 1 FROM movies").fetchone()[0]
+            movie_ids = list(range(first_movie, first_movie + movies))
+            conn.executemany("INSERT INTO movies (movie_id, title, genre, release_year, director) VALUES (?, ?, ?, ?, ?)",
+                             ((movie_id, f"Movie {movie_id}", f"Taste {movie_id % TASTES}", 2000, "Someone")
+                              for movie_id in movie_ids))
+            first_user = conn.execute("SELECT COALESCE(MAX(user_id), 0) + 1 FROM users").fetchone()[0]
+            user_ids = list(range(first_user, first_user + users))
+            conn.executemany("INSERT INTO users (user_id, username, email) VALUES (?, ?, ?)",
+                             ((user_id, f"user{user_id}", f"user{user_id}@example.com") for user_id in user_ids))
+            by_taste = [movie_ids[taste::TASTES] for taste in range(TASTES)]
+            rows = []
+            for user_id in user_ids:
+                favourite = by_taste[user_id % TASTES]
+                # Most of a user's ratings are of their favourite kind of movie, and high
+                for movie_id in set(rng.choice(favourite) for _ in range(ratings_per_user * 2 // 3)):
+                    rows.append((user_id, movie_id, rng.choice([4, 5, 5]), "2024-01-01"))
+                for movie_id in set(rng.sample(movie_ids, ratings_per_user // 3)):
+                    rows.append((user_id, movie_id, rng.randint(1, 3), "2024-01-01"))
+            conn.executemany("INSERT INTO ratings (user_id, movie_id, rating, date) VALUES (?, ?, ?, ?)", rows)
+    print(f"Added {users:,} users, {movies:,} movies and {len(rows):,} ratings")
+    return user_ids, movie_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the similar movies build and the recommendations")
+    parser.add_argument("--users", type=int, default=20000, help="How many users to add")
+    parser.add_argument("--movies", type=int, default=5000, help="How many movies to add")
+    parser.add_argument("--ratings-per-user", type=int, default=30, help="About how many ratings each user makes")
+    parser.add_argument("--requests", type=int, default=200, help="How many users to recommend movies to")
+    args = parser.parse_args()
+
+    with temporary_database():
+        user_ids, movie_ids = add_data(args.users, args.movies, args.ratings_per_user)
+
+        with Timer() as build:
+            with db.get_connection() as conn:
+                with conn:
+                    movies_with_neighbours = recommender.build_similarities(conn)
+        print(f"Worked out the similar movies of {movies_with_neighbours:,} movies in {build.seconds:.1f}s")
+
+        sample = random.Random(1).sample(user_ids, min(args.requests, len(user_ids)))
+        timings = []
+        for user_id in sample:
+            with Timer() as timer:
+                services.get_recommendations(user_id, limit=10)
+            timings.append(timer.seconds * 1000)
+        timings.sort()
+
+        with Timer() as write:
+            services.create_rating(Rating(user_id=user_ids[0], movie_id=movie_ids[0], rating=5, review=None,
+                                          date="2024-01-02"))
+        with Timer() as refresh:
+            services.refresh_similarities()
+
+        print_table(["operation", "ms"], [
+            ["full build", build.seconds * 1000],
+            ["recommendations (median)", timings[len(timings) // 2]],
+            ["recommendations (95th percentile)", timings[int(len(timings) * 0.95)]],
+            ["create_rating", write.seconds * 1000],
+            ["refresh of the similar movies", refresh.seconds * 1000],
+        ])
+
+
+if __name__ == "__main__":
+    main()
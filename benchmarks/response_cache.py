@@ -0,0 +1,89 @@
+# Benchmark: building the busiest list responses every time vs. the response cache.
+#
+# api/response_cache.py keeps the bytes of the responses of GET /api/movies, /api/users and
+#  /api/movies/<id>/ratings, so a repeated request skips SQLite, the model objects and the JSON
+#  encoding.  This script fills a temporary copy of the database with made-up movies, users and
+#  ratings (the same ones as benchmarks/recommendations.py) and times the same requests with the
+#  cache switched off and on.  It then sends a burst of requests for a key that isn't cached yet
+#  from several threads at once, and counts how many of them had to build the response.
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.response_cache --requests 2000
+import argparse
+import threading
+
+from api import config, response_cache, services
+from benchmarks.common import Timer, print_table, temporary_database
+from benchmarks.recommendations import add_data
+from run import create_app_no_swagger
+
+
+def time_requests(client, url: str, count: int) -> float:
+    """Make the same GET request count times and return the milliseconds per request."""
+    with Timer() as timer:
+        for _ in range(count):
+            response = client.get(url)
+    assert response.status_code == 200, response.status_code
+    return timer.seconds * 1000 / count
+
+
+def count_builds(app, url: str, threads: int) -> int:
+    """Send threads requests for url at the same moment and return how many of them ran the query."""
+    builds = []
+    original = services.find_movies
+
+    def counting(*args, **kwargs):
+        builds.append(1)
+        return original(*args, **kwargs)
+    services.find_movies = counting
+    barrier = threading.Barrier(threads)
+
+    def fetch():
+        with app.test_client() as client:
+            barrier.wait()
+            client.get(url)
+    try:
+        workers = [threading.Thread(target=fetch) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        services.find_movies = original
+    return len(builds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the busiest list endpoints with and without the response cache")
+    parser.add_argument("--requests", type=int, default=2000, help="How many requests to time for each URL")
+    parser.add_argument("--threads", type=int, default=32, help="How many requests to send at once for the stampede")
+    parser.add_argument("--users", type=int, default=1000, help="How many users to add")
+    parser.add_argument("--movies", type=int, default=5000, help="How many movies to add")
+    parser.add_argument("--ratings-per-user", type=int, default=300, help="About how many ratings each user makes")
+    args = parser.parse_args()
+
+    with temporary_database():
+        _, movie_ids = add_data(args.users, args.movies, args.ratings_per_user)
+        app = create_app_no_swagger()
+        client = app.test_client()
+        results = []
+        for url in ["/api/movies?limit=100", "/api/movies?genre=Taste 1&limit=1000", "/api/users?starts_with=user1&limit=100",
+                    f"/api/movies/{movie_ids[0]}/ratings?limit=1000"]:
+            config.RESPONSE_CACHE_ENABLED = False
+            try:
+                off = time_requests(client, url, args.requests)
+            finally:
+                config.RESPONSE_CACHE_ENABLED = True
+            on = time_requests(client, url, args.requests)
+            results.append([url, off, on, off / on])
+        print_table(["url", "ms (no cache)", "ms (cached)", "speed-up"], results)
+
+        response_cache.clear()
+        url = "/api/movies?genre=Taste 2&limit=1000"
+        print(f"\n{args.threads} requests at once for {url}: "
+              f"{count_builds(app, url, args.threads)} of them ran the query")
+        print(response_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Benchmark: turning rows into JSON through the model objects vs. straight from the rows.
+#
+# The list endpoints used to make a User, Movie or Rating object for every row, call its to_dict()
+#  and then jsonify the list.  api/serialization.py turns the rows straight into dictionaries with
+#  a precomputed template for each model, and encodes them with orjson if it is installed.  This
+#  script makes rows of each model in an in-memory SQLite database (so the time to read the real
+#  database isn't part of it) and times turning them into JSON bytes each way.
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.serialization --rows 10000 1000000
+import argparse
+import sqlite3
+
+from flask import jsonify
+
+from api import config, serialization, services
+from benchmarks.common import Timer, print_table
+from run import create_app_no_swagger
+
+# model -> (the columns of its table, its row template, the services function that makes its objects)
+MODELS = {
+    "user": ("user_id INTEGER, username TEXT, email TEXT", serialization.USER, services.convert_rows_to_user_list),
+    "movie": ("movie_id INTEGER, title TEXT, genre TEXT, release_year INTEGER, director TEXT",
+              serialization.MOVIE, services.convert_rows_to_movie_list),
+    "rating": ("rating_id INTEGER, user_id INTEGER, movie_id INTEGER, rating INTEGER, review TEXT, date TEXT",
+               serialization.RATING, services.convert_rows_to_rating_list),
+}
+
+
+def make_rows(model: str, count: int) -> list:
+    """Make count made-up rows of a model, read back from SQLite as sqlite3.Row objects."""
+    columns = MODELS[model][0]
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"CREATE TABLE items ({columns})")
+    values = {
+        "user": lambda i: (i, f"user{i}", f"user{i}@example.com"),
+        "movie": lambda i: (i, f"Movie number {i}", "Drama", 1950 + i % 75, f"Director {i % 5000}"),
+        "rating": lambda i: (i, i % 10000, i % 50000, 1 + i % 5, f"Review number {i}, it was fine", "2024-01-01"),
+    }[model]
+    placeholders = ",".join("?" for _ in columns.split(","))
+    conn.executemany(f"INSERT INTO items VALUES ({placeholders})", (values(i) for i in range(count)))
+    rows = conn.execute("SELECT * FROM items").fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time turning rows into JSON with and without the model objects")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 1000000], help="How many rows to encode")
+    args = parser.parse_args()
+
+    encoders = ["json"] + (["orjson"] if serialization.orjson is not None else [])
+    if len(encoders) == 1:
+        print("orjson isn't installed (pip install orjson), only the json module is timed\n")
+    app = create_app_no_swagger()
+    results = []
+    with app.app_context():
+        for count in args.rows:
+            for model, (_, template, convert) in MODELS.items():
+                rows = make_rows(model, count)
+                # The way the endpoints used to do it: objects, then dictionaries, then jsonify
+                with Timer() as timer:
+                    body = jsonify([item.to_dict() for item in convert(rows)]).get_data()
+                before = timer.seconds
+                results.append([count, model, "objects + to_dict + jsonify", before * 1000, count / before, 1.0])
+                for encoder in encoders:
+                    config.JSON_ENCODER = encoder
+                    with Timer() as timer:
+                        fast = serialization.json_response(template.to_dicts(rows)).get_data()
+                    if encoder == "json":
+                        assert fast == body
+                    results.append([count, model, f"template + {encoder}", timer.seconds * 1000,
+                                    count / timer.seconds, before / timer.seconds])
+                del rows
+    config.JSON_ENCODER = "auto"
+    print_table(["rows", "model", "path", "ms", "rows/s", "speed-up"], results)
+
+
+if __name__ == "__main__":
+    main()
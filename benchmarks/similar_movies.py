@@ -0,0 +1,56 @@
+# Benchmark: building, opening and reading the similar movies index (api/similar_movies.py).
+#
+# This script fills a temporary copy of the database with made-up users, movies and ratings (the
+#  same ones as benchmarks/recommendations.py), builds the index the way the batch job does, then
+#  times how long a worker takes to open it (memory-mapped vs. read into memory) and how long
+#  services.get_similar_movies takes per movie.
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.similar_movies --movies 20000
+import argparse
+import random
+
+import numpy as np
+
+from api import db, similar_movies, services
+from benchmarks.common import Timer, print_table, temporary_database
+from benchmarks.recommendations import add_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the similar movies index")
+    parser.add_argument("--users", type=int, default=20000, help="How many users to add")
+    parser.add_argument("--movies", type=int, default=20000, help="How many movies to add")
+    parser.add_argument("--ratings-per-user", type=int, default=30, help="About how many ratings each user makes")
+    parser.add_argument("--requests", type=int, default=500, help="How many movies to look up")
+    args = parser.parse_args()
+
+    with temporary_database() as database_path:
+        _, movie_ids = add_data(args.users, args.movies, args.ratings_per_user)
+        path = similar_movies.index_path(database_path)
+
+        with Timer() as build:
+            with db.get_connection() as conn:
+                similar_movies.build(conn, path)
+        print(f"Built the index in {build.seconds:.1f}s ({path.stat().st_size / 1e6:,.1f} MB)")
+
+        with Timer() as mapped:
+            similar_movies.SimilarMoviesIndex(path)
+        with Timer() as read:
+            np.load(path)
+
+        sample = random.Random(1).sample(movie_ids, min(args.requests, len(movie_ids)))
+        with Timer() as lookups:
+            for movie_id in sample:
+                services.get_similar_movies(movie_id, limit=10)
+
+        print_table(["operation", "ms"], [
+            ["build", build.seconds * 1000],
+            ["open (memory-mapped)", mapped.seconds * 1000],
+            ["open (read into memory)", read.seconds * 1000],
+            ["get_similar_movies (per movie)", lookups.seconds * 1000 / len(sample)],
+        ])
+
+
+if __name__ == "__main__":
+    main()
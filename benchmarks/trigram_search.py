@@ -0,0 +1,92 @@
+# Benchmark: "contains" username searches with LIKE '%...%' vs. the trigram index.
+#
+# services.get_users_by_name(starts_with=False) used to run username LIKE '%text%', which reads
+#  every row of the users table however few of them match.  It now asks the in-memory trigram
+#  index in api/trigram.py instead.  This script fills a temporary copy of the database with lots
+#  of users, then times the same searches both ways, plus how long the index takes to build and
+#  how fast the typo-tolerant (fuzzy) search is.
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.trigram_search --rows 1000000
+import argparse
+import random
+
+from api import config, db, services, trigram
+from benchmarks.common import Timer, print_table, temporary_database
+
+FIRST_NAMES = ["john", "jane", "alex", "maria", "wei", "fatima", "olu", "sven", "priya", "diego",
+               "yuki", "amara", "liam", "noor", "ivan", "chen", "sofia", "kofi", "emma", "raj"]
+LAST_NAMES = ["smith", "garcia", "nguyen", "okafor", "kowalski", "tanaka", "patel", "muller",
+              "rossi", "haddad", "kim", "silva", "obrien", "novak", "larsen", "dubois"]
+
+# Searches that match lots of users, a few users, and nobody
+SEARCHES = ["smith", "maria_g", "kowalski42", "zz_nobody"]
+
+
+def add_users(count: int):
+    """Insert count made-up users straight into the users table of the (temporary) database."""
+    rng = random.Random(42)
+    with db.get_connection() as conn:
+        rows = ((f"{rng.choice(FIRST_NAMES)}_{rng.choice(LAST_NAMES)}{rng.randrange(10000)}", f"user{n}@example.com")
+                for n in range(count))
+        with conn:
+            conn.executemany("INSERT INTO users (username, email) VALUES (?, ?)", rows)
+
+
+def time_searches(repeat: int) -> dict:
+    """
+    Run every search in SEARCHES repeat times with services.get_users_by_name(starts_with=False).
+
+    Returns:
+        dict: search text -> (number of users found, milliseconds per search)
+    """
+    results = {}
+    for text in SEARCHES:
+        with Timer() as timer:
+            for _ in range(repeat):
+                found = services.get_users_by_name(text, starts_with=False, limit=config.DEFAULT_PAGE_SIZE)
+        results[text] = (len(found), timer.seconds * 1000 / repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare LIKE '%...%' with the trigram index for username searches")
+    parser.add_argument("--rows", type=int, default=1000000, help="How many users to add before searching")
+    parser.add_argument("--repeat", type=int, default=5, help="How many times to run each search")
+    args = parser.parse_args()
+
+    with temporary_database():
+        with Timer() as timer:
+            add_users(args.rows)
+        print(f"Added {args.rows:,} users in {timer.seconds:.1f}s")
+
+        original = config.TRIGRAM_INDEX_ENABLED
+        try:
+            config.TRIGRAM_INDEX_ENABLED = False
+            like = time_searches(args.repeat)
+            config.TRIGRAM_INDEX_ENABLED = True
+            with Timer() as build:
+                index = trigram.get_index("users")
+            print(f"Built the trigram index in {build.seconds:.1f}s ({index.stats()['trigrams']:,} trigrams)")
+            indexed = time_searches(args.repeat)
+        finally:
+            config.TRIGRAM_INDEX_ENABLED = original
+
+        rows = []
+        for text in SEARCHES:
+            found, like_ms = like[text]
+            _, index_ms = indexed[text]
+            rows.append([text, found, like_ms, index_ms, like_ms / index_ms if index_ms else 0.0])
+        print_table(["contains", "found (first page)", "LIKE ms", "trigram ms", "speed-up"], rows)
+
+        fuzzy = []
+        for text in ["jonh_smith", "maria_garcai", "kowalsky"]:
+            with Timer() as timer:
+                results = services.fuzzy_search_users(text, limit=10)
+            best = results[0].item.username if results else "-"
+            fuzzy.append([text, best, timer.seconds * 1000])
+        print_table(["similar_to", "best match", "ms"], fuzzy)
+
+
+if __name__ == "__main__":
+    main()
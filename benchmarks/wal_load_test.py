@@ -0,0 +1,87 @@
+# Load test: read throughput of the API while a steady stream of ratings is being written.
+#
+# A handful of reader threads hammer GET /api/movies, GET /api/movies/<id>/ratings and
+#  GET /api/ratings/<id> while one writer thread keeps POSTing new ratings to /api/ratings.
+#  The test is run once with SQLite's default rollback journal and once with the WAL storage
+#  profile, so the two can be compared side by side.
+#
+# Run it from the project's root directory:
+#     python -m benchmarks.wal_load_test --seconds 5 --readers 4
+import argparse
+import itertools
+import threading
+
+from api import config
+from benchmarks.common import print_table, temporary_database
+from run import create_app_no_swagger
+
+
+def run_load(profile_name: str, seconds: float, readers: int) -> dict:
+    """
+    Run the load test against a temporary copy of the database using the given storage profile.
+
+    Args:
+        profile_name (str): A key of config.STORAGE_PROFILES.
+        seconds (float): How long to run the test for.
+        readers (int): The number of concurrent reader threads.
+
+    Returns:
+        dict: The number of reads, writes and errors, and the read/write rates per second.
+    """
+    # Keep one connection per thread so that readers are never waiting on the pool itself
+    with temporary_database(pragmas=config.STORAGE_PROFILES[profile_name], pool_size=readers + 1):
+        app = create_app_no_swagger()
+        stop = threading.Event()
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        lock = threading.Lock()
+
+        def count(key):
+            with lock:
+                counts[key] += 1
+
+        def reader():
+            client = app.test_client()
+            urls = itertools.cycle(["/api/movies", "/api/movies/1/ratings", "/api/ratings/1"])
+            while not stop.is_set():
+                response = client.get(next(urls))
+                count("reads" if response.status_code == 200 else "errors")
+
+        def writer():
+            client = app.test_client()
+            rating = {"user_id": 1, "movie_id": 1, "rating": 4, "review": "Load test", "date": "2024-01-01"}
+            while not stop.is_set():
+                response = client.post("/api/ratings", json=rating)
+                count("writes" if response.status_code == 201 else "errors")
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        stop.wait(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    counts["reads_per_second"] = counts["reads"] / seconds
+    counts["writes_per_second"] = counts["writes"] / seconds
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare API read throughput under a concurrent write stream")
+    parser.add_argument("--seconds", type=float, default=5.0, help="How long to run each profile for")
+    parser.add_argument("--readers", type=int, default=4, help="The number of concurrent reader threads")
+    args = parser.parse_args()
+
+    rows = []
+    for profile_name in ("rollback", "wal"):
+        result = run_load(profile_name, args.seconds, args.readers)
+        rows.append([
+            profile_name, result["reads"], result["reads_per_second"],
+            result["writes"], result["writes_per_second"], result["errors"],
+        ])
+    print_table(["profile", "reads", "reads/s", "writes", "writes/s", "errors"], rows)
+
+
+if __name__ == "__main__":
+    main()
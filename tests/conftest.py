@@ -0,0 +1,19 @@
+import pytest
+
+# Fixtures shared by more than one test file.  pytest finds this file by itself, the tests just
+#  name the fixture as an argument.
+
+
+class FakeClock:
+    """A clock that only moves when we tell it to, so TTL tests don't have to sleep."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,196 @@
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+from api import analytics, config, migrations, services
+from api.analytics import NO_DATE, RatingsSnapshot, parse_day
+from api.models import Movie, Rating, User
+from run import create_app
+
+# These tests cover the columnar ratings snapshot in api/analytics.py and the /api/analytics endpoints.
+
+
+@pytest.fixture
+def snapshot():
+    # Movie 1 is a drama from 2000, movie 2 a drama and comedy from 2000, movie 3 has no genre or
+    #  year, and movie 9 (rated by user 1) has been deleted
+    return RatingsSnapshot(
+        user_ids=[1, 1, 2, 2, 1],
+        movie_ids=[1, 2, 2, 3, 9],
+        ratings=[5, 3, 4, 1, 2],
+        days=[parse_day("2024-01-01"), parse_day("1/1/2024"), parse_day("2024-01-02"), NO_DATE, parse_day("2024-01-02")],
+        users=[3, 2, 1],
+        movies=[3, 2, 1],
+        release_years=[np.nan, 2000, 2000],
+        genre_names={10: "Drama", 11: "Comedy"},
+        genre_links=[(10, 1), (10, 2), (11, 2)],
+    )
+
+
+@pytest.fixture
+def test_client():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+def as_dicts(groups):
+    return [group.to_dict() for group in groups]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1970-01-02", 1),
+    ("2024-01-31 12:30:00", parse_day("2024-01-31")),
+    ("1/31/2024", parse_day("2024-01-31")),
+    ("", NO_DATE),
+    (None, NO_DATE),
+    ("yesterday", NO_DATE),
+])
+def test_parse_day(text, expected):
+    assert parse_day(text) == expected
+
+
+def test_snapshot_is_read_only(snapshot):
+    with pytest.raises(ValueError):
+        snapshot.ratings[0] = 1
+
+
+def test_by_genre(snapshot):
+    # Movie 2 counts towards both of its genres, and the deleted movie towards neither
+    assert as_dicts(snapshot.by_genre()) == [
+        {"genre": "Comedy", "count": 2, "mean": 3.5, "stddev": 0.5},
+        {"genre": "Drama", "count": 3, "mean": 4.0, "stddev": pytest.approx(0.8165, abs=1e-4)},
+    ]
+
+
+def test_by_release_year(snapshot):
+    assert as_dicts(snapshot.by_release_year()) == [
+        {"release_year": 2000, "count": 3, "mean": 4.0, "stddev": pytest.approx(0.8165, abs=1e-4)},
+    ]
+
+
+def test_by_day(snapshot):
+    # The rating without a date is left out, and both ways of writing a date are understood
+    assert [(group.value, group.count, group.mean) for group in snapshot.by_day()] == [
+        ("2024-01-01", 2, 4.0), ("2024-01-02", 2, 3.0)]
+    start = parse_day("2024-01-02")
+    assert [group.value for group in snapshot.by_day(start=start)] == ["2024-01-02"]
+    assert snapshot.by_day(end=start - 2) == []
+
+
+def test_activity(snapshot):
+    # Users 1, 2 and 3 made 3, 2 and 0 ratings
+    assert snapshot.activity("users", [0, 50, 100]) == {
+        "users": 3, "mean": pytest.approx(5 / 3), "max": 3, "percentiles": {"0": 0.0, "50": 2.0, "100": 3.0}}
+    # Movies 1, 2 and 3 have 1, 2 and 1 ratings (the deleted movie isn't counted)
+    assert snapshot.activity("movies", [50])["percentiles"] == {"50": 1.0}
+
+
+def test_load_reads_the_database(tmp_path):
+    conn = sqlite3.connect(tmp_path / "analytics_test.db")
+    conn.executescript("""
+        CREATE TABLE movies (movie_id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, genre TEXT,
+                             release_year INTEGER, director TEXT);
+        CREATE TABLE ratings (rating_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, movie_id INTEGER,
+                              rating INTEGER, review TEXT, date DATE);
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, email TEXT,
+                            date_joined DATE);
+    """)
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO movies (movie_id, title, genre, release_year) VALUES (1, 'One', 'Drama, Comedy', 1999)")
+    conn.execute("INSERT INTO users (user_id, username) VALUES (1, 'one')")
+    conn.executemany("INSERT INTO ratings (user_id, movie_id, rating, date) VALUES (1, 1, ?, ?)",
+                     [(4, "1/5/2023"), (2, "2023-01-05"), (None, "2023-01-06")])
+    snapshot = RatingsSnapshot.load(conn)
+    conn.close()
+    # The rating without a score is left out
+    assert len(snapshot) == 2
+    assert [(group.value, group.count) for group in snapshot.by_genre()] == [("Comedy", 2), ("Drama", 2)]
+    assert [(group.value, group.mean) for group in snapshot.by_day()] == [("2023-01-05", 3.0)]
+
+
+def test_snapshot_is_taken_again_after_enough_writes(monkeypatch):
+    monkeypatch.setattr(config, "ANALYTICS_MAX_AGE_SECONDS", 0)
+    monkeypatch.setattr(config, "ANALYTICS_REFRESH_AFTER_WRITES", 2)
+    analytics.reset()
+    try:
+        first = analytics.get_snapshot()
+        analytics.record_writes()
+        assert analytics.get_snapshot() is first
+        analytics.record_writes()
+        second = analytics.get_snapshot()
+        assert second is not first
+        assert analytics.stats()["writes_since"] == 0
+    finally:
+        analytics.reset()
+
+
+def test_writes_do_not_wait_for_a_snapshot(monkeypatch):
+    monkeypatch.setattr(config, "ANALYTICS_MAX_AGE_SECONDS", 0)
+    monkeypatch.setattr(config, "ANALYTICS_REFRESH_AFTER_WRITES", 1000)
+    original = RatingsSnapshot.load
+    loading = threading.Event()
+    release = threading.Event()
+
+    def slow_load(conn):
+        loading.set()
+        release.wait(5)
+        return original(conn)
+    monkeypatch.setattr(RatingsSnapshot, "load", staticmethod(slow_load))
+    analytics.reset()
+    try:
+        reader = threading.Thread(target=analytics.get_snapshot)
+        reader.start()
+        assert loading.wait(5)
+        # The snapshot is still being taken, but the writes are counted straight away
+        writer = threading.Thread(target=analytics.record_writes, args=(3,))
+        writer.start()
+        writer.join(1)
+        assert not writer.is_alive()
+        release.set()
+        reader.join(5)
+        # The writes made while it was taken may not be in it, so they still count
+        assert analytics.stats()["writes_since"] == 3
+    finally:
+        release.set()
+        analytics.reset()
+
+
+def test_analytics_endpoints(test_client, monkeypatch):
+    # A new snapshot after every write, so it sees the rows added here
+    monkeypatch.setattr(config, "ANALYTICS_REFRESH_AFTER_WRITES", 1)
+    user = User(None, "analytics_user", "analytics@example.com")
+    user.id = services.create_user(user)
+    movie = Movie(None, "Analytics Movie", "Analyticsgenre", 1888, None)
+    movie.movie_id = services.create_movie(movie)
+    rating_ids = [services.create_rating(Rating(user_id=user.id, movie_id=movie.movie_id, rating=score,
+                                                review=None, date="1999-12-31")) for score in (2, 4)]
+    try:
+        response = test_client.get("/api/analytics/ratings/by-genre")
+        assert response.status_code == 200
+        body = response.get_json()
+        assert "as_of" in body
+        assert {"genre": "Analyticsgenre", "count": 2, "mean": 3.0, "stddev": 1.0} in body["groups"]
+
+        years = test_client.get("/api/analytics/ratings/by-release-year").get_json()["groups"]
+        assert {"release_year": 1888, "count": 2, "mean": 3.0, "stddev": 1.0} in years
+
+        days = test_client.get("/api/analytics/ratings/by-date?start=1999-12-31&end=1999-12-31").get_json()
+        assert days["groups"] == [{"date": "1999-12-31", "count": 2, "mean": 3.0, "stddev": 1.0}]
+
+        activity = test_client.get("/api/analytics/users/activity?percentiles=0,100").get_json()
+        assert set(activity["percentiles"]) == {"0", "100"}
+        assert activity["max"] >= 2
+
+        assert test_client.get("/api/analytics/ratings/by-date?start=soon").status_code == 400
+        assert test_client.get("/api/analytics/users/activity?percentiles=50,x").status_code == 400
+        assert test_client.get("/api/analytics/users/activity?percentiles=101").status_code == 400
+        assert test_client.get("/api/analytics/ratings/by-colour").status_code == 404
+    finally:
+        for rating_id in rating_ids:
+            services.delete_rating(rating_id)
+        services.delete_movie(movie.movie_id)
+        services.delete_user(user.id)
+        analytics.reset()
@@ -1,266 +1,432 @@
-import pytest
-from run import create_app
-from api.models import User, Rating, Movie, create_user_from_dict
-from api import services
-from flask import json
-
-
-@pytest.fixture(scope="module")
-def test_client():
-    # Set up Flask test client
-    flask_app = create_app()
-    flask_app.config["TESTING"] = True
-    with flask_app.test_client() as testing_client:
-        yield testing_client
-
-
-@pytest.fixture(scope="function")
-def test_user():
-    # Create a known user for testing purposes
-    user = User(None, "known_user", "knownuser@example.com")
-    user.id = services.create_user(user)
-    yield user
-    # Delete the known user after the test
-    services.delete_user(user.id)
-
-
-@pytest.fixture(scope="function")
-def test_movie():
-    # Create a new movie for testing purposes
-    movie = Movie(None, "test_movie", "test_genre", release_year=2024, director="Test Director")
-    movie.movie_id = services.create_movie(movie)
-    yield movie
-    # Delete the movie after the test
-    services.delete_movie(movie.movie_id)
-
-@pytest.fixture(scope="function")
-def known_rating(test_user, test_movie):
-    # Create a new rating for testing purposes via API
-    rating = Rating(
-            rating_id=None,
-            user_id=test_user.id,
-            movie_id=test_movie.movie_id,
-            rating=4.5,
-            review="Great movie!",
-            date="03/03/2024",
-        )
-    rating_id = services.create_rating(rating)
-    rating.rating_id = rating_id
-    
-    yield rating
-    
-    # Delete the rating after the test
-    services.delete_rating(rating_id)
-
-
-@pytest.fixture(scope="function")
-def test_ratings(test_user, test_movie):
-    """Fixture to set up multiple ratings for a movie."""
-    ratings = [
-        Rating(rating_id=None, user_id=test_user.id, movie_id=test_movie.movie_id, rating=4.5, review="Great movie!", date="03/03/2024"),
-        Rating(rating_id=None, user_id=test_user.id, movie_id=test_movie.movie_id, rating=3.0, review="Not bad!", date="04/30/2024"),
-        Rating(rating_id=None, user_id=test_user.id, movie_id=test_movie.movie_id, rating=5.0, review="Excellent movie!", date="8/13/2024"),
-    ]
-    for rating in ratings:
-        rating_id = services.create_rating(rating)
-        rating.rating_id = rating_id
-
-    yield ratings
-
-    # Clean up after tests
-    for rating in ratings:
-        services.delete_rating(rating.rating_id)
-
-
-class TestDatabaseConnection:
-    def test_create_connection(self, test_client):
-        response = test_client.get("/api/connection")
-        assert response.status_code == 200
-
-    def test_run_query(self, test_client):
-        response = test_client.get("/api/users?username=%%")
-        assert response.status_code == 200
-        data = response.get_json()
-        assert len(data) > 0
-
-
-class TestUserRoutes:
-    def test_get_all_users(self, test_client):
-        response = test_client.get("/api/users")
-        assert response.status_code == 200 , "Response code is not 200"
-        data = response.get_json()
-        assert len(data) > 0, "No users found"
-
-    def test_get_user_by_id(self, test_client, test_user):
-        response = test_client.get(f"/api/users/{test_user.id}")
-        assert response.status_code == 200, "Response code is not 200"
-        user = response.get_json()
-        assert user is not None, "User not found"
-        assert user["id"] == test_user.id, "User ID does not match"
-        assert user["username"] == test_user.username, "Username does not match"
-
-    def test_get_users_by_starts_with_name(self, test_client, test_user):
-        partial_name = test_user.username[:3]
-        response = test_client.get(f"/api/users?starts_with={partial_name}")
-        assert response.status_code == 200, "Response code is not 200"
-        users = response.get_json()
-        assert len(users) > 0   , "No users found"
-        for user in users:
-            assert partial_name in user["username"].lower(), "Partial name not found in username"
-
-        # Now test for the opposite case, where we shouldn't get the user back
-        response = test_client.get("/api/users?starts_with=xxxy")
-        assert response.status_code == 200, "Response code is not 200"
-        users = response.get_json()
-        assert len(users) == 0,    "User found with non-existent partial name"
-
-    def test_get_users_by_contains_name(self, test_client, test_user):
-        partial_name = test_user.username[3:]
-        response = test_client.get(f"/api/users?contains={partial_name}")
-        assert response.status_code == 200, "Response code is not 200"
-        users = response.get_json()
-        assert len(users) > 0 , "No users found"
-        for user in users:
-            assert partial_name in user["username"].lower() , "Partial name not found in username"
-
-    def test_create_user(self, test_client):
-        user_data = {"username": "test_user", "email": "testuser@example.com"}
-        response = test_client.post("/api/users", json=user_data)
-        assert response.status_code == 201, "Response code is not 201"
-        data = response.get_json()
-        user_id = data["user"]["id"]
-        assert user_id is not None , "User ID is None"
-
-        # Now get the user back and check that it is the same
-        response = test_client.get(f"/api/users/{user_id}")
-        user = response.get_json()
-        assert user["username"] == user_data["username"], "Username does not match"
-        assert user["email"] == user_data["email"] ,    "Email does not match"
-        test_client.delete(f"/api/users/{user_id}")
-
-    def test_update_user(self, test_client, test_user):
-        # Update the user
-        updated_data = {"username": "updated_user", "email": "knownuser@example.com"}
-        response = test_client.put(f"/api/users/{test_user.id}", json=updated_data)
-        assert response.status_code == 200, "Response code is not 200"
-
-        # Verify update
-        response = test_client.get(f"/api/users/{test_user.id}")
-        updated_user = response.get_json()
-        assert updated_user["username"] == "updated_user", "Username does not match"
-
-    def test_delete_user(self, test_client, test_user):
-        # Delete the user
-        response = test_client.delete(f"/api/users/{test_user.id}")
-        assert response.status_code == 200, "Response code is not 200"
-
-        # Verify deletion
-        response = test_client.get(f"/api/users/{test_user.id}")
-        assert response.status_code == 404, "Response code is not 404"
-
-
-class TestMovieRoutes:
-    def test_get_all_movies(self, test_client):
-        response = test_client.get("/api/movies")
-        assert response.status_code == 200, "Response code is not 200"
-        data = response.get_json()
-        assert len(data) > 0, "No movies found"
-
-    def test_get_movie_by_id(self, test_client,test_movie):
-        response = test_client.get(f"/api/movies/{test_movie.movie_id}")
-        assert response.status_code == 200, "Response code is not 200"
-        movie = response.get_json()
-        assert movie is not None, "Movie not found"
-        assert movie["movie_id"] == test_movie.movie_id, "Movie ID does not match"
-        assert movie["title"] == test_movie.title, "Title does not match"
-        
-    def test_create_movie(self, test_client):
-        movie_data = {
-            "title": "test_movie",
-            "genre": "test_genre",
-            "release_year": 2024,
-            "director": "Test Director",
-        }
-        response = test_client.post("/api/movies", json=movie_data)
-        assert response.status_code == 201, "Response code is not 201"
-        data = response.get_json()
-        movie_id = data["movie"]["movie_id"]
-        assert movie_id is not None, "Movie ID is None"
-
-        # Now get the movie back and check that it is the same
-        response = test_client.get(f"/api/movies/{movie_id}")
-        movie = response.get_json()
-        assert movie["title"] == movie_data["title"], "Title does not match"
-        assert movie["genre"] == movie_data["genre"], "Genre does not match"
-        assert movie["release_year"] == movie_data["release_year"], "Release year does not match"
-        assert movie["director"] == movie_data["director"], "Director does not match"
-        test_client.delete(f"/api/movies/{movie_id}")
-
-    def test_delete_movie(self, test_client, test_movie):
-        # Delete the movie
-        response = test_client.delete(f"/api/movies/{test_movie.movie_id}")
-        assert response.status_code == 200, "Response code is not 200"
-
-        # Verify deletion
-        response = test_client.get(f"/api/movies/{test_movie.movie_id}")
-        assert response.status_code == 404, "Response code is not 404"
-
-    def test_update_movie(self, test_client, test_movie):
-        # Update the movie
-        updated_data = {
-            "title": "updated_movie",
-            "genre": "test_genre",
-            "release_year": 2024,
-            "director": "Test Director",
-        }
-        response = test_client.put(f"/api/movies/{test_movie.movie_id}", json=updated_data)
-        assert response.status_code == 200, "Response code is not 200"
-
-        # Verify update
-        response = test_client.get(f"/api/movies/{test_movie.movie_id}")
-        updated_movie = response.get_json()
-        assert updated_movie["title"] == "updated_movie", "Title does not match"
-
-class TestReviewRoutes:
-
-    def test_create_review(self, test_client, test_movie, test_user):
-        rating_data = {
-            "user_id": test_user.id,
-            "movie_id": test_movie.movie_id,
-            "rating": 5,
-            "review": "Great movie!",
-            "date": "3/3/2024",
-        }
-        response = test_client.post("/api/ratings", json=rating_data)
-        assert response.status_code == 201, "Response code is not 201"
-        data = response.get_json()
-        rating_id = data["rating"]["rating_id"]
-        assert rating_id is not None, "Rating ID is None"
-
-        # Now get the review back and check that it is the same
-        response = test_client.get(f"/api/ratings/{rating_id}")
-        rating = response.get_json()
-        assert rating["rating"] == 5 , "Rating does not match"
-        assert rating["review"] == "Great movie!", "Review does not match"
-        test_client.delete(f"/api/ratings/{rating_id}")
-
-    def test_get_review_by_id(self, test_client, known_rating):
-        response = test_client.get(f"/api/ratings/{known_rating.rating_id}")
-        assert response.status_code == 200, "Response code is not 200"
-        rating = response.get_json()
-        assert rating is not None , "Rating not found"
-        assert rating["rating_id"] == known_rating.rating_id, "Rating ID does not match"
-        assert rating["rating"] == known_rating.rating, "Rating does not match"
-
-
-    def test_get_ratings_by_movie(self, test_client, test_movie, test_ratings):
-        """Test getting ratings for a specific movie by its ID."""
-        response = test_client.get(f"/api/movies/{test_movie.movie_id}/ratings")
-        assert response.status_code == 200
-        data = response.get_json()
-        ratings = data.get("ratings", None)
-        assert len(ratings) == len(test_ratings) , "Number of ratings does not match"
-
-        for rating, rating_data in zip(test_ratings, ratings):
-            assert rating_data["rating"] == rating.rating, "Rating does not match"
-            assert rating_data["review"] == rating.review, "Review does not match"
+import pytest
+from run import create_app
+from api.models import User, Rating, Movie, create_user_from_dict
+from api import services
+from flask import json
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    # Set up Flask test client
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture(scope="function")
+def test_user():
+    # Create a known user for testing purposes
+    user = User(None, "known_user", "knownuser@example.com")
+    user.id = services.create_user(user)
+    yield user
+    # Delete the known user after the test
+    services.delete_user(user.id)
+
+
+@pytest.fixture(scope="function")
+def test_movie():
+    # Create a new movie for testing purposes
+    movie = Movie(None, "test_movie", "test_genre", release_year=2024, director="Test Director")
+    movie.movie_id = services.create_movie(movie)
+    yield movie
+    # Delete the movie after the test
+    services.delete_movie(movie.movie_id)
+
+@pytest.fixture(scope="function")
+def known_rating(test_user, test_movie):
+    # Create a new rating for testing purposes via API
+    rating = Rating(
+            rating_id=None,
+            user_id=test_user.id,
+            movie_id=test_movie.movie_id,
+            rating=4.5,
+            review="Great movie!",
+            date="03/03/2024",
+        )
+    rating_id = services.create_rating(rating)
+    rating.rating_id = rating_id
+    
+    yield rating
+    
+    # Delete the rating after the test
+    services.delete_rating(rating_id)
+
+
+@pytest.fixture(scope="function")
+def test_ratings(test_user, test_movie):
+    """Fixture to set up multiple ratings for a movie."""
+    ratings = [
+        Rating(rating_id=None, user_id=test_user.id, movie_id=test_movie.movie_id, rating=4.5, review="Great movie!", date="03/03/2024"),
+        Rating(rating_id=None, user_id=test_user.id, movie_id=test_movie.movie_id, rating=3.0, review="Not bad!", date="04/30/2024"),
+        Rating(rating_id=None, user_id=test_user.id, movie_id=test_movie.movie_id, rating=5.0, review="Excellent movie!", date="8/13/2024"),
+    ]
+    for rating in ratings:
+        rating_id = services.create_rating(rating)
+        rating.rating_id = rating_id
+
+    yield ratings
+
+    # Clean up after tests
+    for rating in ratings:
+        services.delete_rating(rating.rating_id)
+
+
+class TestDatabaseConnection:
+    def test_create_connection(self, test_client):
+        response = test_client.get("/api/connection")
+        assert response.status_code == 200
+
+    def test_run_query(self, test_client):
+        response = test_client.get("/api/users?username=%%")
+        assert response.status_code == 200
+        data = response.get_json()
+        assert len(data) > 0
+
+
+class TestUserRoutes:
+    def test_get_all_users(self, test_client):
+        response = test_client.get("/api/users")
+        assert response.status_code == 200 , "Response code is not 200"
+        data = response.get_json()
+        assert len(data) > 0, "No users found"
+
+    def test_get_user_by_id(self, test_client, test_user):
+        response = test_client.get(f"/api/users/{test_user.id}")
+        assert response.status_code == 200, "Response code is not 200"
+        user = response.get_json()
+        assert user is not None, "User not found"
+        assert user["id"] == test_user.id, "User ID does not match"
+        assert user["username"] == test_user.username, "Username does not match"
+
+    def test_get_users_by_starts_with_name(self, test_client, test_user):
+        partial_name = test_user.username[:3]
+        response = test_client.get(f"/api/users?starts_with={partial_name}")
+        assert response.status_code == 200, "Response code is not 200"
+        users = response.get_json()
+        assert len(users) > 0   , "No users found"
+        for user in users:
+            assert partial_name in user["username"].lower(), "Partial name not found in username"
+
+        # Now test for the opposite case, where we shouldn't get the user back
+        response = test_client.get("/api/users?starts_with=xxxy")
+        assert response.status_code == 200, "Response code is not 200"
+        users = response.get_json()
+        assert len(users) == 0,    "User found with non-existent partial name"
+
+    def test_get_users_by_contains_name(self, test_client, test_user):
+        partial_name = test_user.username[3:]
+        response = test_client.get(f"/api/users?contains={partial_name}")
+        assert response.status_code == 200, "Response code is not 200"
+        users = response.get_json()
+        assert len(users) > 0 , "No users found"
+        for user in users:
+            assert partial_name in user["username"].lower() , "Partial name not found in username"
+
+    def test_create_user(self, test_client):
+        user_data = {"username": "test_user", "email": "testuser@example.com"}
+        response = test_client.post("/api/users", json=user_data)
+        assert response.status_code == 201, "Response code is not 201"
+        data = response.get_json()
+        user_id = data["user"]["id"]
+        assert user_id is not None , "User ID is None"
+
+        # Now get the user back and check that it is the same
+        response = test_client.get(f"/api/users/{user_id}")
+        user = response.get_json()
+        assert user["username"] == user_data["username"], "Username does not match"
+        assert user["email"] == user_data["email"] ,    "Email does not match"
+        test_client.delete(f"/api/users/{user_id}")
+
+    def test_update_user(self, test_client, test_user):
+        # Update the user
+        updated_data = {"username": "updated_user", "email": "knownuser@example.com"}
+        response = test_client.put(f"/api/users/{test_user.id}", json=updated_data)
+        assert response.status_code == 200, "Response code is not 200"
+
+        # Verify update
+        response = test_client.get(f"/api/users/{test_user.id}")
+        updated_user = response.get_json()
+        assert updated_user["username"] == "updated_user", "Username does not match"
+
+    def test_delete_user(self, test_client, test_user):
+        # Delete the user
+        response = test_client.delete(f"/api/users/{test_user.id}")
+        assert response.status_code == 200, "Response code is not 200"
+
+        # Verify deletion
+        response = test_client.get(f"/api/users/{test_user.id}")
+        assert response.status_code == 404, "Response code is not 404"
+
+
+class TestMovieRoutes:
+    def test_get_all_movies(self, test_client):
+        response = test_client.get("/api/movies")
+        assert response.status_code == 200, "Response code is not 200"
+        data = response.get_json()
+        assert len(data) > 0, "No movies found"
+
+    def test_get_movie_by_id(self, test_client,test_movie):
+        response = test_client.get(f"/api/movies/{test_movie.movie_id}")
+        assert response.status_code == 200, "Response code is not 200"
+        movie = response.get_json()
+        assert movie is not None, "Movie not found"
+        assert movie["movie_id"] == test_movie.movie_id, "Movie ID does not match"
+        assert movie["title"] == test_movie.title, "Title does not match"
+        
+    def test_create_movie(self, test_client):
+        movie_data = {
+            "title": "test_movie",
+            "genre": "test_genre",
+            "release_year": 2024,
+            "director": "Test Director",
+        }
+        response = test_client.post("/api/movies", json=movie_data)
+        assert response.status_code == 201, "Response code is not 201"
+        data = response.get_json()
+        movie_id = data["movie"]["movie_id"]
+        assert movie_id is not None, "Movie ID is None"
+
+        # Now get the movie back and check that it is the same
+        response = test_client.get(f"/api/movies/{movie_id}")
+        movie = response.get_json()
+        assert movie["title"] == movie_data["title"], "Title does not match"
+        assert movie["genre"] == movie_data["genre"], "Genre does not match"
+        assert movie["release_year"] == movie_data["release_year"], "Release year does not match"
+        assert movie["director"] == movie_data["director"], "Director does not match"
+        test_client.delete(f"/api/movies/{movie_id}")
+
+    def test_delete_movie(self, test_client, test_movie):
+        # Delete the movie
+        response = test_client.delete(f"/api/movies/{test_movie.movie_id}")
+        assert response.status_code == 200, "Response code is not 200"
+
+        # Verify deletion
+        response = test_client.get(f"/api/movies/{test_movie.movie_id}")
+        assert response.status_code == 404, "Response code is not 404"
+
+    def test_update_movie(self, test_client, test_movie):
+        # Update the movie
+        updated_data = {
+            "title": "updated_movie",
+            "genre": "test_genre",
+            "release_year": 2024,
+            "director": "Test Director",
+        }
+        response = test_client.put(f"/api/movies/{test_movie.movie_id}", json=updated_data)
+        assert response.status_code == 200, "Response code is not 200"
+
+        # Verify update
+        response = test_client.get(f"/api/movies/{test_movie.movie_id}")
+        updated_movie = response.get_json()
+        assert updated_movie["title"] == "updated_movie", "Title does not match"
+
+    def test_get_movie_stats(self, test_client, test_movie):
+        rating = Rating(user_id=101, movie_id=test_movie.movie_id, rating=3, review="Stats", date="2024-01-01")
+        rating.rating_id = services.create_rating(rating)
+        response = test_client.get(f"/api/movies/{test_movie.movie_id}/stats")
+        services.delete_rating(rating.rating_id)
+        assert response.status_code == 200, "Response code is not 200"
+        stats = response.get_json()
+        assert stats["count"] == 1
+        assert stats["mean"] == 3
+        assert stats["histogram"]["3"] == 1
+
+    def test_get_top_movies(self, test_client):
+        response = test_client.get("/api/movies/top?limit=3")
+        assert response.status_code == 200, "Response code is not 200"
+        movies = response.get_json()
+        assert len(movies) <= 3
+        scores = [movie["rank_score"] for movie in movies]
+        assert scores == sorted(scores, reverse=True)
+        assert all("stats" in movie for movie in movies)
+
+    def test_get_top_movies_by_genre(self, test_client):
+        response = test_client.get("/api/movies/top?genre=Drama")
+        movies = response.get_json()
+        assert len(movies) > 0
+        assert all("drama" in movie["genre"].lower() for movie in movies)
+        # The genre is matched whatever its case, like GET /api/movies?genre=drama
+        assert test_client.get("/api/movies/top?genre=drama").get_json() == movies
+
+    def test_get_missing_movie_stats(self, test_client):
+        response = test_client.get("/api/movies/999999999/stats")
+        assert response.status_code == 404, "Response code is not 404"
+
+    def test_get_movie_trend(self, test_client, test_movie, test_ratings):
+        # The ratings were made on 3/3/2024, 4/30/2024 and 8/13/2024, and are stored as ISO dates
+        rating = test_client.get(f"/api/ratings/{test_ratings[0].rating_id}").get_json()
+        assert rating["date"] == "2024-03-03"
+
+        response = test_client.get(f"/api/movies/{test_movie.movie_id}/trend?bucket=month")
+        assert response.status_code == 200, "Response code is not 200"
+        trend = response.get_json()
+        assert trend["movie_id"] == test_movie.movie_id and trend["bucket"] == "month"
+        assert [(period["period"], period["count"], period["mean"]) for period in trend["trend"]] == [
+            ("2024-03-01", 1, 4.5), ("2024-04-01", 1, 3.0), ("2024-08-01", 1, 5.0)]
+
+        # 3/3/2024 was a Sunday, so its week started on Monday 26 February
+        weeks = test_client.get(f"/api/movies/{test_movie.movie_id}/trend?bucket=week&to=2024-04-30").get_json()
+        assert [period["period"] for period in weeks["trend"]] == ["2024-02-26", "2024-04-29"]
+        year = test_client.get(f"/api/movies/{test_movie.movie_id}/trend?bucket=year&from=2024-04-01").get_json()
+        assert [(period["period"], period["count"]) for period in year["trend"]] == [("2024-01-01", 2)]
+
+        everyone = test_client.get("/api/ratings/trend?from=2024-08-13&to=2024-08-13").get_json()
+        assert everyone["trend"][0]["count"] >= 1
+
+    def test_get_movie_trend_errors(self, test_client, test_movie):
+        assert test_client.get("/api/movies/999999999/trend").status_code == 404
+        assert test_client.get(f"/api/movies/{test_movie.movie_id}/trend?bucket=fortnight").status_code == 400
+        assert test_client.get(f"/api/movies/{test_movie.movie_id}/trend?from=3/3/2024").status_code == 400
+
+class TestReviewRoutes:
+
+    def test_create_review(self, test_client, test_movie, test_user):
+        rating_data = {
+            "user_id": test_user.id,
+            "movie_id": test_movie.movie_id,
+            "rating": 5,
+            "review": "Great movie!",
+            "date": "3/3/2024",
+        }
+        response = test_client.post("/api/ratings", json=rating_data)
+        assert response.status_code == 201, "Response code is not 201"
+        data = response.get_json()
+        rating_id = data["rating"]["rating_id"]
+        assert rating_id is not None, "Rating ID is None"
+
+        # Now get the review back and check that it is the same
+        response = test_client.get(f"/api/ratings/{rating_id}")
+        rating = response.get_json()
+        assert rating["rating"] == 5 , "Rating does not match"
+        assert rating["review"] == "Great movie!", "Review does not match"
+        test_client.delete(f"/api/ratings/{rating_id}")
+
+    def test_get_review_by_id(self, test_client, known_rating):
+        response = test_client.get(f"/api/ratings/{known_rating.rating_id}")
+        assert response.status_code == 200, "Response code is not 200"
+        rating = response.get_json()
+        assert rating is not None , "Rating not found"
+        assert rating["rating_id"] == known_rating.rating_id, "Rating ID does not match"
+        assert rating["rating"] == known_rating.rating, "Rating does not match"
+
+
+    def test_get_ratings_by_movie(self, test_client, test_movie, test_ratings):
+        """Test getting ratings for a specific movie by its ID."""
+        response = test_client.get(f"/api/movies/{test_movie.movie_id}/ratings")
+        assert response.status_code == 200
+        data = response.get_json()
+        ratings = data.get("ratings", None)
+        assert len(ratings) == len(test_ratings) , "Number of ratings does not match"
+
+        for rating, rating_data in zip(test_ratings, ratings):
+            assert rating_data["rating"] == rating.rating, "Rating does not match"
+            assert rating_data["review"] == rating.review, "Review does not match"
+
+    def test_get_ratings_by_movie_paged(self, test_client, test_movie, test_ratings):
+        response = test_client.get(f"/api/movies/{test_movie.movie_id}/ratings?limit=2")
+        assert response.status_code == 200
+        ratings = response.get_json()["ratings"]
+        assert [rating["rating_id"] for rating in ratings] == [rating.rating_id for rating in test_ratings[:2]]
+
+        # Follow the link to the next (and last) page
+        assert 'rel="next"' in response.headers["Link"]
+        cursor = response.headers["X-Next-Cursor"]
+        response = test_client.get(f"/api/movies/{test_movie.movie_id}/ratings?limit=2&cursor={cursor}")
+        assert response.status_code == 200
+        ratings = response.get_json()["ratings"]
+        assert [rating["rating_id"] for rating in ratings] == [test_ratings[2].rating_id]
+        assert "Link" not in response.headers
+
+    def test_get_ratings_for_missing_movie(self, test_client):
+        response = test_client.get("/api/movies/999999999/ratings")
+        assert response.status_code == 404, "Response code is not 404"
+
+
+class TestPagination:
+    def test_movies_pages_cover_everything(self, test_client):
+        all_ids = [movie["movie_id"] for movie in test_client.get("/api/movies?limit=1000").get_json()]
+        seen_ids = []
+        url = "/api/movies?limit=3"
+        while url:
+            response = test_client.get(url)
+            assert response.status_code == 200
+            page = response.get_json()
+            assert len(page) <= 3
+            seen_ids.extend(movie["movie_id"] for movie in page)
+            cursor = response.headers.get("X-Next-Cursor")
+            url = f"/api/movies?limit=3&cursor={cursor}" if cursor else None
+        assert seen_ids == all_ids
+
+    def test_next_link_keeps_filters(self, test_client):
+        response = test_client.get("/api/users?starts_with=j&limit=1")
+        assert response.status_code == 200
+        if "Link" in response.headers:
+            assert "starts_with=j" in response.headers["Link"]
+
+    def test_user_ratings_paged(self, test_client, test_user, test_ratings):
+        response = test_client.get(f"/api/users/{test_user.id}/ratings?limit=2")
+        assert response.status_code == 200
+        assert len(response.get_json()["ratings"]) == 2
+        assert "X-Next-Cursor" in response.headers
+
+    def test_invalid_cursor(self, test_client):
+        response = test_client.get("/api/movies?cursor=not-a-cursor")
+        assert response.status_code == 400, "Response code is not 400"
+
+    def test_invalid_limit(self, test_client):
+        assert test_client.get("/api/movies?limit=0").status_code == 400
+        assert test_client.get("/api/movies?limit=abc").status_code == 400
+
+
+class TestBulkRoutes:
+    def test_bulk_ratings(self, test_client, test_movie, test_user):
+        ratings = [{"user_id": test_user.id, "movie_id": test_movie.movie_id, "rating": score,
+                    "review": "Bulk", "date": "3/3/2024"} for score in (1, 3, 5)]
+        # One bad rating in the middle doesn't stop the others from being added
+        ratings.insert(1, {"user_id": test_user.id, "movie_id": test_movie.movie_id, "rating": 9})
+        response = test_client.post("/api/ratings/bulk?batch_size=2", json=ratings)
+        assert response.status_code == 201, "Response code is not 201"
+        data = response.get_json()
+        assert data["created"] == 3
+        assert data["ids"][1] is None
+        assert data["errors"] == [{"index": 1, "errors": ["rating must be between 1 and 5"]}]
+        for rating_id, rating in zip(data["ids"], ratings):
+            if rating_id is not None:
+                assert test_client.get(f"/api/ratings/{rating_id}").get_json()["rating"] == rating["rating"]
+                test_client.delete(f"/api/ratings/{rating_id}")
+
+    def test_bulk_users_as_ndjson(self, test_client):
+        body = '{"username": "bulk_one", "email": "one@test.com"}\n{"username": "bulk_two", "email": "two@test.com"}\n'
+        response = test_client.post("/api/users/bulk", data=body, content_type="application/x-ndjson")
+        assert response.status_code == 201, "Response code is not 201"
+        ids = response.get_json()["ids"]
+        assert test_client.get(f"/api/users/{ids[1]}").get_json()["username"] == "bulk_two"
+        for user_id in ids:
+            test_client.delete(f"/api/users/{user_id}")
+
+    def test_bulk_ndjson_must_be_utf8(self, test_client):
+        response = test_client.post("/api/users/bulk", data=b'{"username": "\xff"}\n', content_type="application/x-ndjson")
+        assert response.status_code == 400, "Response code is not 400"
+        assert response.get_json()["message"] == "The request body is not valid UTF-8"
+
+    def test_bulk_failure_reports_what_was_saved(self, test_client, monkeypatch):
+        def fail_after_first(users, batch_size):
+            raise services.BulkInsertError("Only the first 1 rows were saved: disk I/O error", [12345])
+        monkeypatch.setattr(services, "create_users", fail_after_first)
+        body = [{"username": "bulk_one", "email": "one@test.com"}, {"username": "bulk_two", "email": "two@test.com"}]
+        response = test_client.post("/api/users/bulk", json=body)
+        assert response.status_code == 500, "Response code is not 500"
+        data = response.get_json()
+        assert data["created"] == 1
+        assert data["ids"] == [12345, None]
+        assert data["message"] == "Only the first 1 rows were saved: disk I/O error"
+
+    def test_bulk_movies_all_invalid(self, test_client):
+        response = test_client.post("/api/movies/bulk", json=[{"genre": "Drama"}])
+        assert response.status_code == 400, "Response code is not 400"
+        assert response.get_json()["created"] == 0
+
+    def test_bulk_body_must_be_an_array(self, test_client):
+        response = test_client.post("/api/movies/bulk", json={"title": "Not a list"})
+        assert response.status_code == 400, "Response code is not 400"
@@ -0,0 +1,140 @@
+import pytest
+from api import cache, config, services
+from api.cache import LocalLRUCache
+from api.models import Movie, User
+
+# These tests cover the read-through cache in api/cache.py and how api/services.py uses it.
+
+
+@pytest.fixture
+def lru(clock):
+    return LocalLRUCache(max_entries=2, ttl=10, clock=clock)
+
+
+@pytest.fixture
+def shared_cache():
+    """Swap in an empty cache for the services functions, and put the real one back afterwards."""
+    original = cache.get_backend()
+    backend = LocalLRUCache(max_entries=100, ttl=60)
+    cache.set_backend(backend)
+    yield backend
+    cache.set_backend(original)
+
+
+@pytest.fixture
+def new_movie():
+    movie = Movie(None, "Cache Test Movie", "Drama", 2001, "Someone")
+    movie.movie_id = services.create_movie(movie)
+    yield movie
+    services.delete_movie(movie.movie_id)
+
+
+@pytest.fixture
+def new_user():
+    user = User(None, "cache_test_user", "cache@test.com")
+    user.id = services.create_user(user)
+    yield user
+    services.delete_user(user.id)
+
+
+# ---------------------------------------------------------
+# LocalLRUCache
+# ---------------------------------------------------------
+def test_get_and_set(lru):
+    assert lru.get("a") is None
+    lru.set("a", {"value": 1})
+    assert lru.get("a") == {"value": 1}
+    assert lru.stats()["hits"] == 1
+    assert lru.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(lru):
+    lru.set("a", 1)
+    lru.set("b", 2)
+    # Reading "a" makes "b" the least recently used entry
+    lru.get("a")
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert lru.stats()["evictions"] == 1
+
+
+def test_entries_expire(lru, clock):
+    lru.set("a", 1)
+    clock.now = 9.9
+    assert lru.get("a") == 1
+    clock.now = 10
+    assert lru.get("a") is None
+    assert lru.stats()["expirations"] == 1
+
+
+def test_delete_and_clear(lru):
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.delete("a")
+    assert lru.get("a") is None
+    lru.clear()
+    assert lru.stats()["entries"] == 0
+
+
+# ---------------------------------------------------------
+# The services layer
+# ---------------------------------------------------------
+def test_movie_lookup_is_cached(shared_cache, new_movie):
+    first = services.get_movie_by_id(new_movie.movie_id)
+    second = services.get_movie_by_id(new_movie.movie_id)
+    assert first.to_dict() == second.to_dict()
+    # Each call gets its own object, so changing one can't change the cached copy
+    assert first is not second
+    assert shared_cache.stats()["misses"] == 1
+    assert shared_cache.stats()["hits"] == 1
+
+
+def test_update_movie_invalidates(shared_cache, new_movie):
+    services.get_movie_by_id(new_movie.movie_id)
+    new_movie.title = "Cache Test Movie 2"
+    services.update_movie(new_movie)
+    assert services.get_movie_by_id(new_movie.movie_id).title == "Cache Test Movie 2"
+
+
+def test_delete_movie_invalidates(shared_cache):
+    movie = Movie(None, "Cache Delete Movie", "Drama", 2001, "Someone")
+    movie.movie_id = services.create_movie(movie)
+    services.get_movie_by_id(movie.movie_id)
+    services.delete_movie(movie.movie_id)
+    assert services.get_movie_by_id(movie.movie_id) is None
+
+
+def test_user_lookup_is_cached_and_invalidated(shared_cache, new_user):
+    assert services.get_user_by_id(new_user.id).username == "cache_test_user"
+    assert services.get_user_by_id(new_user.id).username == "cache_test_user"
+    assert shared_cache.stats()["hits"] == 1
+    new_user.username = "cache_test_user_2"
+    services.update_user(new_user)
+    assert services.get_user_by_id(new_user.id).username == "cache_test_user_2"
+
+
+def test_load_racing_an_invalidate_is_not_stored(shared_cache):
+    def load_then_change():
+        # The row is read, then changed (and invalidated) before the read is stored
+        value = {"title": "Old Title"}
+        cache.invalidate("movie", 1)
+        return value
+    assert cache.read_through("movie", 1, load_then_change) == {"title": "Old Title"}
+    assert shared_cache.stats()["entries"] == 0
+    # The next lookup reads it again, and that one is kept
+    assert cache.read_through("movie", 1, lambda: {"title": "New Title"}) == {"title": "New Title"}
+    assert cache.read_through("movie", 1, lambda: {"title": "Not read"}) == {"title": "New Title"}
+
+
+def test_missing_entities_are_not_cached(shared_cache):
+    assert services.get_movie_by_id(999999999) is None
+    assert shared_cache.stats()["entries"] == 0
+
+
+def test_cache_can_be_disabled(shared_cache, new_movie, monkeypatch):
+    monkeypatch.setattr(config, "CACHE_ENABLED", False)
+    services.get_movie_by_id(new_movie.movie_id)
+    services.get_movie_by_id(new_movie.movie_id)
+    assert shared_cache.stats()["entries"] == 0
@@ -0,0 +1,96 @@
+import gzip
+import json
+
+import pytest
+from api import compression, config, response_cache
+from run import create_app
+
+# These tests cover the response compression in api/compression.py, and the compressed copies the
+#  response cache keeps (see api/response_cache.py).
+
+
+class FakeBrotli:
+    """Stands in for the brotli package, which isn't a requirement."""
+
+    @staticmethod
+    def compress(body, quality):
+        return b"br:" + body
+
+
+@pytest.fixture
+def test_client(monkeypatch):
+    # Compress everything, however small, so the test database's responses are big enough
+    monkeypatch.setattr(config, "COMPRESSION_MIN_BYTES", 0)
+    monkeypatch.setattr(compression, "brotli", None)
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    response_cache.clear()
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+    response_cache.clear()
+
+
+def test_gzip_when_accepted(test_client):
+    plain = test_client.get("/api/genres")
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+
+    compressed = test_client.get("/api/genres", headers={"Accept-Encoding": "gzip, deflate"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+    assert int(compressed.headers["Content-Length"]) == len(compressed.data)
+
+
+@pytest.mark.parametrize("accept_encoding", ["identity", "gzip;q=0", "deflate"])
+def test_not_compressed_unless_accepted(test_client, accept_encoding):
+    response = test_client.get("/api/genres", headers={"Accept-Encoding": accept_encoding})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_small_responses_and_errors_are_not_compressed(test_client, monkeypatch):
+    monkeypatch.setattr(config, "COMPRESSION_MIN_BYTES", 10 ** 9)
+    assert "Content-Encoding" not in test_client.get("/api/genres", headers={"Accept-Encoding": "gzip"}).headers
+    monkeypatch.setattr(config, "COMPRESSION_MIN_BYTES", 0)
+    missing = test_client.get("/api/movies/999999999", headers={"Accept-Encoding": "gzip"})
+    assert missing.status_code == 404
+    assert "Content-Encoding" not in missing.headers
+
+
+def test_brotli_is_preferred(test_client, monkeypatch):
+    monkeypatch.setattr(compression, "brotli", FakeBrotli)
+    response = test_client.get("/api/genres", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.data.startswith(b"br:")
+    # Unless the client would rather have gzip
+    response = test_client.get("/api/genres", headers={"Accept-Encoding": "gzip, br;q=0.5"})
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_cached_responses_are_compressed_once(test_client, monkeypatch):
+    calls = []
+    original = compression.compress
+
+    def counting(body, encoding):
+        calls.append(encoding)
+        return original(body, encoding)
+    monkeypatch.setattr(compression, "compress", counting)
+
+    bodies = [test_client.get("/api/users?limit=5", headers={"Accept-Encoding": "gzip"}).data for _ in range(3)]
+    assert calls == ["gzip"]
+    assert len(set(bodies)) == 1
+    # A client that doesn't accept gzip gets the uncompressed copy from the same entry
+    plain = test_client.get("/api/users?limit=5")
+    assert "Content-Encoding" not in plain.headers
+    assert json.loads(gzip.decompress(bodies[0])) == plain.get_json()
+    assert calls == ["gzip"]
+
+
+def test_compressed_responses_have_their_own_etag(test_client):
+    plain = test_client.get("/api/movies/1")
+    compressed = test_client.get("/api/movies/1", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+    # Either tag is still current
+    for etag in (plain.headers["ETag"], compressed.headers["ETag"]):
+        response = test_client.get("/api/movies/1", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
@@ -0,0 +1,145 @@
+import pytest
+from api import config, services
+from api.db import connect
+from api.models import Movie, Rating, User
+from run import create_app
+
+# These tests cover the ETag and Last-Modified headers and the 304 Not Modified responses of the
+#  conditional endpoints (see api/conditional.py).
+
+
+@pytest.fixture
+def test_client():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture
+def movie():
+    movie = Movie(None, "Conditional Movie", "Drama", 1999, "Someone")
+    movie.movie_id = services.create_movie(movie)
+    yield movie
+    services.delete_movie(movie.movie_id)
+
+
+@pytest.fixture
+def user():
+    user = User(None, "conditional_user", "conditional@example.com")
+    user.id = services.create_user(user)
+    yield user
+    services.delete_user(user.id)
+
+
+def test_movie_has_validators(test_client, movie):
+    response = test_client.get(f"/api/movies/{movie.movie_id}")
+    assert response.status_code == 200
+    etag, is_weak = response.get_etag()
+    assert etag.startswith("movies:") and not is_weak
+    assert response.last_modified is not None
+    assert response.headers["Cache-Control"] == config.HTTP_CACHE_CONTROL
+
+
+def test_if_none_match_gets_304_without_reading_the_movie(test_client, movie, monkeypatch):
+    etag = test_client.get(f"/api/movies/{movie.movie_id}").headers["ETag"]
+
+    def fail(movie_id):
+        raise AssertionError("the movie shouldn't be read")
+    monkeypatch.setattr(services, "get_movie_by_id", fail)
+    response = test_client.get(f"/api/movies/{movie.movie_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    # A weak tag from a CDN, and *, match too
+    assert test_client.get(f"/api/movies/{movie.movie_id}", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+    assert test_client.get(f"/api/movies/{movie.movie_id}", headers={"If-None-Match": "*"}).status_code == 304
+
+
+def test_update_changes_the_etag(test_client, movie):
+    first = test_client.get(f"/api/movies/{movie.movie_id}").headers["ETag"]
+    movie.title = "Conditional Movie II"
+    services.update_movie(movie)
+    response = test_client.get(f"/api/movies/{movie.movie_id}", headers={"If-None-Match": first})
+    assert response.status_code == 200
+    assert response.get_json()["title"] == "Conditional Movie II"
+    assert response.headers["ETag"] != first
+
+
+def test_change_from_another_process_is_not_served_from_the_cache(test_client, movie, user):
+    # Both are in this process's by-id cache now
+    movie_etag = test_client.get(f"/api/movies/{movie.movie_id}").headers["ETag"]
+    user_etag = test_client.get(f"/api/users/{user.id}").headers["ETag"]
+    # A write through a connection of its own, like another worker process or a script would make,
+    #  which can't invalidate the cached copies
+    conn = connect()
+    try:
+        conn.execute("UPDATE movies SET title = 'Changed Elsewhere' WHERE movie_id = ?", (movie.movie_id,))
+        conn.execute("UPDATE users SET username = 'changed_elsewhere' WHERE user_id = ?", (user.id,))
+        conn.commit()
+    finally:
+        conn.close()
+    response = test_client.get(f"/api/movies/{movie.movie_id}", headers={"If-None-Match": movie_etag})
+    assert response.status_code == 200
+    assert response.get_json()["title"] == "Changed Elsewhere"
+    assert test_client.get(f"/api/movies/{movie.movie_id}",
+                           headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+    response = test_client.get(f"/api/users/{user.id}", headers={"If-None-Match": user_etag})
+    assert response.status_code == 200
+    assert response.get_json()["username"] == "changed_elsewhere"
+
+
+def test_if_modified_since(test_client, movie):
+    last_modified = test_client.get(f"/api/movies/{movie.movie_id}").headers["Last-Modified"]
+    response = test_client.get(f"/api/movies/{movie.movie_id}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    old = "Mon, 01 Jan 2001 00:00:00 GMT"
+    assert test_client.get(f"/api/movies/{movie.movie_id}", headers={"If-Modified-Since": old}).status_code == 200
+    # If-None-Match wins when both are sent
+    response = test_client.get(f"/api/movies/{movie.movie_id}",
+                               headers={"If-Modified-Since": last_modified, "If-None-Match": '"something-else"'})
+    assert response.status_code == 200
+
+
+def test_missing_movie_has_no_validators(test_client):
+    response = test_client.get("/api/movies/999999999")
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
+
+
+def test_movie_list(test_client, monkeypatch):
+    response = test_client.get("/api/movies?limit=2")
+    etag = response.headers["ETag"]
+    assert test_client.get("/api/movies?limit=2", headers={"If-None-Match": etag}).status_code == 304
+    # Filtering by rank_score depends on the ratings too
+    assert "ratings:" in test_client.get("/api/movies?min_score=1").headers["ETag"]
+    # Streamed responses aren't conditional
+    assert "ETag" not in test_client.get("/api/movies?stream=true").headers
+
+    movie = Movie(None, "Conditional List Movie", "Drama", 1999, None)
+    movie.movie_id = services.create_movie(movie)
+    try:
+        assert test_client.get("/api/movies?limit=2", headers={"If-None-Match": etag}).status_code == 200
+    finally:
+        services.delete_movie(movie.movie_id)
+
+    monkeypatch.setattr(config, "CONDITIONAL_REQUESTS_ENABLED", False)
+    assert "ETag" not in test_client.get("/api/movies?limit=2").headers
+
+
+def test_user_ratings(test_client, user, movie):
+    etag = test_client.get(f"/api/users/{user.id}/ratings").headers["ETag"]
+    assert test_client.get(f"/api/users/{user.id}/ratings", headers={"If-None-Match": etag}).status_code == 304
+    rating_id = services.create_rating(Rating(user_id=user.id, movie_id=movie.movie_id, rating=4,
+                                              review=None, date="2024-01-02"))
+    try:
+        response = test_client.get(f"/api/users/{user.id}/ratings", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert [rating["rating_id"] for rating in response.get_json()["ratings"]] == [rating_id]
+
+        rating_etag = test_client.get(f"/api/ratings/{rating_id}").headers["ETag"]
+        assert test_client.get(f"/api/ratings/{rating_id}", headers={"If-None-Match": rating_etag}).status_code == 304
+        user_etag = test_client.get(f"/api/users/{user.id}").headers["ETag"]
+        assert test_client.get(f"/api/users/{user.id}", headers={"If-None-Match": user_etag}).status_code == 304
+    finally:
+        services.delete_rating(rating_id)
@@ -1,340 +1,525 @@
-import pytest
-import api.services as services
-from api.models import User, Rating, Movie
-
-# This set of tests will test the database connection and the services module
-# It is important to test the database connection and the services module to ensure that the database is set up correctly and that the services module is working as expected
-# The way this file is setup is to just use a list of functions as the tests, there are no classes in this module
-# It is a simple way to write tests and keep everything in one file
-
-
-# Fixtures are used to set up the test environment before running the tests
-# They are used to create objects that are used in the tests
-# The objects created by the fixtures are passed to the test functions as arguments
-@pytest.fixture
-def known_user():
-    # Create a known user for testing purposes
-    user = User(None, "known_user", "knownuser@example.com")
-    user.id = services.create_user(user)
-    yield user
-    # Delete the known user after the test
-    services.delete_user(user.id)
-
-
-@pytest.fixture
-def known_movie():
-    # Create a new movie for testing purposes
-    movie = Movie(
-        None, "test_movie", "test_genre", release_year=2024, director="Test Director"
-    )
-    movie.movie_id = services.create_movie(movie)
-    yield movie
-    # Delete the movie after the test
-    services.delete_movie(movie.movie_id)
-
-@pytest.fixture
-def new_rating():
-    rating = Rating(
-        user_id=101,
-        movie_id=1,
-        rating=5,
-        review="Great movie!",
-        date="2022-01-01",
-    )
-    rating.rating_id = services.create_rating(rating)
-    yield rating
-    # Delete the rating after the test
-    services.delete_rating(rating.rating_id)
-
-def test_create_connection():
-    conn = services.get_db_connection()
-    assert conn is not None
-    conn.close()
-
-
-def test_run_query():
-    results = services.run_query("SELECT * FROM users where username like '%%'")
-    assert len(results) > 0
-
-
-def test_get_all_users():
-    all_users = services.get_all_users()
-    assert len(all_users) > 0
-
-# This test will use the known_user fixture to create a user and then test the get_user_by_id function
-def test_get_user_by_id(known_user):
-    """ Test the get_user_by_id function """
-    user = services.get_user_by_id(known_user.id)
-    assert user is not None
-    assert user.id == known_user.id
-    assert user.username == known_user.username
-
-
-def test_get_users_by_starts_with_name(known_user):
-    # We're going to take just the first three characters of the username and search for users
-    users = services.get_users_by_name(known_user.username[:3], starts_with=True)
-    assert len(users) > 0
-    for user in users:
-        assert known_user.username[:3] in user.username[:3].lower()
-
-    # Now test for the opposite case, where we shouldn't get the user back
-    users = services.get_users_by_name("xyz", starts_with=True)
-    assert len(users) == 0
-
-
-def test_get_users_by_contains_name(known_user):
-    users = services.get_users_by_name(known_user.username, starts_with=False)
-    assert len(users) > 0
-    for user in users:
-        assert known_user.username in user.username.lower()
-
-    # Now test for a user where just a part of the name is in the username
-    users = services.get_users_by_name("xyz", starts_with=False)
-    assert len(users) == 0
-    for user in users:
-        assert "xyz" in user.username.lower()
-
-
-def test_create_user():
-    new_user = User(None, "test_user", "testuser@example.com")
-    new_user.id = services.create_user(new_user)
-    assert new_user.id is not None
-
-    # Now get the user back and check that it is the same
-    user = services.get_user_by_id(new_user.id)
-    assert user.username == new_user.username
-    assert user.email == new_user.email
-    services.delete_user(new_user.id)
-
-
-def test_update_user(known_user):
-    # Update the user
-    known_user.username = "updated_user"
-    services.update_user(known_user)
-    updated_user = services.get_user_by_id(known_user.id)
-    assert updated_user.username == "updated_user"
-
-
-def test_delete_user(known_user):
-    # Delete the user
-    services.delete_user(known_user.id)
-    deleted_user = services.get_user_by_id(known_user.id)
-    assert deleted_user is None
-
-# ---------------------------------------------------------
-# This set of tests will test the database connection and the services module for the MOVIES table
-# ---------------------------------------------------------
-def test_get_all_movies():
-    all_movies = services.get_all_movies()
-    assert len(all_movies) > 0
-
-
-def test_get_movie_by_id(known_movie):
-    movie = services.get_movie_by_id(known_movie.movie_id)
-    assert movie is not None
-    assert movie.title == "test_movie"
-    assert movie.genre == "test_genre"
-    assert movie.release_year == 2024
-    assert movie.director == "Test Director"
-
-
-def test_create_movie():
-    movie = Movie(
-        None, "test_movie", "test_genre", release_year=2024, director="Test Director"
-    )
-    movie.movie_id = services.create_movie(movie)
-    assert movie.movie_id is not None
-
-    # Now get the movie back and check that it is the same
-    retrieved_movie = services.get_movie_by_id(movie.movie_id)
-    assert retrieved_movie.title == movie.title
-    assert retrieved_movie.genre == movie.genre
-    assert retrieved_movie.release_year == movie.release_year
-    assert retrieved_movie.director == movie.director
-    services.delete_movie(movie.movie_id)
-
-
-def test_delete_movie(known_movie):
-    # Delete the movie
-    services.delete_movie(known_movie.movie_id)
-    deleted_movie = services.get_movie_by_id(known_movie.movie_id)
-    assert deleted_movie is None
-
-
-def test_update_movie(known_movie):
-    # Update the movie
-    known_movie.title = "updated_movie"
-    services.update_movie(known_movie)
-    updated_movie = services.get_movie_by_id(known_movie.movie_id)
-    assert updated_movie.title == "updated_movie"
-
-
-def test_get_movie_by_criteria_all(known_movie):
-    # Do the test
-    movies = services.get_movies_matching_criteria(
-        genre="test_genre", director="Test Director", year=2024
-    )
-    assert len(movies) > 0
-    for movie in movies:
-        assert movie.title == "test_movie"
-        assert movie.genre == "test_genre"
-        assert movie.release_year == 2024
-        assert movie.director == "Test Director"
-
-    # Now test for the opposite case, where we shouldn't get the movie back
-    movies = services.get_movies_matching_criteria(
-        genre="test_genre", director="Test Director2", year=2024
-    )
-    assert len(movies) == 0
-
-
-def test_movie_by_criteria_director(known_movie):
-    # Do the test
-    movies = services.get_movies_matching_criteria(director="Test Director")
-    assert len(movies) > 0
-    for movie in movies:
-        assert movie.title == "test_movie"
-
-    # Now test for the opposite case, where we shouldn't get the movie back
-    movies = services.get_movies_matching_criteria(director="Test Director2")
-    assert len(movies) == 0
-
-
-def test_movie_by_criteria_genre(known_movie):
-    # Do the test
-    movies = services.get_movies_matching_criteria(genre=known_movie.genre)
-    assert len(movies) > 0
-    for movie in movies:
-        assert movie.title == known_movie.title
-
-    # Now test for the opposite case, where we shouldn't get the movie back
-    movies = services.get_movies_matching_criteria(genre="test_genre2")
-    assert len(movies) == 0
-
-def test_movie_by_criteria_multiple(known_movie):
-    # Do the test
-    movies = services.get_movies_matching_criteria(
-        director=known_movie.director, genre=known_movie.genre
-    )
-    assert len(movies) > 0
-    for movie in movies:
-        assert movie.title == known_movie.title
-
-    movies = services.get_movies_matching_criteria(
-        genre=known_movie.genre,
-        year=known_movie.release_year,
-    )
-    assert len(movies) > 0
-    for movie in movies:
-        assert movie.title == known_movie.title
-# ---------------------------------------------------------
-# This set of tests will test the database connection and the services module for the RATINGS table
-# ---------------------------------------------------------
-def test_get_rating_by_id(new_rating):
-    # Get the rating by id
-    rating = services.get_rating_by_id(new_rating.rating_id)
-    assert rating is not None
-    assert rating.rating_id == new_rating.rating_id
-
-def test_get_movie_ratings(known_movie):
-    # Create a sample rating
-    sample_rating = Rating(
-        user_id=101,
-        movie_id=known_movie.movie_id,
-        rating=5,
-        review="Great movie!",
-        date="1/1/2024",
-    )
-    sample_rating.rating_id = services.create_rating(sample_rating)
-
-    # Create a sample rating
-    sample_rating2 = Rating(
-        user_id=101,
-        movie_id=known_movie.movie_id,
-        rating=3,
-        review="So so movie!",
-        date="2/1/2024",
-    )
-    sample_rating2.rating_id = services.create_rating(sample_rating2)
-
-    # Get the ratings for the movie
-    ratings = services.get_movie_ratings(known_movie.movie_id)
-    assert len(ratings) > 0
-    for rating in ratings:
-        assert rating.movie_id == known_movie.movie_id
-
-    # Clean up
-    services.delete_rating(sample_rating.rating_id)
-    services.delete_rating(sample_rating2.rating_id)
-
-def test_get_rating_by_user(new_rating):
-    # Get the rating by user
-    ratings = services.get_user_ratings(new_rating.user_id)
-    assert len(ratings) > 0
-    for rating in ratings:
-        assert rating.user_id == new_rating.user_id
-
-
-def test_delete_rating(new_rating):
-    # Delete the rating
-    services.delete_rating(new_rating.rating_id)
-    deleted_rating = services.get_rating_by_id(new_rating.rating_id)
-    assert deleted_rating is None
-
-def test_update_rating(new_rating):
-    # Update the rating
-    new_rating.rating = 4
-    services.update_rating(new_rating)
-    updated_rating = services.get_rating_by_id(new_rating.rating_id)
-    assert updated_rating.rating == 4
-
-def test_create_rating():
-    rating = Rating(
-        user_id=101,
-        movie_id=1,
-        rating=5,
-        review="Great movie!",
-        date="2022-01-01",
-    )
-    rating.rating_id = services.create_rating(rating)
-    assert rating.rating_id is not None
-
-    # Now get the rating back and check that it is the same
-    retrieved_rating = services.get_rating_by_id(rating.rating_id)
-    assert retrieved_rating.user_id == rating.user_id
-    assert retrieved_rating.movie_id == rating.movie_id
-    assert retrieved_rating.rating == rating.rating
-    assert retrieved_rating.review == rating.review
-    assert retrieved_rating.date == rating.date
-    services.delete_rating(rating.rating_id)
-
-def test_get_user_ratings(known_user, known_movie):
-    # Create a sample rating
-    sample_rating = Rating(
-        user_id=known_user.id,
-        movie_id=known_movie.movie_id,
-        rating=5,
-        review="Great movie!",
-        date="1/1/2024",
-    )
-    sample_rating.rating_id = services.create_rating(sample_rating)
-
-    # Create a sample rating
-    sample_rating2 = Rating(
-        user_id=known_user.id,
-        movie_id=known_movie.movie_id,
-        rating=3,
-        review="So so movie!",
-        date="2/1/2024",
-    )
-    sample_rating2.rating_id = services.create_rating(sample_rating2)
-
-    # Get the ratings for the user
-    ratings = services.get_user_ratings(known_user.id)
-    assert len(ratings) > 0
-    for rating in ratings:
-        assert rating.user_id == known_user.id
-
-    # Clean up
-    services.delete_rating(sample_rating.rating_id)
-    services.delete_rating(sample_rating2.rating_id)
+import pytest
+import api.services as services
+from api.models import User, Rating, Movie
+
+# This set of tests will test the database connection and the services module
+# It is important to test the database connection and the services module to ensure that the database is set up correctly and that the services module is working as expected
+# The way this file is setup is to just use a list of functions as the tests, there are no classes in this module
+# It is a simple way to write tests and keep everything in one file
+
+
+# Fixtures are used to set up the test environment before running the tests
+# They are used to create objects that are used in the tests
+# The objects created by the fixtures are passed to the test functions as arguments
+@pytest.fixture
+def known_user():
+    # Create a known user for testing purposes
+    user = User(None, "known_user", "knownuser@example.com")
+    user.id = services.create_user(user)
+    yield user
+    # Delete the known user after the test
+    services.delete_user(user.id)
+
+
+@pytest.fixture
+def known_movie():
+    # Create a new movie for testing purposes
+    movie = Movie(
+        None, "test_movie", "test_genre", release_year=2024, director="Test Director"
+    )
+    movie.movie_id = services.create_movie(movie)
+    yield movie
+    # Delete the movie after the test
+    services.delete_movie(movie.movie_id)
+
+@pytest.fixture
+def new_rating():
+    rating = Rating(
+        user_id=101,
+        movie_id=1,
+        rating=5,
+        review="Great movie!",
+        date="2022-01-01",
+    )
+    rating.rating_id = services.create_rating(rating)
+    yield rating
+    # Delete the rating after the test
+    services.delete_rating(rating.rating_id)
+
+def test_create_connection():
+    conn = services.get_db_connection()
+    assert conn is not None
+    conn.close()
+
+
+def test_run_query():
+    results = services.run_query("SELECT * FROM users where username like '%%'")
+    assert len(results) > 0
+
+
+def test_get_all_users():
+    all_users = services.get_all_users()
+    assert len(all_users) > 0
+
+# This test will use the known_user fixture to create a user and then test the get_user_by_id function
+def test_get_user_by_id(known_user):
+    """ Test the get_user_by_id function """
+    user = services.get_user_by_id(known_user.id)
+    assert user is not None
+    assert user.id == known_user.id
+    assert user.username == known_user.username
+
+
+def test_get_users_by_starts_with_name(known_user):
+    # We're going to take just the first three characters of the username and search for users
+    users = services.get_users_by_name(known_user.username[:3], starts_with=True)
+    assert len(users) > 0
+    for user in users:
+        assert known_user.username[:3] in user.username[:3].lower()
+
+    # Now test for the opposite case, where we shouldn't get the user back
+    users = services.get_users_by_name("xyz", starts_with=True)
+    assert len(users) == 0
+
+
+def test_get_users_by_contains_name(known_user):
+    users = services.get_users_by_name(known_user.username, starts_with=False)
+    assert len(users) > 0
+    for user in users:
+        assert known_user.username in user.username.lower()
+
+    # Now test for a user where just a part of the name is in the username
+    users = services.get_users_by_name("xyz", starts_with=False)
+    assert len(users) == 0
+    for user in users:
+        assert "xyz" in user.username.lower()
+
+
+def test_create_user():
+    new_user = User(None, "test_user", "testuser@example.com")
+    new_user.id = services.create_user(new_user)
+    assert new_user.id is not None
+
+    # Now get the user back and check that it is the same
+    user = services.get_user_by_id(new_user.id)
+    assert user.username == new_user.username
+    assert user.email == new_user.email
+    services.delete_user(new_user.id)
+
+
+def test_update_user(known_user):
+    # Update the user
+    known_user.username = "updated_user"
+    services.update_user(known_user)
+    updated_user = services.get_user_by_id(known_user.id)
+    assert updated_user.username == "updated_user"
+
+
+def test_delete_user(known_user):
+    # Delete the user
+    services.delete_user(known_user.id)
+    deleted_user = services.get_user_by_id(known_user.id)
+    assert deleted_user is None
+
+# ---------------------------------------------------------
+# This set of tests will test the database connection and the services module for the MOVIES table
+# ---------------------------------------------------------
+def test_get_all_movies():
+    all_movies = services.get_all_movies()
+    assert len(all_movies) > 0
+
+
+def test_get_movie_by_id(known_movie):
+    movie = services.get_movie_by_id(known_movie.movie_id)
+    assert movie is not None
+    assert movie.title == "test_movie"
+    assert movie.genre == "test_genre"
+    assert movie.release_year == 2024
+    assert movie.director == "Test Director"
+
+
+def test_create_movie():
+    movie = Movie(
+        None, "test_movie", "test_genre", release_year=2024, director="Test Director"
+    )
+    movie.movie_id = services.create_movie(movie)
+    assert movie.movie_id is not None
+
+    # Now get the movie back and check that it is the same
+    retrieved_movie = services.get_movie_by_id(movie.movie_id)
+    assert retrieved_movie.title == movie.title
+    assert retrieved_movie.genre == movie.genre
+    assert retrieved_movie.release_year == movie.release_year
+    assert retrieved_movie.director == movie.director
+    services.delete_movie(movie.movie_id)
+
+
+def test_delete_movie(known_movie):
+    # Delete the movie
+    services.delete_movie(known_movie.movie_id)
+    deleted_movie = services.get_movie_by_id(known_movie.movie_id)
+    assert deleted_movie is None
+
+
+def test_update_movie(known_movie):
+    # Update the movie
+    known_movie.title = "updated_movie"
+    services.update_movie(known_movie)
+    updated_movie = services.get_movie_by_id(known_movie.movie_id)
+    assert updated_movie.title == "updated_movie"
+
+
+def test_get_movie_by_criteria_all(known_movie):
+    # Do the test
+    movies = services.get_movies_matching_criteria(
+        genre="test_genre", director="Test Director", year=2024
+    )
+    assert len(movies) > 0
+    for movie in movies:
+        assert movie.title == "test_movie"
+        assert movie.genre == "test_genre"
+        assert movie.release_year == 2024
+        assert movie.director == "Test Director"
+
+    # Now test for the opposite case, where we shouldn't get the movie back
+    movies = services.get_movies_matching_criteria(
+        genre="test_genre", director="Test Director2", year=2024
+    )
+    assert len(movies) == 0
+
+
+def test_movie_by_criteria_director(known_movie):
+    # Do the test
+    movies = services.get_movies_matching_criteria(director="Test Director")
+    assert len(movies) > 0
+    for movie in movies:
+        assert movie.title == "test_movie"
+
+    # Now test for the opposite case, where we shouldn't get the movie back
+    movies = services.get_movies_matching_criteria(director="Test Director2")
+    assert len(movies) == 0
+
+
+def test_movie_by_criteria_genre(known_movie):
+    # Do the test
+    movies = services.get_movies_matching_criteria(genre=known_movie.genre)
+    assert len(movies) > 0
+    for movie in movies:
+        assert movie.title == known_movie.title
+
+    # Now test for the opposite case, where we shouldn't get the movie back
+    movies = services.get_movies_matching_criteria(genre="test_genre2")
+    assert len(movies) == 0
+
+def test_movie_by_criteria_multiple(known_movie):
+    # Do the test
+    movies = services.get_movies_matching_criteria(
+        director=known_movie.director, genre=known_movie.genre
+    )
+    assert len(movies) > 0
+    for movie in movies:
+        assert movie.title == known_movie.title
+
+    movies = services.get_movies_matching_criteria(
+        genre=known_movie.genre,
+        year=known_movie.release_year,
+    )
+    assert len(movies) > 0
+    for movie in movies:
+        assert movie.title == known_movie.title
+# ---------------------------------------------------------
+# This set of tests will test the database connection and the services module for the RATINGS table
+# ---------------------------------------------------------
+def test_get_rating_by_id(new_rating):
+    # Get the rating by id
+    rating = services.get_rating_by_id(new_rating.rating_id)
+    assert rating is not None
+    assert rating.rating_id == new_rating.rating_id
+
+def test_get_movie_ratings(known_movie):
+    # Create a sample rating
+    sample_rating = Rating(
+        user_id=101,
+        movie_id=known_movie.movie_id,
+        rating=5,
+        review="Great movie!",
+        date="1/1/2024",
+    )
+    sample_rating.rating_id = services.create_rating(sample_rating)
+
+    # Create a sample rating
+    sample_rating2 = Rating(
+        user_id=101,
+        movie_id=known_movie.movie_id,
+        rating=3,
+        review="So so movie!",
+        date="2/1/2024",
+    )
+    sample_rating2.rating_id = services.create_rating(sample_rating2)
+
+    # Get the ratings for the movie
+    ratings = services.get_movie_ratings(known_movie.movie_id)
+    assert len(ratings) > 0
+    for rating in ratings:
+        assert rating.movie_id == known_movie.movie_id
+
+    # Clean up
+    services.delete_rating(sample_rating.rating_id)
+    services.delete_rating(sample_rating2.rating_id)
+
+def test_get_rating_by_user(new_rating):
+    # Get the rating by user
+    ratings = services.get_user_ratings(new_rating.user_id)
+    assert len(ratings) > 0
+    for rating in ratings:
+        assert rating.user_id == new_rating.user_id
+
+
+def test_delete_rating(new_rating):
+    # Delete the rating
+    services.delete_rating(new_rating.rating_id)
+    deleted_rating = services.get_rating_by_id(new_rating.rating_id)
+    assert deleted_rating is None
+
+def test_update_rating(new_rating):
+    # Update the rating
+    new_rating.rating = 4
+    services.update_rating(new_rating)
+    updated_rating = services.get_rating_by_id(new_rating.rating_id)
+    assert updated_rating.rating == 4
+
+def test_create_rating():
+    rating = Rating(
+        user_id=101,
+        movie_id=1,
+        rating=5,
+        review="Great movie!",
+        date="2022-01-01",
+    )
+    rating.rating_id = services.create_rating(rating)
+    assert rating.rating_id is not None
+
+    # Now get the rating back and check that it is the same
+    retrieved_rating = services.get_rating_by_id(rating.rating_id)
+    assert retrieved_rating.user_id == rating.user_id
+    assert retrieved_rating.movie_id == rating.movie_id
+    assert retrieved_rating.rating == rating.rating
+    assert retrieved_rating.review == rating.review
+    assert retrieved_rating.date == rating.date
+    services.delete_rating(rating.rating_id)
+
+def test_get_user_ratings(known_user, known_movie):
+    # Create a sample rating
+    sample_rating = Rating(
+        user_id=known_user.id,
+        movie_id=known_movie.movie_id,
+        rating=5,
+        review="Great movie!",
+        date="1/1/2024",
+    )
+    sample_rating.rating_id = services.create_rating(sample_rating)
+
+    # Create a sample rating
+    sample_rating2 = Rating(
+        user_id=known_user.id,
+        movie_id=known_movie.movie_id,
+        rating=3,
+        review="So so movie!",
+        date="2/1/2024",
+    )
+    sample_rating2.rating_id = services.create_rating(sample_rating2)
+
+    # Get the ratings for the user
+    ratings = services.get_user_ratings(known_user.id)
+    assert len(ratings) > 0
+    for rating in ratings:
+        assert rating.user_id == known_user.id
+
+    # Clean up
+    services.delete_rating(sample_rating.rating_id)
+    services.delete_rating(sample_rating2.rating_id)
+
+def test_get_movie_with_ratings(known_movie):
+    ratings = []
+    for score in (5, 3, 4):
+        rating = Rating(user_id=101, movie_id=known_movie.movie_id, rating=score, review="Review", date="2024-01-01")
+        rating.rating_id = services.create_rating(rating)
+        ratings.append(rating)
+
+    movie = services.get_movie_with_ratings(known_movie.movie_id)
+    assert movie.title == known_movie.title
+    assert [rating.rating_id for rating in movie.ratings] == [rating.rating_id for rating in ratings]
+    for rating in movie.ratings:
+        assert rating.movie_id == known_movie.movie_id
+
+    # Page through the ratings
+    page = services.get_movie_with_ratings(known_movie.movie_id, limit=2, after=ratings[0].rating_id)
+    assert [rating.rating_id for rating in page.ratings] == [rating.rating_id for rating in ratings[1:3]]
+
+    # Paging past the end still returns the movie, just without ratings
+    past_the_end = services.get_movie_with_ratings(known_movie.movie_id, limit=2, after=ratings[-1].rating_id)
+    assert past_the_end.title == known_movie.title
+    assert past_the_end.ratings == []
+
+    # Clean up
+    for rating in ratings:
+        services.delete_rating(rating.rating_id)
+
+def test_get_movie_with_ratings_is_capped(known_movie, monkeypatch):
+    monkeypatch.setattr(services.config, "MAX_RATINGS_PER_MOVIE", 1)
+    ratings = []
+    for score in (5, 3):
+        rating = Rating(user_id=101, movie_id=known_movie.movie_id, rating=score, review="Review", date="2024-01-01")
+        rating.rating_id = services.create_rating(rating)
+        ratings.append(rating)
+
+    # Without a limit, the number of ratings is capped
+    movie = services.get_movie_with_ratings(known_movie.movie_id)
+    assert len(movie.ratings) == 1
+
+    # Clean up
+    for rating in ratings:
+        services.delete_rating(rating.rating_id)
+
+def test_get_movie_with_ratings_missing_movie():
+    assert services.get_movie_with_ratings(-1) is None
+
+def test_get_all_movies_paged():
+    first_page = services.get_all_movies(limit=2)
+    assert len(first_page) == 2
+    second_page = services.get_all_movies(after=first_page[-1].movie_id, limit=2)
+    assert len(second_page) > 0
+    # The pages follow on from each other, in movie_id order
+    assert second_page[0].movie_id > first_page[-1].movie_id
+    all_ids = [movie.movie_id for movie in services.get_all_movies()]
+    assert [movie.movie_id for movie in first_page + second_page] == all_ids[:len(first_page + second_page)]
+
+def test_get_user_ratings_paged(known_user, known_movie):
+    ratings = []
+    for score in (1, 2, 3):
+        rating = Rating(user_id=known_user.id, movie_id=known_movie.movie_id, rating=score, review="Review", date="2024-01-01")
+        rating.rating_id = services.create_rating(rating)
+        ratings.append(rating)
+
+    page = services.get_user_ratings(known_user.id, after=ratings[0].rating_id, limit=1)
+    assert [rating.rating_id for rating in page] == [ratings[1].rating_id]
+
+    # Clean up
+    for rating in ratings:
+        services.delete_rating(rating.rating_id)
+
+
+def test_get_movie_rating_stats(known_movie):
+    stats = services.get_movie_rating_stats(known_movie.movie_id)
+    assert stats.count == 0
+    assert stats.mean is None
+
+    ratings = []
+    for score in (2, 4, 4):
+        rating = Rating(user_id=101, movie_id=known_movie.movie_id, rating=score, review="Stats", date="2024-01-01")
+        rating.rating_id = services.create_rating(rating)
+        ratings.append(rating)
+    stats = services.get_movie_rating_stats(known_movie.movie_id)
+    assert stats.count == 3
+    assert stats.mean == pytest.approx(10 / 3)
+    assert stats.histogram == {1: 0, 2: 1, 3: 0, 4: 2, 5: 0}
+
+    # Changing and deleting ratings keeps the statistics up to date
+    ratings[0].rating = 5
+    services.update_rating(ratings[0])
+    services.delete_rating(ratings[1].rating_id)
+    stats = services.get_movie_rating_stats(known_movie.movie_id)
+    assert stats.count == 2
+    assert stats.mean == 4.5
+    assert stats.stddev == pytest.approx(0.5)
+    assert stats.histogram == {1: 0, 2: 0, 3: 0, 4: 1, 5: 1}
+
+    for rating in ratings:
+        services.delete_rating(rating.rating_id)
+    assert services.get_movie_rating_stats(known_movie.movie_id).count == 0
+
+
+def test_get_movie_rating_stats_missing_movie():
+    assert services.get_movie_rating_stats(999999999) is None
+
+
+def test_get_top_movies(known_movie):
+    # Give the test movie (genre "test_genre") lots of 5 star ratings so it's the best test_genre movie
+    ratings = []
+    for user_id in range(10):
+        rating = Rating(user_id=user_id, movie_id=known_movie.movie_id, rating=5, review="Top", date="2024-01-01")
+        rating.rating_id = services.create_rating(rating)
+        ratings.append(rating)
+
+    top = services.get_top_movies(genre="test_genre", limit=5)
+    assert top[0].movie_id == known_movie.movie_id
+    assert top[0].stats.count == 10
+    assert all(movie.genre == "test_genre" for movie in top)
+
+    overall = services.get_top_movies(limit=5)
+    assert len(overall) <= 5
+    scores = [movie.rank_score for movie in overall]
+    assert scores == sorted(scores, reverse=True)
+
+    for rating in ratings:
+        services.delete_rating(rating.rating_id)
+    # With no ratings left the movie drops out of the list
+    assert known_movie.movie_id not in [movie.movie_id for movie in services.get_top_movies(genre="test_genre")]
+
+
+def test_get_top_movies_matches_any_genre_in_any_case():
+    movie = Movie(None, "test_two_genres", "Test_Genre_Two, Test_Genre_Three", 2024, "Test Director")
+    movie.movie_id = services.create_movie(movie)
+    rating_id = services.create_rating(Rating(user_id=1, movie_id=movie.movie_id, rating=4, review="Top", date="2024-01-01"))
+    try:
+        for genre in ("test_genre_two", "TEST_GENRE_THREE"):
+            assert [top.movie_id for top in services.get_top_movies(genre=genre)] == [movie.movie_id]
+    finally:
+        services.delete_rating(rating_id)
+        services.delete_movie(movie.movie_id)
+
+
+def test_get_top_movies_by_year():
+    top = services.get_top_movies(year=2010)
+    assert all(movie.release_year == 2010 for movie in top)
+
+
+def test_create_ratings_in_bulk(known_movie):
+    ratings = [Rating(user_id=user_id, movie_id=known_movie.movie_id, rating=user_id % 5 + 1, review="Bulk",
+                      date="2024-01-01") for user_id in range(1, 8)]
+    # A small batch size so the ratings go in over several transactions
+    ids = services.create_ratings(ratings, batch_size=3)
+    assert len(ids) == 7
+    for rating, rating_id in zip(ratings, ids):
+        assert services.get_rating_by_id(rating_id).user_id == rating.user_id
+    # The triggers keep the statistics up to date for bulk inserts too
+    assert services.get_movie_rating_stats(known_movie.movie_id).count == 7
+    for rating_id in ids:
+        services.delete_rating(rating_id)
+
+
+def test_create_users_and_movies_in_bulk():
+    user_ids = services.create_users([User(None, f"bulk_user_{n}", f"bulk{n}@test.com") for n in range(3)])
+    assert [services.get_user_by_id(user_id).username for user_id in user_ids] == ["bulk_user_0", "bulk_user_1", "bulk_user_2"]
+    movie_ids = services.create_movies([Movie(None, f"Bulk Movie {n}", "Drama", 2000 + n, "Someone") for n in range(2)])
+    assert [services.get_movie_by_id(movie_id).release_year for movie_id in movie_ids] == [2000, 2001]
+    for user_id in user_ids:
+        services.delete_user(user_id)
+    for movie_id in movie_ids:
+        services.delete_movie(movie_id)
+
+
+def test_failed_bulk_batch_reports_what_was_saved():
+    users = [User(None, f"bulk_partial_{n}", f"partial{n}@test.com") for n in range(3)]
+    # The third user is in the second batch, and fails because it has the wrong number of values
+    rows = [(user.username, user.email) for user in users]
+    rows[2] = ("bulk_partial_2",)
+    with pytest.raises(services.BulkInsertError) as error:
+        services.bulk_insert("INSERT INTO users (username, email) VALUES (?, ?)", rows, batch_size=2)
+    saved = error.value.ids
+    try:
+        assert [services.get_user_by_id(user_id).username for user_id in saved] == ["bulk_partial_0", "bulk_partial_1"]
+        assert services.get_users_by_name("bulk_partial_2") == []
+    finally:
+        for user_id in saved:
+            services.delete_user(user_id)
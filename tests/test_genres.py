@@ -0,0 +1,86 @@
+import pytest
+from api import services
+from api.models import Movie
+from run import create_app
+
+# These tests cover the genre and director tables (migration 6), the services functions that read
+#  them and the /api/genres and /api/directors endpoints.  The movies are created through the
+#  normal services functions, so they also check that the triggers keep the links up to date.
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture
+def linked_movies():
+    movies = [Movie(None, "Linked One", "Linkgenre, Othergenre", 2001, "Ada Linkdirector, Bo Linkdirector"),
+              Movie(None, "Linked Two", "linkgenre", 2002, "Bo Linkdirector")]
+    for movie in movies:
+        movie.movie_id = services.create_movie(movie)
+    yield movies
+    for movie in movies:
+        services.delete_movie(movie.movie_id)
+
+
+def find_director(name):
+    directors = services.get_directors(name=name)
+    return directors[0] if directors else None
+
+
+def test_comma_separated_values_are_split(linked_movies):
+    one, two = linked_movies
+    # Names are matched without regard to case, so "linkgenre" is the same genre as "Linkgenre"
+    genre = services.get_genres(name="LINKGENRE")[0]
+    assert genre.name == "Linkgenre"
+    assert [movie.movie_id for movie in services.get_genre_movies(genre.genre_id)] == [one.movie_id, two.movie_id]
+    ada, bo = find_director("Ada Linkdirector"), find_director("bo linkdirector")
+    assert [movie.movie_id for movie in services.get_director_movies(ada.person_id)] == [one.movie_id]
+    assert [movie.movie_id for movie in services.get_director_movies(bo.person_id)] == [one.movie_id, two.movie_id]
+
+
+def test_links_follow_updates_and_deletes(linked_movies):
+    one, two = linked_movies
+    bo = find_director("Bo Linkdirector")
+    one.director = "Bo Linkdirector"
+    services.update_movie(one)
+    # Ada doesn't direct anything anymore so she's gone, Bo keeps his id
+    assert find_director("Ada Linkdirector") is None
+    assert find_director("Bo Linkdirector").person_id == bo.person_id
+    services.delete_movie(two.movie_id)
+    assert [movie.movie_id for movie in services.get_director_movies(bo.person_id)] == [one.movie_id]
+    assert services.get_genres(name="Othergenre") != []
+
+
+def test_find_movies_matches_any_director(linked_movies):
+    one, two = linked_movies
+    assert [movie.movie_id for movie in services.find_movies(director="bo linkdirector")] == [one.movie_id, two.movie_id]
+    assert [movie.movie_id for movie in services.find_movies(director_starts_with="Ada Link")] == [one.movie_id]
+    assert [movie.movie_id for movie in services.find_movies(genres=["Othergenre"])] == [one.movie_id]
+
+
+def test_director_movies_endpoint(test_client, linked_movies):
+    bo = find_director("Bo Linkdirector")
+    response = test_client.get(f"/api/directors/{bo.person_id}/movies?limit=1")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["name"] == "Bo Linkdirector"
+    assert [movie["movie_id"] for movie in body["movies"]] == [linked_movies[0].movie_id]
+    next_page = test_client.get(f"/api/directors/{bo.person_id}/movies?limit=1&cursor={response.headers['X-Next-Cursor']}")
+    assert [movie["movie_id"] for movie in next_page.get_json()["movies"]] == [linked_movies[1].movie_id]
+
+
+def test_genre_endpoints(test_client, linked_movies):
+    genres = test_client.get("/api/genres?name=linkgenre").get_json()
+    assert [genre["name"] for genre in genres] == ["Linkgenre"]
+    response = test_client.get(f"/api/genres/{genres[0]['genre_id']}/movies")
+    assert len(response.get_json()["movies"]) == 2
+
+
+@pytest.mark.parametrize("url", ["/api/genres/999999/movies", "/api/directors/999999/movies"])
+def test_unknown_ids(test_client, url):
+    assert test_client.get(url).status_code == 404
@@ -0,0 +1,82 @@
+import sqlite3
+import pytest
+from utility import load_data
+
+# These tests load small CSV files from pytest's tmp_path into a throw-away database with the
+#  streaming loader in utility/load_data.py.
+
+
+def write_csv(folder, name, lines):
+    (folder / name).write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    folder = tmp_path / "csv"
+    folder.mkdir()
+    write_csv(folder, "movies.csv", ["movie_id,title,genre,release_year,director",
+                                     "1,First,Drama,2001,Someone",
+                                     "2,Second,Action,2002,Someone Else"])
+    write_csv(folder, "users.csv", ["user_id,username,email,date_joined",
+                                    "1,first_user,first@test.com,1/2/2023"])
+    write_csv(folder, "ratings.csv", ["rating_id,user_id,movie_id,rating,review,date",
+                                      "1,1,1,4,Good,1/2/2023",
+                                      "2,1,1,2,,2023-03-04",
+                                      "3,1,2,5,\"Great, really\",12/31/2022"])
+    return folder
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    return tmp_path / "load_test.db"
+
+
+def query(database_path, sql):
+    conn = sqlite3.connect(database_path)
+    rows = conn.execute(sql).fetchall()
+    conn.close()
+    return rows
+
+
+@pytest.mark.parametrize("value, expected", [("1/2/2023", "2023-01-02"), ("12/31/2022", "2022-12-31"),
+                                             ("2023-03-04", "2023-03-04"), ("", None)])
+def test_normalise_date(value, expected):
+    assert load_data.normalise_date(value) == expected
+
+
+def test_load_converts_and_loads_in_chunks(data_path, database_path):
+    load_data.load_data(database_path, data_path, chunk_size=2, replace=True)
+    assert query(database_path, "SELECT rating_id, rating, review, date FROM ratings ORDER BY rating_id") == [
+        (1, 4, "Good", "2023-01-02"), (2, 2, None, "2023-03-04"), (3, 5, "Great, really", "2022-12-31")]
+    # The statistics are rebuilt at the end of the load
+    assert query(database_path, "SELECT movie_id, rating_count, rating_sum FROM movie_rating_stats ORDER BY movie_id") == [
+        (1, 2, 6), (2, 1, 5)]
+
+
+def test_indexes_and_triggers_are_restored(data_path, database_path):
+    load_data.load_data(database_path, data_path, replace=True)
+    names = {row[0] for row in query(database_path, "SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+    assert {"idx_ratings_movie_id_rating", "idx_movies_genre_rank_score", "ratings_stats_insert"} <= names
+
+
+def test_reload_upserts(data_path, database_path):
+    load_data.load_data(database_path, data_path, replace=True)
+    # Change one rating and add a new one, the existing rows should be updated rather than duplicated
+    write_csv(data_path, "ratings.csv", ["rating_id,user_id,movie_id,rating,review,date",
+                                         "1,1,1,1,Changed my mind,1/5/2023",
+                                         "4,1,2,3,New,1/6/2023"])
+    generation = query(database_path, "SELECT generation FROM table_generations WHERE table_name = 'ratings'")[0][0]
+    load_data.load_data(database_path, data_path)
+    assert query(database_path, "SELECT rating_id, rating FROM ratings ORDER BY rating_id") == [(1, 1), (2, 2), (3, 5), (4, 3)]
+    assert query(database_path, "SELECT COUNT(*) FROM movies") == [(2,)]
+    # The triggers were off, so the loader bumps the changed row's version and the table's generation itself
+    assert query(database_path, "SELECT rating_id, row_version FROM ratings WHERE rating_id IN (1, 2) ORDER BY rating_id") == [
+        (1, 2), (2, 1)]
+    assert query(database_path, "SELECT generation FROM table_generations WHERE table_name = 'ratings'") == [(generation + 1,)]
+
+
+def test_file_without_ids_gets_new_ids(data_path, database_path):
+    load_data.load_data(database_path, data_path, replace=True)
+    write_csv(data_path, "ratings.csv", ["user_id,movie_id,rating,review,date", "1,2,4,Partner review,2/2/2023"])
+    load_data.load_data(database_path, data_path)
+    assert query(database_path, "SELECT rating_id, rating FROM ratings WHERE review = 'Partner review'") == [(4, 4)]
@@ -0,0 +1,261 @@
+import sqlite3
+import pytest
+from api import migrations
+from api.migrations import Migration
+
+# These tests run the migrations against an empty copy of the schema in pytest's tmp_path,
+#  the same tables that utility/load_data.py creates.
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "migrations_test.db")
+    conn.executescript("""
+        CREATE TABLE movies (movie_id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, genre TEXT,
+                             release_year INTEGER, director TEXT);
+        CREATE TABLE ratings (rating_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, movie_id INTEGER,
+                              rating INTEGER, review TEXT, date DATE);
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, email TEXT,
+                            date_joined DATE);
+    """)
+    yield conn
+    conn.close()
+
+
+def index_names(conn):
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+    return {row[0] for row in rows}
+
+
+def test_new_database_starts_at_version_zero(conn):
+    assert migrations.get_schema_version(conn) == 0
+
+
+def test_migrate_applies_everything(conn):
+    applied = migrations.migrate(conn)
+    assert applied == [migration.version for migration in migrations.MIGRATIONS]
+    assert migrations.get_schema_version(conn) == migrations.latest_version()
+    assert "idx_ratings_movie_id_rating" in index_names(conn)
+    assert "idx_users_username_nocase" in index_names(conn)
+    assert "idx_movie_genres_movie_id" in index_names(conn)
+    assert "idx_item_similarities_neighbour_id" in index_names(conn)
+
+
+def test_migrate_is_idempotent(conn):
+    migrations.migrate(conn)
+    assert migrations.migrate(conn) == []
+
+
+def test_migrate_to_target_version(conn):
+    assert migrations.migrate(conn, target_version=0) == []
+    assert migrations.get_schema_version(conn) == 0
+
+
+def test_failed_migration_is_rolled_back(conn, monkeypatch):
+    broken = Migration(migrations.latest_version() + 1, "Broken", [
+        "CREATE TABLE half_done (id INTEGER)",
+        "THIS IS NOT SQL",
+    ])
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [broken])
+    with pytest.raises(sqlite3.Error):
+        migrations.migrate(conn)
+    # Everything before the broken migration was applied, the broken one left no trace
+    assert migrations.get_schema_version(conn) == broken.version - 1
+    tables = conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchall()
+    assert tables == []
+
+
+def test_python_migration_steps(conn, monkeypatch):
+    def add_column(connection):
+        connection.execute("ALTER TABLE users ADD COLUMN nickname TEXT")
+
+    extra = Migration(migrations.latest_version() + 1, "Python step", add_column)
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [extra])
+    migrations.migrate(conn)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    assert "nickname" in columns
+
+
+# ---------------------------------------------------------
+# Rating statistics (migration 2)
+# ---------------------------------------------------------
+def read_stats(conn):
+    return conn.execute("SELECT * FROM movie_rating_stats ORDER BY movie_id").fetchall()
+
+
+def test_rating_stats_are_backfilled(conn):
+    conn.executemany("INSERT INTO ratings (user_id, movie_id, rating) VALUES (?, ?, ?)",
+                     [(1, 1, 4), (2, 1, 5), (1, 2, 1)])
+    conn.commit()
+    migrations.migrate(conn)
+    # movie_id, count, sum, sum of squares, then the histogram for 1-5
+    assert read_stats(conn) == [(1, 2, 9, 41, 0, 0, 0, 1, 1), (2, 1, 1, 1, 1, 0, 0, 0, 0)]
+
+
+def test_triggers_match_a_rebuild(conn):
+    migrations.migrate(conn)
+    conn.executemany("INSERT INTO ratings (user_id, movie_id, rating) VALUES (?, ?, ?)",
+                     [(1, 1, 4), (2, 1, 5), (3, 1, 2), (1, 2, 3)])
+    conn.execute("UPDATE ratings SET rating = 1 WHERE user_id = 2")
+    # Moving a rating to another movie takes it off one movie's totals and adds it to the other's
+    conn.execute("UPDATE ratings SET movie_id = 2 WHERE user_id = 3")
+    conn.execute("DELETE FROM ratings WHERE user_id = 1 AND movie_id = 2")
+    conn.commit()
+    from_triggers = read_stats(conn)
+    assert from_triggers == [(1, 2, 5, 17, 1, 0, 0, 1, 0), (2, 1, 2, 4, 0, 1, 0, 0, 0)]
+    migrations.rebuild_rating_stats(conn)
+    assert read_stats(conn) == from_triggers
+
+
+# ---------------------------------------------------------
+# Rankings (migration 3)
+# ---------------------------------------------------------
+def rank_scores(conn):
+    return dict(conn.execute("SELECT movie_id, rank_score FROM movies").fetchall())
+
+
+def test_rank_scores_are_damped_averages(conn):
+    conn.executemany("INSERT INTO movies (movie_id, title) VALUES (?, ?)",
+                     [(1, "One"), (2, "Two"), (3, "Three"), (4, "Four")])
+    # Movie 1 has a single 5, movie 2 has 19 5s and a 4, movie 3 has no ratings and movie 4 has ten 1s
+    conn.executemany("INSERT INTO ratings (user_id, movie_id, rating) VALUES (?, ?, ?)",
+                     [(1, 1, 5)] + [(user_id, 2, 5) for user_id in range(19)] + [(19, 2, 4)]
+                     + [(user_id, 4, 1) for user_id in range(10)])
+    conn.commit()
+    migrations.migrate(conn)
+    prior_mean, prior_weight = conn.execute("SELECT prior_mean, prior_weight FROM ranking_prior").fetchone()
+    assert prior_mean == pytest.approx(114 / 31)
+    scores = rank_scores(conn)
+    assert scores[1] == pytest.approx((prior_weight * prior_mean + 5) / (prior_weight + 1))
+    assert scores[3] is None
+    # Lots of great ratings beat a single perfect one
+    assert scores[2] > scores[1] > scores[4]
+
+
+def test_rank_score_follows_new_ratings(conn):
+    conn.execute("INSERT INTO movies (movie_id, title) VALUES (1, 'One')")
+    conn.commit()
+    migrations.migrate(conn)
+    assert rank_scores(conn)[1] is None
+    conn.execute("INSERT INTO ratings (user_id, movie_id, rating) VALUES (1, 1, 5)")
+    first = rank_scores(conn)[1]
+    conn.execute("INSERT INTO ratings (user_id, movie_id, rating) VALUES (2, 1, 5)")
+    assert rank_scores(conn)[1] > first
+    conn.execute("DELETE FROM ratings")
+    assert rank_scores(conn)[1] is None
+    conn.commit()
+
+
+def test_search_index_is_backfilled_and_follows_changes(conn):
+    conn.execute("INSERT INTO movies (movie_id, title, director) VALUES (1, 'The Dark Knight', 'Christopher Nolan')")
+    conn.commit()
+    migrations.migrate(conn)
+
+    def search(text):
+        return [row[0] for row in conn.execute("SELECT rowid FROM movies_fts WHERE movies_fts MATCH ?", (text,))]
+
+    assert search("nolan") == [1]
+    conn.execute("UPDATE movies SET director = 'Someone Else' WHERE movie_id = 1")
+    assert search("nolan") == []
+    conn.execute("INSERT INTO ratings (user_id, movie_id, rating, review) VALUES (1, 1, 5, 'Brilliant')")
+    assert [row[0] for row in conn.execute("SELECT rowid FROM reviews_fts WHERE reviews_fts MATCH 'brilliant'")] == [1]
+    conn.execute("DELETE FROM movies")
+    assert search("dark") == []
+    conn.commit()
+
+
+def test_movie_links_are_backfilled(conn):
+    conn.executemany("INSERT INTO movies (movie_id, title, genre, director) VALUES (?, ?, ?, ?)",
+                     [(1, "One", "Action, Adventure", "Anthony Russo, Joe Russo"), (2, "Two", "action", None),
+                      (3, "Three", None, 'Someone "Quoted" \\ Odd')])
+    conn.commit()
+    migrations.migrate(conn)
+    assert conn.execute("SELECT name FROM genres ORDER BY genre_id").fetchall() == [("Action",), ("Adventure",)]
+    assert conn.execute("SELECT genre_id, movie_id FROM movie_genres ORDER BY genre_id, movie_id").fetchall() == [
+        (1, 1), (1, 2), (2, 1)]
+    assert conn.execute("SELECT name FROM people ORDER BY person_id").fetchall() == [
+        ("Anthony Russo",), ("Joe Russo",), ('Someone "Quoted" \\ Odd',)]
+    # Rebuilding keeps the ids
+    migrations.rebuild_movie_links(conn)
+    assert conn.execute("SELECT person_id FROM people WHERE name = 'Joe Russo'").fetchone() == (2,)
+    conn.commit()
+
+
+def read_rollups(conn):
+    return (conn.execute("SELECT * FROM rating_daily_rollups WHERE rating_count > 0 ORDER BY movie_id, day").fetchall(),
+            conn.execute("SELECT * FROM rating_daily_totals WHERE rating_count > 0 ORDER BY day").fetchall())
+
+
+def test_rating_dates_are_normalised_and_rolled_up(conn):
+    conn.executemany("INSERT INTO ratings (user_id, movie_id, rating, date) VALUES (?, ?, ?, ?)",
+                     [(1, 1, 5, "1/2/2024"), (2, 1, 3, "2024-01-02"), (3, 2, 4, "12/31/2023"), (4, 2, 2, "soon")])
+    conn.commit()
+    migrations.migrate(conn)
+    dates = [row[0] for row in conn.execute("SELECT date FROM ratings ORDER BY rating_id")]
+    # A date that can't be read is left alone (and isn't in the rollups)
+    assert dates == ["2024-01-02", "2024-01-02", "2023-12-31", "soon"]
+    assert "idx_ratings_date" in index_names(conn)
+    assert read_rollups(conn) == ([(1, "2024-01-02", 2, 8, 34), (2, "2023-12-31", 1, 4, 16)],
+                                  [("2023-12-31", 1, 4, 16), ("2024-01-02", 2, 8, 34)])
+    # New m/d/yyyy dates are rewritten by the trigger
+    conn.execute("INSERT INTO ratings (user_id, movie_id, rating, date) VALUES (5, 2, 1, '3/4/2024')")
+    assert conn.execute("SELECT date FROM ratings WHERE user_id = 5").fetchone() == ("2024-03-04",)
+    conn.commit()
+
+
+def test_rollup_triggers_match_a_rebuild(conn):
+    migrations.migrate(conn)
+    conn.executemany("INSERT INTO ratings (user_id, movie_id, rating, date) VALUES (?, ?, ?, ?)",
+                     [(1, 1, 5, "1/2/2024"), (2, 1, 3, "2024-01-02 10:30:00"), (3, 2, 4, None), (4, 2, 2, "2024-01-05")])
+    conn.execute("UPDATE ratings SET rating = 1, date = '1/3/2024' WHERE user_id = 1")
+    conn.execute("UPDATE ratings SET date = '2024-01-06' WHERE user_id = 3")
+    conn.execute("UPDATE ratings SET movie_id = 1 WHERE user_id = 4")
+    conn.execute("DELETE FROM ratings WHERE user_id = 2")
+    from_triggers = read_rollups(conn)
+    migrations.rebuild_rating_rollups(conn)
+    assert read_rollups(conn) == from_triggers
+    assert from_triggers[0] == [(1, "2024-01-03", 1, 1, 1), (1, "2024-01-05", 1, 2, 4), (2, "2024-01-06", 1, 4, 16)]
+    conn.commit()
+
+
+def test_item_similarities_are_backfilled_and_queued(conn):
+    # Users 1 and 2 rated movies 1 and 2 the same, nobody else rated movie 3 with them
+    conn.executemany("INSERT INTO ratings (user_id, movie_id, rating) VALUES (?, ?, ?)",
+                     [(1, 1, 5), (1, 2, 5), (2, 1, 3), (2, 2, 3), (3, 3, 4)])
+    conn.commit()
+    migrations.migrate(conn)
+    rows = conn.execute("SELECT movie_id, neighbour_id, similarity FROM item_similarities ORDER BY movie_id").fetchall()
+    assert [row[:2] for row in rows] == [(1, 2), (2, 1)]
+    assert rows[0][2] == pytest.approx(1.0)
+    # New ratings are queued for the next refresh
+    conn.execute("INSERT INTO ratings (user_id, movie_id, rating) VALUES (3, 1, 1)")
+    conn.execute("UPDATE ratings SET movie_id = 2 WHERE user_id = 3 AND movie_id = 3")
+    assert conn.execute("SELECT movie_id FROM similarity_refresh_queue ORDER BY movie_id").fetchall() == [
+        (1,), (2,), (3,)]
+    conn.commit()
+
+
+def read_versions(conn, table, key_column):
+    versions = conn.execute(f"SELECT {key_column}, row_version, updated_at IS NOT NULL FROM {table} ORDER BY 1").fetchall()
+    generation = conn.execute("SELECT generation FROM table_generations WHERE table_name = ?", (table,)).fetchone()[0]
+    return versions, generation
+
+
+def test_row_versions_and_generations(conn):
+    # Rows that were there before the migration start at version 1, without an updated_at time
+    conn.execute("INSERT INTO movies (title, genre) VALUES ('Old', 'Drama')")
+    conn.commit()
+    migrations.migrate(conn)
+    assert read_versions(conn, "movies", "movie_id") == ([(1, 1, 0)], 1)
+    conn.execute("INSERT INTO movies (title, genre) VALUES ('New', 'Comedy')")
+    conn.execute("UPDATE movies SET title = 'Older' WHERE movie_id = 1")
+    assert read_versions(conn, "movies", "movie_id") == ([(1, 2, 1), (2, 1, 1)], 3)
+    # The rankings rewrite rank_score after every rating, which isn't a change to the movie
+    conn.execute("INSERT INTO ratings (user_id, movie_id, rating, date) VALUES (1, 2, 5, '2024-01-02')")
+    assert read_versions(conn, "movies", "movie_id") == ([(1, 2, 1), (2, 1, 1)], 3)
+    assert read_versions(conn, "ratings", "rating_id") == ([(1, 1, 1)], 2)
+    conn.execute("DELETE FROM movies WHERE movie_id = 2")
+    assert read_versions(conn, "movies", "movie_id")[1] == 4
+    migrations.touch_generations(conn, ["users"])
+    assert read_versions(conn, "users", "user_id") == ([], 2)
+    conn.commit()
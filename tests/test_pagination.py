@@ -0,0 +1,43 @@
+import pytest
+from api import pagination
+from api.pagination import InvalidCursorError, PaginationError
+
+
+def test_cursor_round_trip():
+    cursor = pagination.encode_cursor((42,))
+    assert pagination.decode_cursor(cursor) == (42,)
+
+
+def test_cursor_is_url_safe():
+    cursor = pagination.encode_cursor(("a title with spaces & symbols?", 7))
+    assert all(character.isalnum() or character in "-_" for character in cursor)
+    assert pagination.decode_cursor(cursor) == ("a title with spaces & symbols?", 7)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "", "e30", "!!!"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursorError):
+        pagination.decode_cursor(cursor)
+
+
+def test_clamp_limit(monkeypatch):
+    monkeypatch.setattr(pagination.config, "DEFAULT_PAGE_SIZE", 10)
+    monkeypatch.setattr(pagination.config, "MAX_PAGE_SIZE", 50)
+    assert pagination.clamp_limit(None) == 10
+    assert pagination.clamp_limit(20) == 20
+    assert pagination.clamp_limit(500) == 50
+    assert pagination.clamp_limit(500, maximum=5) == 5
+    with pytest.raises(PaginationError):
+        pagination.clamp_limit(0)
+
+
+def test_split_page():
+    # Three items came back for a page of two, so there is another page
+    page, next_cursor = pagination.split_page([1, 2, 3], 2, key=lambda item: (item,))
+    assert page == [1, 2]
+    assert pagination.decode_cursor(next_cursor) == (2,)
+
+    # Exactly a page (or less) means this is the last page
+    page, next_cursor = pagination.split_page([1, 2], 2, key=lambda item: (item,))
+    assert page == [1, 2]
+    assert next_cursor is None
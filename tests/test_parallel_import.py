@@ -0,0 +1,79 @@
+import sqlite3
+from utility import parallel_import
+
+# These tests run the parallel importer in utility/parallel_import.py against CSV shards in
+#  pytest's tmp_path, with a throw-away database.
+
+
+def write_csv(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_import_shards_in_parallel(tmp_path):
+    write_csv(tmp_path / "movies.csv", ["movie_id,title,genre,release_year,director",
+                                        "1,First,Drama,2001,Someone", "2,Second,Action,2002,Someone Else"])
+    write_csv(tmp_path / "users.csv", ["user_id,username,email,date_joined", "1,first_user,first@test.com,1/2/2023"])
+    # The ratings are split over three shards, one of them with a bad rating
+    write_csv(tmp_path / "ratings.csv", ["rating_id,user_id,movie_id,rating,review,date",
+                                         "1,1,1,4,Good,1/2/2023", "2,1,2,5,Great,1/3/2023"])
+    write_csv(tmp_path / "ratings_part2.csv", ["rating_id,user_id,movie_id,rating,review,date",
+                                               "3,1,1,2,Meh,1/4/2023", "4,1,1,9,Too high,1/5/2023"])
+    write_csv(tmp_path / "ratings_part3.csv", ["user_id,movie_id,rating,review,date",
+                                               "1,2,3,No id,1/6/2023"])
+    database_path = tmp_path / "import_test.db"
+
+    summary = parallel_import.import_files(database_path, tmp_path, workers=2, chunk_size=1, replace=True)
+
+    assert summary["error"] is None
+    assert summary["written"] == {"movies": 2, "users": 1, "ratings": 4}
+    rejected = [error for shard in summary["shards"] for error in shard["errors"]]
+    assert rejected == ["ratings_part2.csv line 3: rating must be between 1 and 5"]
+
+    conn = sqlite3.connect(database_path)
+    assert conn.execute("SELECT COUNT(*), MIN(date) FROM ratings").fetchone() == (4, "2023-01-02")
+    # The statistics are rebuilt once the import is done, and the triggers are back
+    assert conn.execute("SELECT rating_count FROM movie_rating_stats WHERE movie_id = 1").fetchone() == (2,)
+    triggers = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'ratings'").fetchone()
+    assert triggers[0] > 0
+    conn.close()
+
+
+def test_empty_shard_is_reported(tmp_path):
+    write_csv(tmp_path / "movies.csv", ["movie_id,title,genre,release_year,director", "1,First,Drama,2001,Someone"])
+    write_csv(tmp_path / "users.csv", ["user_id,username,email,date_joined", "1,first_user,first@test.com,1/2/2023"])
+    write_csv(tmp_path / "ratings.csv", ["rating_id,user_id,movie_id,rating,review,date", "1,1,1,4,Good,1/2/2023"])
+    (tmp_path / "ratings_empty.csv").write_text("", encoding="utf-8")
+    database_path = tmp_path / "import_test.db"
+
+    summary = parallel_import.import_files(database_path, tmp_path, workers=2, replace=True)
+
+    assert summary["written"] == {"movies": 1, "users": 1, "ratings": 1}
+    rejected = [error for shard in summary["shards"] for error in shard["errors"]]
+    assert rejected == ["ratings_empty.csv: the file is empty, it has no header row"]
+    conn = sqlite3.connect(database_path)
+    triggers = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'ratings'").fetchone()
+    assert triggers[0] > 0
+    conn.close()
+
+
+def test_bad_values_only_reject_their_row(tmp_path):
+    write_csv(tmp_path / "movies.csv", ["movie_id,title,genre,release_year,director", "1,First,Drama,2001,Someone"])
+    write_csv(tmp_path / "users.csv", ["user_id,username,email,date_joined", "1,first_user,first@test.com,1/2/2023"])
+    write_csv(tmp_path / "ratings.csv", ["rating_id,user_id,movie_id,rating,review,date",
+                                         "1,1,1,4,Good,1/2/2023",
+                                         "2,1,1,abc,Not a number,1/3/2023",
+                                         "3,1,1,3,Bad date,31/31/2023",
+                                         "4,1,1,5,Great,1/4/2023"])
+    database_path = tmp_path / "import_test.db"
+
+    # All of the ratings are in one chunk, and the good ones on either side of the bad ones still go in
+    summary = parallel_import.import_files(database_path, tmp_path, workers=2, replace=True)
+
+    assert summary["written"]["ratings"] == 2
+    shard = [shard for shard in summary["shards"] if shard["file"] == "ratings.csv"][0]
+    assert shard["rejected"] == 2
+    assert shard["errors"] == ["ratings.csv line 3: invalid literal for int() with base 10: 'abc'",
+                               "ratings.csv line 4: Unrecognised date: '31/31/2023'"]
+    conn = sqlite3.connect(database_path)
+    assert [row[0] for row in conn.execute("SELECT rating_id FROM ratings ORDER BY rating_id")] == [1, 4]
+    conn.close()
@@ -0,0 +1,188 @@
+import sqlite3
+import threading
+import pytest
+from api import config, db
+from api.db import ConnectionPool, PoolTimeoutError
+from run import create_app
+
+# These tests exercise the connection pool in api/db.py.
+# Most of them use a throw-away database in pytest's tmp_path so that they don't touch the real data.
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(tmp_path / "pool_test.db", size=2, timeout=0.1, health_check_interval=30)
+    yield pool
+    pool.close()
+
+
+def test_connections_are_reused(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert pool.stats()["opened"] == 1
+
+
+def test_rows_can_be_accessed_by_name(pool):
+    conn = pool.acquire()
+    row = conn.execute("SELECT 1 AS answer").fetchone()
+    assert row["answer"] == 1
+    pool.release(conn)
+
+
+def test_pool_is_bounded(pool):
+    first = pool.acquire()
+    second = pool.acquire()
+    assert pool.stats()["saturation"] == 1.0
+    # The pool only has two connections, so the third caller should time out
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+    pool.release(first)
+    pool.release(second)
+
+
+def test_waiting_caller_gets_released_connection(pool):
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.timeout = 5
+    # Give a connection back a moment after another thread starts waiting for one
+    timer = threading.Timer(0.05, pool.release, args=(first,))
+    timer.start()
+    assert pool.acquire() is first
+    assert pool.stats()["max_wait_seconds"] > 0
+    timer.join()
+    pool.release(first)
+    pool.release(second)
+
+
+def test_release_rolls_back_open_transaction(pool):
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE items (name TEXT)")
+    conn.commit()
+    conn.execute("INSERT INTO items VALUES ('uncommitted')")
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+    pool.release(conn)
+
+
+def test_broken_idle_connection_is_replaced(pool):
+    pool.health_check_interval = 0
+    conn = pool.acquire()
+    pool.release(conn)
+    # Simulate a connection that died while sitting in the pool
+    conn.close()
+    replacement = pool.acquire()
+    assert replacement is not conn
+    assert replacement.execute("SELECT 1").fetchone()[0] == 1
+    pool.release(replacement)
+
+
+def test_failed_reopen_frees_its_slot(pool, monkeypatch):
+    pool.health_check_interval = 0
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.close()
+
+    def fail():
+        raise sqlite3.OperationalError("unable to open database file")
+    monkeypatch.setattr(pool, "_open", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        pool.acquire()
+    assert pool.stats()["opened"] == 0
+    monkeypatch.undo()
+    # Both slots can still be filled
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+
+
+def test_pragmas_are_applied(tmp_path):
+    pool = ConnectionPool(tmp_path / "pragma_test.db", size=1, timeout=0.1,
+                          health_check_interval=30, pragmas={"busy_timeout": 1234})
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+    pool.release(conn)
+    pool.close()
+
+
+def test_checkout_listener_is_called(pool):
+    calls = []
+    pool.checkout_listeners.append(lambda wait, in_use, size: calls.append((wait, in_use, size)))
+    conn = pool.acquire()
+    pool.release(conn)
+    assert len(calls) == 1
+    wait, in_use, size = calls[0]
+    assert wait >= 0
+    assert in_use == 1
+    assert size == 2
+
+
+def test_request_shares_one_connection():
+    app = create_app()
+    with app.app_context():
+        with db.get_connection() as first:
+            pass
+        with db.get_connection() as second:
+            pass
+        assert first is second
+    # After the app context ends the connection has gone back to the pool
+    assert db.pool_stats()["in_use"] == 0
+
+
+def test_connection_outside_request_is_returned():
+    with db.get_connection() as conn:
+        assert isinstance(conn, sqlite3.Connection)
+        assert db.pool_stats()["in_use"] >= 1
+    assert db.pool_stats()["in_use"] == 0
+
+
+# ---------------------------------------------------------
+# Storage profile (WAL mode and PRAGMA tuning)
+# ---------------------------------------------------------
+def test_wal_profile_is_applied(pool):
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    # synchronous=NORMAL is reported as 1
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+    pool.release(conn)
+
+
+def test_reader_does_not_block_writer(tmp_path):
+    # Don't wait for locks at all, so any blocking shows up as an error straight away
+    profile = dict(config.STORAGE_PROFILES["wal"], busy_timeout=0)
+    pool = ConnectionPool(tmp_path / "wal_test.db", size=2, timeout=0.1,
+                          health_check_interval=30, pragmas=profile)
+    writer = pool.acquire()
+    writer.execute("CREATE TABLE items (name TEXT)")
+    writer.execute("INSERT INTO items VALUES ('first')")
+    writer.commit()
+
+    # The reader starts a read transaction and keeps it open while the writer commits
+    reader = pool.acquire()
+    reader.execute("BEGIN")
+    assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
+    writer.execute("INSERT INTO items VALUES ('second')")
+    writer.commit()
+    # The reader still sees the snapshot it started with
+    assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
+    reader.rollback()
+    assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+
+    pool.release(reader)
+    pool.release(writer)
+    pool.close()
+
+
+def test_checkpoint_empties_wal(pool):
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE items (name TEXT)")
+    conn.executemany("INSERT INTO items VALUES (?)", [("item",)] * 100)
+    conn.commit()
+    pool.release(conn)
+    busy, wal_pages, checkpointed = pool.checkpoint("TRUNCATE")
+    assert busy == 0
+    assert wal_pages == 0
@@ -0,0 +1,123 @@
+import pytest
+from api import services
+from api.models import Movie
+from api.query_builder import MOVIES, RATINGS, Query, QueryError, compile_statement, escape_like
+from run import create_app
+
+# These tests cover the query builder in api/query_builder.py and the movie and rating filters built on it.
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture
+def filter_movies():
+    movies = [Movie(None, "Filter One", "FilterGenreA", 1991, "Zebulon Quist"),
+              Movie(None, "Filter Two", "FilterGenreB", 1995, "Zebulon Quist"),
+              Movie(None, "Filter Three", "FilterGenreA", 2005, "Zebra_Director")]
+    for movie in movies:
+        movie.movie_id = services.create_movie(movie)
+    yield movies
+    for movie in movies:
+        services.delete_movie(movie.movie_id)
+
+
+def test_query_without_filters():
+    assert Query(MOVIES).to_sql() == (
+        "SELECT movie_id, title, genre, release_year, director FROM movies ORDER BY movie_id", [])
+
+
+def test_query_with_every_kind_of_filter():
+    sql, params = (Query(MOVIES).equals("title", "Heat").starts_with("title", "He").one_of("release_year", [1995, 1996])
+                   .between("rank_score", 3.5).order_by("title", descending=True).limit(5).to_sql())
+    assert sql == ("SELECT movie_id, title, genre, release_year, director FROM movies "
+                   "WHERE title COLLATE NOCASE = ? AND title LIKE ? ESCAPE '\\' AND release_year IN (?, ?) "
+                   "AND rank_score >= ? ORDER BY title DESC, movie_id DESC LIMIT ?")
+    assert params == ["Heat", "He%", 1995, 1996, 3.5, 5]
+
+
+def test_linked_filters():
+    sql, params = Query(MOVIES).one_of("genres", ["Drama", "Crime"]).starts_with("directors", "Nol").to_sql()
+    assert sql == ("SELECT movie_id, title, genre, release_year, director FROM movies WHERE "
+                   "movie_id IN (SELECT l.movie_id FROM genres t JOIN movie_genres l ON l.genre_id = t.genre_id "
+                   "WHERE t.name IN (?, ?)) AND "
+                   "movie_id IN (SELECT l.movie_id FROM people t JOIN movie_directors l ON l.person_id = t.person_id "
+                   "WHERE t.name LIKE ? ESCAPE '\\') ORDER BY movie_id")
+    assert params == ["Drama", "Crime", "Nol%"]
+
+
+def test_open_ended_range_and_paging():
+    sql, params = Query(RATINGS).equals("user_id", 1).between("rating", low=4).after(10).limit(2).to_sql()
+    assert sql.endswith("WHERE user_id = ? AND rating >= ? AND rating_id > ? ORDER BY rating_id LIMIT ?")
+    assert params == [1, 4, 10, 2]
+
+
+def test_statements_are_cached_per_shape():
+    compile_statement.cache_clear()
+    Query(MOVIES).equals("genre", "Drama").to_sql()
+    Query(MOVIES).equals("genre", "Crime").to_sql()
+    Query(MOVIES).one_of("genre", ["Drama", "Crime"]).to_sql()
+    info = compile_statement.cache_info()
+    assert (info.hits, info.misses) == (1, 2)
+
+
+def test_escape_like():
+    assert escape_like("50%_off\\") == "50\\%\\_off\\\\"
+
+
+@pytest.mark.parametrize("build", [
+    lambda: Query(MOVIES).equals("password", "x"),
+    lambda: Query(MOVIES).order_by("director"),
+    lambda: Query(MOVIES).between("release_year", 2000, 1990),
+    lambda: Query(MOVIES).one_of("genre", []),
+    lambda: Query(MOVIES).order_by("title").after(5).to_sql(),
+])
+def test_bad_queries(build):
+    with pytest.raises(QueryError):
+        build()
+
+
+def test_find_movies_filters(filter_movies):
+    one, two, three = filter_movies
+
+    def ids(**filters):
+        return [movie.movie_id for movie in services.find_movies(**filters)]
+
+    assert ids(genres=["filtergenrea"]) == [one.movie_id, three.movie_id]
+    assert ids(genres=["FilterGenreA", "FilterGenreB"], year_from=1990, year_to=1999) == [one.movie_id, two.movie_id]
+    assert ids(director="zebulon quist", year_from=1992) == [two.movie_id]
+    # The _ in the search text is a real underscore, not a LIKE wildcard
+    assert ids(director_starts_with="Zebra_") == [three.movie_id]
+    assert ids(director_starts_with="Zebr_") == []
+    assert ids(genres=["FilterGenreA", "FilterGenreB"], sort="release_year", descending=True) == [
+        three.movie_id, two.movie_id, one.movie_id]
+
+
+def test_movies_matching_criteria_without_criteria():
+    # This used to build "... WHERE " with nothing after it
+    assert len(services.get_movies_matching_criteria()) == len(services.get_all_movies())
+
+
+def test_movies_endpoint_filters(test_client, filter_movies):
+    response = test_client.get("/api/movies?genre=FilterGenreA,FilterGenreB&year_to=1999&limit=1")
+    assert response.status_code == 200
+    assert [movie["movie_id"] for movie in response.get_json()] == [filter_movies[0].movie_id]
+    # The filters are kept in the link to the next page
+    response = test_client.get(f"/api/movies?genre=FilterGenreA,FilterGenreB&year_to=1999&limit=1"
+                               f"&cursor={response.headers['X-Next-Cursor']}")
+    assert [movie["movie_id"] for movie in response.get_json()] == [filter_movies[1].movie_id]
+
+    response = test_client.get("/api/movies?director_starts_with=zeb&sort=-title")
+    assert [movie["title"] for movie in response.get_json()] == ["Filter Two", "Filter Three", "Filter One"]
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.parametrize("query", ["year_from=abc", "sort=director", "year_from=2000&year_to=1990",
+                                   "sort=title&cursor=WzFd"])
+def test_movies_endpoint_bad_filters(test_client, query):
+    assert test_client.get(f"/api/movies?{query}").status_code == 400
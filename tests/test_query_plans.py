@@ -0,0 +1,102 @@
+import pytest
+from api import db
+from api import services
+from run import create_app
+
+# These tests prove that the lookups in api/services.py are answered with an index rather than by
+#  reading the whole table.  We record every SQL statement a services function runs (using
+#  sqlite3's trace callback) and ask SQLite how it would execute each one with EXPLAIN QUERY PLAN.
+#  A plan step like "SCAN ratings" means SQLite reads every row of that table.  Scans of a
+#  subquery's (already limited) results, like "SCAN r", are fine.
+#
+# Functions that list a whole table (get_all_users, get_all_movies) are left out on purpose,
+#  reading every row is exactly what they are supposed to do.
+
+
+@pytest.fixture(scope="module")
+def app():
+    return create_app()
+
+
+def traced_statements(app, function, *args, **kwargs):
+    """Run a services function and return the SQL statements it executed."""
+    statements = []
+
+    def record(statement):
+        # Statements that start with "--" are run internally by a virtual table (the full-text
+        #  search index, for example) and only have their own, already indexed, lookups
+        if not statement.startswith("--"):
+            statements.append(statement)
+
+    with app.app_context():
+        # Inside an app context the services functions share this same connection
+        with db.get_connection() as conn:
+            conn.set_trace_callback(record)
+            try:
+                function(*args, **kwargs)
+            finally:
+                conn.set_trace_callback(None)
+    return statements
+
+
+def full_scans(app, statement):
+    """Return the plan steps for the statement that read a whole table."""
+    with app.app_context():
+        with db.get_connection() as conn:
+            tables = {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    scans = []
+    for row in plan:
+        words = row["detail"].split()
+        # A "SCAN ... VIRTUAL TABLE" step is a full-text index lookup, not a table scan
+        if words[0] == "SCAN" and words[1] in tables and "VIRTUAL TABLE" not in row["detail"]:
+            scans.append(row["detail"])
+    return scans
+
+
+# The by-id lookups are cached (see api/cache.py), so test the functions that actually query the database
+INDEXED_LOOKUPS = [
+    (services.load_user_dict, (1,), {}),
+    (services.get_users_by_name, ("jane",), {"starts_with": True}),
+    (services.load_movie_dict, (1,), {}),
+    (services.get_movies_by_name, ("The",), {"starts_with": True}),
+    (services.get_rating_by_id, (1,), {}),
+    (services.get_movie_ratings, (1,), {}),
+    (services.get_movie_with_ratings, (1,), {"limit": 10}),
+    (services.get_user_ratings, (1,), {}),
+    (services.get_top_movies, (), {"limit": 10}),
+    (services.get_top_movies, (), {"genre": "Drama", "limit": 10}),
+    (services.get_top_movies, (), {"year": 2010, "limit": 10}),
+    (services.find_movies, (), {"genres": ["Drama", "Crime"], "limit": 10}),
+    (services.find_movies, (), {"genres": ["drama"], "year_from": 1990, "year_to": 1999}),
+    (services.find_movies, (), {"director_starts_with": "Chris"}),
+    (services.find_movies, (), {"year_from": 2000, "year_to": 2005}),
+    (services.find_ratings, (), {"user_id": 1, "min_rating": 4}),
+    (services.get_genre_movies, (1,), {"limit": 10}),
+    (services.get_director_movies, (1,), {}),
+    (services.get_genres, (), {"name": "drama"}),
+    (services.get_recommendations, (1,), {"limit": 10}),
+    (services.get_rating_trend, (1,), {"start": "2023-01-01", "end": "2023-12-31", "bucket": "week"}),
+    (services.get_rating_trend, (), {"start": "2023-01-01", "bucket": "month"}),
+    (services.search_movies, ("dark",), {}),
+    (services.search_reviews, ("amazing",), {}),
+]
+
+
+@pytest.mark.parametrize("function, args, kwargs", INDEXED_LOOKUPS, ids=lambda value: getattr(value, "__name__", ""))
+def test_services_lookup_uses_index(app, function, args, kwargs):
+    statements = traced_statements(app, function, *args, **kwargs)
+    assert len(statements) > 0, "No SQL statements were traced"
+    for statement in statements:
+        assert full_scans(app, statement) == [], f"Full table scan in: {statement}"
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"genre": "Drama"}, {"year": 2010}])
+def test_top_movies_are_read_in_index_order(app, kwargs):
+    # The whole point of the rank_score indexes is that the top N can be read off the index,
+    #  so SQLite should never have to sort the movies itself
+    statement = traced_statements(app, services.get_top_movies, limit=10, **kwargs)[0]
+    with app.app_context():
+        with db.get_connection() as conn:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    assert not any("TEMP B-TREE" in row["detail"] for row in plan), [row["detail"] for row in plan]
@@ -0,0 +1,223 @@
+import sqlite3
+
+import numpy as np
+import pytest
+from api import config, db, migrations, recommender, services
+from api.models import Movie, Rating, User
+from api.recommender import RatingMatrix
+from run import create_app
+
+# These tests cover the similar movies worked out in api/recommender.py, the recommendations in
+#  api/services.py and the /api/users/<id>/recommendations endpoint.
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture
+def fan():
+    # A new user and two new movies.  The user rates one of them, and an existing user (who has rated
+    #  other movies too) rates both, so the new movies are similar to each other.
+    user = User(None, "Recommendation_Fan", "fan@example.com")
+    user.id = services.create_user(user)
+    movies = [Movie(None, f"Recommended {n}", "Drama", 2020, "Someone") for n in range(2)]
+    for movie in movies:
+        movie.movie_id = services.create_movie(movie)
+    ratings = [Rating(user_id=user.id, movie_id=movies[0].movie_id, rating=5, review="Loved it", date="2024-01-01"),
+               Rating(user_id=1, movie_id=movies[0].movie_id, rating=5, review=None, date="2024-01-01"),
+               Rating(user_id=1, movie_id=movies[1].movie_id, rating=4, review=None, date="2024-01-01")]
+    for rating in ratings:
+        rating.rating_id = services.create_rating(rating)
+    # The similar movies are brought up to date by a scheduled job, not by the writes
+    services.refresh_similarities()
+    yield user, movies
+    for rating in ratings:
+        services.delete_rating(rating.rating_id)
+    for movie in movies:
+        services.delete_movie(movie.movie_id)
+    services.delete_user(user.id)
+    services.refresh_similarities()
+
+
+def dense_similarities(users, movies, ratings):
+    """The cosine similarity of every pair of movies, worked out the slow and simple way."""
+    movie_ids = sorted(set(movies))
+    user_ids = sorted(set(users))
+    table = np.zeros((len(user_ids), len(movie_ids)))
+    for user, movie, rating in zip(users, movies, ratings):
+        table[user_ids.index(user), movie_ids.index(movie)] = rating
+    lengths = np.linalg.norm(table, axis=0)
+    return movie_ids, table.T @ table / np.outer(lengths, lengths)
+
+
+def test_concatenated_ranges():
+    ranges = recommender.concatenated_ranges(np.array([10, 20, 5]), np.array([2, 3, 0]))
+    assert ranges.tolist() == [10, 11, 20, 21, 22]
+
+
+def test_rating_matrix_layout():
+    matrix = RatingMatrix([7, 3, 7], [20, 10, 10], [4, 5, 1])
+    assert matrix.user_ids.tolist() == [3, 7]
+    assert matrix.movie_ids.tolist() == [10, 20]
+    # User 3 has one rating (movie 10), user 7 has two (movies 10 and 20)
+    assert matrix.indptr.tolist() == [0, 1, 3]
+    assert matrix.indices.tolist() == [0, 0, 1]
+    assert matrix.data.tolist() == [5, 1, 4]
+    assert matrix.sum_squares().tolist() == [26, 16]
+
+
+@pytest.fixture
+def ratings_db():
+    # A small database of its own with random ratings: 30 users and 12 movies
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE ratings (rating_id INTEGER PRIMARY KEY, user_id INTEGER, movie_id INTEGER, "
+                 "rating INTEGER, review TEXT, date DATE)")
+    for statement in migrations.ITEM_SIMILARITY_TABLES + migrations.ITEM_SIMILARITY_TRIGGERS:
+        conn.execute(statement)
+    rng = np.random.default_rng(0)
+    pairs = {(int(user), int(movie)) for user, movie in zip(rng.integers(0, 30, 200), rng.integers(0, 12, 200))}
+    conn.executemany("INSERT INTO ratings (user_id, movie_id, rating) VALUES (?, ?, ?)",
+                     [(user, movie, int(rng.integers(1, 6))) for user, movie in sorted(pairs)])
+    yield conn
+    conn.close()
+
+
+def read_rows(conn):
+    return {(row[0], row[1]): row[2] for row in
+            conn.execute("SELECT movie_id, neighbour_id, similarity FROM item_similarities")}
+
+
+# With 12 movies, 1 and 30 cells mean blocks of 1 and 2 movies, 1000 does them all at once
+@pytest.mark.parametrize("block_cells", [1, 30, 1000])
+def test_similarities_match_the_dense_calculation(monkeypatch, ratings_db, block_cells):
+    monkeypatch.setattr(config, "RECOMMENDER_BLOCK_CELLS", block_cells)
+    monkeypatch.setattr(config, "RECOMMENDER_NEIGHBOURS", 3)
+    users, movies, ratings = zip(*ratings_db.execute("SELECT user_id, movie_id, rating FROM ratings"))
+    movie_ids, expected = dense_similarities(users, movies, ratings)
+
+    recommender.build_similarities(ratings_db)
+    rows = read_rows(ratings_db)
+    for movie_id in movie_ids:
+        found = sorted((similarity, neighbour) for (movie, neighbour), similarity in rows.items() if movie == movie_id)
+        assert len(found) == 3
+        position = movie_ids.index(movie_id)
+        others = np.delete(expected[position], position)
+        # The three kept are the three most similar movies
+        assert [similarity for similarity, _ in found] == pytest.approx(sorted(others)[-3:])
+        for similarity, neighbour in found:
+            assert similarity == pytest.approx(expected[position, movie_ids.index(neighbour)])
+
+
+def test_min_common_users():
+    # Movies 1 and 2 only have one user in common
+    matrix = RatingMatrix([1, 1, 2], [1, 2, 1], [5, 5, 3])
+    columns = np.arange(2)
+    for min_common_users, expected in [(1, 2), (2, 0)]:
+        similarities = recommender.similarity_rows(matrix, columns, matrix.sum_squares(), min_common_users)
+        assert len(recommender.top_neighbours(matrix, columns, similarities, 5)) == expected
+
+
+@pytest.mark.parametrize("neighbours", [3, 50])
+def test_refresh_follows_changes(monkeypatch, ratings_db, neighbours):
+    monkeypatch.setattr(config, "RECOMMENDER_NEIGHBOURS", neighbours)
+    recommender.build_similarities(ratings_db)
+    ratings_db.executemany("INSERT INTO ratings (user_id, movie_id, rating) VALUES (?, ?, ?)",
+                           [(100, 1, 5), (100, 2, 5), (101, 2, 1)])
+    ratings_db.execute("UPDATE ratings SET rating = 1 WHERE movie_id = 3")
+    ratings_db.execute("DELETE FROM ratings WHERE movie_id = 4")
+    assert recommender.refresh_similarities(ratings_db) == 4
+    refreshed = read_rows(ratings_db)
+    recommender.build_similarities(ratings_db)
+    rebuilt = read_rows(ratings_db)
+    changed = {1, 2, 3, 4}
+    # The changed movies' own lists, and their similarity to every other movie, are up to date
+    for (movie, neighbour), similarity in rebuilt.items():
+        if movie in changed or neighbour in changed:
+            assert refreshed.get((movie, neighbour)) == pytest.approx(similarity)
+    assert not any(4 in key for key in refreshed)
+    if neighbours == 50:
+        # No list is full, so nothing was ever pushed out of one and the refresh is exact
+        assert refreshed.keys() == rebuilt.keys()
+
+
+def test_recommendations(fan):
+    user, movies = fan
+    results = services.get_recommendations(user.id)
+    scores = {result.item.movie_id: result.score for result in results}
+    # The user's own movie isn't recommended back to them, the movie rated by the same people is.
+    #  They only rated movies with a 5, so that's what they are expected to give it too
+    assert movies[0].movie_id not in scores
+    assert scores[movies[1].movie_id] == pytest.approx(5)
+    assert [result.score for result in results] == sorted(scores.values(), reverse=True)
+    assert len(services.get_recommendations(user.id, limit=1)) == 1
+    # Someone who hasn't rated anything gets no recommendations
+    assert services.get_recommendations(999999) == []
+
+
+def test_refresh_can_wait(monkeypatch, fan):
+    user, movies = fan
+    monkeypatch.setattr(config, "RECOMMENDER_REFRESH_ON_WRITE", False)
+    rating = Rating(user_id=user.id, movie_id=movies[1].movie_id, rating=1, review=None, date="2024-01-02")
+    rating_id = services.create_rating(rating)
+    try:
+        with db.get_connection() as conn:
+            queued = [row[0] for row in conn.execute("SELECT movie_id FROM similarity_refresh_queue")]
+        assert queued == [movies[1].movie_id]
+        assert services.refresh_similarities() > 0
+        assert services.refresh_similarities() == 0
+    finally:
+        services.delete_rating(rating_id)
+        services.refresh_similarities()
+
+
+def queued_movies() -> list:
+    with db.get_connection() as conn:
+        return [row[0] for row in conn.execute("SELECT movie_id FROM similarity_refresh_queue")]
+
+
+def test_refresh_on_write_runs_in_the_background(fan, monkeypatch):
+    user, movies = fan
+    monkeypatch.setattr(config, "RECOMMENDER_REFRESH_ON_WRITE", True)
+    rating_id = services.create_rating(
+        Rating(user_id=user.id, movie_id=movies[1].movie_id, rating=2, review=None, date="2024-01-03"))
+    try:
+        assert services.wait_for_similarity_refresh(timeout=30)
+        assert queued_movies() == []
+    finally:
+        services.delete_rating(rating_id)
+        services.wait_for_similarity_refresh(timeout=30)
+
+
+def test_failed_refresh_does_not_fail_the_write(fan, monkeypatch):
+    user, movies = fan
+    monkeypatch.setattr(config, "RECOMMENDER_REFRESH_ON_WRITE", True)
+
+    def locked(conn):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(recommender, "refresh_similarities", locked)
+    rating_id = services.create_rating(
+        Rating(user_id=user.id, movie_id=movies[1].movie_id, rating=2, review=None, date="2024-01-03"))
+    try:
+        assert services.get_rating_by_id(rating_id) is not None
+        assert services.wait_for_similarity_refresh(timeout=30)
+        # The movie stays queued for the next refresh
+        assert queued_movies() == [movies[1].movie_id]
+    finally:
+        monkeypatch.setattr(config, "RECOMMENDER_REFRESH_ON_WRITE", False)
+        services.delete_rating(rating_id)
+
+
+def test_recommendations_endpoint(test_client, fan):
+    user, movies = fan
+    response = test_client.get(f"/api/users/{user.id}/recommendations")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert 0 < len(body)
+    assert movies[1].movie_id in [movie["movie_id"] for movie in body]
+    assert all(1 <= movie["score"] <= 5 for movie in body)
+    assert test_client.get("/api/users/999999/recommendations").status_code == 404
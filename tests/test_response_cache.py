@@ -0,0 +1,244 @@
+import threading
+
+import pytest
+from api import config, response_cache, services
+from api.db import connect
+from api.models import User
+from api.response_cache import CachedResponse, ResponseStore, SingleFlight, SingleFlightTimeoutError
+from run import create_app
+
+# These tests cover the response cache in api/response_cache.py and the endpoints that use it.
+
+
+@pytest.fixture
+def store(clock):
+    return ResponseStore(max_bytes=10, clock=clock)
+
+
+@pytest.fixture
+def app():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    response_cache.clear()
+    yield flask_app
+    response_cache.clear()
+
+
+@pytest.fixture
+def test_client(app):
+    with app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture
+def new_user():
+    user = User(None, "response_cache_user", "response_cache@example.com")
+    user.id = services.create_user(user)
+    yield user
+    services.delete_user(user.id)
+
+
+def body(size: int) -> CachedResponse:
+    return CachedResponse(b"x" * size, 200, [])
+
+
+def test_store_keeps_under_its_size(store):
+    store.set("a", body(4), ttl=60)
+    store.set("b", body(4), ttl=60)
+    # Using "a" makes "b" the least recently used
+    assert store.get("a") is not None
+    store.set("c", body(4), ttl=60)
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.stats()["bytes"] == 8
+    assert store.stats()["evictions"] == 1
+    # Storing a key again replaces it rather than counting it twice
+    store.set("a", body(2), ttl=60)
+    assert store.stats()["bytes"] == 6
+
+
+def test_store_entries_expire(store, clock):
+    store.set("short", body(1), ttl=5)
+    store.set("long", body(1), ttl=50)
+    clock.now = 10
+    assert store.get("short") is None
+    assert store.get("long") is not None
+    assert store.stats()["expirations"] == 1
+
+
+def test_single_flight_runs_once():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    leader = threading.Thread(target=lambda: results.append(flight.run("key", work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.run("key", work))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    # Wait until every follower is waiting for the leader
+    while flight.shared < 4:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert len(calls) == 1
+    assert sorted(results) == [("answer", False)] * 4 + [("answer", True)]
+    # Once it has finished, the next call for the key runs again
+    assert flight.run("key", lambda: "again") == ("again", True)
+
+
+def test_single_flight_error_is_not_shared():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+    with pytest.raises(ValueError):
+        flight.run("key", fail)
+    assert flight.run("key", lambda: 1) == (1, True)
+
+
+def test_repeated_request_is_a_hit(test_client, new_user):
+    first = test_client.get("/api/users?starts_with=response_cache&limit=5")
+    hits = response_cache.stats()["hits"]
+    # The same parameters in a different order are the same request
+    second = test_client.get("/api/users?limit=5&starts_with=response_cache")
+    assert response_cache.stats()["hits"] == hits + 1
+    assert second.data == first.data
+    assert second.content_type == first.content_type
+
+
+def test_write_invalidates(test_client, new_user):
+    url = "/api/users?starts_with=response_cache"
+    assert [user["username"] for user in test_client.get(url).get_json()] == ["response_cache_user"]
+    other = User(None, "response_cache_other", "other@example.com")
+    other.id = services.create_user(other)
+    try:
+        assert [user["username"] for user in test_client.get(url).get_json()] == [
+            "response_cache_user", "response_cache_other"]
+    finally:
+        services.delete_user(other.id)
+
+
+def test_change_from_another_process_invalidates(test_client, new_user):
+    # A write through a connection of its own, like another worker process or a script would make
+    url = "/api/users?starts_with=response_cache"
+    assert [user["username"] for user in test_client.get(url).get_json()] == ["response_cache_user"]
+    conn = connect()
+    try:
+        conn.execute("UPDATE users SET username = 'response_cache_renamed' WHERE user_id = ?", (new_user.id,))
+        conn.commit()
+    finally:
+        conn.close()
+    assert [user["username"] for user in test_client.get(url).get_json()] == ["response_cache_renamed"]
+
+
+def test_waiters_give_up_after_the_timeout():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "done"
+    leader = threading.Thread(target=flights.run, args=("key", slow))
+    leader.start()
+    try:
+        assert started.wait(5)
+        with pytest.raises(SingleFlightTimeoutError):
+            flights.run("key", lambda: "not run", timeout=0.01)
+        assert flights.timeouts == 1
+    finally:
+        release.set()
+        leader.join(5)
+
+
+def test_waiting_too_long_is_a_503(app, new_user, monkeypatch):
+    original = services.get_users_by_name
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_lookup(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(services, "get_users_by_name", slow_lookup)
+    monkeypatch.setattr(config, "RESPONSE_CACHE_WAIT_TIMEOUT", 0.01)
+
+    def fetch():
+        with app.test_client() as client:
+            client.get("/api/users?starts_with=response_cache")
+    leader = threading.Thread(target=fetch)
+    leader.start()
+    try:
+        assert started.wait(5)
+        with app.test_client() as client:
+            response = client.get("/api/users?starts_with=response_cache")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        release.set()
+        leader.join(5)
+
+
+def test_headers_are_kept(test_client, new_user):
+    # A full page has a Link header pointing at the next one
+    first = test_client.get("/api/users?limit=1")
+    second = test_client.get("/api/users?limit=1")
+    assert first.headers["Link"] == second.headers["Link"]
+    assert first.headers["X-Next-Cursor"] == second.headers["X-Next-Cursor"]
+
+
+def test_errors_and_streams_are_not_cached(test_client):
+    assert test_client.get("/api/movies/999999999/ratings").status_code == 404
+    assert test_client.get("/api/movies?stream=true").status_code == 200
+    assert response_cache.stats()["entries"] == 0
+
+
+def test_cache_can_be_disabled_per_route(test_client, monkeypatch):
+    monkeypatch.setattr(config, "RESPONSE_CACHE_TTL_SECONDS", {"movies": 0})
+    test_client.get("/api/movies?limit=1")
+    assert response_cache.stats()["entries"] == 0
+    test_client.get("/api/users?limit=1")
+    assert response_cache.stats()["entries"] == 1
+
+
+def test_expiry_does_not_stampede(app, new_user, monkeypatch):
+    # Every request for the same page arrives while the first one is still reading the database
+    original = services.get_users_by_name
+    release = threading.Event()
+    calls = []
+
+    def slow_lookup(*args, **kwargs):
+        calls.append(1)
+        release.wait(5)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(services, "get_users_by_name", slow_lookup)
+
+    responses = []
+    shared = response_cache.stats()["single_flight_shared"]
+
+    def fetch():
+        with app.test_client() as client:
+            responses.append(client.get("/api/users?starts_with=response_cache"))
+    threads = [threading.Thread(target=fetch) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while not calls or response_cache.stats()["single_flight_shared"] < shared + 4:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert [response.status_code for response in responses] == [200] * 5
+    assert len({response.data for response in responses}) == 1
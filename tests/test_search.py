@@ -0,0 +1,87 @@
+import pytest
+from api import services
+from api.models import Movie, Rating
+from run import create_app
+
+# These tests cover the full-text search in api/services.py and the /api/search endpoint.
+#  The movies and ratings are created through the normal services functions, so they also check
+#  that the triggers keep the search index in step with the tables.
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture
+def search_movies():
+    movies = [Movie(None, "Zyzzyva Returns", "Drama", 2001, "Quillon Abernathy"),
+              Movie(None, "The Zyzzyva Saga", "Action", 2002, "Someone Else"),
+              Movie(None, "Unrelated", "Zyzzyva", 2003, "Someone Else")]
+    for movie in movies:
+        movie.movie_id = services.create_movie(movie)
+    yield movies
+    for movie in movies:
+        services.delete_movie(movie.movie_id)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("dark knight", '"dark" "knight"*'),
+    ("  dark   kni ", '"dark" "kni"*'),
+    ('title:"oops" OR', '"title" "oops" "OR"*'),
+    ("!!!", ""),
+])
+def test_build_search_query(text, expected):
+    assert services.build_search_query(text) == expected
+
+
+def test_search_movies_ranks_title_matches_first(search_movies):
+    results = services.search_movies("zyzzyva")
+    assert [result.item.movie_id for result in results[:2]] == sorted(
+        [search_movies[0].movie_id, search_movies[1].movie_id], key=lambda movie_id: results[0].item.movie_id != movie_id)
+    # The movie that only has the word in its genre comes last
+    assert results[-1].item.movie_id == search_movies[2].movie_id
+    assert results[0].score >= results[-1].score
+    assert "<mark>Zyzzyva</mark>" in results[0].snippet
+
+
+def test_search_by_prefix_and_director(search_movies):
+    assert [result.item.title for result in services.search_movies("quillon aber")] == ["Zyzzyva Returns"]
+
+
+def test_search_follows_updates_and_deletes(search_movies):
+    movie = search_movies[0]
+    movie.title = "Xylophone Returns"
+    services.update_movie(movie)
+    assert [result.item.movie_id for result in services.search_movies("xylophone")] == [movie.movie_id]
+    assert movie.movie_id not in [result.item.movie_id for result in services.search_movies("zyzzyva")]
+    services.delete_movie(search_movies[1].movie_id)
+    assert search_movies[1].movie_id not in [result.item.movie_id for result in services.search_movies("zyzzyva")]
+
+
+def test_search_reviews():
+    rating = Rating(user_id=101, movie_id=1, rating=4, review="A thoroughly flibbertigibbet experience", date="2024-01-01")
+    rating.rating_id = services.create_rating(rating)
+    results = services.search_reviews("flibbertigibbet")
+    assert [result.item.rating_id for result in results] == [rating.rating_id]
+    services.delete_rating(rating.rating_id)
+    assert services.search_reviews("flibbertigibbet") == []
+
+
+def test_search_endpoint_pages(test_client, search_movies):
+    response = test_client.get("/api/search?q=zyzzyva&limit=2")
+    assert response.status_code == 200
+    first_page = response.get_json()
+    assert len(first_page) == 2
+    assert "snippet" in first_page[0] and "score" in first_page[0]
+    second_page = test_client.get(f"/api/search?q=zyzzyva&limit=2&cursor={response.headers['X-Next-Cursor']}").get_json()
+    ids = [result["movie_id"] for result in first_page + second_page]
+    assert sorted(ids) == sorted(movie.movie_id for movie in search_movies)
+
+
+@pytest.mark.parametrize("url", ["/api/search", "/api/search?q=dark&type=users", "/api/search?q=dark&cursor=WzFd"])
+def test_search_endpoint_bad_requests(test_client, url):
+    assert test_client.get(url).status_code == 400
@@ -0,0 +1,95 @@
+import json
+import sqlite3
+
+import pytest
+from flask import jsonify
+from api import config, response_cache, serialization, services
+from api.serialization import MOVIE, RATING, USER, RowTemplate
+from run import create_app
+
+# These tests cover the row templates and JSON encoders in api/serialization.py.
+
+
+@pytest.fixture(scope="module")
+def app():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    return flask_app
+
+
+@pytest.fixture
+def test_client(app):
+    response_cache.clear()
+    with app.test_client() as testing_client:
+        yield testing_client
+    response_cache.clear()
+
+
+@pytest.fixture(params=["json", "orjson"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson" and serialization.orjson is None:
+        pytest.skip("orjson isn't installed")
+    monkeypatch.setattr(config, "JSON_ENCODER", request.param)
+    return request.param
+
+
+def test_templates_match_to_dict():
+    assert USER.to_dicts(services.get_all_users(raw=True)) == [user.to_dict() for user in services.get_all_users()]
+    assert MOVIE.to_dicts(services.find_movies(raw=True)) == [movie.to_dict() for movie in services.find_movies()]
+    assert RATING.to_dicts(services.find_ratings(limit=50, raw=True)) == [
+        rating.to_dict() for rating in services.find_ratings(limit=50)]
+
+
+def test_template_follows_the_columns_of_the_query():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    template = RowTemplate("thing", {"b": "second", "a": "first", "c": None})
+    assert template.keys == ("a", "b", "c")
+    # The same template works for queries that return the columns in any order, or extra ones
+    first = conn.execute("SELECT 1 AS first, 2 AS second").fetchall()
+    second = conn.execute("SELECT 3 AS extra, 2 AS second, 1 AS first").fetchall()
+    assert template.to_dicts(first) == template.to_dicts(second) == [{"a": 1, "b": 2, "c": None}]
+    assert template.to_dicts([]) == []
+    single = RowTemplate("single", {"only": "first"})
+    assert single.to_dicts(first) == [{"only": 1}]
+
+
+def test_json_encoder_gives_the_same_bytes_as_jsonify(app, monkeypatch):
+    monkeypatch.setattr(config, "JSON_ENCODER", "json")
+    body = {"user_id": 1, "ratings": RATING.to_dicts(services.find_ratings(limit=20, raw=True)),
+            "note": "Ünïcödé"}
+    with app.app_context():
+        assert serialization.json_response(body).get_data() == jsonify(body).get_data()
+
+
+def test_orjson_falls_back_to_json(monkeypatch):
+    if serialization.orjson is None:
+        pytest.skip("orjson isn't installed")
+    monkeypatch.setattr(config, "JSON_ENCODER", "auto")
+    assert serialization.encoder_name() == "orjson"
+    # orjson can't encode integers bigger than 64 bits
+    assert json.loads(serialization.dumps({"big": 2 ** 70})) == {"big": 2 ** 70}
+
+
+def test_encoder_can_be_chosen(monkeypatch):
+    monkeypatch.setattr(config, "JSON_ENCODER", "json")
+    assert serialization.encoder_name() == "json"
+    monkeypatch.setattr(serialization, "orjson", None)
+    monkeypatch.setattr(config, "JSON_ENCODER", "orjson")
+    assert serialization.encoder_name() == "json"
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("/api/users?limit=5", lambda: [user.to_dict() for user in services.get_all_users(limit=5)]),
+    ("/api/movies?limit=5", lambda: [movie.to_dict() for movie in services.get_all_movies(limit=5)]),
+    ("/api/movies?sort=-title&limit=5",
+     lambda: [movie.to_dict() for movie in services.find_movies(limit=5, sort="title", descending=True)]),
+    ("/api/users/1/ratings?limit=5",
+     lambda: {"user_id": 1, "ratings": [rating.to_dict() for rating in services.get_user_ratings(1, limit=5)]}),
+    ("/api/movies/1/ratings?limit=5", lambda: services.get_movie_with_ratings(1, limit=5).to_dict()),
+])
+def test_list_endpoints(test_client, encoder, url, expected):
+    response = test_client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    assert response.get_json() == expected()
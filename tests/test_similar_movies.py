@@ -0,0 +1,146 @@
+import sqlite3
+
+import pytest
+from api import config, migrations, services, similar_movies
+from api.db import get_connection
+from api.models import Movie
+from run import create_app
+
+# These tests cover the similar movies index in api/similar_movies.py and the
+#  /api/movies/<id>/similar endpoint that reads it.
+
+
+@pytest.fixture
+def conn(tmp_path):
+    # A small database of its own, with the full schema
+    conn = sqlite3.connect(tmp_path / "similar_test.db")
+    conn.executescript("""
+        CREATE TABLE movies (movie_id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, genre TEXT,
+                             release_year INTEGER, director TEXT);
+        CREATE TABLE ratings (rating_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, movie_id INTEGER,
+                              rating INTEGER, review TEXT, date DATE);
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, email TEXT,
+                            date_joined DATE);
+    """)
+    migrations.migrate(conn)
+    conn.executemany("INSERT INTO movies (movie_id, title, genre, release_year, director) VALUES (?, ?, ?, ?, ?)", [
+        (1, "One", "Drama", 2000, "Ada"),
+        (2, "Two", "Drama", 2000, "Ada"),
+        (3, "Three", "Drama, Comedy", 2005, "Bo"),
+        (4, "Four", "Horror", 1950, "Cy"),
+        (5, "Five", None, None, None),
+    ])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def weights(monkeypatch):
+    for name, weight in [("RATINGS", 0.5), ("GENRE", 0.25), ("DIRECTOR", 0.15), ("YEAR", 0.1)]:
+        monkeypatch.setattr(config, f"SIMILAR_MOVIES_{name}_WEIGHT", weight)
+    monkeypatch.setattr(config, "SIMILAR_MOVIES_YEAR_SPAN", 10.0)
+
+
+@pytest.fixture
+def test_client():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+def neighbours(index, position):
+    record = index[position]
+    return [(int(movie_id), pytest.approx(float(score)))
+            for movie_id, score in zip(record["neighbours"], record["scores"]) if score > 0]
+
+
+def test_scores_combine_metadata(conn, weights):
+    index = similar_movies.build_index(conn, count=3)
+    assert index["movie_id"].tolist() == [1, 2, 3, 4, 5]
+    # One and Two share their genre, director and year: 0.25 + 0.15 + 0.1.  Three shares one of its two
+    #  genres (1 / sqrt(2)) and is 5 years away
+    assert neighbours(index, 0) == [(2, 0.5), (3, 0.25 / 2 ** 0.5 + 0.05)]
+    # Nothing is like Four or Five, and the unused places are padded
+    assert neighbours(index, 3) == [] and neighbours(index, 4) == []
+    assert index["neighbours"][4].tolist() == [0, 0, 0]
+
+
+def test_ratings_similarities_count_too(conn, weights):
+    conn.execute("INSERT INTO item_similarities (movie_id, neighbour_id, similarity) VALUES (4, 5, 0.8), (5, 4, 0.8)")
+    index = similar_movies.build_index(conn)
+    assert neighbours(index, 3) == [(5, 0.4)]
+
+
+@pytest.mark.parametrize("block_cells", [1, 10, 1000])
+def test_blocks_give_the_same_index(conn, weights, monkeypatch, block_cells):
+    expected = similar_movies.build_index(conn)
+    monkeypatch.setattr(config, "RECOMMENDER_BLOCK_CELLS", block_cells)
+    index = similar_movies.build_index(conn)
+    assert [neighbours(index, position) for position in range(5)] == \
+        [neighbours(expected, position) for position in range(5)]
+
+
+def test_saved_index_is_memory_mapped(conn, weights, tmp_path):
+    path = tmp_path / "similar.npy"
+    assert similar_movies.build(conn, path) == 5
+    index = similar_movies.SimilarMoviesIndex(path)
+    assert len(index) == 5
+    assert index.lookup(1) == [(2, pytest.approx(0.5)), (3, pytest.approx(0.2268, abs=1e-4))]
+    assert index.lookup(1, limit=1) == index.lookup(1)[:1]
+    assert index.lookup(99) == []
+    assert index.lookup(0) == []
+
+
+def test_year_span_must_be_positive(conn, weights, monkeypatch):
+    monkeypatch.setattr(config, "SIMILAR_MOVIES_YEAR_SPAN", 0.0)
+    with pytest.raises(ValueError):
+        similar_movies.build_index(conn)
+
+
+def test_shared_index_is_opened_and_reloaded(conn, weights, tmp_path, monkeypatch):
+    path = tmp_path / "shared.npy"
+    monkeypatch.setattr(config, "SIMILAR_MOVIES_INDEX_PATH", path)
+    similar_movies.reset()
+    try:
+        # There is no file yet, and building one is left to the batch job
+        with pytest.raises(similar_movies.IndexNotBuiltError):
+            similar_movies.get_index(tmp_path / "similar_test.db")
+        assert not path.exists()
+        similar_movies.build(conn, path)
+        index = similar_movies.get_index(tmp_path / "similar_test.db")
+        assert similar_movies.get_index(tmp_path / "similar_test.db") is index
+        # A new build is picked up
+        conn.execute("UPDATE movies SET director = 'Ada' WHERE movie_id = 4")
+        similar_movies.build(conn, path)
+        reloaded = similar_movies.get_index(tmp_path / "similar_test.db")
+        assert reloaded is not index
+        assert 4 in [movie_id for movie_id, _ in reloaded.lookup(1)]
+    finally:
+        similar_movies.reset()
+
+
+def test_similar_endpoint(test_client, tmp_path, monkeypatch):
+    path = tmp_path / "endpoint.npy"
+    monkeypatch.setattr(config, "SIMILAR_MOVIES_INDEX_PATH", path)
+    movies = [Movie(None, f"Similar {n}", "Similargenre", 1901, "Similar Director") for n in range(2)]
+    for movie in movies:
+        movie.movie_id = services.create_movie(movie)
+    try:
+        # Until the batch job has run there is nothing to read
+        response = test_client.get(f"/api/movies/{movies[0].movie_id}/similar?limit=3")
+        assert response.status_code == 503
+        with get_connection() as conn:
+            similar_movies.build(conn, path)
+        response = test_client.get(f"/api/movies/{movies[0].movie_id}/similar?limit=3")
+        assert response.status_code == 200
+        body = response.get_json()
+        assert len(body) <= 3
+        assert body[0]["movie_id"] == movies[1].movie_id
+        assert 0 < body[0]["score"] <= 1
+        assert test_client.get("/api/movies/999999/similar").status_code == 404
+    finally:
+        for movie in movies:
+            services.delete_movie(movie.movie_id)
+        similar_movies.reset()
@@ -0,0 +1,84 @@
+import json
+import pytest
+from api import services
+from api.models import Rating
+from run import create_app
+
+# These tests cover the streaming versions of the list endpoints (see api/streaming.py).
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture
+def movie_with_ratings():
+    movie = services.get_movie_by_id(1)
+    ratings = []
+    for score in (1, 2, 3, 4, 5):
+        rating = Rating(user_id=101, movie_id=movie.movie_id, rating=score, review="Streamed", date="2024-01-01")
+        rating.rating_id = services.create_rating(rating)
+        ratings.append(rating)
+    yield movie
+    for rating in ratings:
+        services.delete_rating(rating.rating_id)
+
+
+def test_stream_movies_as_json_array(test_client, monkeypatch):
+    # Use a tiny batch size so the response really is sent in several chunks
+    monkeypatch.setattr(services.config, "STREAM_BATCH_SIZE", 3)
+    response = test_client.get("/api/movies?stream=true")
+    assert response.status_code == 200
+    # A streamed response doesn't know its length up front
+    assert "Content-Length" not in response.headers
+    assert response.mimetype == "application/json"
+    movies = json.loads(response.get_data(as_text=True))
+    assert movies == [movie.to_dict() for movie in services.get_all_movies()]
+
+
+def test_stream_movies_as_ndjson(test_client):
+    response = test_client.get("/api/movies?title=The", headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    movies = [json.loads(line) for line in lines]
+    assert movies == [movie.to_dict() for movie in services.get_movies_by_name("The")]
+
+
+def test_stream_movie_ratings(test_client, movie_with_ratings, monkeypatch):
+    monkeypatch.setattr(services.config, "STREAM_BATCH_SIZE", 2)
+    # Streaming ignores the MAX_RATINGS_PER_MOVIE cap, that's the whole point of it
+    monkeypatch.setattr(services.config, "MAX_RATINGS_PER_MOVIE", 1)
+    response = test_client.get(f"/api/movies/{movie_with_ratings.movie_id}/ratings?stream=true")
+    assert response.status_code == 200
+    movie = json.loads(response.get_data(as_text=True))
+    assert movie["title"] == movie_with_ratings.title
+    expected = [rating.to_dict() for rating in services.get_movie_ratings(movie_with_ratings.movie_id)]
+    assert movie["ratings"] == expected
+
+
+def test_stream_movie_ratings_as_ndjson(test_client, movie_with_ratings):
+    response = test_client.get(f"/api/movies/{movie_with_ratings.movie_id}/ratings",
+                               headers={"Accept": "application/x-ndjson"})
+    ratings = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(ratings) == len(services.get_movie_ratings(movie_with_ratings.movie_id))
+    assert all(rating["movie_id"] == movie_with_ratings.movie_id for rating in ratings)
+
+
+def test_stream_empty_result(test_client):
+    response = test_client.get("/api/movies?stream=true&title=zzzzzz")
+    assert json.loads(response.get_data(as_text=True)) == []
+
+
+def test_stream_missing_movie(test_client):
+    response = test_client.get("/api/movies/999999999/ratings?stream=true")
+    assert response.status_code == 404
+
+
+def test_normal_response_without_stream(test_client):
+    response = test_client.get("/api/movies", headers={"Accept": "*/*"})
+    assert "Content-Length" in response.headers
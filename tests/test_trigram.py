@@ -0,0 +1,147 @@
+import threading
+
+import pytest
+from api import config, services, trigram
+from api.models import Movie, User
+from api.trigram import TrigramIndex
+from run import create_app
+
+# These tests cover the trigram index in api/trigram.py and the name searches in api/services.py that use it.
+
+
+@pytest.fixture
+def index():
+    index = TrigramIndex()
+    for item_id, text in enumerate(["john_smith", "Johnny", "jane", "abcab", "mary-jo"], start=1):
+        index.add(item_id, text)
+    return index
+
+
+@pytest.fixture
+def test_client():
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture
+def new_user():
+    user = User(None, "Quetzalcoatl_Fan", "quetzal@example.com")
+    user.id = services.create_user(user)
+    yield user
+    services.delete_user(user.id)
+
+
+def test_trigrams_are_padded():
+    assert trigram.trigrams("ab") == {"  a", " ab", "ab "}
+    assert trigram.trigrams("abc", padded=False) == {"abc"}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("john", [1, 2]),
+    ("JOHN", [1, 2]),
+    ("_sm", [1]),
+    ("jo", [1, 2, 5]),
+    ("j", [1, 2, 3, 5]),
+    # "abcab" has all of its trigrams ("abc", "bca" and "cab") but doesn't contain it
+    ("abcabc", []),
+    ("nobody", []),
+])
+def test_contains(index, text, expected):
+    assert index.contains(text) == expected
+
+
+def test_add_replaces_and_remove_forgets(index):
+    index.add(3, "Janet")
+    assert index.contains("jane") == [3]
+    assert index.contains("janet") == [3]
+    index.remove(3)
+    assert index.contains("jane") == []
+    # Removing something that isn't there is fine
+    index.remove(3)
+    index.add(4, None)
+    assert len(index) == 3
+
+
+def test_similar_copes_with_typos(index):
+    results = index.similar("johny")
+    assert [item_id for item_id, _ in results] == [2, 1]
+    assert all(0 < score <= 1 for _, score in results)
+    assert index.similar("johnny", threshold=0.3)[0] == (2, 1.0)
+    assert index.similar("johny", limit=1) == results[:1]
+    # A lower threshold lets less alike names through
+    assert len(index.similar("johny", threshold=0.05)) > len(results)
+    assert index.similar("zzzz") == []
+
+
+def test_contains_search_uses_the_index(new_user):
+    found = services.get_users_by_name("zalcoatl_f", starts_with=False)
+    assert [user.id for user in found] == [new_user.id]
+    # The index is kept up to date as the user changes
+    new_user.username = "Someone_Else"
+    services.update_user(new_user)
+    assert services.get_users_by_name("zalcoatl_f", starts_with=False) == []
+    assert new_user.id in [user.id for user in services.get_users_by_name("someone_else", starts_with=False)]
+
+
+def test_contains_search_matches_like(monkeypatch, new_user):
+    # The index and LIKE '%...%' should find the same users (without wildcards in the search text)
+    with_index = [user.id for user in services.get_users_by_name("an", starts_with=False)]
+    monkeypatch.setattr(config, "TRIGRAM_INDEX_ENABLED", False)
+    with_like = [user.id for user in services.get_users_by_name("an", starts_with=False)]
+    assert with_index == with_like
+
+
+def test_contains_search_pages(new_user):
+    everyone = [user.id for user in services.get_users_by_name("a", starts_with=False)]
+    first = services.get_users_by_name("a", starts_with=False, limit=2)
+    rest = services.get_users_by_name("a", starts_with=False, after=first[-1].id)
+    assert [user.id for user in first + rest] == everyone
+
+
+def test_deleted_movies_leave_the_index():
+    movie_id = services.create_movie(Movie(None, "Xanadu Xylophone", "Drama", 2001, "Someone"))
+    assert [movie.movie_id for movie in services.get_movies_by_name("du xylo", starts_with=False)] == [movie_id]
+    services.delete_movie(movie_id)
+    assert services.get_movies_by_name("du xylo", starts_with=False) == []
+
+
+def test_similar_to_endpoint(test_client, new_user):
+    response = test_client.get("/api/users?similar_to=quetzalcoatl_fna")
+    assert response.status_code == 200
+    result = response.get_json()[0]
+    assert result["id"] == new_user.id
+    assert 0 < result["score"] < 1
+
+
+def test_rebuild_does_not_block_searches_or_lose_changes(monkeypatch):
+    old = trigram.get_index("users")
+    original = trigram.build_index
+    read = threading.Event()
+    release = threading.Event()
+
+    def slow_build(name):
+        # The table has been read, but the new index hasn't replaced the old one yet
+        index = original(name)
+        read.set()
+        release.wait(5)
+        return index
+    monkeypatch.setattr(trigram, "build_index", slow_build)
+    monkeypatch.setattr(config, "TRIGRAM_MAX_AGE_SECONDS", 1e-9)
+    rebuilt = []
+    builder = threading.Thread(target=lambda: rebuilt.append(trigram.get_index("users")))
+    builder.start()
+    try:
+        assert read.wait(5)
+        # Searches keep using the old index rather than waiting
+        assert trigram.get_index("users") is old
+        # A change made after the table was read still reaches the new index
+        trigram.record_change("users", 999999999, "Rebuild_Only_Name")
+        release.set()
+        builder.join(5)
+        assert rebuilt[0] is not old
+        assert rebuilt[0].contains("rebuild_only") == [999999999]
+    finally:
+        release.set()
+        trigram.reset()
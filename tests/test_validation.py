@@ -0,0 +1,68 @@
+import pytest
+from api import validation
+from api.models import Rating
+from api.validation import ValidationError
+
+# These tests cover the checks in api/validation.py that the bulk endpoints run on every item.
+
+
+def test_valid_rating():
+    assert validation.validate_rating({"user_id": 1, "movie_id": 2, "rating": 5, "review": "Good", "date": "1/1/2023"}) == []
+
+
+@pytest.mark.parametrize("rating, message", [
+    ({"movie_id": 2, "rating": 5}, "user_id is required"),
+    ({"user_id": "1", "movie_id": 2, "rating": 5}, "user_id must be an integer"),
+    ({"user_id": 1, "movie_id": 2, "rating": 6}, "rating must be between 1 and 5"),
+    ({"user_id": 0, "movie_id": 2, "rating": 5}, "user_id must be at least 1"),
+    ({"user_id": 1, "movie_id": 2, "rating": True}, "rating must be an integer"),
+    ({"user_id": 1, "movie_id": 2, "rating": 3, "review": 7}, "review must be a string"),
+    ({"user_id": 1, "movie_id": 2, "rating": 3, "date": "31st Jan"}, "date must be a date like 2024-01-31"),
+    ({"user_id": 1, "movie_id": 2, "rating": 3, "date": "2024-01-31garbage"}, "date must be a date like 2024-01-31"),
+    ({"user_id": 1, "movie_id": 2, "rating": 3, "date": "2024-02-30"}, "date must be a date like 2024-01-31"),
+])
+def test_invalid_rating(rating, message):
+    assert message in validation.validate_rating(rating)
+
+
+def test_user_and_movie_checks():
+    assert validation.validate_user({"username": "someone", "email": "someone@example.com"}) == []
+    assert validation.validate_user({"username": "", "email": "nope"}) == [
+        "username must be a non-empty string", "email must be an email address"]
+    assert validation.validate_movie({"title": "A Movie", "genre": "Drama", "release_year": 2001, "director": "X"}) == []
+    assert validation.validate_movie({"release_year": 20}) == [
+        "title is required", "release_year must be between 1800 and 3000"]
+
+
+def test_validate_items_reports_by_index():
+    items = [
+        {"user_id": 1, "movie_id": 2, "rating": 5},
+        {"user_id": 1, "movie_id": 2, "rating": 0},
+        "not an object",
+    ]
+    valid, invalid = validation.validate_items("rating", items)
+    assert [index for index, _ in valid] == [0]
+    assert isinstance(valid[0][1], Rating)
+    assert [error["index"] for error in invalid] == [1, 2]
+
+
+def test_parse_ndjson_keeps_going_after_a_bad_line():
+    body = b'{"username": "a"}\nnot json\n\n{"username": "b"}\n'
+    assert validation.parse_items(body, ndjson=True) == [{"username": "a"}, None, {"username": "b"}]
+
+
+@pytest.mark.parametrize("body", [b"not json", b'{"username": "a"}'])
+def test_parse_rejects_bodies_that_are_not_arrays(body):
+    with pytest.raises(ValidationError):
+        validation.parse_items(body)
+
+
+@pytest.mark.parametrize("ndjson", [False, True])
+def test_parse_rejects_bodies_that_are_not_utf8(ndjson):
+    with pytest.raises(ValidationError):
+        validation.parse_items(b'{"username": "\xff"}\n', ndjson=ndjson)
+
+
+def test_parse_limits_the_number_of_items():
+    with pytest.raises(ValidationError):
+        validation.parse_items(b"[1, 2, 3]", max_items=2)
@@ -0,0 +1,37 @@
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+# Add the project root directory to sys.path so we can use the api package from this script
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from api import migrations, similar_movies
+
+# The batch job that builds the index behind /api/movies/<id>/similar (see api/similar_movies.py).
+#  utility/load_data.py runs it after every load, but the ratings keep changing after that, so run
+#  it again from time to time (e.g. every night) to keep the similar movies up to date:
+#     python utility/build_similar_movies.py
+#  The API notices the new file by itself, there is no need to restart it.
+
+DATABASE_PATH = Path(__file__).parents[1] / 'data' / 'movie_data.db'
+
+
+def build_index(database_path=None):
+    # Build the index from the database and save it next to it (or to MOVIE_SIMILAR_MOVIES_INDEX_PATH)
+    database_path = database_path or DATABASE_PATH
+    path = similar_movies.index_path(database_path)
+    started = time.perf_counter()
+    conn = sqlite3.connect(database_path)
+    # The index is built from tables added by migrations (the genre/director links, the ratings similarities)
+    migrations.migrate(conn)
+    movies = similar_movies.build(conn, path)
+    conn.close()
+    print(f'Found the similar movies of {movies:,} movies in {time.perf_counter() - started:.1f}s, saved to {path}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the similar movies index from the database')
+    parser.add_argument('--database', type=Path, default=DATABASE_PATH, help='The database to read')
+    args = parser.parse_args()
+    build_index(args.database)
@@ -1,83 +1,296 @@
-import pandas as pd
-from pathlib import Path
-import sqlite3
-    
-# Set the path of where to find the data files
-RAW_DATA_PATH = Path(__file__).parent / 'data'
-
-# Set the path of where to save the SQLite database
-DATABASE_PATH = Path(__file__).parents[1] / 'data'
-
-# Load the data into the SQLite database
-def load_data():
-    # Read the data files into pandas dataframes
-    movie_data = pd.read_csv(RAW_DATA_PATH / 'movies.csv', index_col=0)
-    rating_data = pd.read_csv(RAW_DATA_PATH / 'ratings.csv', index_col=0)
-    user_data = pd.read_csv(RAW_DATA_PATH / 'users.csv', index_col=0)
-    
-    # Create the tables in the SQLite database
-    create_tables()
-    
-    # Create a SQLite database
-    conn = sqlite3.connect(DATABASE_PATH / 'movie_data.db')
-    # Write the dataframes to the database
-    movie_data.to_sql('movies', conn, if_exists='append', index=False)
-    rating_data.to_sql('ratings', conn, if_exists='append', index=False)
-    user_data.to_sql('users', conn, if_exists='append', index=False)
-    print('Data loaded into SQLite database')
-
-def create_tables():
-    # Create a SQLite database
-    conn = sqlite3.connect(DATABASE_PATH / 'movie_data.db')
-    cursor = conn.cursor()
-    
-    # Create the tables in the database
-    cursor.execute('''DROP TABLE IF EXISTS movies ''')
-    cursor.execute('''
-                   CREATE TABLE IF NOT EXISTS movies (
-                movie_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT,
-                genre TEXT,
-                release_year INTEGER,
-                director TEXT)
-                ''')
-    
-    cursor.execute('''DROP TABLE IF EXISTS ratings''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ratings (
-            rating_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            movie_id INTEGER,
-            rating INTEGER,
-            review TEXT,
-            date DATE
-        )
-    ''')
-    
-    cursor.execute('''DROP TABLE IF EXISTS users''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT,
-            email TEXT,
-            date_joined DATE
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    
-    print('Tables created in SQLite database')
-
-
-def test_data_load():
-    # Query the database to make sure the data was loaded
-    conn = sqlite3.connect(DATABASE_PATH / 'movie_data.db')
-    query = 'SELECT * FROM movies'
-    movies = pd.read_sql(query, conn, index_col='movie_id')
-    print(movies.head())
-
-if __name__ == '__main__':
-    load_data()
-    test_data_load()
-   
\ No newline at end of file
+import argparse
+import csv
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+# Add the project root directory to sys.path so we can use the api package from this script
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from api import migrations, similar_movies
+
+# Set the path of where to find the data files
+RAW_DATA_PATH = Path(__file__).parent / 'data'
+
+# Set the path of where to save the SQLite database
+DATABASE_PATH = Path(__file__).parents[1] / 'data'
+
+# How many CSV rows to read (and insert) at a time.  Only one chunk is ever held in memory,
+#  so the loader can handle files far bigger than the machine's RAM.
+CHUNK_SIZE = 10000
+
+# The file each table is loaded from, and how to convert each CSV column to what goes in the database.
+#  The first column is the table's primary key.  Columns that aren't in a CSV file are left out,
+#  so a file without ids (e.g. a partner's dump of new ratings) just gets new ids from the database.
+TABLES = {
+    'movies': ('movies.csv', {
+        'movie_id': int, 'title': str, 'genre': str, 'release_year': int, 'director': str}),
+    'users': ('users.csv', {
+        'user_id': int, 'username': str, 'email': str, 'date_joined': 'date'}),
+    'ratings': ('ratings.csv', {
+        'rating_id': int, 'user_id': int, 'movie_id': int, 'rating': int, 'review': str, 'date': 'date'}),
+}
+
+# Load the data into the SQLite database
+def load_data(database_path=None, data_path=None, chunk_size=CHUNK_SIZE, replace=False):
+    # database_path is the database file and data_path the folder with the CSV files.
+    # By default the rows in the CSV files are "upserted": new rows are added, and rows whose id is
+    #  already in the database are updated, so the loader can be run again with new data.
+    #  replace=True starts again from empty tables instead.
+    database_path = database_path or DATABASE_PATH / 'movie_data.db'
+    data_path = data_path or RAW_DATA_PATH
+
+    # Make sure the tables exist (and are empty, if we're replacing them)
+    create_tables(database_path, drop=replace)
+
+    conn = sqlite3.connect(database_path)
+    # The schema has to be complete (e.g. the columns added by migrations) before we load into it
+    applied = migrations.migrate(conn)
+    print(f'Applied schema migrations: {applied}')
+
+    with deferred_indexes_and_triggers(conn, TABLES.keys()):
+        for table, (file_name, columns) in TABLES.items():
+            path = Path(data_path) / file_name
+            if path.exists():
+                load_table(conn, table, path, columns, chunk_size)
+    print('Data loaded into SQLite database')
+
+    # The triggers were switched off during the load, so work out everything they keep up to date from scratch
+    migrations.rebuild_rating_stats(conn)
+    migrations.refresh_rankings(conn)
+    migrations.rebuild_search_index(conn)
+    migrations.rebuild_movie_links(conn)
+    migrations.rebuild_item_similarities(conn)
+    migrations.rebuild_rating_rollups(conn)
+    migrations.touch_generations(conn, TABLES.keys())
+    conn.commit()
+    # The similar movies index is a file of its own, next to the database
+    similar_movies.build(conn, similar_movies.index_path(database_path))
+    conn.close()
+    print('Rating statistics, rankings, search index, genre/director links, similar movies and daily rollups rebuilt')
+
+def normalise_date(value):
+    # The CSV files write dates as m/d/yyyy, the database stores them as ISO dates (yyyy-mm-dd)
+    #  so that they sort and compare properly.  ISO dates are passed through as they are.
+    value = value.strip()
+    if not value:
+        return None
+    for date_format in ('%m/%d/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, date_format).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f'Unrecognised date: {value!r}')
+
+def convert_row(row, columns):
+    # Turn one CSV row (a list of strings) into the values to insert.  Empty cells become NULL.
+    values = []
+    for value, convert in zip(row, columns.values()):
+        if value == '':
+            values.append(None)
+        elif convert == 'date':
+            values.append(normalise_date(value))
+        else:
+            values.append(convert(value))
+    return values
+
+def read_csv_rows(path, columns, chunk_size=CHUNK_SIZE):
+    # Read a CSV file chunk_size rows at a time, without converting the values.  The first yield is
+    #  the list of columns the file has (in the order of `columns`), after that every yield is a list
+    #  of up to chunk_size (line number, row) pairs, where row is a list of strings in that order.
+    with open(path, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            raise ValueError('the file is empty, it has no header row')
+        positions = {name: header.index(name) for name in columns if name in header}
+        yield list(positions)
+        while True:
+            rows = []
+            for row in islice(reader, chunk_size):
+                # line_num is the line the row ended on, which is where a text editor would show it
+                #  (a quoted value can span several lines)
+                # A short row is missing its last cells, which are read as empty (NULL) like any other empty cell
+                rows.append((reader.line_num, [row[position] if position < len(row) else ''
+                                               for position in positions.values()]))
+            if not rows:
+                return
+            yield rows
+
+def read_csv_chunks(path, columns, chunk_size=CHUNK_SIZE):
+    # Read a CSV file chunk_size rows at a time.  The first yield is the list of columns the file
+    #  has (in the order of `columns`), after that every yield is a list of up to chunk_size
+    #  converted rows.  A value that can't be converted raises a ValueError.
+    chunks = read_csv_rows(path, columns, chunk_size)
+    file_columns = next(chunks)
+    yield file_columns
+    wanted = {name: columns[name] for name in file_columns}
+    for rows in chunks:
+        yield [convert_row(row, wanted) for _, row in rows]
+
+def upsert_statement(table, file_columns, key_column):
+    # INSERT ... ON CONFLICT DO UPDATE adds new rows and overwrites the ones that are already there.
+    #  If the file doesn't have the key column, there is nothing to clash on, so it's a plain INSERT.
+    placeholders = ', '.join('?' for _ in file_columns)
+    statement = f'INSERT INTO {table} ({", ".join(file_columns)}) VALUES ({placeholders})'
+    updates = [f'{column} = excluded.{column}' for column in file_columns if column != key_column]
+    if key_column in file_columns and updates:
+        # The triggers are switched off during a load, so the row versions are bumped here instead
+        #  (see migration 9), otherwise a client could be told its old copy of the row is still current
+        if table in migrations.VERSIONED_TABLES:
+            updates += ['row_version = row_version + 1', f'updated_at = {migrations.NOW_SQL}']
+        statement += f' ON CONFLICT ({key_column}) DO UPDATE SET {", ".join(updates)}'
+    return statement
+
+def load_table(conn, table, path, columns, chunk_size=CHUNK_SIZE):
+    # Stream one CSV file into a table, one transaction per chunk.  Returns the number of rows loaded.
+    started = time.perf_counter()
+    chunks = read_csv_chunks(path, columns, chunk_size)
+    file_columns = next(chunks)
+    # The same prepared statement is used for every row
+    statement = upsert_statement(table, file_columns, key_column=next(iter(columns)))
+    loaded = 0
+    for rows in chunks:
+        with conn:
+            conn.executemany(statement, rows)
+        loaded += len(rows)
+    seconds = time.perf_counter() - started
+    rate = loaded / seconds if seconds > 0 else 0
+    print(f'Loaded {loaded:,} rows into {table} in {seconds:.2f}s ({rate:,.0f} rows/sec)')
+    return loaded
+
+@contextmanager
+def deferred_indexes_and_triggers(conn, tables):
+    # Keeping an index up to date row by row is much slower than building it once at the end, and
+    #  the rating triggers would update the statistics once per row.  So drop the indexes and
+    #  triggers on the tables, load the data, then put them back exactly as they were.
+    placeholders = ', '.join('?' for _ in tables)
+    saved = conn.execute(
+        f"SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') "
+        f"AND tbl_name IN ({placeholders}) AND sql IS NOT NULL", list(tables)).fetchall()
+    with conn:
+        for object_type, name, _ in saved:
+            conn.execute(f'DROP {object_type.upper()} IF EXISTS {name}')
+    try:
+        yield
+    finally:
+        with conn:
+            for _, _, sql in saved:
+                conn.execute(sql)
+
+def create_tables(database_path=None, drop=True):
+    # Create the tables in the database if they don't exist yet.
+    #  drop=True deletes the existing tables (and all of their data) first.
+    conn = sqlite3.connect(database_path or DATABASE_PATH / 'movie_data.db')
+    cursor = conn.cursor()
+
+    # Create the tables in the database
+    if drop:
+        cursor.execute('''DROP TABLE IF EXISTS movies ''')
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS movies (
+                movie_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT,
+                genre TEXT,
+                release_year INTEGER,
+                director TEXT)
+                ''')
+
+    if drop:
+        cursor.execute('''DROP TABLE IF EXISTS ratings''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ratings (
+            rating_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            movie_id INTEGER,
+            rating INTEGER,
+            review TEXT,
+            date DATE
+        )
+    ''')
+
+    if drop:
+        cursor.execute('''DROP TABLE IF EXISTS users''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT,
+            email TEXT,
+            date_joined DATE
+        )
+    ''')
+
+    if drop:
+        # Tables created by the schema migrations are rebuilt from the data by migrate()
+        cursor.execute('''DROP TABLE IF EXISTS movie_rating_stats''')
+        cursor.execute('''DROP TABLE IF EXISTS ranking_prior''')
+        cursor.execute('''DROP TABLE IF EXISTS movies_fts''')
+        cursor.execute('''DROP TABLE IF EXISTS reviews_fts''')
+        cursor.execute('''DROP TABLE IF EXISTS movie_genres''')
+        cursor.execute('''DROP TABLE IF EXISTS movie_directors''')
+        cursor.execute('''DROP TABLE IF EXISTS genres''')
+        cursor.execute('''DROP TABLE IF EXISTS people''')
+        cursor.execute('''DROP TABLE IF EXISTS item_similarities''')
+        cursor.execute('''DROP TABLE IF EXISTS item_norms''')
+        cursor.execute('''DROP TABLE IF EXISTS similarity_refresh_queue''')
+        cursor.execute('''DROP TABLE IF EXISTS rating_daily_rollups''')
+        cursor.execute('''DROP TABLE IF EXISTS rating_daily_totals''')
+        cursor.execute('''DROP TABLE IF EXISTS table_generations''')
+
+        # The tables were recreated from scratch, so none of the schema migrations apply to them anymore
+        cursor.execute('PRAGMA user_version = 0')
+
+    conn.commit()
+    conn.close()
+
+    print('Tables created in SQLite database')
+
+
+def rebuild_stats(database_path=None):
+    # Recalculate the per-movie rating statistics, rankings, full-text search index, genre/director links,
+    #  similar movies and daily rollups (and rewrite any m/d/yyyy rating dates as ISO dates).
+    #  The triggers keep them up to date, so this is only needed if they have got out of step
+    #  (e.g. the ratings table was edited with the triggers missing).
+    database_path = database_path or DATABASE_PATH / 'movie_data.db'
+    conn = sqlite3.connect(database_path)
+    migrations.rebuild_rating_stats(conn)
+    # The rankings are worked out from the statistics, so bring them up to date too
+    migrations.refresh_rankings(conn)
+    migrations.rebuild_search_index(conn)
+    migrations.rebuild_movie_links(conn)
+    migrations.rebuild_item_similarities(conn)
+    migrations.normalise_rating_dates(conn)
+    migrations.rebuild_rating_rollups(conn)
+    conn.commit()
+    similar_movies.build(conn, similar_movies.index_path(database_path))
+    conn.close()
+    print('Rating statistics, rankings, search index, genre/director links, similar movies and daily rollups rebuilt')
+
+
+def test_data_load(database_path=None):
+    # Query the database to make sure the data was loaded
+    conn = sqlite3.connect(database_path or DATABASE_PATH / 'movie_data.db')
+    query = 'SELECT movie_id, title, genre, release_year, director FROM movies ORDER BY movie_id LIMIT 5'
+    for movie in conn.execute(query):
+        print(movie)
+    conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load the CSV files in utility/data into the database')
+    parser.add_argument('--replace', action='store_true',
+                        help='Delete all of the existing data first, instead of adding to / updating it')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='How many rows to insert per transaction')
+    parser.add_argument('--data', type=Path, default=RAW_DATA_PATH, help='The folder with the CSV files')
+    # python utility/load_data.py --rebuild-stats only rebuilds what the triggers keep up to date (statistics, rankings, ...)
+    parser.add_argument('--rebuild-stats', action='store_true',
+                        help='Only recalculate the rating statistics, rankings, search index, genre/director links and similar movies')
+    args = parser.parse_args()
+
+    if args.rebuild_stats:
+        rebuild_stats()
+    else:
+        load_data(data_path=args.data, chunk_size=args.chunk_size, replace=args.replace)
+        test_data_load()
@@ -0,0 +1,234 @@
+# Import CSV files into the database using several processes.
+#
+# utility/load_data.py reads and writes one file at a time in a single process.  For big imports
+#  (e.g. a ratings dump split into ratings_part1.csv, ratings_part2.csv, ...) most of that time is
+#  spent parsing and checking the CSV rows, which can happen in parallel.  Writing can't: SQLite
+#  only allows one writer at a time, and several processes fighting over the write lock would be
+#  slower than one.  So this script splits the work up like this:
+#
+#   - a pool of parser processes, each one reads a CSV file (a "shard") in chunks, converts and
+#     validates the rows and puts the good ones on a queue
+#   - one writer process takes the chunks off the queue and inserts them, one transaction each
+#
+# The queue has a maximum size, so if the writer falls behind the parsers wait for it rather than
+#  filling up memory.  Users and movies are imported before ratings (ratings refer to them), and
+#  every table accepts any number of shards named after it, e.g. ratings.csv and ratings_2024.csv.
+#
+# Run it from the project's root directory:
+#     python utility/parallel_import.py --workers 4 --data path/to/csv/files
+import argparse
+import csv
+import multiprocessing
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from queue import Empty, Full
+
+# Add the project root directory to sys.path so we can use the api package from this script
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from api import migrations, similar_movies, validation
+from utility.load_data import (CHUNK_SIZE, DATABASE_PATH, RAW_DATA_PATH, TABLES, convert_row, create_tables,
+                               deferred_indexes_and_triggers, read_csv_rows, upsert_statement)
+
+# The tables are imported in phases, a phase only starts once everything before it has been queued
+PHASES = [['users', 'movies'], ['ratings']]
+
+# How each table's rows are checked (see api/validation.py)
+VALIDATORS = {'users': validation.validate_user, 'movies': validation.validate_movie,
+              'ratings': validation.validate_rating}
+
+# How many chunks can wait in the queue for the writer
+QUEUE_SIZE = 8
+
+# The most rejected rows to describe in the report (they are all counted)
+MAX_REPORTED_ERRORS = 20
+
+# How often (in seconds) the writer reports its progress
+PROGRESS_INTERVAL = 1.0
+
+# Set in each parser process by init_parser
+_queue = None
+
+
+def init_parser(queue):
+    # Runs once in each parser process when the pool starts.  A multiprocessing queue can't be
+    #  passed to a pool task as an argument, but it can be handed to the process when it starts.
+    global _queue
+    _queue = queue
+
+
+def parse_shard(table, path, chunk_size):
+    # Parse one CSV file and queue its valid rows for the writer, a chunk at a time.
+    #  Returns a summary of the file: the number of rows queued and rejected, and the first few errors.
+    columns = TABLES[table][1]
+    validate = VALIDATORS[table]
+    queued, rejected, errors = 0, 0, []
+    try:
+        chunks = read_csv_rows(path, columns, chunk_size)
+        # Reading the header is inside the try too, an empty file is an error like any other
+        file_columns = next(chunks)
+        wanted = {name: columns[name] for name in file_columns}
+        for rows in chunks:
+            good_rows = []
+            # Every row is converted and checked on its own, so a bad row only rejects itself
+            for line_number, row in rows:
+                try:
+                    values = convert_row(row, wanted)
+                except ValueError as error:
+                    # A value that can't be converted at all, e.g. a date in an unknown format
+                    problems = [str(error)]
+                else:
+                    problems = validate(dict(zip(file_columns, values)))
+                if problems:
+                    rejected += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append(f'{path.name} line {line_number}: {"; ".join(problems)}')
+                else:
+                    good_rows.append(values)
+            if good_rows:
+                _queue.put((table, file_columns, good_rows))
+                queued += len(good_rows)
+    except (ValueError, OSError, csv.Error) as error:
+        # A file that can't be read, isn't CSV or is empty stops the file, the chunks already
+        #  queued are still imported
+        errors.append(f'{path.name}: {error}')
+    return {'file': path.name, 'table': table, 'queued': queued, 'rejected': rejected, 'errors': errors}
+
+
+def run_writer(database_path, queue, results):
+    # The writer process: insert every chunk that arrives on the queue until it gets None.
+    conn = sqlite3.connect(database_path)
+    written = {table: 0 for table in TABLES}
+    statements = {}
+    error = None
+    started = last_report = time.perf_counter()
+    with deferred_indexes_and_triggers(conn, TABLES.keys()):
+        while True:
+            message = queue.get()
+            if message is None:
+                break
+            if error is not None:
+                # Something went wrong, keep emptying the queue so the parsers don't wait forever
+                continue
+            table, file_columns, rows = message
+            key = (table, tuple(file_columns))
+            if key not in statements:
+                statements[key] = upsert_statement(table, file_columns, key_column=next(iter(TABLES[table][1])))
+            try:
+                with conn:
+                    conn.executemany(statements[key], rows)
+            except sqlite3.Error as exception:
+                error = f'{table}: {exception}'
+                continue
+            written[table] += len(rows)
+            if time.perf_counter() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.perf_counter()
+                total = sum(written.values())
+                print(f'Written {total:,} rows so far ({total / (last_report - started):,.0f} rows/sec)', flush=True)
+    # The triggers were switched off during the import, so work out everything they keep up to date from scratch
+    migrations.rebuild_rating_stats(conn)
+    migrations.refresh_rankings(conn)
+    migrations.rebuild_search_index(conn)
+    migrations.rebuild_movie_links(conn)
+    migrations.rebuild_item_similarities(conn)
+    migrations.rebuild_rating_rollups(conn)
+    migrations.touch_generations(conn, TABLES.keys())
+    conn.commit()
+    # The similar movies index is a file of its own, next to the database
+    similar_movies.build(conn, similar_movies.index_path(database_path))
+    conn.close()
+    results.put({'written': written, 'seconds': time.perf_counter() - started, 'error': error})
+
+
+def put_until_taken(queue, message, writer):
+    # Put a message on the queue, giving up if the writer process has died (nobody would ever take it)
+    while True:
+        try:
+            queue.put(message, timeout=PROGRESS_INTERVAL)
+            return
+        except Full:
+            # The writer hasn't made room yet
+            if not writer.is_alive():
+                return
+
+
+def wait_for_writer(writer, results):
+    # Wait for the writer's summary, checking that it is still running so we never wait forever
+    while True:
+        try:
+            return results.get(timeout=PROGRESS_INTERVAL)
+        except Empty:
+            if not writer.is_alive():
+                break
+    # It may have sent its summary just before it finished
+    try:
+        return results.get(timeout=PROGRESS_INTERVAL)
+    except Empty:
+        raise RuntimeError(f'The writer process stopped without finishing the import (exit code {writer.exitcode})')
+
+
+def find_shards(data_path, table):
+    # Every CSV file whose name starts with the table's name, e.g. ratings.csv, ratings_part2.csv
+    return sorted(Path(data_path).glob(f'{table}*.csv'))
+
+
+def import_files(database_path=None, data_path=None, workers=None, chunk_size=CHUNK_SIZE, replace=False):
+    # Import every CSV shard in data_path into the database.  Returns a summary of the import.
+    database_path = database_path or DATABASE_PATH / 'movie_data.db'
+    data_path = data_path or RAW_DATA_PATH
+    workers = workers or multiprocessing.cpu_count()
+
+    create_tables(database_path, drop=replace)
+    conn = sqlite3.connect(database_path)
+    migrations.migrate(conn)
+    conn.close()
+
+    started = time.perf_counter()
+    queue = multiprocessing.Queue(maxsize=QUEUE_SIZE)
+    results = multiprocessing.Queue()
+    writer = multiprocessing.Process(target=run_writer, args=(database_path, queue, results))
+    writer.start()
+
+    shards = []
+    try:
+        with multiprocessing.Pool(workers, initializer=init_parser, initargs=(queue,)) as pool:
+            for phase in PHASES:
+                tasks = [(table, path, chunk_size) for table in phase for path in find_shards(data_path, table)]
+                # starmap waits for the whole phase, so every user and movie is queued before any rating.
+                #  There is only one writer, taking chunks in order, so they are also written first.
+                for shard in pool.starmap(parse_shard, tasks):
+                    shards.append(shard)
+                    print(f'Parsed {shard["file"]}: {shard["queued"]:,} rows queued, {shard["rejected"]:,} rejected')
+    finally:
+        # Always tell the writer to finish, even if a parser failed, so it puts the indexes and
+        #  triggers back rather than waiting for more chunks forever
+        put_until_taken(queue, None, writer)
+        summary = wait_for_writer(writer, results)
+        writer.join()
+
+    seconds = time.perf_counter() - started
+    summary['shards'] = shards
+    summary['total_seconds'] = seconds
+    total = sum(summary['written'].values())
+    print(f'Imported {total:,} rows from {len(shards)} files with {workers} parsers in {seconds:.2f}s '
+          f'({total / seconds:,.0f} rows/sec)')
+    for table, count in summary['written'].items():
+        print(f'  {table}: {count:,} rows')
+    for shard in shards:
+        for error in shard['errors']:
+            print(f'  rejected: {error}')
+    if summary['error']:
+        print(f'  import stopped early: {summary["error"]}')
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import CSV files into the database using several processes')
+    parser.add_argument('--workers', type=int, default=None, help='The number of parser processes (default: one per CPU)')
+    parser.add_argument('--data', type=Path, default=RAW_DATA_PATH, help='The folder with the CSV files')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='How many rows to insert per transaction')
+    parser.add_argument('--replace', action='store_true',
+                        help='Delete all of the existing data first, instead of adding to / updating it')
+    args = parser.parse_args()
+    import_files(data_path=args.data, workers=args.workers, chunk_size=args.chunk_size, replace=args.replace)
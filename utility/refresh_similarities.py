@@ -0,0 +1,41 @@
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+# Add the project root directory to sys.path so we can use the api package from this script
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from api import migrations, recommender
+
+# The scheduled job that brings the similar movies behind the recommendations up to date (see
+#  api/recommender.py).  Adding, changing or deleting a rating queues its movie in
+#  similarity_refresh_queue, and this works the similar movies of the queued movies out again.
+#  Run it every few minutes (e.g. from cron):
+#     python utility/refresh_similarities.py
+
+DATABASE_PATH = Path(__file__).parents[1] / 'data' / 'movie_data.db'
+
+
+def refresh(database_path=None):
+    # Work out the similar movies of the queued movies again, in one transaction
+    database_path = database_path or DATABASE_PATH
+    started = time.perf_counter()
+    conn = sqlite3.connect(database_path, timeout=60)
+    migrations.migrate(conn)
+    try:
+        movies = recommender.refresh_similarities(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f'Refreshed the similar movies of {movies:,} movies in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refresh the similar movies of the movies whose ratings changed')
+    parser.add_argument('--database', type=Path, default=DATABASE_PATH, help='The database to update')
+    args = parser.parse_args()
+    refresh(args.database)